@@ -24,6 +24,7 @@ from pathlib import Path
 from src.console import console, Panel, Table, print_panel, print_success, print_error, print_warning, HAVE_RICH
 from src.config import load_config, generate_example_config, CONFIG_FILE, OPENROUTER_URL
 from src.key_manager import KeyManager
+from src.providers.connection_pool import get_connection_pool
 from src.session_manager import load_sessions, list_sessions
 from src.terminal import terminal_session_manager, print_commands_box
 from src.gui.core import HAVE_GUI
@@ -102,7 +103,7 @@ def initialize():
     
     # Initialize key managers
     for provider in ["custom", "openrouter", "google"]:
-        web_server.KEY_MANAGERS[provider] = KeyManager(keys[provider], provider)
+        web_server.KEY_MANAGERS[provider] = KeyManager.from_config(keys[provider], provider, config)
     
     # ─── Configuration Summary ────────────────────────────────────────────
     provider = config.get('default_provider', 'google')
@@ -279,6 +280,9 @@ def cleanup():
             print("Stopping SnipTool...")
         SNIP_TOOL_APP.stop()
         SNIP_TOOL_APP = None
+    
+    # Release pooled upstream connections
+    get_connection_pool().close_all()
 
 
 def signal_handler(signum, frame):
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Admission Control for Upstream Calls
+
+Flask runs with threaded=True, so a burst of screenshot uploads becomes a
+burst of threads, each holding the decoded image and its base64 copy while
+it waits on the upstream. The AdmissionController caps how many upstream
+calls run at once and orders the rest by priority class:
+
+    interactive   GUI traffic (chat windows, popups, snip tool); never
+                  refused, waits only for a free slot
+    http          Flask endpoints and the gateway
+    batch         execute_batch items and background jobs
+
+Waiting http / batch requests are bounded twice: when
+admission_queue_size of them are already waiting a new one is refused
+(HTTP 429), and one that waited admission_queue_timeout seconds gives up
+(HTTP 503). Both carry a Retry-After estimated from the queue depth and
+recent upstream call durations. web_server.py also refuses endpoint and
+gateway POSTs with 429 before reading their bodies when the queue is full.
+
+Slots are taken in RequestPipeline._with_fallback, so middleware answers
+(cache hits, coalesced followers) never need one. /health reports in-flight
+calls, queue depth per class, refusals and wait-time percentiles under
+admission.
+
+Config:
+    admission_max_concurrent = 8     # 0 = no admission control
+    admission_queue_size = 64
+    admission_queue_timeout = 30     # seconds
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .metrics import RollingPercentiles
+
+INTERACTIVE = "interactive"
+HTTP = "http"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, HTTP, BATCH)  # Highest first
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+# Retry-After bounds (seconds)
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+
+def priority_for(ctx) -> str:
+    """ctx.priority, or the class of its origin (endpoints and gateway are http)"""
+    if ctx.priority:
+        return ctx.priority
+    origin = ctx.origin.value
+    return HTTP if origin.startswith("endpoint/") or origin == "gateway" else INTERACTIVE
+
+
+class AdmissionRejected(Exception):
+    """A request that was refused a slot"""
+
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status  # 429 queue full, 503 waited too long
+        self.message = message
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "granted", "abandoned")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.granted = False
+        self.abandoned = False
+
+
+class Slot:
+    """A granted upstream slot; release() exactly once (or use as a context manager)"""
+
+    __slots__ = ("_controller", "_started", "_released")
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Concurrency cap with a bounded, priority-ordered wait queue"""
+
+    def __init__(self, max_concurrent: int, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self._cond = threading.Condition()
+        self._heap = []  # (priority rank, sequence, waiter)
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self.configure(max_concurrent, queue_size, queue_timeout)
+
+        # Stats
+        self._admitted = {priority: 0 for priority in PRIORITIES}
+        self._queue_full = 0
+        self._timeouts = 0
+        self._wait_ms = {priority: RollingPercentiles() for priority in PRIORITIES}
+        self._durations = RollingPercentiles()
+
+    def configure(self, max_concurrent: int, queue_size: int, queue_timeout: float):
+        with self._cond:
+            self.max_concurrent = max(1, int(max_concurrent))
+            self.queue_size = max(0, int(queue_size))
+            self.queue_timeout = max(0.0, float(queue_timeout))
+            self._grant()
+
+    # -- Admission -------------------------------------------------------
+
+    def _queued(self) -> int:
+        """Waiting http / batch requests (the ones queue_size bounds)"""
+        return self._waiting[HTTP] + self._waiting[BATCH]
+
+    def retry_after(self) -> int:
+        """Seconds until a refused request is likely to get a slot"""
+        typical = self._durations.percentile(50) or 1.0
+        waves = (self._queued() + 1) / self.max_concurrent
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(waves * typical))))
+
+    def check(self, priority: str) -> Optional[AdmissionRejected]:
+        """
+        The refusal acquire(priority) would raise right now for a full queue
+        (counted as refused), or None
+        """
+        with self._cond:
+            if priority != INTERACTIVE and self._in_flight >= self.max_concurrent \
+                    and self._queued() >= self.queue_size:
+                self._queue_full += 1
+                return AdmissionRejected(429, "Too many requests waiting for an upstream slot",
+                                         self.retry_after())
+        return None
+
+    def acquire(self, priority: str, cancel_token=None) -> Optional[Slot]:
+        """
+        Wait for a slot.
+
+        Returns:
+            The Slot, or None when cancel_token was cancelled while waiting
+
+        Raises:
+            AdmissionRejected: queue full (429) or queue_timeout passed (503)
+        """
+        start = time.monotonic()
+        with self._cond:
+            if self._in_flight < self.max_concurrent and not self._heap:
+                self._in_flight += 1
+                self._admit(priority, start)
+                return Slot(self)
+            rejected = self.check(priority)
+            if rejected is not None:
+                raise rejected
+
+            waiter = _Waiter(priority)
+            heapq.heappush(self._heap, (PRIORITIES.index(priority), next(self._sequence), waiter))
+            self._waiting[priority] += 1
+            self._grant()  # Slots may be free behind abandoned waiters
+        unregister = cancel_token.on_cancel(self._wake) if cancel_token is not None else None
+        try:
+            deadline = None if priority == INTERACTIVE else start + self.queue_timeout
+            with self._cond:
+                while not waiter.granted:
+                    cancelled = cancel_token is not None and cancel_token.cancelled
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if cancelled or (remaining is not None and remaining <= 0):
+                        waiter.abandoned = True
+                        self._waiting[priority] -= 1
+                        if cancelled:
+                            return None
+                        self._timeouts += 1
+                        raise AdmissionRejected(503, f"No upstream slot within {self.queue_timeout:g}s",
+                                                self.retry_after())
+                    self._cond.wait(remaining)
+                self._admit(priority, start)
+                return Slot(self)
+        finally:
+            if unregister:
+                unregister()
+
+    def _admit(self, priority: str, start: float):
+        self._admitted[priority] += 1
+        self._wait_ms[priority].add((time.monotonic() - start) * 1000)
+
+    def _grant(self):
+        """Hand free slots to the best waiters (caller holds the lock)"""
+        granted = False
+        while self._heap and self._in_flight < self.max_concurrent:
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.abandoned:
+                continue
+            waiter.granted = True
+            self._waiting[waiter.priority] -= 1
+            self._in_flight += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _release(self, duration: float):
+        self._durations.add(duration)
+        with self._cond:
+            self._in_flight -= 1
+            self._grant()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self._in_flight,
+                "queued": dict(self._waiting),
+                "admitted": dict(self._admitted),
+                "rejected_queue_full": self._queue_full,
+                "rejected_timeout": self._timeouts,
+                "wait_ms": {priority: self._wait_ms[priority].snapshot() for priority in PRIORITIES},
+            }
+
+
+_CONTROLLER: Optional[AdmissionController] = None
+_CONTROLLER_LOCK = threading.Lock()
+
+
+def get_admission_controller(config: Dict) -> Optional[AdmissionController]:
+    """The process-wide controller for the admission_* settings (None when off)"""
+    global _CONTROLLER
+    max_concurrent = int(config.get("admission_max_concurrent") or 0)
+    if max_concurrent <= 0:
+        return None
+    queue_size = config.get("admission_queue_size")
+    queue_size = DEFAULT_QUEUE_SIZE if queue_size is None else queue_size
+    timeout = config.get("admission_queue_timeout")
+    timeout = DEFAULT_QUEUE_TIMEOUT if timeout is None else timeout
+    with _CONTROLLER_LOCK:
+        if _CONTROLLER is None:
+            _CONTROLLER = AdmissionController(max_concurrent, queue_size, timeout)
+        elif (_CONTROLLER.max_concurrent, _CONTROLLER.queue_size, _CONTROLLER.queue_timeout) != \
+                (max_concurrent, int(queue_size), float(timeout)):
+            _CONTROLLER.configure(max_concurrent, queue_size, timeout)
+        return _CONTROLLER
+
+
+def get_admission_stats(config: Dict) -> Optional[Dict[str, Any]]:
+    controller = get_admission_controller(config)
+    return controller.get_stats() if controller is not None else None
@@ -13,11 +13,14 @@ All API requests flow through the provider classes for consistent:
 
 import base64
 import re
+import threading
 import time
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple, Callable, Any
 
 import requests
 
+from .cancellation import CancellationToken
 from .config import OPENROUTER_URL
 from .providers import (
     OpenAICompatibleProvider,
@@ -27,43 +30,53 @@ from .providers import (
     StreamCallback as ProviderStreamCallback,
 )
 from .providers.base import estimate_tokens, estimate_message_tokens
+from .providers.deadlines import Deadlines
+from .providers.health import get_health_tracker
 
 
 # ============================================================
 # PROVIDER FACTORY AND MANAGEMENT
 # ============================================================
 
-def get_provider_for_type(
-    provider_type: str,
-    key_manager,
-    config: Dict
-):
-    """
-    Get the appropriate provider instance for the given type.
-    
-    Args:
-        provider_type: Provider type (custom, openrouter, google)
-        key_manager: Key manager for API keys
-        config: Configuration dictionary
-    
-    Returns:
-        Provider instance
-    """
-    provider_config = {
+def _build_provider_config(config: Dict) -> Dict:
+    """Extract the provider-relevant subset of the app configuration"""
+    return {
         "request_timeout": config.get("request_timeout", 120),
         "max_retries": config.get("max_retries", 3),
         "retry_delay": config.get("retry_delay", 5),
+        "retry_max_delay": config.get("retry_max_delay", 30),
+        "retry_deadline": config.get("retry_deadline", 300),
+        "http_pool_size": config.get("http_pool_size", 10),
+        "connect_timeout": config.get("connect_timeout", 10),
+        "stream_first_byte_timeout": config.get("stream_first_byte_timeout"),
+        "stream_idle_timeout": config.get("stream_idle_timeout", 30),
+        "stream_total_timeout": config.get("stream_total_timeout", 0),
+        "circuit_failure_threshold": config.get("circuit_failure_threshold", 5),
+        "circuit_open_seconds": config.get("circuit_open_seconds", 30),
         "reasoning_effort": config.get("reasoning_effort", "high"),
         "thinking_budget": config.get("thinking_budget", -1),
         "thinking_level": config.get("thinking_level", "high"),
         "gemini_endpoint": config.get("gemini_endpoint")
     }
-    
+
+
+def _get_provider_base_url(provider_type: str, config: Dict) -> str:
+    """Get the upstream base URL a provider type talks to"""
+    if provider_type == "custom":
+        return config.get("custom_url", "") or ""
+    if provider_type == "openrouter":
+        return "https://openrouter.ai/api/v1"
+    if provider_type == "google":
+        return config.get("gemini_endpoint") or "https://generativelanguage.googleapis.com/v1beta"
+    raise ValueError(f"Unknown provider type: {provider_type}")
+
+
+def _create_provider(provider_type: str, key_manager, provider_config: Dict, base_url: str):
+    """Construct a new provider instance for the given type"""
     if provider_type == "custom":
-        url = config.get("custom_url", "")
         return OpenAICompatibleProvider(
             endpoint_type=OpenAICompatibleProvider.ENDPOINT_CUSTOM,
-            base_url=url,
+            base_url=base_url,
             key_manager=key_manager,
             config=provider_config
         )
@@ -71,7 +84,7 @@ def get_provider_for_type(
     elif provider_type == "openrouter":
         return OpenAICompatibleProvider(
             endpoint_type=OpenAICompatibleProvider.ENDPOINT_OPENROUTER,
-            base_url="https://openrouter.ai/api/v1",
+            base_url=base_url,
             key_manager=key_manager,
             config=provider_config
         )
@@ -87,6 +100,128 @@ def get_provider_for_type(
         raise ValueError(f"Unknown provider type: {provider_type}")
 
 
+class ProviderRegistry:
+    """
+    Cache of provider instances keyed by (provider type, base URL, config version).
+    
+    Reusing instances keeps per-provider state (Gemini upload cache, pooled
+    connections, health stats) alive across requests. The config version is a
+    fingerprint of the provider settings, the key manager and its key list, so
+    editing config.ini or the API keys yields fresh instances automatically.
+    """
+    
+    # Bound on cached instances (temporary key managers, e.g. from the
+    # settings window "refresh models" button, would otherwise accumulate)
+    MAX_ENTRIES = 32
+    
+    def __init__(self):
+        self._providers: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _config_version(provider_config: Dict, key_manager) -> tuple:
+        """Fingerprint of everything a provider instance was built from"""
+        keys = getattr(key_manager, "keys", None)
+        key_list = tuple(keys) if isinstance(keys, (list, tuple)) else ()
+        return (
+            tuple(sorted((k, repr(v)) for k, v in provider_config.items())),
+            id(key_manager),
+            key_list
+        )
+    
+    def get(self, provider_type: str, key_manager, config: Dict):
+        """
+        Get a cached provider instance, creating one if the config changed.
+        
+        Args:
+            provider_type: Provider type (custom, openrouter, google)
+            key_manager: Key manager for API keys
+            config: Configuration dictionary
+        
+        Returns:
+            Provider instance
+        """
+        provider_config = _build_provider_config(config)
+        base_url = _get_provider_base_url(provider_type, config)
+        cache_key = (
+            provider_type,
+            base_url,
+            self._config_version(provider_config, key_manager)
+        )
+        
+        with self._lock:
+            provider = self._providers.get(cache_key)
+            if provider is not None:
+                self._providers.move_to_end(cache_key)
+                return provider
+            
+            provider = _create_provider(provider_type, key_manager, provider_config, base_url)
+            get_health_tracker().configure(provider_config)
+            
+            # Drop stale versions for the same key manager/provider type
+            for stale_key in [k for k in self._providers
+                              if k[0] == provider_type and k[2][1] == id(key_manager)]:
+                del self._providers[stale_key]
+            
+            self._providers[cache_key] = provider
+            while len(self._providers) > self.MAX_ENTRIES:
+                self._providers.popitem(last=False)
+            return provider
+    
+    def invalidate(self, provider_type: Optional[str] = None):
+        """
+        Drop cached instances (all, or only those of one provider type).
+        
+        Instances already handed out keep working; new calls get fresh ones.
+        """
+        with self._lock:
+            if provider_type is None:
+                self._providers.clear()
+                return
+            for cache_key in [k for k in self._providers if k[0] == provider_type]:
+                del self._providers[cache_key]
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._providers)
+
+
+# Global registry shared by all API entry points
+_PROVIDER_REGISTRY = ProviderRegistry()
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Get the global provider registry"""
+    return _PROVIDER_REGISTRY
+
+
+def invalidate_providers(provider_type: Optional[str] = None):
+    """Invalidate cached provider instances (call after config or key changes)"""
+    _PROVIDER_REGISTRY.invalidate(provider_type)
+
+
+def get_provider_for_type(
+    provider_type: str,
+    key_manager,
+    config: Dict
+):
+    """
+    Get the appropriate provider instance for the given type.
+    
+    Instances are cached in the provider registry and reused until the
+    provider config or key list changes.
+    
+    Args:
+        provider_type: Provider type (custom, openrouter, google)
+        key_manager: Key manager for API keys
+        config: Configuration dictionary
+    
+    Returns:
+        Provider instance
+    """
+    return _PROVIDER_REGISTRY.get(provider_type, key_manager, config)
+
+
 
 # ============================================================
 # BACKWARD COMPATIBILITY - Legacy function signatures
@@ -189,7 +324,9 @@ def call_api_stream_unified(
     key_managers: Dict,
     callback: Callable[[str, Any], None],
     thinking_enabled: bool = False,
-    thinking_output: str = "reasoning_content"
+    thinking_output: str = "reasoning_content",
+    cancel_token: Optional[CancellationToken] = None,
+    deadlines: Optional[Deadlines] = None
 ) -> Tuple[Optional[str], Optional[str], Optional[Dict], Optional[str]]:
     """
     Unified streaming API call using new provider classes.
@@ -204,6 +341,8 @@ def call_api_stream_unified(
         callback: Callback function (type, content)
         thinking_enabled: Enable thinking/reasoning mode
         thinking_output: How to handle thinking (filter, raw, reasoning_content)
+        cancel_token: Optional token that aborts the request
+        deadlines: Per-attempt stream deadlines (default: global config values)
     
     Returns:
         (full_text, reasoning_text, usage_data, error) tuple
@@ -220,20 +359,16 @@ def call_api_stream_unified(
     # Build params from ai_params
     params = dict(ai_params)
     
-    # Track content for the callback adapter
-    accumulated_text = ""
-    accumulated_thinking = ""
+    # Track usage for the callback adapter (content comes back in the result)
     usage_data = None
     
     def provider_callback(cb_type: CallbackType, content: Any):
-        nonlocal accumulated_text, accumulated_thinking, usage_data
+        nonlocal usage_data
         
         if cb_type == CallbackType.TEXT:
-            accumulated_text += content
             callback("text", content)
         
         elif cb_type == CallbackType.THINKING:
-            accumulated_thinking += content
             if thinking_output != "filter":
                 if thinking_output == "raw":
                     callback("text", content)
@@ -252,6 +387,9 @@ def call_api_stream_unified(
         
         elif cb_type == CallbackType.ERROR:
             callback("error", content)
+        
+        elif cb_type == CallbackType.TIMINGS:
+            callback("timings", content)
     
     # Execute streaming request via provider
     result = provider.generate_stream(
@@ -259,7 +397,9 @@ def call_api_stream_unified(
         model=model,
         params=params,
         callback=provider_callback,
-        thinking_enabled=thinking_enabled
+        thinking_enabled=thinking_enabled,
+        cancel_token=cancel_token,
+        deadlines=deadlines
     )
     
     if result.success:
@@ -294,19 +434,15 @@ def call_custom_api_stream(key_manager, url, model, messages, ai_params, timeout
         config=config
     )
     
-    # Track accumulated content
-    accumulated_text = ""
-    accumulated_thinking = ""
+    # Track usage (content comes back in the result)
     usage_data = None
     
     def provider_callback(cb_type: CallbackType, content: Any):
-        nonlocal accumulated_text, accumulated_thinking, usage_data
+        nonlocal usage_data
         
         if cb_type == CallbackType.TEXT:
-            accumulated_text += content
             callback("text", content)
         elif cb_type == CallbackType.THINKING:
-            accumulated_thinking += content
             if thinking_output != "filter":
                 if thinking_output == "raw":
                     callback("text", content)
@@ -373,15 +509,21 @@ def extract_text_from_response(response_json, provider):
         return None
 
 
-def call_api_with_retry(provider, messages, model_override, config, ai_params, key_managers):
+def call_api_result(provider, messages, model_override, config, ai_params, key_managers,
+                    thinking_enabled=None) -> ProviderResult:
     """
-    Call API with retry logic and key rotation.
+    Non-streaming call returning the provider's full result.
+    
+    Unlike call_api_with_retry this keeps thinking content, real token usage,
+    the retry count and timings. Setup problems (no keys, no model, provider
+    errors) come back as an unsuccessful ProviderResult.
     
-    REFACTORED: Now uses provider classes for consistent retry behavior.
+    thinking_enabled overrides the config's thinking_enabled for this call
+    (None = use the config).
     """
     key_manager = key_managers.get(provider)
     if not key_manager or not key_manager.has_keys():
-        return None, f"No API keys configured for provider: {provider}"
+        return ProviderResult(success=False, error=f"No API keys configured for provider: {provider}")
     
     # Determine model
     if model_override:
@@ -396,7 +538,7 @@ def call_api_with_retry(provider, messages, model_override, config, ai_params, k
         model = None
     
     if not model:
-        return None, f"No model configured for provider: {provider}"
+        return ProviderResult(success=False, error=f"No model configured for provider: {provider}")
     
     # Create provider and execute
     try:
@@ -404,22 +546,31 @@ def call_api_with_retry(provider, messages, model_override, config, ai_params, k
         
         params = dict(ai_params)
         
-        thinking_enabled = config.get("thinking_enabled", False)
+        if thinking_enabled is None:
+            thinking_enabled = config.get("thinking_enabled", False)
         
-        result = prov.generate(
+        return prov.generate(
             messages=messages,
             model=model,
             params=params,
             thinking_enabled=thinking_enabled
         )
-        
-        if result.success:
-            return result.content, None
-        else:
-            return None, result.error
     
     except Exception as e:
-        return None, f"Provider error: {e}"
+        return ProviderResult(success=False, error=f"Provider error: {e}")
+
+
+def call_api_with_retry(provider, messages, model_override, config, ai_params, key_managers):
+    """
+    Call API with retry logic and key rotation.
+    
+    Returns:
+        (text, error) tuple; see call_api_result for usage and thinking
+    """
+    result = call_api_result(provider, messages, model_override, config, ai_params, key_managers)
+    if result.success:
+        return result.content, None
+    return None, result.error
 
 
 def call_api_simple(provider, prompt, image_base64, mime_type, model_override, config, ai_params, key_managers):
@@ -460,7 +611,7 @@ def call_api_chat(session, config, ai_params, key_managers, provider_override=No
     return call_api_with_retry(provider, messages, model, config, ai_params, key_managers)
 
 
-def call_api_chat_stream(session, config, ai_params, key_managers, callback, provider_override=None, model_override=None, system_instruction=None):
+def call_api_chat_stream(session, config, ai_params, key_managers, callback, provider_override=None, model_override=None, system_instruction=None, cancel_token=None, deadlines=None):
     """
     API call for chat session with streaming support.
     Uses current config settings for provider/model, not session-stored values.
@@ -476,6 +627,8 @@ def call_api_chat_stream(session, config, ai_params, key_managers, callback, pro
         provider_override: Optional provider override
         model_override: Optional model override
         system_instruction: Optional system instruction to prepend
+        cancel_token: Optional CancellationToken that aborts the request
+        deadlines: Optional per-attempt stream Deadlines
     """
     messages = session.get_conversation_for_api(include_image=True)
     
@@ -513,7 +666,9 @@ def call_api_chat_stream(session, config, ai_params, key_managers, callback, pro
         key_managers=key_managers,
         callback=callback,
         thinking_enabled=thinking_enabled,
-        thinking_output=thinking_output
+        thinking_output=thinking_output,
+        cancel_token=cancel_token,
+        deadlines=deadlines
     )
 
 
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Cooperative cancellation for in-flight API requests
+
+A CancellationToken is handed to a provider call. Cancelling it closes the
+registered HTTP response (unblocking the stream read), stops the SSE loop at
+the next chunk and keeps the retry loop from starting another attempt.
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+
+# ProviderResult.error of a request stopped by its token
+CANCELLED_ERROR = "Request cancelled"
+
+
+class CancellationToken:
+    """Thread-safe, one-shot cancellation flag with close callbacks"""
+
+    __slots__ = ("_event", "_lock", "_callbacks", "reason")
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancel the request; callbacks run once, on the cancelling thread"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Register callback to run on cancel (immediately if already cancelled).
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until cancelled or timeout; returns whether cancelled"""
+        return self._event.wait(timeout)
+
+    def _discard(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
@@ -10,6 +10,7 @@ from pathlib import Path
 # Configuration file paths
 CONFIG_FILE = "config.ini"
 SESSIONS_FILE = "chat_sessions.json"
+USAGE_LEDGER_FILE = "usage_ledger.db"
 
 # Import endpoint prompts from unified prompts module
 # This avoids circular imports by using a late import pattern
@@ -32,7 +33,62 @@ DEFAULT_CONFIG = {
     "gemini_endpoint": None,
     "max_retries": 3,
     "retry_delay": 5,
+    # Exponential backoff cap and overall retry budget (seconds)
+    "retry_max_delay": 30,
+    "retry_deadline": 300,
     "request_timeout": 120,
+    # Pooled keep-alive connections per upstream base URL
+    "http_pool_size": 10,
+    # Streaming deadlines (seconds): connect, request -> first body byte
+    # (empty = request_timeout), longest gap between chunks, whole attempt
+    # (0 = none); origin_deadlines overrides them per request origin
+    "connect_timeout": 10,
+    "stream_first_byte_timeout": None,
+    "stream_idle_timeout": 30,
+    "stream_total_timeout": 0,
+    "origin_deadlines": None,
+    # Per-key request budget (requests/minute, 0 = unlimited) and the
+    # cooldown (seconds) after a 429 that carries no Retry-After
+    "key_rpm_limit": 0,
+    "key_cooldown": 30,
+    # Concurrent requests per key (0 = unlimited) and how long a request
+    # waits for a free key when all are busy (seconds)
+    "key_max_concurrency": 0,
+    "key_queue_timeout": 60,
+    # Circuit breaker per provider+model: consecutive 5xx/timeout/network
+    # failures that open it, and how long it stays open (seconds)
+    "circuit_failure_threshold": 5,
+    "circuit_open_seconds": 30,
+    # Providers tried in order when the selected one fails or its circuit
+    # is open (comma-separated provider types); empty = no fallback
+    "provider_fallback_chain": None,
+    # Concurrent requests of one RequestPipeline.execute_batch call
+    "batch_concurrency": 4,
+    # Images accepted by one POST /<endpoint>/batch request
+    "batch_max_images": 100,
+    # Middleware stages around every pipeline request, in order: registered
+    # names (e.g. cache, metrics) or module:factory paths; empty = none
+    "pipeline_middleware": None,
+    # Response cache ("cache" stage): memory LRU entries, entry lifetime
+    # (seconds, 0 = forever), optional disk tier directory and its size
+    # limit (MB), and whether requests without a per-action "cache" setting
+    # in prompts.json are cached
+    "response_cache_size": 256,
+    "response_cache_ttl": 86400,
+    "response_cache_dir": None,
+    "response_cache_disk_mb": 100,
+    "response_cache_default": False,
+    # Request log records are queued and rendered by a background writer:
+    # console (rich panels), jsonl (one JSON object per line to
+    # request_log_file, empty = stdout) or off; records beyond
+    # request_log_queue_size pending are dropped
+    "request_log_format": "console",
+    "request_log_file": None,
+    "request_log_queue_size": 1000,
+    # SQLite usage ledger (empty = off) and optional prices per model glob,
+    # USD per million input/output tokens: "gemini-2.5-flash: 0.30/2.50"
+    "usage_ledger_file": USAGE_LEDGER_FILE,
+    "usage_prices": None,
     "max_sessions": 50,
     # Show AI response in chat window: yes or no
     # This controls whether responses appear in a GUI window or are typed directly.
@@ -44,6 +100,17 @@ DEFAULT_CONFIG = {
     "streaming_enabled": True,
     "thinking_enabled": False,
     "thinking_output": "reasoning_content",  # filter, raw, or reasoning_content
+    # Batch streamed deltas for up to N ms (or N chars) per callback, 0 = off
+    "stream_coalesce_ms": 30,
+    "stream_coalesce_chars": 1024,
+    # Hedged requests: origins (origin[:percentile], comma-separated) that fire
+    # a duplicate request when no first token arrives within the percentile
+    # of recent time-to-first-token; empty = off
+    "hedge_origins": None,
+    "hedge_percentile": 90,
+    "hedge_delay": 2.0,
+    "hedge_min_delay": 0.5,
+    "hedge_provider": None,
     # Thinking configuration (per JSON-request-reference.md)
     # - reasoning_effort: For OpenAI-compatible APIs ("low", "medium", "high")
     # - thinking_budget: For Gemini 2.5 models (integer tokens, -1 = auto/unlimited)
@@ -70,6 +137,20 @@ DEFAULT_CONFIG = {
     # When disabled, endpoints from prompts.json are not registered
     # Default: False (use built-in screen snipping instead)
     "flask_endpoints_enabled": False,
+    # Background jobs for endpoints: POST /jobs/<endpoint> (see jobs.py)
+    "jobs_workers": 2,
+    "jobs_queue_size": 32,
+    "jobs_ttl": 3600,
+    "jobs_memory": 100,
+    "jobs_dir": None,
+    "jobs_max_wait": 60,
+    # Admission control for upstream calls (0 = unlimited)
+    "admission_max_concurrent": 0,
+    "admission_queue_size": 64,
+    "admission_queue_timeout": 30,
+    # OpenAI-compatible /v1/chat/completions gateway (see gateway.py)
+    "gateway_enabled": False,
+    "gateway_api_key": None,  # Required as "Authorization: Bearer <key>" when set
     # UI Theme settings
     # Available themes: catppuccin, dracula, nord, gruvbox, onedark, minimal, highcontrast
     "ui_theme": "dracula",
@@ -287,8 +368,91 @@ google_model = gemma-3-27b-it
 # Retry settings
 max_retries = 3
 retry_delay = 5
+# Backoff doubles per attempt (with jitter) up to retry_max_delay seconds;
+# retries stop once retry_deadline seconds have elapsed
+retry_max_delay = 30
+retry_deadline = 300
 request_timeout = 120
 
+# Keep-alive connections pooled per upstream API (shared across requests)
+http_pool_size = 10
+
+# Streaming deadlines (seconds). A stream that connects too slowly, sends no
+# data within stream_first_byte_timeout (default: request_timeout), stalls for
+# stream_idle_timeout between chunks, or runs past stream_total_timeout
+# (0 = no limit) is closed and retried on another key.
+connect_timeout = 10
+stream_idle_timeout = 30
+stream_total_timeout = 0
+# stream_first_byte_timeout = 60
+# Per-origin overrides (fields: connect, first_byte, idle, total):
+# origin_deadlines = popup_prompt: first_byte=15, idle=10; endpoint/ocr: total=300
+
+# API key scheduling: each key gets key_rpm_limit requests per minute
+# (0 = unlimited) and rests key_cooldown seconds after a 429 unless the
+# server says otherwise via Retry-After. Keys rejected with 401/403 are
+# taken out of rotation until restart or settings reload.
+key_rpm_limit = 0
+key_cooldown = 30
+
+# At most key_max_concurrency requests run on one key at a time (0 = unlimited).
+# When every key is busy, requests queue for up to key_queue_timeout seconds.
+key_max_concurrency = 0
+key_queue_timeout = 60
+
+# Provider health: after circuit_failure_threshold consecutive server errors,
+# timeouts or network failures for a provider+model, its circuit opens and
+# requests fail immediately for circuit_open_seconds (doubling while the
+# provider keeps failing). Requests then fall through provider_fallback_chain
+# to the next provider with keys, using its <provider>_model.
+circuit_failure_threshold = 5
+circuit_open_seconds = 30
+# provider_fallback_chain = google, openrouter, custom
+
+# Non-streaming batches (RequestPipeline.execute_batch, POST
+# /<endpoint>/batch) run this many requests at once; key_max_concurrency
+# still applies per key
+batch_concurrency = 4
+# Images accepted by one POST /<endpoint>/batch request (files or zip)
+batch_max_images = 100
+
+# Pipeline middleware: stages that run around every request (before the
+# call, on each streamed delta, after success / on error), in this order.
+# Built-in: cache (response cache, below), metrics (per-origin counts and
+# latency in /health) and singleflight (identical requests in flight at the
+# same time share one upstream call; list it before delta-rewriting stages).
+# Custom stages are loaded as module:factory, e.g. mypackage.stages:make_stage
+# pipeline_middleware = singleflight, cache, metrics
+
+# Response cache: repeats of the exact same request (provider, model,
+# parameters, messages and images) are answered locally. Only actions with
+# "cache": true in prompts.json (and endpoints listed in cached_endpoints)
+# are cached, unless response_cache_default is on. Entries live in memory
+# (response_cache_size, least recently used evicted) and, with
+# response_cache_dir set, on disk up to response_cache_disk_mb. Entries
+# expire after response_cache_ttl seconds (0 = never).
+response_cache_size = 256
+response_cache_ttl = 86400
+# response_cache_dir = response_cache
+response_cache_disk_mb = 100
+response_cache_default = 0
+
+# Request logging: request panels are rendered by a background writer so
+# requests never wait on the console. request_log_format = console (rich
+# panels), jsonl (compact JSON lines for log shippers) or off.
+# request_log_file is the JSONL destination (empty = stdout). When more than
+# request_log_queue_size records are waiting, new ones are dropped.
+request_log_format = console
+# request_log_file = requests.jsonl
+request_log_queue_size = 1000
+
+# Usage ledger: every finished request (origin, provider, model, key, tokens,
+# latency, success) is stored in this SQLite file and served by /usage
+# (?group=day|model|key|origin|provider&days=30). Leave empty to disable.
+usage_ledger_file = usage_ledger.db
+# Cost per model (glob patterns), USD per million input/output tokens:
+# usage_prices = gemini-2.5-flash: 0.30/2.50; gpt-5*: 1.25/10
+
 # Session management
 max_sessions = 50
 
@@ -312,6 +476,23 @@ thinking_enabled = false
 # - reasoning_content: Separate field (for collapsible display)
 thinking_output = reasoning_content
 
+# Batch streamed text for up to this many milliseconds (or characters) before
+# updating the chat window / typing engine. 0 = deliver every delta as-is
+stream_coalesce_ms = 30
+stream_coalesce_chars = 1024
+
+# Hedged requests for latency-critical origins (popup_prompt, snip_tool, ...).
+# If no first token arrives within the hedge_percentile of recent
+# time-to-first-token (hedge_delay until enough samples exist, never below
+# hedge_min_delay), a duplicate request is fired on another key - or on
+# hedge_provider if set - and the slower stream is cancelled.
+# Per-origin percentile: hedge_origins = popup_prompt:95, snip_tool
+# hedge_origins = popup_prompt, snip_tool
+hedge_percentile = 90
+hedge_delay = 2.0
+hedge_min_delay = 0.5
+# hedge_provider = openrouter
+
 # Thinking configuration (for different providers)
 # - reasoning_effort: OpenAI-compatible APIs (low, medium, high)
 # - thinking_budget: Gemini 2.5 models (integer tokens, -1 = auto/unlimited)
@@ -360,6 +541,37 @@ screen_snip_hotkey = ctrl+shift+x
 # Endpoint prompts are defined in prompts.json (endpoints section)
 flask_endpoints_enabled = false
 
+# Background jobs: POST /jobs/<endpoint> returns a job id at once and runs
+# the request on jobs_workers threads; GET /jobs/<id>?wait=30 long-polls for
+# status, partial text and usage. At most jobs_queue_size jobs wait for a
+# worker (more are refused with 503). Results are kept for jobs_ttl seconds,
+# the newest jobs_memory of them in memory and older ones in jobs_dir (if set)
+jobs_workers = 2
+jobs_queue_size = 32
+jobs_ttl = 3600
+jobs_memory = 100
+# jobs_dir = jobs
+jobs_max_wait = 60
+
+# Admission control: at most admission_max_concurrent upstream calls run at
+# once (0 = unlimited). Interactive GUI requests go first, then endpoint and
+# gateway requests, then batch items and background jobs. When
+# admission_queue_size requests are already waiting, new endpoint / gateway
+# requests are refused with 429; one that waits admission_queue_timeout
+# seconds gets a 503. Both carry a Retry-After header.
+admission_max_concurrent = 0
+admission_queue_size = 64
+admission_queue_timeout = 30
+
+# OpenAI-compatible gateway: POST /v1/chat/completions routes OpenAI-format
+# requests (stream: true supported) through the request pipeline, using the
+# provider keys, retries and fallback configured here. The provider comes
+# from the "provider" field or X-API-Provider header (default_provider
+# otherwise); an empty model uses <provider>_model.
+gateway_enabled = false
+# When set, clients must send "Authorization: Bearer <gateway_api_key>"
+# gateway_api_key =
+
 # ============================================================
 # UI THEME SETTINGS
 # ============================================================
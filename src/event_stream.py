@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Server-Sent Events responses for Flask endpoints
+
+A Flask handler that blocks on execute_simple holds its client until the
+whole answer is back. EventStream instead runs the request on a worker
+thread and turns its StreamCallback events into an SSE response:
+
+    event: thinking   data: {"text": "..."}
+    event: text       data: {"text": "..."}
+    event: usage      data: {"prompt_tokens": ..., "completion_tokens": ..., ...}
+    event: done       data: {"text": "<full answer>", "elapsed": 1.23, ...}
+    event: error      data: {"error": "...", "elapsed": 1.23}
+
+A keep-alive comment is written whenever nothing was sent for
+KEEPALIVE_INTERVAL seconds, so proxies keep the connection open and a client
+that went away is noticed even while the model is still thinking. When the
+client disconnects, the server closes the response generator and the
+request's cancel token is cancelled, which closes the upstream stream.
+
+Note: the provider's SSE decoder lives in providers/sse.py.
+"""
+
+import json
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+from flask import Response
+
+from .cancellation import CancellationToken
+from .request_pipeline import StreamCallback
+
+# Seconds without an event before a keep-alive comment is written
+KEEPALIVE_INTERVAL = 15.0
+
+DISCONNECT_REASON = "client disconnected"
+
+_TRUE = ("1", "true", "yes", "on")
+_END = object()  # Queue sentinel: the worker finished
+
+
+def wants_stream(request) -> bool:
+    """Whether a Flask request asked for SSE (?stream=1 or Accept: text/event-stream)"""
+    stream = request.args.get("stream")
+    if stream is not None:
+        return stream.lower() in _TRUE
+    return "text/event-stream" in (request.headers.get("Accept") or "")
+
+
+def format_event(event: str, data: Any) -> str:
+    """One SSE message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventStream:
+    """
+    Queue between a request running on a worker thread and the SSE response
+    generator that drains it on the Flask thread.
+    """
+
+    def __init__(
+        self,
+        keepalive: float = KEEPALIVE_INTERVAL,
+        formatter: Callable[[str, Any], str] = format_event
+    ):
+        self.keepalive = keepalive
+        self.formatter = formatter  # (event, data) -> SSE text
+        self.cancel_token = CancellationToken()
+        self._queue: "queue.Queue" = queue.Queue()
+
+    def send(self, event: str, data: Any):
+        """Queue an event (thread-safe)"""
+        self._queue.put((event, data))
+
+    def stream_callback(self) -> StreamCallback:
+        """StreamCallback forwarding thinking, text, usage and tool calls"""
+        return StreamCallback(
+            on_text=lambda text: self.send("text", {"text": text}),
+            on_thinking=lambda text: self.send("thinking", {"text": text}),
+            on_usage=lambda usage: self.send("usage", usage),
+            on_tool_calls=lambda calls: self.send("tool_calls", {"tool_calls": calls}),
+        )
+
+    def run(self, target: Callable[["EventStream"], None], name: str = "EventStream") -> Iterator[str]:
+        """
+        Start target(self) on a worker thread and yield its events as SSE
+        text until it returns. Closing the generator early (client
+        disconnect) cancels self.cancel_token.
+        """
+        def work():
+            try:
+                target(self)
+            except Exception as e:
+                self.send("error", {"error": f"Unexpected error: {e}"})
+            finally:
+                self._queue.put(_END)
+
+        threading.Thread(target=work, name=name, daemon=True).start()
+        finished = False
+        try:
+            # Flushes headers right away, before the first token arrives
+            yield ": stream open\n\n"
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.keepalive)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is _END:
+                    finished = True
+                    return
+                yield self.formatter(*item)
+        finally:
+            if not finished:
+                self.cancel_token.cancel(DISCONNECT_REASON)
+
+    def response(self, target: Callable[["EventStream"], None], name: str = "EventStream") -> Response:
+        """Flask streaming response for run(target)"""
+        return Response(self.run(target, name), mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disables nginx response buffering
+        })
+
+
+def result_event(ctx) -> Tuple[str, Dict[str, Any]]:
+    """Final (event, data) for a completed RequestContext: done or error"""
+    if ctx.error:
+        return "error", {"error": ctx.error, "elapsed": ctx.elapsed_time}
+    data: Dict[str, Any] = {
+        "text": ctx.response_text,
+        "elapsed": ctx.elapsed_time,
+        "usage": {
+            "prompt_tokens": ctx.input_tokens,
+            "completion_tokens": ctx.output_tokens,
+            "total_tokens": ctx.total_tokens,
+            "estimated": ctx.estimated,
+        },
+    }
+    if ctx.reasoning_text:
+        data["thinking"] = ctx.reasoning_text
+    if ctx.served_by:
+        data["served_by"] = ctx.served_by
+    return "done", data
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+OpenAI-compatible Gateway
+
+POST /v1/chat/completions accepts an OpenAI chat completions request and
+runs it through RequestPipeline, so other tools pointed at AIPromptBridge
+use its providers, key scheduling, retries, fallback chain, middleware and
+pooled connections - and show up in the request log and usage ledger with
+origin "gateway".
+
+Request fields:
+    messages            OpenAI format, passed to the provider as is
+    model               empty = <provider>_model from config
+    provider            google / openrouter / custom (or the X-API-Provider
+                        header); default_provider otherwise
+    stream              true = SSE chat.completion.chunk stream ending in
+                        data: [DONE]; stream_options.include_usage adds the
+                        usage chunk
+    reasoning_effort    any value but "none" enables thinking (its level
+                        comes from config); otherwise thinking_enabled applies
+    temperature, top_p, max_tokens, stop, tools, tool_choice, ...
+                        see PASSTHROUGH_PARAMS; they override the configured
+                        ai_params for this request
+
+Streamed deltas are re-encoded from the pipeline's events rather than
+copied from the upstream stream, so every provider - including Gemini's
+native API - streams the same format. Tool call deltas are passed through
+as the provider sent them.
+
+Config:
+    gateway_enabled = true
+    gateway_api_key = secret   # clients send "Authorization: Bearer secret"
+"""
+
+import hmac
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import Blueprint, jsonify, request
+
+from .event_stream import EventStream
+from .request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+# Request fields forwarded to the provider as generation parameters
+PASSTHROUGH_PARAMS = (
+    "temperature", "top_p", "top_k", "max_tokens", "max_completion_tokens", "stop",
+    "presence_penalty", "frequency_penalty", "seed", "logit_bias", "user",
+    "tools", "tool_choice", "parallel_tool_calls", "response_format",
+)
+
+# Global state - initialized by web_server.init_web_server
+CONFIG: Dict = {}
+AI_PARAMS: Dict = {}
+KEY_MANAGERS: Dict = {}
+
+gateway = Blueprint("gateway", __name__)
+
+
+def init_gateway(config: Dict, ai_params: Dict, key_managers: Dict):
+    """Share the server's configuration and key managers with the gateway"""
+    global CONFIG, AI_PARAMS, KEY_MANAGERS
+    CONFIG = config
+    AI_PARAMS = ai_params
+    KEY_MANAGERS = key_managers
+
+
+def error_response(message: str, status: int, error_type: str = "invalid_request_error",
+                   headers: Optional[Dict[str, str]] = None):
+    """OpenAI-style error body"""
+    return jsonify({"error": {"message": message, "type": error_type, "code": status}}), status, headers or {}
+
+
+def _authorized() -> bool:
+    expected = CONFIG.get("gateway_api_key")
+    if not expected:
+        return True
+    header = request.headers.get("Authorization", "")
+    token = header[7:] if header.startswith("Bearer ") else ""
+    return hmac.compare_digest(token.encode("utf-8"), str(expected).encode("utf-8"))
+
+
+def parse_request(body: Any) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate a chat completions body against the configured providers.
+
+    Returns:
+        (settings, None) with provider, model, messages, stream, thinking,
+        include_usage and ai_params - or (None, error message)
+    """
+    if not isinstance(body, dict):
+        return None, "Request body must be a JSON object"
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return None, "'messages' must be a non-empty list"
+
+    provider = str(body.get("provider") or request.headers.get("X-API-Provider")
+                   or CONFIG.get("default_provider", "google")).lower()
+    if provider not in KEY_MANAGERS:
+        return None, f"Unknown provider '{provider}' (available: {', '.join(sorted(KEY_MANAGERS))})"
+    model = body.get("model") or CONFIG.get(f"{provider}_model")
+    if not model:
+        return None, f"No model given and {provider}_model is not configured"
+
+    effort = body.get("reasoning_effort")
+    thinking = str(effort).lower() != "none" if effort is not None else CONFIG.get("thinking_enabled", False)
+
+    ai_params = dict(AI_PARAMS)
+    ai_params.update((key, body[key]) for key in PASSTHROUGH_PARAMS if body.get(key) is not None)
+
+    stream_options = body.get("stream_options") or {}
+    return {
+        "provider": provider,
+        "model": model,
+        "messages": messages,
+        "stream": bool(body.get("stream")),
+        "include_usage": bool(stream_options.get("include_usage")),
+        "thinking": bool(thinking),
+        "ai_params": ai_params,
+    }, None
+
+
+def _usage(ctx) -> Dict[str, int]:
+    return {
+        "prompt_tokens": ctx.input_tokens,
+        "completion_tokens": ctx.output_tokens,
+        "total_tokens": ctx.total_tokens,
+    }
+
+
+def completion_body(ctx, created: int) -> Dict:
+    """chat.completion object for a finished non-streaming request"""
+    message: Dict[str, Any] = {"role": "assistant", "content": ctx.response_text}
+    if ctx.reasoning_text:
+        message["reasoning_content"] = ctx.reasoning_text
+    if ctx.tool_calls:
+        message["tool_calls"] = ctx.tool_calls
+    return {
+        "id": f"chatcmpl-{ctx.request_id}",
+        "object": "chat.completion",
+        "created": created,
+        "model": ctx.model,
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if ctx.tool_calls else "stop",
+        }],
+        "usage": _usage(ctx),
+    }
+
+
+def format_chunk(event: str, data: Any) -> str:
+    """EventStream formatter: data-only SSE lines, "[DONE]" for the done event"""
+    if event == "done":
+        return "data: [DONE]\n\n"
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ChunkWriter:
+    """Turns pipeline stream events into chat.completion.chunk events"""
+
+    def __init__(self, stream: EventStream, ctx, created: int):
+        self.stream = stream
+        self.ctx = ctx
+        self.created = created
+        self.role_sent = False
+
+    def chunk(self, delta: Optional[Dict], finish_reason: Optional[str] = None, usage=None) -> Dict:
+        body = {
+            "id": f"chatcmpl-{self.ctx.request_id}",
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.ctx.model,
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            body["usage"] = usage
+        return body
+
+    def delta(self, **fields):
+        if not self.role_sent:
+            fields = dict(role="assistant", **fields)
+            self.role_sent = True
+        self.stream.send("chunk", self.chunk(fields))
+
+    def callbacks(self) -> StreamCallback:
+        return StreamCallback(
+            on_text=lambda text: self.delta(content=text),
+            on_thinking=lambda text: self.delta(reasoning_content=text),
+            on_tool_calls=lambda calls: self.delta(tool_calls=calls),
+        )
+
+    def finish(self, include_usage: bool):
+        ctx = self.ctx
+        if ctx.error:
+            self.stream.send("error", {"error": {"message": ctx.error, "type": "upstream_error", "code": 502}})
+        else:
+            self.stream.send("chunk", self.chunk({} if self.role_sent else {"role": "assistant", "content": ""},
+                                                 "tool_calls" if ctx.tool_calls else "stop"))
+            if include_usage:
+                self.stream.send("chunk", self.chunk(None, usage=_usage(ctx)))
+        self.stream.send("done", None)
+
+
+@gateway.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    """OpenAI-compatible chat completions routed through RequestPipeline"""
+    if not _authorized():
+        return error_response("Invalid API key", 401, "authentication_error")
+    settings, error = parse_request(request.get_json(silent=True))
+    if error:
+        return error_response(error, 400)
+
+    created = int(time.time())
+    ctx = create_request_context(
+        RequestOrigin.GATEWAY,
+        settings["provider"],
+        settings["model"],
+        streaming=settings["stream"],
+        thinking_enabled=settings["thinking"]
+    )
+    messages: List[Dict] = settings["messages"]
+    ai_params = settings["ai_params"]
+
+    if settings["stream"]:
+        stream = EventStream(formatter=format_chunk)
+        writer = ChunkWriter(stream, ctx, created)
+
+        def run(stream):
+            RequestPipeline.execute_unified_stream(
+                ctx, messages, CONFIG, ai_params, KEY_MANAGERS, writer.callbacks(),
+                cancel_token=stream.cancel_token
+            )
+            writer.finish(settings["include_usage"])
+
+        return stream.response(run, name="Gateway")
+
+    ctx = RequestPipeline.execute_simple(ctx, messages, CONFIG, ai_params, KEY_MANAGERS)
+    if ctx.rejected_status:
+        return error_response(ctx.error, ctx.rejected_status, "rate_limit_error",
+                              {"Retry-After": str(ctx.retry_after)})
+    if ctx.error:
+        return error_response(ctx.error, 502, "upstream_error")
+    return jsonify(completion_body(ctx, created))
@@ -27,6 +27,9 @@ import tkinter as tk
 from typing import Optional, Callable, Any
 from dataclasses import dataclass, field
 
+from ..cancellation import CancellationToken
+from ..text_buffer import TextBuffer
+
 # Import CustomTkinter with fallback
 from .platform import HAVE_CTK, ctk
 
@@ -53,6 +56,8 @@ class StreamingChatCallbacks:
     on_done: Optional[Callable[[], None]] = None
     window: Any = None  # Reference to the AttachedChatWindow
     ready: threading.Event = field(default_factory=threading.Event)
+    # Cancelled when the window is closed mid-stream
+    cancel_token: CancellationToken = field(default_factory=CancellationToken)
     
     def finalize(self, response_text: str, thinking_text: str = ""):
         """
@@ -81,8 +86,8 @@ class StreamingChatCallbacks:
                 self.window._update_status("✅ Response received", self.window.theme.accent_green)
                 
                 # Reset streaming state
-                self.window.streaming_text = ""
-                self.window.streaming_thinking = ""
+                self.window.streaming_text = TextBuffer()
+                self.window.streaming_thinking = TextBuffer()
             
             self.window._safe_after(0, do_finalize)
 
@@ -331,8 +336,9 @@ class GUICoordinator:
             
             # Put window in streaming mode
             window.is_streaming = True
-            window.streaming_text = ""
-            window.streaming_thinking = ""
+            window.streaming_text = TextBuffer()
+            window.streaming_thinking = TextBuffer()
+            window.cancel_token = callbacks.cancel_token
             
             # Show initial streaming indicator
             window._update_streaming_display()
@@ -341,13 +347,13 @@ class GUICoordinator:
             def on_text(content):
                 if window._destroyed:
                     return
-                window.streaming_text += content
+                window.streaming_text.append(content)
                 window._safe_after(0, window._update_streaming_display)
             
             def on_thinking(content):
                 if window._destroyed:
                     return
-                window.streaming_thinking += content
+                window.streaming_thinking.append(content)
                 window._safe_after(0, window._update_streaming_display)
             
             def on_done():
@@ -42,6 +42,11 @@ Per-Action Options (new structure):
   - prompt_type: "edit" or "general" - determines which output rules to use
   - show_chat_window_instead_of_replace: Whether to show result in chat window
   - icon: Icon to display in the popup (optional)
+  - cache: Answer repeats of the exact same request from the response cache
+    (needs "cache" in pipeline_middleware; omitted = response_cache_default)
+
+Endpoints _settings:
+  - cached_endpoints: Endpoint names whose requests use the response cache
 
 """
 
@@ -211,7 +216,8 @@ DEFAULT_TEXT_EDIT_ACTIONS = {
         "prompt_type": "general",
         "system_prompt": "You are a summarization expert who distills text to its essential points.\n\n<format>\n- Use Markdown: bold for key terms, bullet points for main ideas.\n- Add line spacing between logical sections.\n- Use small headings (###) only if the content has distinct sections.\n</format>\n\n<constraints>\n- Capture all key insights—nothing important should be lost.\n- Be succinct but not cryptic.\n- Never add information not present in the original.\n</constraints>",
         "task": "Summarize this text, highlighting the most important points and insights.",
-        "show_chat_window_instead_of_replace": True
+        "show_chat_window_instead_of_replace": True,
+        "cache": True
     },
     "Key Points": {
         "icon": "🔑",
@@ -225,7 +231,8 @@ DEFAULT_TEXT_EDIT_ACTIONS = {
         "prompt_type": "edit",
         "system_prompt": "You are a meticulous proofreader with expertise in grammar, spelling, and punctuation.\n\n<constraints>\n- Preserve the original structure, formatting, and writing style.\n- Only correct errors; do not rewrite or rephrase.\n- If the text is already correct, return it unchanged.\n</constraints>",
         "task": "Proofread the following text. Correct any grammar, spelling, or punctuation errors while preserving the original voice.",
-        "show_chat_window_instead_of_replace": False
+        "show_chat_window_instead_of_replace": False,
+        "cache": True
     },
     "Refine": {
         "icon": "✨",
@@ -471,7 +478,8 @@ DEFAULT_SNIP_ACTIONS = {
 # =============================================================================
 
 DEFAULT_ENDPOINTS_SETTINGS = {
-    "description": "Flask API endpoints for external tools like ShareX. Enabled via flask_endpoints_enabled in config.ini."
+    "description": "Flask API endpoints for external tools like ShareX. Enabled via flask_endpoints_enabled in config.ini.",
+    "cached_endpoints": ["ocr"]
 }
 
 DEFAULT_ENDPOINTS = {
@@ -678,6 +686,11 @@ class PromptsConfig:
         """Get complete endpoints configuration (including _settings)."""
         return self._config.get("endpoints", {})
     
+    def get_endpoint_setting(self, key: str, default=None):
+        """Get a setting from endpoints _settings."""
+        settings = self.get_endpoints().get("_settings", {})
+        return settings.get(key, DEFAULT_ENDPOINTS_SETTINGS.get(key, default))
+    
     def get_endpoint_prompts(self) -> dict:
         """Get endpoint prompts (excluding _settings)."""
         endpoints = self.get_endpoints()
@@ -2148,11 +2148,13 @@ class SettingsWindow:
                                     key_strings.append(key_str)
                             elif kd:
                                 key_strings.append(str(kd))
-                        web_server.KEY_MANAGERS[provider].keys = key_strings
-                        web_server.KEY_MANAGERS[provider].current_index = 0
-                        web_server.KEY_MANAGERS[provider].exhausted_keys.clear()
+                        web_server.KEY_MANAGERS[provider].reload_keys(key_strings, self.config_data.config)
                         print(f"[Settings] Reloaded {len(key_strings)} {provider} API key(s)")
                 
+                # Drop cached provider instances built from the old config/keys
+                from ..api_client import invalidate_providers
+                invalidate_providers()
+                
                 # Hot-reload endpoints without restart
                 for endpoint_name, prompt in self.config_data.endpoints.items():
                     web_server.ENDPOINTS[endpoint_name] = prompt
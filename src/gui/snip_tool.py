@@ -239,6 +239,7 @@ class SnipToolApp:
             active_modifiers = []
         
         try:
+            cache = None
             # Handle File Processor source separately
             if source == "file_processor":
                 system_prompt, task = self._get_file_processor_prompt(action_key)
@@ -252,6 +253,8 @@ class SnipToolApp:
                     settings = self.prompts.get_snip_tool().get("_settings", {})
                 
                 action = actions.get(action_key, {})
+                # Per-action response cache opt-in (see response_cache.py)
+                cache = action.get("cache")
                 
                 # Build prompt
                 system_prompt = action.get("system_prompt", "You are an AI assistant analyzing images.")
@@ -307,7 +310,8 @@ class SnipToolApp:
                 messages=messages,
                 window_title=window_title,
                 origin=RequestOrigin.SNIP_TOOL,
-                compare_capture=compare_capture
+                compare_capture=compare_capture,
+                cache=cache
             )
             
             print(f"{'─'*60}\n")
@@ -412,7 +416,8 @@ class SnipToolApp:
         messages: List[Dict[str, Any]],
         window_title: str,
         origin,
-        compare_capture: Optional[CaptureResult] = None
+        compare_capture: Optional[CaptureResult] = None,
+        cache: Optional[bool] = None
     ):
         """
         Open a chat window and stream API response into it.
@@ -422,6 +427,7 @@ class SnipToolApp:
             window_title: Title for the chat window
             origin: RequestOrigin for logging
             compare_capture: Optional second capture for comparison mode
+            cache: Per-action response cache setting (None = response_cache_default)
         """
         from .core import GUICoordinator
         from ..session_manager import ChatSession
@@ -501,7 +507,8 @@ class SnipToolApp:
                 provider=provider,
                 model=self.config.get(f"{provider}_model"),
                 streaming=True,
-                thinking_enabled=self.config.get("thinking_enabled", False)
+                thinking_enabled=self.config.get("thinking_enabled", False),
+                cache=cache
             )
             
             # Stream callbacks
@@ -532,9 +539,13 @@ class SnipToolApp:
                 self.config,
                 self.ai_params,
                 self.key_managers,
-                stream_callbacks
+                stream_callbacks,
+                cancel_token=callbacks.cancel_token  # Cancelled when the window closes
             )
             
+            if ctx.cancelled:
+                return
+            
             if ctx.error:
                 logging.error(f'Streaming to chat window failed: {ctx.error}')
                 print(f"  [Error] {ctx.error}")
@@ -563,7 +574,8 @@ class SnipToolApp:
                 provider=provider,
                 model=self.config.get(f"{provider}_model"),
                 streaming=False,
-                thinking_enabled=self.config.get("thinking_enabled", False)
+                thinking_enabled=self.config.get("thinking_enabled", False),
+                cache=cache
             )
             
             ctx = RequestPipeline.execute_simple(
@@ -24,6 +24,7 @@ from .prompts import SETTINGS_KEY, DEFAULT_TEXT_EDIT_SETTINGS, DEFAULT_TEXT_EDIT
 
 # Import API client directly (no wrapper needed)
 from ..api_client import call_api_with_retry
+from ..cancellation import CancellationToken
 
 
 class TextEditToolApp:
@@ -76,6 +77,8 @@ class TextEditToolApp:
         # Streaming abort state
         self.streaming_aborted = False
         self._abort_listener = None
+        # Token of the in-flight streaming request, cancelled by the abort hotkey
+        self._cancel_token: Optional[CancellationToken] = None
         
         logging.debug('TextEditToolApp initialized')
     
@@ -225,7 +228,7 @@ class TextEditToolApp:
             daemon=True
         ).start()
     
-    def _call_api(self, messages, provider=None, model=None, on_chunk=None, origin_override=None):
+    def _call_api(self, messages, provider=None, model=None, on_chunk=None, origin_override=None, cache=None):
         """
         Call the AI API with streaming support when enabled.
         
@@ -235,6 +238,7 @@ class TextEditToolApp:
             model: Optional model override
             on_chunk: Optional callback for each text chunk (for real-time typing)
             origin_override: Optional RequestOrigin override
+            cache: Per-action response cache setting (None = response_cache_default)
         """
         from ..request_pipeline import RequestPipeline, RequestContext, RequestOrigin, StreamCallback
         from ..session_manager import ChatSession
@@ -253,7 +257,8 @@ class TextEditToolApp:
             provider=provider,
             model=model or self.config.get(f"{provider}_model"),
             streaming=streaming_enabled,
-            thinking_enabled=self.config.get("thinking_enabled", False)
+            thinking_enabled=self.config.get("thinking_enabled", False),
+            cache=cache
         )
         
         if streaming_enabled:
@@ -282,14 +287,19 @@ class TextEditToolApp:
                 on_done=on_done
             )
             
-            ctx = RequestPipeline.execute_streaming(
-                ctx,
-                session,
-                self.config,
-                self.ai_params,
-                self.key_managers,
-                callbacks
-            )
+            self._cancel_token = CancellationToken()
+            try:
+                ctx = RequestPipeline.execute_streaming(
+                    ctx,
+                    session,
+                    self.config,
+                    self.ai_params,
+                    self.key_managers,
+                    callbacks,
+                    cancel_token=self._cancel_token
+                )
+            finally:
+                self._cancel_token = None
             
             if self.cancel_requested:
                 return None, "Request cancelled"
@@ -329,8 +339,13 @@ class TextEditToolApp:
                 self.cancel_requested = True
                 logging.debug("Abort hotkey pressed - stopping stream")
                 
+                # Close the upstream stream so no further tokens are generated
+                token = self._cancel_token
+                if token:
+                    token.cancel("aborted by user")
+                
                 # Immediately unlock hotkey so new triggers work right away
-                # The background API call will continue but we don't need to wait for it
+                # The background API call winds down on its own
                 self.is_processing = False
                 
                 # Provide immediate visual feedback
@@ -731,6 +746,9 @@ class TextEditToolApp:
             else:  # "default" - use the action's setting
                 show_in_chat_window = option.get("show_chat_window_instead_of_replace", False)
             
+            # Per-action response cache opt-in (see response_cache.py)
+            cache = option.get("cache")
+            
             # Build prompt using new structure
             # Keys: system_prompt, task, prompt_type
             system_prompt = option.get("system_prompt", "")
@@ -809,11 +827,12 @@ class TextEditToolApp:
                         original_text=selected_text,
                         task_context=task,
                         origin=RequestOrigin.POPUP_PROMPT,
-                        followup_system_instruction=chat_window_system_instruction
+                        followup_system_instruction=chat_window_system_instruction,
+                        cache=cache
                     )
                 else:
                     # Non-streaming: wait for response, then show window
-                    response, error = self._call_api(messages, origin_override=RequestOrigin.POPUP_PROMPT)
+                    response, error = self._call_api(messages, origin_override=RequestOrigin.POPUP_PROMPT, cache=cache)
                     
                     if error:
                         logging.error(f'Option processing failed: {error}')
@@ -879,7 +898,7 @@ class TextEditToolApp:
                                 typing_aborted = True
                     
                     try:
-                        response, error = self._call_api(messages, on_chunk=type_chunk, origin_override=RequestOrigin.POPUP_PROMPT)
+                        response, error = self._call_api(messages, on_chunk=type_chunk, origin_override=RequestOrigin.POPUP_PROMPT, cache=cache)
                         
                         # Type any remaining buffered text (unless aborted)
                         if chunk_buffer and not self.streaming_aborted and not typing_aborted:
@@ -893,7 +912,7 @@ class TextEditToolApp:
                     # so we don't need to show it again here
                 else:
                     # Non-streaming: get full response then paste instantly
-                    response, error = self._call_api(messages, origin_override=RequestOrigin.POPUP_PROMPT)
+                    response, error = self._call_api(messages, origin_override=RequestOrigin.POPUP_PROMPT, cache=cache)
                     
                     # Paste the full response instantly using clipboard
                     if response and not error:
@@ -969,7 +988,8 @@ class TextEditToolApp:
     
     def _stream_to_chat_window(self, messages: list, window_title: str, original_text: str,
                                 task_context: Optional[str], origin,
-                                followup_system_instruction: Optional[str] = None):
+                                followup_system_instruction: Optional[str] = None,
+                                cache: Optional[bool] = None):
         """
         Open a chat window immediately and stream API response into it.
         
@@ -982,6 +1002,7 @@ class TextEditToolApp:
             followup_system_instruction: System instruction to use for follow-up messages.
                 For popup buttons (ELI5, etc.): use chat_window_system_instruction
                 For direct chat: use chat_system_instruction (same as initial)
+            cache: Per-action response cache setting (None = response_cache_default)
         """
         from .core import GUICoordinator
         from ..session_manager import ChatSession
@@ -1027,7 +1048,8 @@ class TextEditToolApp:
             provider=provider,
             model=self.config.get(f"{provider}_model"),
             streaming=True,
-            thinking_enabled=self.config.get("thinking_enabled", False)
+            thinking_enabled=self.config.get("thinking_enabled", False),
+            cache=cache
         )
         
         # Stream callbacks
@@ -1059,9 +1081,13 @@ class TextEditToolApp:
             self.config,
             self.ai_params,
             self.key_managers,
-            stream_callbacks
+            stream_callbacks,
+            cancel_token=callbacks.cancel_token  # Cancelled when the window closes
         )
         
+        if ctx.cancelled:
+            return
+        
         if ctx.error:
             logging.error(f'Streaming to chat window failed: {ctx.error}')
             print(f"  [Error] {ctx.error}")
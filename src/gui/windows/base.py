@@ -17,7 +17,9 @@ from typing import Optional, Dict, List
 
 from ..platform import HAVE_CTK, ctk
 from ...utils import strip_markdown
+from ...cancellation import CancellationToken
 from ...session_manager import add_session
+from ...text_buffer import TextBuffer
 from ..core import get_next_window_id, register_window, unregister_window
 from ..utils import copy_to_clipboard, render_markdown, get_color_scheme, setup_text_tags
 from ..custom_widgets import ScrollableComboBox
@@ -57,9 +59,11 @@ class ChatWindowBase(ABC):
         self._destroyed = False
         
         # Streaming state
-        self.streaming_text = ""
-        self.streaming_thinking = ""
+        self.streaming_text = TextBuffer()
+        self.streaming_thinking = TextBuffer()
         self.is_streaming = False
+        # Token of the in-flight request; closing the window cancels it
+        self.cancel_token: Optional[CancellationToken] = None
         self.thinking_collapsed_states: Dict[int, bool] = {}
         self.last_usage = None
         
@@ -836,14 +840,16 @@ class ChatWindowBase(ABC):
             thinking_header = "▶ Thinking..." if is_collapsed else "▼ Thinking:"
             self.chat_text.insert(tk.END, f"  {thinking_header}\n", ("thinking_header", message_tag))
             if not is_collapsed:
-                for t_line in self.streaming_thinking.split('\n'):
+                for t_line in self.streaming_thinking.getvalue().split('\n'):
                     self.chat_text.insert(tk.END, "    " + t_line + "\n", ("thinking_content", message_tag))
         
         # Streaming content
         if self.streaming_text:
-            for c_idx, c_line in enumerate(self.streaming_text.split('\n')):
+            content_lines = self.streaming_text.getvalue().split('\n')
+            last_idx = len(content_lines) - 1
+            for c_idx, c_line in enumerate(content_lines):
                 self.chat_text.insert(tk.END, "  " + c_line, ("normal", message_tag))
-                if c_idx < len(self.streaming_text.split('\n')) - 1:
+                if c_idx < last_idx:
                     self.chat_text.insert(tk.END, "\n", (message_tag,))
         else:
             self.chat_text.insert(tk.END, "  ...", ("normal", message_tag))
@@ -1045,8 +1051,8 @@ class ChatWindowBase(ABC):
                 self.attach_btn.configure(state=tk.DISABLED)
         
         # Reset streaming state
-        self.streaming_text = ""
-        self.streaming_thinking = ""
+        self.streaming_text = TextBuffer()
+        self.streaming_thinking = TextBuffer()
         self.is_streaming = False
         self.last_usage = None
         
@@ -1070,13 +1076,13 @@ class ChatWindowBase(ABC):
             def on_text(content):
                 if self._destroyed:
                     return
-                self.streaming_text += content
+                self.streaming_text.append(content)
                 self._safe_after(0, self._update_streaming_display)
             
             def on_thinking(content):
                 if self._destroyed:
                     return
-                self.streaming_thinking += content
+                self.streaming_thinking.append(content)
                 self._safe_after(0, self._update_streaming_display)
             
             def on_usage(content):
@@ -1098,9 +1104,10 @@ class ChatWindowBase(ABC):
             self._safe_after(0, lambda: self._update_status("Streaming..." if streaming_enabled else "Processing..."))
             
             if streaming_enabled and current_provider in ("custom", "google", "openrouter"):
+                self.cancel_token = CancellationToken()
                 ctx = RequestPipeline.execute_streaming(
                     ctx, self.session, web_server.CONFIG, web_server.AI_PARAMS,
-                    web_server.KEY_MANAGERS, callbacks
+                    web_server.KEY_MANAGERS, callbacks, cancel_token=self.cancel_token
                 )
             else:
                 self.is_streaming = False
@@ -1129,7 +1136,7 @@ class ChatWindowBase(ABC):
                     self._update_status(f"Error: {ctx.error}", self.theme.accent_red)
                 else:
                     self.session.add_message("assistant", ctx.response_text)
-                    thinking_content = self.streaming_thinking or ctx.reasoning_text
+                    thinking_content = self.streaming_thinking.getvalue() or ctx.reasoning_text
                     if thinking_content and len(self.session.messages) > 0:
                         self.session.messages[-1]["thinking"] = thinking_content
                     
@@ -1159,8 +1166,8 @@ class ChatWindowBase(ABC):
                     if self.attach_btn:
                         self.attach_btn.configure(state=tk.NORMAL)
                 
-                self.streaming_text = ""
-                self.streaming_thinking = ""
+                self.streaming_text = TextBuffer()
+                self.streaming_thinking = TextBuffer()
             
             self._safe_after(0, handle_response)
         
@@ -1626,8 +1633,8 @@ class ChatWindowBase(ABC):
         self._clear_pending_attachments()
         
         # Reset streaming state
-        self.streaming_text = ""
-        self.streaming_thinking = ""
+        self.streaming_text = TextBuffer()
+        self.streaming_thinking = TextBuffer()
         self.is_streaming = False
         self.last_usage = None
         
@@ -1686,13 +1693,13 @@ class ChatWindowBase(ABC):
             def on_text(content):
                 if self._destroyed:
                     return
-                self.streaming_text += content
+                self.streaming_text.append(content)
                 self._safe_after(0, self._update_streaming_display)
             
             def on_thinking(content):
                 if self._destroyed:
                     return
-                self.streaming_thinking += content
+                self.streaming_thinking.append(content)
                 self._safe_after(0, self._update_streaming_display)
             
             def on_usage(content):
@@ -1714,9 +1721,10 @@ class ChatWindowBase(ABC):
             self._safe_after(0, lambda: self._update_status("Streaming..." if streaming_enabled else "Processing..."))
             
             if streaming_enabled and current_provider in ("custom", "google", "openrouter"):
+                self.cancel_token = CancellationToken()
                 ctx = RequestPipeline.execute_streaming(
                     ctx, self.session, web_server.CONFIG, web_server.AI_PARAMS,
-                    web_server.KEY_MANAGERS, callbacks
+                    web_server.KEY_MANAGERS, callbacks, cancel_token=self.cancel_token
                 )
             else:
                 self.is_streaming = False
@@ -1746,7 +1754,7 @@ class ChatWindowBase(ABC):
                     self.session.messages.pop()
                 else:
                     self.session.add_message("assistant", ctx.response_text)
-                    thinking_content = self.streaming_thinking or ctx.reasoning_text
+                    thinking_content = self.streaming_thinking.getvalue() or ctx.reasoning_text
                     if thinking_content and len(self.session.messages) > 0:
                         self.session.messages[-1]["thinking"] = thinking_content
                     
@@ -1772,8 +1780,8 @@ class ChatWindowBase(ABC):
                     if self.attach_btn:
                         self.attach_btn.configure(state=tk.NORMAL)
                 
-                self.streaming_text = ""
-                self.streaming_thinking = ""
+                self.streaming_text = TextBuffer()
+                self.streaming_thinking = TextBuffer()
             
             self._safe_after(0, handle_response)
         
@@ -1799,6 +1807,8 @@ class ChatWindowBase(ABC):
         """Close window and cleanup."""
         self._destroyed = True
         self.is_streaming = False
+        if self.cancel_token:
+            self.cancel_token.cancel("chat window closed")
         unregister_window(self._get_window_tag())
         
         try:
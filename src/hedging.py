@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Hedged streaming requests for latency-critical origins
+
+When an opted-in origin (config hedge_origins, e.g. popup prompts and the
+snip tool) has not received its first token after a percentile-based delay,
+a duplicate request is fired - on another key of the same provider (the key
+scheduler hands the hedge the least-loaded key) or on hedge_provider. The
+first attempt to produce a token wins: its buffered events are replayed to
+the caller and the other attempt's HTTP stream is cancelled.
+
+The delay is the hedge percentile (default p90) of recent time-to-first-token
+samples for the origin, floored at hedge_min_delay. Until enough samples
+exist, hedge_delay is used. Every attempt records its own TTFT, losers
+included: sampling only winners would drop the slow primaries that hedges
+beat, pulling the delay down and firing ever more hedges. An attempt
+cancelled before its first token still leaves no sample, so the delay can
+lean low when most primaries lose; hedge_min_delay bounds it.
+
+Both attempts run on worker threads; their stream events are funneled through
+a queue and forwarded from the calling thread, so callers see events on the
+same thread as an unhedged request.
+
+Config:
+    hedge_origins = popup_prompt, snip_tool:95   # origin[:percentile], empty = off
+    hedge_percentile = 90
+    hedge_delay = 2.0        # seconds, until MIN_SAMPLES TTFT samples exist
+    hedge_min_delay = 0.5    # seconds
+    hedge_provider =         # empty = same provider, another key
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancellationToken
+from .metrics import RollingPercentiles
+
+# Events that count as "first token" and decide the race
+FIRST_TOKEN_EVENTS = ("text", "thinking", "tool_calls")
+
+# TTFT samples needed before the percentile replaces hedge_delay
+MIN_SAMPLES = 20
+
+DEFAULT_PERCENTILE = 90
+DEFAULT_DELAY = 2.0
+DEFAULT_MIN_DELAY = 0.5
+
+StreamResult = Tuple[Optional[str], Optional[str], Optional[Dict], Optional[str]]
+# launch(callback, cancel_token, is_hedge) -> (text, reasoning, usage, error)
+LaunchFn = Callable[[Callable[[str, Any], None], CancellationToken, bool], StreamResult]
+
+
+class HedgeStats:
+    """Counters and TTFT history for one origin"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.wasted_tokens = 0
+        self.ttft = RollingPercentiles()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "wasted_tokens": self.wasted_tokens,
+                "ttft": self.ttft.snapshot(),
+            }
+
+
+_STATS: Dict[str, HedgeStats] = {}
+_STATS_LOCK = threading.Lock()
+
+
+def get_origin_stats(origin: str) -> HedgeStats:
+    """Stats for an origin (RequestOrigin.value), created on first use"""
+    with _STATS_LOCK:
+        stats = _STATS.get(origin)
+        if stats is None:
+            stats = _STATS[origin] = HedgeStats()
+        return stats
+
+
+def get_hedge_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters for every origin that has run a hedge-enabled request"""
+    with _STATS_LOCK:
+        origins = list(_STATS.items())
+    return {origin: stats.to_dict() for origin, stats in origins}
+
+
+def parse_hedge_origins(value: Any) -> Dict[str, Optional[float]]:
+    """
+    Parse hedge_origins ("popup_prompt, snip_tool:95") into {origin: percentile}.
+
+    A missing percentile maps to None (use hedge_percentile).
+    """
+    if not value or value is True:
+        return {}
+    items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    origins: Dict[str, Optional[float]] = {}
+    for item in items:
+        name, _, percentile = str(item).strip().partition(":")
+        if not name:
+            continue
+        try:
+            origins[name.strip().lower()] = float(percentile) if percentile.strip() else None
+        except ValueError:
+            origins[name.strip().lower()] = None
+    return origins
+
+
+def get_hedge_delay(config: Dict, origin: str) -> Optional[float]:
+    """
+    Seconds to wait for a first token before hedging, or None if the
+    origin does not hedge.
+    """
+    origins = parse_hedge_origins(config.get("hedge_origins"))
+    if origin not in origins:
+        return None
+    percentile = origins[origin] or config.get("hedge_percentile") or DEFAULT_PERCENTILE
+    min_delay = float(config.get("hedge_min_delay") or DEFAULT_MIN_DELAY)
+    ttft = get_origin_stats(origin).ttft
+    if len(ttft) < MIN_SAMPLES:
+        return max(min_delay, float(config.get("hedge_delay") or DEFAULT_DELAY))
+    return max(min_delay, ttft.percentile(percentile))
+
+
+class HedgedStream:
+    """Races a primary streaming request against a delayed duplicate"""
+
+    def __init__(
+        self,
+        origin: str,
+        delay: float,
+        launch: LaunchFn,
+        forward: Callable[[str, Any], None]
+    ):
+        self.origin = origin
+        self.delay = delay
+        self.launch = launch
+        self.forward = forward
+        self.stats = get_origin_stats(origin)
+        self.winner: Optional[int] = None
+        self.hedged = False
+
+        self._events: "queue.Queue" = queue.Queue()
+        self._tokens: List[CancellationToken] = []
+        self._buffers: List[List[Tuple[str, Any]]] = []
+        self._output_chars: List[int] = []
+        self._running = set()
+        self._cancelled = False
+
+    def run(self) -> StreamResult:
+        """Run the race and return the winning attempt's result"""
+        start = time.monotonic()
+        with self.stats.lock:
+            self.stats.requests += 1
+        self._spawn()
+        hedge_at = start + self.delay
+
+        while True:
+            timeout = None
+            if self.winner is None and not self.hedged and not self._cancelled:
+                timeout = max(0.0, hedge_at - time.monotonic())
+            try:
+                item = self._events.get(timeout=timeout)
+            except queue.Empty:
+                if not self._cancelled:
+                    self._fire_hedge()
+                continue
+
+            if item[0] == "event":
+                _, index, kind, content = item
+                if self.winner is None and kind in FIRST_TOKEN_EVENTS:
+                    self._declare_winner(index, time.monotonic() - start)
+                    self.forward(kind, content)
+                elif self.winner == index:
+                    self.forward(kind, content)
+                elif self.winner is None:
+                    self._buffers[index].append((kind, content))
+                continue
+
+            _, index, result = item
+            self._running.discard(index)
+            if self.winner == index:
+                return self._finish(result)
+            if self.winner is not None:
+                continue  # A cancelled loser finished
+            if result[3] is None:
+                # Succeeded without streaming a token (empty answer)
+                self._declare_winner(index, time.monotonic() - start)
+                return self._finish(result)
+            if self._running:
+                continue  # The other attempt may still succeed
+            # Every attempt failed (a primary failing before the hedge is
+            # due ends the race too): report the last failure
+            for kind, content in self._buffers[index]:
+                self.forward(kind, content)
+            return self._finish(result)
+
+    def cancel(self, reason: str = "cancelled"):
+        """Cancel every attempt (safe from any thread); run() then returns the cancelled result"""
+        self._cancelled = True
+        for token in list(self._tokens):
+            token.cancel(reason)
+
+    def _spawn(self):
+        index = len(self._tokens)
+        token = CancellationToken()
+        self._tokens.append(token)
+        self._buffers.append([])
+        self._output_chars.append(0)
+        self._running.add(index)
+        if self._cancelled:
+            token.cancel("cancelled")
+        started = time.monotonic()
+        first_token = False
+
+        def callback(kind, content):
+            nonlocal first_token
+            if not first_token and kind in FIRST_TOKEN_EVENTS:
+                # Recorded here rather than by the race so a loser's first
+                # token counts even after run() returned
+                first_token = True
+                self.stats.ttft.add(time.monotonic() - started)
+            if kind in ("text", "thinking") and content:
+                self._output_chars[index] += len(content)
+            self._events.put(("event", index, kind, content))
+
+        def target():
+            try:
+                result = self.launch(callback, token, index > 0)
+            except Exception as e:
+                result = (None, None, None, str(e))
+            self._events.put(("result", index, result))
+
+        threading.Thread(target=target, name=f"Hedge-{self.origin}-{index}", daemon=True).start()
+
+    def _fire_hedge(self):
+        self.hedged = True
+        with self.stats.lock:
+            self.stats.hedges_fired += 1
+        print(f"  [Hedge] No first token after {self.delay:.2f}s ({self.origin}), firing hedge request")
+        self._spawn()
+
+    def _declare_winner(self, index: int, ttft: float):
+        self.winner = index
+        if index > 0:
+            with self.stats.lock:
+                self.stats.hedges_won += 1
+            print(f"  [Hedge] Hedge request won ({ttft:.2f}s to first token)")
+        for other, token in enumerate(self._tokens):
+            if other != index:
+                token.cancel("hedge lost")
+        for kind, content in self._buffers[index]:
+            self.forward(kind, content)
+        self._buffers = [[] for _ in self._buffers]
+
+    def _finish(self, result: StreamResult) -> StreamResult:
+        wasted = sum(chars for i, chars in enumerate(self._output_chars) if i != self.winner)
+        if self.hedged and wasted:
+            with self.stats.lock:
+                self.stats.wasted_tokens += max(1, wasted // 4)
+        return result
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Multi-image batch requests for Flask endpoints
+
+OCR on 50 screenshots used to take 50 sequential POSTs. POST
+/<endpoint>/batch (web_server.py) takes all of them at once - as several
+multipart files, a zip archive, or both - and runs one endpoint request per
+image through RequestPipeline.execute_batch:
+
+    POST /ocr/batch                 {"results": [...], "succeeded": 49, "failed": 1, ...}
+    POST /ocr/batch?stream=1        event: result per image as it finishes,
+                                    then event: done with the counts
+
+Results are returned in upload order (zip entries in archive order); each
+carries its index and file name, plus the text and usage or the error. In
+the streamed form they arrive in completion order instead.
+
+Concurrency is capped per request by batch_concurrency (lowered with
+?concurrency=N) and across requests by admission control, where batch
+items queue behind interactive and single-image requests; the key
+scheduler's per-key limits still apply to every call. At most
+batch_max_images images are accepted per request.
+
+Config:
+    batch_concurrency = 4
+    batch_max_images = 100
+"""
+
+import io
+import mimetypes
+import time
+import zipfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .event_stream import EventStream, result_event
+from .request_pipeline import RequestContext, RequestPipeline
+
+DEFAULT_MAX_IMAGES = 100
+
+# Uncompressed size limit for one zip upload (guards against zip bombs)
+MAX_ZIP_BYTES = 256 * 1024 * 1024
+
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# (file name, image bytes, mime type)
+BatchImage = Tuple[str, bytes, str]
+
+
+def _is_zip(name: str, mime_type: str) -> bool:
+    return mime_type in ZIP_TYPES or name.lower().endswith(".zip")
+
+
+def _read_zip(data: bytes, max_images: int, have: int = 0) -> List[BatchImage]:
+    """Image entries of a zip archive, in archive order (other files skipped)"""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Invalid zip archive")
+    images = []
+    total = 0
+    with archive:
+        for info in archive.infolist():
+            mime_type = mimetypes.guess_type(info.filename)[0] or ""
+            if info.is_dir() or not mime_type.startswith("image/"):
+                continue
+            total += info.file_size
+            if total > MAX_ZIP_BYTES:
+                raise ValueError(f"Zip archive expands to more than {MAX_ZIP_BYTES // (1024 * 1024)} MB")
+            if have + len(images) >= max_images:
+                raise ValueError(f"Too many images (at most {max_images} per batch)")
+            images.append((info.filename, archive.read(info), mime_type))
+    return images
+
+
+def read_images(request, max_images: int = DEFAULT_MAX_IMAGES) -> List[BatchImage]:
+    """
+    Images of a batch upload: every multipart file (zip files expanded), or
+    a zip request body.
+
+    Raises:
+        ValueError: No images, more than max_images, or an unreadable zip
+    """
+    images: List[BatchImage] = []
+    if request.files:
+        for index, (_, upload) in enumerate(request.files.items(multi=True)):
+            name = upload.filename or f"image-{index}"
+            mime_type = upload.mimetype or mimetypes.guess_type(name)[0] or "image/png"
+            data = upload.read()
+            if _is_zip(name, mime_type):
+                images.extend(_read_zip(data, max_images, len(images)))
+            elif data:
+                images.append((name, data, mime_type))
+            if len(images) > max_images:
+                raise ValueError(f"Too many images (at most {max_images} per batch)")
+    elif request.content_type and request.content_type.split(";")[0] in ZIP_TYPES:
+        images = _read_zip(request.get_data(), max_images)
+    if not images:
+        raise ValueError("No images found in request.")
+    return images
+
+
+def item_result(index: int, name: str, ctx: RequestContext) -> Dict[str, Any]:
+    """Result entry for one image: index, name, status (done / error) and the done or error data"""
+    status, data = result_event(ctx)
+    return {"index": index, "name": name, "status": status, **data}
+
+
+def run_batch(
+    ctx: RequestContext,
+    names: List[str],
+    message_lists: List[List[Dict]],
+    config: Dict,
+    ai_params: Dict,
+    key_managers: Dict,
+    concurrency: Optional[int] = None,
+    stream: Optional[EventStream] = None
+) -> Dict[str, Any]:
+    """
+    Run one request per image and summarize the results.
+
+    Args:
+        ctx: Template context for every image (origin, provider, model, ...)
+        names: File name per image
+        message_lists: Endpoint messages per image
+        concurrency: Concurrent requests (default and maximum: batch_concurrency)
+        stream: When given, each result is sent as a "result" event as soon
+            as it finishes, and a client disconnect skips images not yet started
+
+    Returns:
+        {"count", "succeeded", "failed", "elapsed", "results"} with results
+        in upload order
+    """
+    limit = max(1, int(config.get("batch_concurrency") or 4))
+    workers = max(1, min(limit, concurrency)) if concurrency else limit
+    on_result: Optional[Callable[[int, RequestContext], None]] = None
+    if stream is not None:
+        on_result = lambda index, item_ctx: stream.send("result", item_result(index, names[index], item_ctx))
+
+    start = time.time()
+    contexts = RequestPipeline.execute_batch(
+        ctx, message_lists, config, ai_params, key_managers, max_workers=workers,
+        on_result=on_result, cancel_token=stream.cancel_token if stream is not None else None
+    )
+    failed = sum(1 for item_ctx in contexts if item_ctx.error)
+    return {
+        "count": len(contexts),
+        "succeeded": len(contexts) - failed,
+        "failed": failed,
+        "elapsed": time.time() - start,
+        "results": [item_result(index, names[index], item_ctx) for index, item_ctx in enumerate(contexts)],
+    }
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Async Job API
+
+A large OCR / describe request holds a Flask thread and the client's HTTP
+connection for the whole generation; clients with short timeouts give up
+and the answer is lost. POST /jobs/<endpoint> (web_server.py) instead
+returns a job id right away and runs the request on a bounded worker pool:
+
+    POST   /jobs/<endpoint>            202 {"id": ..., "status": "queued", ...}
+    GET    /jobs/<id>?wait=30&since=N  status, partial text and usage
+    DELETE /jobs/<id>                  cancel a queued or running job
+
+GET with wait=<seconds> long-polls: it returns as soon as the job finishes
+or, with since=<chars>, as soon as its text grows past that many
+characters; wait is capped at jobs_max_wait.
+
+Jobs are streamed through the pipeline, so their text grows while they run.
+Finished jobs stay retrievable for jobs_ttl seconds. At most jobs_memory of
+them are kept in memory; older ones are spilled to jobs_dir as JSON (or
+dropped when it is unset). When jobs_queue_size jobs are already waiting,
+new submissions are refused (503). The jobs_* settings are read when the
+first job is submitted.
+
+Config:
+    jobs_workers = 2
+    jobs_queue_size = 32
+    jobs_ttl = 3600
+    jobs_memory = 100
+    jobs_dir =              # empty = no disk spill
+    jobs_max_wait = 60
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from .cancellation import CANCELLED_ERROR, CancellationToken
+from .request_pipeline import StreamCallback
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_TTL = 3600
+DEFAULT_MEMORY = 100
+DEFAULT_MAX_WAIT = 60.0
+
+# Job status values
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "error"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """jobs_queue_size jobs are already waiting"""
+
+
+class Job:
+    """One submitted request; text and usage fill in while it runs"""
+
+    def __init__(self, endpoint: str):
+        self.id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.text_parts: List[str] = []
+        self.text_length = 0
+        self.thinking_parts: List[str] = []
+        self.usage: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.served_by: Optional[str] = None
+        self.cancel_token = CancellationToken()
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def _update(self, apply: Callable[[], None]):
+        with self._changed:
+            apply()
+            self._changed.notify_all()
+
+    def start(self):
+        def apply():
+            self.started = time.time()
+            self.status = RUNNING
+        self._update(apply)
+
+    def add_text(self, text: str):
+        def apply():
+            self.text_parts.append(text)
+            self.text_length += len(text)
+        self._update(apply)
+
+    def stream_callback(self) -> StreamCallback:
+        """StreamCallback that records text, thinking and usage on the job"""
+        return StreamCallback(
+            on_text=self.add_text,
+            on_thinking=lambda text: self._update(lambda: self.thinking_parts.append(text)),
+            on_usage=lambda usage: self._update(lambda: setattr(self, "usage", usage)),
+        )
+
+    def complete(self, ctx):
+        """Take the final text, usage and outcome from a finished RequestContext"""
+        def apply():
+            if ctx.response_text:
+                self.text_parts = [ctx.response_text]
+                self.text_length = len(ctx.response_text)
+            if ctx.reasoning_text:
+                self.thinking_parts = [ctx.reasoning_text]
+            self.usage = {
+                "prompt_tokens": ctx.input_tokens,
+                "completion_tokens": ctx.output_tokens,
+                "total_tokens": ctx.total_tokens,
+                "estimated": ctx.estimated,
+            }
+            self.served_by = ctx.served_by
+            self._finish(CANCELLED if ctx.cancelled else FAILED if ctx.error else DONE, ctx.error)
+        self._update(apply)
+
+    def fail(self, status: str, error: Optional[str]):
+        """Finish without a RequestContext (cancelled while queued, crashed)"""
+        self._update(lambda: self._finish(status, error))
+
+    def _finish(self, status: str, error: Optional[str]):
+        if not self.done:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+
+    def wait(self, timeout: float, since: Optional[int] = None):
+        """Block until the job finishes, its text passes since chars, or timeout"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not self.done and (since is None or self.text_length <= since):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._changed.wait(remaining)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._changed:
+            data = {
+                "id": self.id,
+                "endpoint": self.endpoint,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "elapsed": round((self.finished or time.time()) - self.started, 3) if self.started else None,
+                "text": "".join(self.text_parts),
+                "usage": self.usage,
+                "error": self.error,
+            }
+            if self.thinking_parts:
+                data["thinking"] = "".join(self.thinking_parts)
+            if self.served_by:
+                data["served_by"] = self.served_by
+        return data
+
+
+class JobStore:
+    """Running jobs plus finished results: memory (LRU) with optional disk spill"""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, memory: int = DEFAULT_MEMORY, directory: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = memory
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._active: Dict[str, Job] = {}
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        self._last_purge = 0.0
+
+        # Stats
+        self.spilled = 0
+        self.expired = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def add(self, job: Job):
+        with self._lock:
+            self._active[job.id] = job
+
+    def finish(self, job: Job):
+        """Move a finished job to the retained results"""
+        with self._lock:
+            self._active.pop(job.id, None)
+            self._finished[job.id] = job
+            while len(self._finished) > self.memory:
+                _, oldest = self._finished.popitem(last=False)
+                self._spill(oldest)
+        self.purge()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job as a dict (running, in memory or spilled), or None"""
+        with self._lock:
+            job = self._active.get(job_id) or self._finished.get(job_id)
+        if job is not None:
+            if job.done and self._expired(job.finished):
+                return None
+            return job.to_dict()
+        return self._load(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        """In-memory Job (for waiting and cancelling), or None"""
+        with self._lock:
+            return self._active.get(job_id) or self._finished.get(job_id)
+
+    def _expired(self, finished: Optional[float]) -> bool:
+        return bool(self.ttl) and finished is not None and time.time() - finished > self.ttl
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _spill(self, job: Job):
+        if not self.directory or self._expired(job.finished):
+            return
+        try:
+            with open(self._path(job.id), "w", encoding="utf-8") as f:
+                json.dump(job.to_dict(), f, ensure_ascii=False)
+            self.spilled += 1
+        except OSError as e:
+            print(f"  [Jobs] Could not spill job {job.id}: {e}")
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not self.directory or not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if self._expired(data.get("finished")):
+            self._remove_file(job_id)
+            return None
+        return data
+
+    def _remove_file(self, job_id: str):
+        try:
+            os.remove(self._path(job_id))
+            self.expired += 1
+        except OSError:
+            pass
+
+    def purge(self, force: bool = False):
+        """Drop expired results (at most once a minute unless forced)"""
+        now = time.time()
+        if not self.ttl or (not force and now - self._last_purge < 60):
+            return
+        self._last_purge = now
+        with self._lock:
+            for job_id in [j for j, job in self._finished.items() if self._expired(job.finished)]:
+                del self._finished[job_id]
+                self.expired += 1
+        if self.directory:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json") and now - entry.stat().st_mtime > self.ttl:
+                    self._remove_file(entry.name[:-5])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": len(self._active),
+                "finished_in_memory": len(self._finished),
+                "spilled": self.spilled,
+                "expired": self.expired,
+            }
+
+
+class JobRunner:
+    """Bounded worker pool that runs submitted jobs"""
+
+    def __init__(self, config: Dict):
+        self.workers = max(1, int(config.get("jobs_workers") or DEFAULT_WORKERS))
+        queue_size = config.get("jobs_queue_size")
+        self.queue_size = DEFAULT_QUEUE_SIZE if queue_size is None else max(0, int(queue_size))
+        ttl = config.get("jobs_ttl")
+        memory = config.get("jobs_memory")
+        directory = config.get("jobs_dir")
+        self.store = JobStore(
+            ttl=DEFAULT_TTL if ttl is None else max(0.0, float(ttl)),
+            memory=DEFAULT_MEMORY if memory is None else max(0, int(memory)),
+            directory=directory if isinstance(directory, str) and directory else None
+        )
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Job")
+        self._lock = threading.Lock()
+        self._queued = 0
+
+        # Stats
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, endpoint: str, run: Callable[[Job], None]) -> Job:
+        """
+        Queue run(job) on the worker pool; run should call job.complete(ctx).
+
+        Raises:
+            QueueFull: jobs_queue_size jobs are already waiting
+        """
+        with self._lock:
+            if self._queued >= self.queue_size + self.workers:
+                self.rejected += 1
+                raise QueueFull(f"{self._queued} jobs queued or running")
+            self._queued += 1
+            self.submitted += 1
+        job = Job(endpoint)
+        self.store.add(job)
+        self._pool.submit(self._run, job, run)
+        return job
+
+    def _run(self, job: Job, run: Callable[[Job], None]):
+        try:
+            if job.cancel_token.cancelled:
+                job.fail(CANCELLED, CANCELLED_ERROR)
+                return
+            job.start()
+            run(job)
+            job.fail(FAILED, "Job ended without a result")  # No-op when run completed it
+        except Exception as e:
+            job.fail(FAILED, f"Unexpected error: {e}")
+        finally:
+            with self._lock:
+                self._queued -= 1
+            self.store.finish(job)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if unknown or finished"""
+        job = self.store.get_job(job_id)
+        if job is None or job.done:
+            return False
+        job.cancel_token.cancel("job cancelled")
+        return True
+
+    def shutdown(self, wait: bool = False):
+        """Cancel every unfinished job and stop the workers"""
+        with self.store._lock:
+            active = list(self.store._active.values())
+        for job in active:
+            job.cancel_token.cancel("shutdown")
+        self._pool.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.store.get_stats()
+        stats.update({
+            "workers": self.workers,
+            "queued_or_running": self._queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        })
+        return stats
+
+
+_RUNNER: Optional[JobRunner] = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def get_job_runner(config: Dict) -> JobRunner:
+    """The process-wide runner, created from config on first use"""
+    global _RUNNER
+    if _RUNNER is None:
+        with _RUNNER_LOCK:
+            if _RUNNER is None:
+                _RUNNER = JobRunner(config)
+    return _RUNNER
+
+
+@atexit.register
+def _shutdown_runner():
+    if _RUNNER is not None:
+        _RUNNER.shutdown()
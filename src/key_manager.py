@@ -1,64 +1,469 @@
 #!/usr/bin/env python3
 """
-API Key Management with rotation and exhaustion tracking
+API Key Management with per-key scheduling and leases
+
+Each key carries its own state:
+- a token bucket refilled at key_rpm_limit requests per minute (0 = unlimited)
+- a cooldown after a 429 (honoring Retry-After when the server sends one)
+- permanent quarantine after 401/403 (invalid or revoked key)
+- an in-flight count, capped at key_max_concurrency (0 = unlimited)
+
+A request acquires a KeyLease for its whole lifetime (including retries)
+and releases it when done. Acquisition prefers ready keys with free
+capacity, then the least loaded, then the least recently used, so
+concurrent requests spread across the pool instead of piling onto one key.
+When every key is at its concurrency cap the caller blocks until a lease
+is released, up to key_queue_timeout seconds.
+
+The lease is tracked per thread: retries inside one request rotate away
+from keys that already failed while other threads keep their own.
 """
 
 import threading
+import time
+
+from src.metrics import RollingPercentiles
+
+# Successful requests per key kept for the TTFT/throughput percentiles
+KEY_LATENCY_WINDOW = 100
+
+
+class KeysBusyError(Exception):
+    """Raised when no key frees up within the queue timeout"""
+
+
+class _KeyState:
+    """Scheduling state for a single API key"""
+
+    __slots__ = ("tokens", "last_refill", "cooldown_until", "quarantined", "last_used",
+                 "in_flight", "requests", "rate_limited", "failures", "successes", "ttft",
+                 "throughput")
+
+    def __init__(self, burst):
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.cooldown_until = 0.0
+        self.quarantined = False
+        self.last_used = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.successes = 0
+        self.ttft = RollingPercentiles(KEY_LATENCY_WINDOW)
+        self.throughput = RollingPercentiles(KEY_LATENCY_WINDOW)
+
+
+class KeyLease:
+    """A key held by one request; release() (or the with-block) gives it back"""
+
+    __slots__ = ("manager", "key", "parent", "released")
+
+    def __init__(self, manager, key, parent=None):
+        self.manager = manager
+        self.key = key
+        self.parent = parent
+        self.released = False
+
+    def release(self):
+        self.manager._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
 
 class KeyManager:
-    """Manages API keys with rotation on failures"""
-    
-    def __init__(self, keys, provider_name):
+    """Manages API keys with rate-aware selection, leases and rotation on failures"""
+
+    DEFAULT_COOLDOWN = 30.0  # seconds a key rests after a 429 without Retry-After
+    DEFAULT_QUEUE_TIMEOUT = 60.0  # seconds to wait for a free key when all are busy
+    MAX_SELECT_WAIT = 10.0  # longest a request waits for a key to become ready
+
+    def __init__(self, keys, provider_name, rpm_limit=0, cooldown=DEFAULT_COOLDOWN,
+                 max_in_flight=0, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
         self.keys = [k for k in keys if k]
-        self.current_index = 0
-        self.exhausted_keys = set()
         self.provider_name = provider_name
+        self.rpm_limit = float(rpm_limit or 0)
+        self.cooldown = float(cooldown or 0) or self.DEFAULT_COOLDOWN
+        self.max_in_flight = int(max_in_flight or 0)
+        self.queue_timeout = float(queue_timeout or 0)
         self.lock = threading.Lock()
-    
+        self._available = threading.Condition(self.lock)
+        self._states = {}
+        self._local = threading.local()
+        self._waiting = 0
+        self._queued_total = 0
+        self._busy_timeouts = 0
+
+    @classmethod
+    def from_config(cls, keys, provider_name, config):
+        """Build a manager using the key_* scheduling settings from config"""
+        return cls(
+            keys, provider_name,
+            rpm_limit=config.get("key_rpm_limit", 0),
+            cooldown=config.get("key_cooldown", cls.DEFAULT_COOLDOWN),
+            max_in_flight=config.get("key_max_concurrency", 0),
+            queue_timeout=config.get("key_queue_timeout", cls.DEFAULT_QUEUE_TIMEOUT)
+        )
+
+    # ------------------------------------------------------------------
+    # Internal helpers (call with self.lock held)
+    # ------------------------------------------------------------------
+
+    def _state(self, key):
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _KeyState(self._burst())
+        return state
+
+    def _burst(self):
+        return max(1.0, self.rpm_limit) if self.rpm_limit > 0 else 1.0
+
+    def _refill(self, state, now):
+        if self.rpm_limit <= 0:
+            return
+        elapsed = now - state.last_refill
+        state.tokens = min(self._burst(), state.tokens + elapsed * self.rpm_limit / 60.0)
+        state.last_refill = now
+
+    def _ready_at(self, key, now):
+        """Monotonic time at which key can take a request"""
+        state = self._state(key)
+        self._refill(state, now)
+        ready = max(now, state.cooldown_until)
+        if self.rpm_limit > 0 and state.tokens < 1.0:
+            ready = max(ready, now + (1.0 - state.tokens) * 60.0 / self.rpm_limit)
+        return ready
+
+    def _saturated(self, key):
+        return self.max_in_flight > 0 and self._state(key).in_flight >= self.max_in_flight
+
+    def _usable(self, exclude=()):
+        return [k for k in self.keys if k not in exclude and not self._state(k).quarantined]
+
+    def _pick(self, candidates):
+        """
+        Choose the best key: ready first, least loaded next, then least recently used.
+
+        Returns:
+            (key, wait_seconds), or (None, 0) if there are no candidates
+        """
+        now = time.monotonic()
+        best = None
+        best_rank = None
+        for key in candidates:
+            state = self._state(key)
+            rank = (self._ready_at(key, now), state.in_flight, state.last_used)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = key, rank
+        if best is None:
+            return None, 0.0
+        return best, best_rank[0] - now
+
+    def _take(self, key, lease=None):
+        """Consume a bucket token for key; count it in flight when leased"""
+        state = self._state(key)
+        self._refill(state, time.monotonic())
+        if self.rpm_limit > 0:
+            state.tokens -= 1.0
+        state.last_used = time.monotonic()
+        state.requests += 1
+        if lease is not None:
+            state.in_flight += 1
+            lease.key = key
+        else:
+            self._local.key = key
+        return key
+
+    def _drop(self, key):
+        """Give back one in-flight slot on key"""
+        state = self._states.get(key)
+        if state is not None and state.in_flight > 0:
+            state.in_flight -= 1
+            self._available.notify_all()
+
+    def _lease(self):
+        lease = getattr(self._local, "lease", None)
+        return lease if lease is not None and not lease.released else None
+
+    def _tried(self):
+        tried = getattr(self._local, "tried", None)
+        if tried is None:
+            tried = self._local.tried = set()
+        return tried
+
+    def _raw_thread_key(self):
+        lease = self._lease()
+        return lease.key if lease is not None else getattr(self._local, "key", None)
+
+    def _thread_key(self):
+        key = self._raw_thread_key()
+        if key is None or key not in self.keys or self._state(key).quarantined:
+            return None
+        return key
+
+    def _acquire_locked(self, lease, rate_wait, queue_timeout):
+        """
+        Wait for a free, ready key and bind it to lease.
+
+        Returns:
+            The key, or None if no usable key exists
+        Raises:
+            KeysBusyError: If every usable key stayed saturated for queue_timeout
+        """
+        start = time.monotonic()
+        rate_deadline = start + rate_wait
+        queue_deadline = start + queue_timeout if queue_timeout > 0 else None
+        queued = False
+        while True:
+            usable = self._usable()
+            if not usable:
+                return None
+            key, wait = self._pick([k for k in usable if not self._saturated(k)])
+            now = time.monotonic()
+            if key is not None:
+                if wait <= 0 or now >= rate_deadline:
+                    return self._take(key, lease)
+                timeout = min(wait, rate_deadline - now)
+            else:
+                if queue_deadline is not None and now >= queue_deadline:
+                    self._busy_timeouts += 1
+                    raise KeysBusyError(
+                        f"All {self.provider_name} API keys are busy "
+                        f"({self.max_in_flight} in flight each)"
+                    )
+                if not queued:
+                    queued = True
+                    self._queued_total += 1
+                timeout = queue_deadline - now if queue_deadline is not None else None
+            self._waiting += 1
+            try:
+                self._available.wait(timeout)
+            finally:
+                self._waiting -= 1
+
+    def _release(self, lease):
+        with self.lock:
+            if lease.released:
+                return
+            lease.released = True
+            if lease.key is not None:
+                self._drop(lease.key)
+            if getattr(self._local, "lease", None) is lease:
+                self._local.lease = lease.parent
+
+    # ------------------------------------------------------------------
+    # Leases and selection
+    # ------------------------------------------------------------------
+
+    def acquire(self, max_wait=None, queue_timeout=None):
+        """
+        Lease a key for a new request on this thread.
+
+        Waits (up to max_wait, default MAX_SELECT_WAIT) when every key is
+        cooling down or out of bucket tokens; after that the soonest-ready
+        key is used anyway and the server's 429 handling takes over. When
+        every key is at key_max_concurrency, blocks until one is released.
+
+        Returns:
+            KeyLease (its key is None if no usable key exists)
+        Raises:
+            KeysBusyError: If no key frees up within queue_timeout seconds
+        """
+        max_wait = self.MAX_SELECT_WAIT if max_wait is None else max_wait
+        queue_timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+        with self.lock:
+            lease = KeyLease(self, None, parent=self._lease())
+            self._acquire_locked(lease, max_wait, queue_timeout)
+            self._local.lease = lease
+            self._local.tried = set()
+            return lease
+
     def get_current_key(self):
-        """Get the current active API key"""
+        """
+        Get the API key held by this thread's current request.
+        
+        Outside a lease (model listing, logging) the best key is returned
+        and remembered for this thread without spending a bucket token or
+        counting a request; only leased requests do that.
+        """
         with self.lock:
-            if not self.keys:
+            key = self._thread_key()
+            if key is not None:
+                return key
+            usable = self._usable()
+            key, _ = self._pick([k for k in usable if not self._saturated(k)] or usable)
+            if key is None:
                 return None
-            if self.current_index >= len(self.keys):
-                self.current_index = 0
-            return self.keys[self.current_index]
-    
+            lease = self._lease()
+            if lease is not None:
+                if lease.key is not None:
+                    self._drop(lease.key)
+                return self._take(key, lease)
+            self._local.key = key
+            return key
+
     def rotate_key(self, reason=""):
-        """Rotate to next available key"""
+        """
+        Move this thread's request to the best key it has not tried yet.
+
+        Never blocks: the released slot on the current key is always free
+        for the retry, so when every untried key is saturated the request
+        stays where it is and None is returned (no rotation happened).
+        """
         with self.lock:
             if not self.keys:
                 return None
-            self.exhausted_keys.add(self.current_index)
-            for i in range(len(self.keys)):
-                next_index = (self.current_index + 1 + i) % len(self.keys)
-                if next_index not in self.exhausted_keys:
-                    self.current_index = next_index
-                    print(f"    → Switched to {self.provider_name} key #{self.current_index + 1} {reason}")
-                    return self.keys[self.current_index]
+            lease = self._lease()
+            tried = self._tried()
+            current = self._raw_thread_key()
+            if current is not None:
+                tried.add(current)
+
+            untried = self._usable(tried)
+            key, _ = self._pick([k for k in untried if not self._saturated(k)])
+            if key is None and untried:
+                if self._thread_key() is not None:
+                    return None
+                # Current key is gone (quarantined/removed): over-commit rather than stall
+                key, _ = self._pick(untried)
+
+            if lease is not None and lease.key is not None:
+                self._drop(lease.key)
+                lease.key = None
+            if key is not None:
+                self._take(key, lease)
+                print(f"    → Switched to {self.provider_name} key #{self.keys.index(key) + 1} {reason}")
+                return key
+
             print(f"    → All {self.provider_name} keys exhausted, resetting...")
-            self.exhausted_keys.clear()
-            self.current_index = 0
-            return self.keys[0] if self.keys else None
-    
+            tried.clear()
+            usable = self._usable()
+            key, _ = self._pick([k for k in usable if not self._saturated(k)] or usable)
+            return self._take(key, lease) if key is not None else None
+
+    # ------------------------------------------------------------------
+    # Failure reporting
+    # ------------------------------------------------------------------
+
+    def mark_rate_limited(self, retry_after=None):
+        """Cool down this thread's key after a 429"""
+        with self.lock:
+            key = self._thread_key()
+            if key is None:
+                return
+            state = self._state(key)
+            cooldown = retry_after if retry_after and retry_after > 0 else self.cooldown
+            state.cooldown_until = max(state.cooldown_until, time.monotonic() + cooldown)
+            state.rate_limited += 1
+            if self.rpm_limit > 0:
+                state.tokens = min(state.tokens, 0.0)
+
+    def mark_invalid(self):
+        """Quarantine this thread's key permanently (401/403)"""
+        with self.lock:
+            key = self._thread_key()
+            if key is None:
+                return
+            state = self._state(key)
+            state.quarantined = True
+            state.failures += 1
+            usable = len(self._usable())
+            print(f"    → Quarantined {self.provider_name} key #{self.keys.index(key) + 1} "
+                  f"({usable} usable key(s) left)")
+            self._available.notify_all()
+
+    def mark_failed(self):
+        """Count a non-rate-limit failure against this thread's key"""
+        with self.lock:
+            key = self._thread_key()
+            if key is not None:
+                self._state(key).failures += 1
+
+    def mark_success(self, ttft=None, tokens_per_second=None):
+        """Record a successful request (and its speed) on this thread's key"""
+        with self.lock:
+            key = self._thread_key()
+            if key is None:
+                return
+            state = self._state(key)
+            state.successes += 1
+            if ttft is not None:
+                state.ttft.add(ttft)
+            if tokens_per_second:
+                state.throughput.add(tokens_per_second)
+
+    # ------------------------------------------------------------------
+    # Pool management
+    # ------------------------------------------------------------------
+
+    def reload_keys(self, keys, config=None):
+        """Replace the key list (hot reload); state of surviving keys is kept"""
+        with self.lock:
+            self.keys = [k for k in keys if k]
+            if config is not None:
+                self.rpm_limit = float(config.get("key_rpm_limit") or 0)
+                self.cooldown = float(config.get("key_cooldown") or 0) or self.DEFAULT_COOLDOWN
+                self.max_in_flight = int(config.get("key_max_concurrency") or 0)
+                self.queue_timeout = float(config.get("key_queue_timeout") or 0)
+            self._states = {k: s for k, s in self._states.items() if k in self.keys}
+            self._available.notify_all()
+
     def get_key_count(self):
         """Get total number of keys"""
         return len(self.keys)
-    
+
     def get_key_number(self):
-        """Get current key number (1-indexed)"""
-        return self.current_index + 1
-    
+        """Get this thread's current key number (1-indexed)"""
+        key = self.get_current_key()
+        return self.keys.index(key) + 1 if key in self.keys else 1
+
     def has_keys(self):
         """Check if any keys are available"""
         return len(self.keys) > 0
-    
+
     def has_more_keys(self):
-        """Check if there are more keys to try"""
-        return len(self.exhausted_keys) < len(self.keys)
-    
+        """Check if this request has usable keys left to try"""
+        with self.lock:
+            return bool(self._usable(self._tried()))
+
     def reset_exhausted(self):
-        """Reset exhausted keys tracking"""
+        """Reset this thread's tried-keys tracking"""
+        with self.lock:
+            self._tried().clear()
+
+    def get_stats(self):
+        """Per-key scheduling state (keys masked)"""
+        with self.lock:
+            now = time.monotonic()
+            stats = []
+            for index, key in enumerate(self.keys):
+                state = self._state(key)
+                self._refill(state, now)
+                stats.append({
+                    "key": f"#{index + 1} …{key[-4:]}",
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "rate_limited": state.rate_limited,
+                    "failures": state.failures,
+                    "successes": state.successes,
+                    "ttft": state.ttft.snapshot((50, 90)),
+                    "tokens_per_second": state.throughput.snapshot((10, 50)),
+                    "quarantined": state.quarantined,
+                    "cooldown_remaining": round(max(0.0, state.cooldown_until - now), 1),
+                    "tokens": round(state.tokens, 2) if self.rpm_limit > 0 else None,
+                })
+            return stats
+
+    def get_queue_stats(self):
+        """Lease queue counters"""
         with self.lock:
-            self.exhausted_keys.clear()
+            return {
+                "max_in_flight": self.max_in_flight,
+                "waiting": self._waiting,
+                "queued_total": self._queued_total,
+                "busy_timeouts": self._busy_timeouts,
+            }
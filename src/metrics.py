@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Rolling latency statistics
+
+RollingPercentiles keeps the most recent N samples of a measurement (time
+to first token, request duration, ...) and answers percentile queries over
+that window, so decisions like hedge delays track current upstream behavior
+rather than all-time history.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+
+def _nearest_rank(ordered, p: float) -> Optional[float]:
+    """Nearest-rank percentile p (0-100) of an already sorted list"""
+    if not ordered:
+        return None
+    rank = math.ceil(min(max(p, 0.0), 100.0) / 100.0 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+class RollingPercentiles:
+    """Percentiles over a sliding window of the most recent samples"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        """Record one sample"""
+        with self._lock:
+            self._samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        Nearest-rank percentile of the current window.
+
+        Args:
+            p: Percentile in [0, 100]
+
+        Returns:
+            The percentile value, or None when there are no samples
+        """
+        with self._lock:
+            ordered = sorted(self._samples)
+        return _nearest_rank(ordered, p)
+
+    def snapshot(self, percentiles: Iterable[float] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+        """Sample count plus the requested percentiles, e.g. {"count": 10, "p50": ...}"""
+        with self._lock:
+            ordered = sorted(self._samples)
+        result: Dict[str, Optional[float]] = {"count": len(ordered)}
+        for p in percentiles:
+            value = _nearest_rank(ordered, p)
+            result[f"p{p:g}"] = round(value, 4) if value is not None else None
+        return result
+
+    def __len__(self) -> int:
+        return len(self._samples)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Pipeline Middleware
+
+Cross-cutting behavior (caching, prompt compression, metrics, redaction, ...)
+plugs into RequestPipeline as an ordered chain of stages instead of being
+written into execute_streaming, execute_simple and execute_unified_stream
+one by one. A stage implements any of four hooks:
+
+    before_request(ctx, request)    before the provider is called; may
+                                    rewrite request.messages or answer the
+                                    request without calling the provider by
+                                    returning a ProviderResult or a live
+                                    answer (see below)
+    on_delta(ctx, kind, content)    every streamed "text" / "thinking" delta;
+                                    returns the (possibly changed) content,
+                                    None or "" drops it
+    after_response(ctx)             after a successful request, before it is
+                                    logged
+    on_error(ctx, error)            instead of after_response when the
+                                    request failed
+
+Stages run in config order; the first before_request that returns an answer
+wins and ctx.served_by records its name. A live answer is an object with
+stream(callback) that passes stream events to callback as they become
+available and returns the final ProviderResult - or None, before delivering
+anything, to let the provider be called after all. A stage that raises is reported and
+skipped - it never fails the request.
+
+Config:
+    pipeline_middleware = cache, metrics, singleflight, mypackage.stages:make_stage
+        # registered names (register_middleware; built-in: cache - see
+        # response_cache.py -, metrics and singleflight - see singleflight.py)
+        # or module:factory paths;
+        # factories are called with the config dict. Empty = no stages.
+
+Stages are built once and reused while pipeline_middleware is unchanged. A
+stage that reads other settings in its factory lists them in config_keys,
+and the chain is rebuilt (resetting every stage's state) when one of them
+changes; a stage can instead re-read its settings per request, as the
+response cache does.
+
+With no stages configured the chain costs well under a microsecond per
+request (test/benchmark_middleware.py): hooks are resolved once per
+configuration and the stream callback is not wrapped at all.
+"""
+
+import importlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import RollingPercentiles
+
+HOOKS = ("before_request", "on_delta", "after_response", "on_error")
+
+
+class PipelineRequest:
+    """What before_request hooks see (and may change) about a request"""
+
+    __slots__ = ("messages", "config", "ai_params", "session", "cancel_token")
+
+    def __init__(self, messages: Optional[List[Dict]], config: Dict, ai_params: Dict, session=None,
+                 cancel_token=None):
+        self.messages = messages
+        self.config = config
+        self.ai_params = ai_params
+        # Chat session of execute_streaming; its messages are built from the
+        # session, so rewriting them has no effect there
+        self.session = session
+        self.cancel_token = cancel_token  # The caller's CancellationToken, if any
+
+    def get_messages(self) -> List[Dict]:
+        """The request's messages (built from the session for chat streams)"""
+        if self.messages is None and self.session is not None:
+            self.messages = self.session.get_conversation_for_api(include_image=True)
+        return self.messages or []
+
+
+class Middleware:
+    """Base class for stages; override only the hooks you need"""
+
+    # Settings the stage reads when it is built; changing one rebuilds the chain
+    config_keys: Tuple[str, ...] = ()
+
+    def before_request(self, ctx, request: PipelineRequest):
+        return None
+
+    def on_delta(self, ctx, kind: str, content: str) -> Optional[str]:
+        return content
+
+    def after_response(self, ctx):
+        pass
+
+    def on_error(self, ctx, error: str):
+        pass
+
+
+def _report(name: str, hook: str, error: Exception):
+    print(f"  [Middleware] {name}.{hook} failed: {error}")
+
+
+class MiddlewareChain:
+    """Ordered stages with their hooks resolved once"""
+
+    def __init__(self, stages: Optional[List[Tuple[str, Any]]] = None, value: Any = None,
+                 config: Optional[Dict] = None):
+        self.stages = list(stages or [])
+        self.value = value
+        keys: List[str] = []
+        for _, stage in self.stages:
+            keys.extend(key for key in getattr(stage, "config_keys", ()) if key not in keys)
+        self.config_keys = tuple(keys)
+        self.settings = self.read_settings(config or {})
+        # (name, bound hook) per hook, leaving out stages that don't override it
+        self._hooks: Dict[str, Tuple[Tuple[str, Callable], ...]] = {}
+        for hook in HOOKS:
+            default = getattr(Middleware, hook)
+            self._hooks[hook] = tuple(
+                (name, getattr(stage, hook)) for name, stage in self.stages
+                if getattr(type(stage), hook, default) is not default
+            )
+        self._before = self._hooks["before_request"]
+        self._delta = self._hooks["on_delta"]
+        self._after = self._hooks["after_response"]
+        self._error = self._hooks["on_error"]
+
+    def __bool__(self) -> bool:
+        return bool(self.stages)
+
+    def read_settings(self, config: Dict) -> Tuple:
+        """config's values for the stages' config_keys"""
+        return tuple(config.get(key) for key in self.config_keys)
+
+    def matches(self, config: Dict) -> bool:
+        """Whether the chain was built for config's middleware settings"""
+        if self.value != config.get("pipeline_middleware"):
+            return False
+        return not self.config_keys or self.read_settings(config) == self.settings
+
+    def before_request(
+        self,
+        ctx,
+        messages: Optional[List[Dict]],
+        config: Dict,
+        ai_params: Dict,
+        session=None,
+        cancel_token=None
+    ):
+        """
+        Run before_request hooks.
+
+        Returns:
+            (messages, answer): the messages to send (possibly rewritten) and
+            the answer (ProviderResult or live answer) of a stage that
+            answered the request, or None
+        """
+        if not self._before:
+            return messages, None
+        request = PipelineRequest(messages, config, ai_params, session, cancel_token)
+        for name, hook in self._before:
+            try:
+                result = hook(ctx, request)
+            except Exception as e:
+                _report(name, "before_request", e)
+                continue
+            if result is not None:
+                ctx.served_by = name
+                return request.messages, result
+        return request.messages, None
+
+    def wrap_stream(self, ctx, stream_wrapper: Callable[[str, Any], None]) -> Callable[[str, Any], None]:
+        """Pass text/thinking deltas through on_delta hooks (unchanged when there are none)"""
+        hooks = self._delta
+        if not hooks:
+            return stream_wrapper
+
+        def wrapper(data_type, content):
+            if data_type == "text" or data_type == "thinking":
+                for name, hook in hooks:
+                    try:
+                        content = hook(ctx, data_type, content)
+                    except Exception as e:
+                        _report(name, "on_delta", e)
+                    if not content:
+                        return
+            stream_wrapper(data_type, content)
+
+        return wrapper
+
+    def finish(self, ctx):
+        """Run on_error hooks for a failed request, after_response hooks otherwise"""
+        if ctx.error:
+            for name, hook in self._error:
+                try:
+                    hook(ctx, ctx.error)
+                except Exception as e:
+                    _report(name, "on_error", e)
+        else:
+            for name, hook in self._after:
+                try:
+                    hook(ctx)
+                except Exception as e:
+                    _report(name, "after_response", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Stage names, plus get_stats() of the stages that have it"""
+        stats: Dict[str, Any] = {"stages": [name for name, _ in self.stages]}
+        for name, stage in self.stages:
+            get = getattr(stage, "get_stats", None)
+            if get is not None:
+                stats[name] = get()
+        return stats
+
+
+# ------------------------------------------------------------------
+# Built-in stages
+# ------------------------------------------------------------------
+
+class MetricsMiddleware(Middleware):
+    """Request, error and latency counters per origin"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self._lock = threading.Lock()
+        self._origins: Dict[str, Dict[str, Any]] = {}
+
+    def _origin(self, ctx) -> Dict[str, Any]:
+        origin = ctx.origin.value
+        stats = self._origins.get(origin)
+        if stats is None:
+            with self._lock:
+                stats = self._origins.setdefault(origin, {
+                    "requests": 0,
+                    "errors": 0,
+                    "served_by_middleware": 0,
+                    "output_tokens": 0,
+                    "latency": RollingPercentiles(),
+                })
+        return stats
+
+    def after_response(self, ctx):
+        stats = self._origin(ctx)
+        with self._lock:
+            stats["requests"] += 1
+            stats["output_tokens"] += ctx.output_tokens
+            if ctx.served_by:
+                stats["served_by_middleware"] += 1
+        stats["latency"].add(ctx.elapsed_time)
+
+    def on_error(self, ctx, error: str):
+        stats = self._origin(ctx)
+        with self._lock:
+            stats["requests"] += 1
+            stats["errors"] += 1
+        stats["latency"].add(ctx.elapsed_time)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            origins = list(self._origins.items())
+        return {
+            origin: dict(stats, latency=stats["latency"].snapshot((50, 95)))
+            for origin, stats in origins
+        }
+
+
+# ------------------------------------------------------------------
+# Registry
+# ------------------------------------------------------------------
+
+def _response_cache(config: Dict):
+    from .response_cache import ResponseCache
+    return ResponseCache(config)
+
+
+def _singleflight(config: Dict):
+    from .singleflight import SingleFlight
+    return SingleFlight(config)
+
+
+_FACTORIES: Dict[str, Callable[[Dict], Any]] = {
+    "cache": _response_cache,
+    "metrics": MetricsMiddleware,
+    "singleflight": _singleflight,
+}
+
+_STALE = object()  # Chain value that matches no setting
+_CHAIN = MiddlewareChain()
+_CHAIN_LOCK = threading.Lock()
+
+
+def register_middleware(name: str, factory: Callable[[Dict], Any]):
+    """
+    Add a stage selectable by name in pipeline_middleware.
+
+    factory(config) returns an object with any of the hooks (subclassing
+    Middleware is optional).
+    """
+    global _CHAIN
+    _FACTORIES[name.lower()] = factory
+    _CHAIN = MiddlewareChain(value=_STALE)  # Rebuilt with the new factory on next use
+
+
+def parse_middleware(value: Any) -> List[str]:
+    """Parse pipeline_middleware ("metrics, pkg.mod:factory") into entries"""
+    if not value or value is True:
+        return []
+    items = value if isinstance(value, (list, tuple)) else str(value).split(",")
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def _load_factory(entry: str) -> Optional[Callable[[Dict], Any]]:
+    factory = _FACTORIES.get(entry.lower())
+    if factory is not None or ":" not in entry:
+        return factory
+    module_name, _, attr = entry.partition(":")
+    module = importlib.import_module(module_name.strip())
+    return getattr(module, attr.strip())
+
+
+def build_chain(config: Dict) -> MiddlewareChain:
+    """Instantiate the stages listed in pipeline_middleware"""
+    value = config.get("pipeline_middleware")
+    stages = []
+    for entry in parse_middleware(value):
+        try:
+            factory = _load_factory(entry)
+            if factory is None:
+                print(f"  [Middleware] Unknown stage '{entry}', skipping")
+                continue
+            stages.append((entry, factory(config)))
+        except Exception as e:
+            print(f"  [Middleware] Could not load '{entry}': {e}")
+    return MiddlewareChain(stages, value, config)
+
+
+def get_middleware_chain(config: Dict) -> MiddlewareChain:
+    """
+    The chain for config's pipeline_middleware.
+
+    Built once and reused while the setting - and the stages' config_keys -
+    are unchanged; changing them builds fresh stages (and so resets their
+    state).
+    """
+    global _CHAIN
+    chain = _CHAIN
+    if chain.value == config.get("pipeline_middleware") and not chain.config_keys:
+        return chain
+    if chain.matches(config):
+        return chain
+    with _CHAIN_LOCK:
+        if not _CHAIN.matches(config):
+            _CHAIN = build_chain(config)
+        return _CHAIN
+
+
+def get_middleware_stats() -> Dict[str, Any]:
+    """Stats of the current chain (for /health)"""
+    return _CHAIN.get_stats()
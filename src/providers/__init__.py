@@ -9,6 +9,8 @@ This module provides a unified interface for different AI API providers:
 from .base import BaseProvider, ProviderResult, StreamCallback, CallbackType, UsageData
 from .openai_compatible import OpenAICompatibleProvider
 from .gemini_native import GeminiNativeProvider
+from .health import HealthTracker, get_health_tracker
+from .timings import RequestTimings
 
 __all__ = [
     'BaseProvider',
@@ -18,4 +20,7 @@ __all__ = [
     'UsageData',
     'OpenAICompatibleProvider',
     'GeminiNativeProvider',
+    'HealthTracker',
+    'get_health_tracker',
+    'RequestTimings',
 ]
\ No newline at end of file
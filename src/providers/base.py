@@ -7,11 +7,24 @@ Retry behavior modeled after reverse-proxy/src/upstream/gemini.js and openai-com
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Callable, Optional, Any, List, Dict
+from typing import Callable, Optional, Any, List, Dict, Tuple
 from enum import Enum
+from email.utils import parsedate_to_datetime
+import json
+import random
+import re
 import time
 
+import requests
+
 from src.console import console, HAVE_RICH
+from .connection_pool import get_connection_pool, DEFAULT_POOL_SIZE
+from .media import encode_json_body
+from ..key_manager import KeysBusyError
+from ..cancellation import CANCELLED_ERROR, CancellationToken
+from . import health
+from .deadlines import Deadlines, StreamWatch
+from .timings import OUTCOME_CANCELLED, OUTCOME_OK, RequestTimings
 
 class CallbackType(Enum):
     """Types of callback events during streaming"""
@@ -21,6 +34,7 @@ class CallbackType(Enum):
     USAGE = "usage"
     DONE = "done"
     ERROR = "error"
+    TIMINGS = "timings"  # RequestTimings.to_dict(), sent once the request finishes
 
 
 @dataclass
@@ -50,6 +64,7 @@ class ProviderResult:
     usage: Optional[UsageData] = None
     error: Optional[str] = None
     retry_count: int = 0
+    timings: Optional[RequestTimings] = None
     
     def has_content(self) -> bool:
         """Check if result has any meaningful content"""
@@ -65,6 +80,51 @@ class ProviderResult:
 StreamCallback = Callable[[CallbackType, Any], None]
 
 
+class FirstTokenProbe:
+    """
+    Stream callback wrapper that timestamps the first content event.
+    
+    The retry loop calls start() before each attempt; ttft is then the
+    time from that attempt's start to its first text/thinking/tool call.
+    The first text and first thinking events are also stamped separately;
+    forwarded tells the retry loop the attempt already produced output.
+    """
+    
+    __slots__ = ("callback", "started", "first_token_at", "first_text_at", "first_thinking_at")
+    
+    FIRST_TOKEN_TYPES = (CallbackType.TEXT, CallbackType.THINKING, CallbackType.TOOL_CALLS)
+    
+    def __init__(self, callback: StreamCallback):
+        self.callback = callback
+        self.start()
+    
+    def start(self):
+        self.started = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.first_text_at: Optional[float] = None
+        self.first_thinking_at: Optional[float] = None
+    
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+    
+    @property
+    def forwarded(self) -> bool:
+        """Whether the current attempt has passed text or thinking on to the callback"""
+        return self.first_text_at is not None or self.first_thinking_at is not None
+    
+    def __call__(self, cb_type: CallbackType, content: Any):
+        if self.first_token_at is None and cb_type in self.FIRST_TOKEN_TYPES:
+            self.first_token_at = time.monotonic()
+        if cb_type == CallbackType.TEXT and self.first_text_at is None:
+            self.first_text_at = time.monotonic()
+        elif cb_type == CallbackType.THINKING and self.first_thinking_at is None:
+            self.first_thinking_at = time.monotonic()
+        self.callback(cb_type, content)
+
+
 class RetryReason(Enum):
     """Reasons for retry"""
     RATE_LIMITED = "rate_limited"
@@ -75,6 +135,81 @@ class RetryReason(Enum):
     NON_RETRYABLE = "non_retryable"
 
 
+class RetryableError(Exception):
+    """
+    Raised by a single request attempt to hand control back to the retry loop.
+    
+    Attributes:
+        reason: RetryReason classifying the failure
+        error: Error message used in the final ProviderResult if retries run out
+        detail: Brief description for the retry log line
+        notify: Text sent as a CallbackType.ERROR event on final failure (None = silent)
+        status_code: HTTP status code (0 if not an HTTP error)
+        retry_after: Upstream hint in seconds (Retry-After header or Gemini retryDelay)
+    """
+    
+    def __init__(
+        self,
+        reason: RetryReason,
+        error: str,
+        detail: str = "",
+        notify: Optional[str] = None,
+        status_code: int = 0,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(error)
+        self.reason = reason
+        self.error = error
+        self.detail = detail
+        self.notify = notify
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers: Any = None, error_text: str = "") -> Optional[float]:
+    """
+    Extract an upstream retry hint in seconds.
+    
+    Honors the standard Retry-After header (seconds or HTTP-date) and the
+    Gemini google.rpc.RetryInfo "retryDelay" field (e.g. "37s") in error bodies.
+    
+    Returns:
+        Delay in seconds, or None if no hint was given
+    """
+    if headers is not None:
+        try:
+            value = headers.get("Retry-After")
+        except Exception:
+            value = None
+        if isinstance(value, (int, float)):
+            return max(0.0, float(value))
+        if isinstance(value, str) and value.strip():
+            value = value.strip()
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    when = parsedate_to_datetime(value)
+                    return max(0.0, when.timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+    
+    if isinstance(error_text, str) and "retryDelay" in error_text:
+        try:
+            data = json.loads(error_text)
+            details = data.get("error", {}).get("details", []) if isinstance(data, dict) else []
+            for detail in details:
+                if isinstance(detail, dict) and "retryDelay" in detail:
+                    return max(0.0, float(str(detail["retryDelay"]).rstrip("s")))
+        except (ValueError, TypeError, AttributeError):
+            # Truncated bodies still carry the hint in plain text
+            match = re.search(r'"retryDelay"\s*:\s*"([\d.]+)s"', error_text)
+            if match:
+                return float(match.group(1))
+    
+    return None
+
+
 class BaseProvider(ABC):
     """
     Abstract base provider with common retry logic.
@@ -82,13 +217,35 @@ class BaseProvider(ABC):
     Retry behavior (matching reverse-proxy):
     - 429 Rate Limit: Immediate key rotation, no delay
     - 401/402/403 Auth Error: Immediate key rotation
-    - 5xx Server Error: 2 second delay, then retry
-    - Empty Response (0 tokens + no content): Key rotation, 2 second delay
-    - Network Error: Key rotation, 1 second delay
+    - 5xx Server Error: retry_delay backoff, then retry
+    - Empty Response (0 tokens + no content): Key rotation, retry_delay backoff
+    - Network Error: Key rotation, 1 second backoff
+    
+    Retries run in an iterative loop (_run_with_retry): the request body is
+    built and serialized once, delays grow exponentially with jitter, and
+    Retry-After / Gemini retryDelay hints are honored whenever the retry
+    would reuse the same key. An overall deadline bounds the whole loop.
     
     Configuration (from config dict):
     - max_retries: Maximum number of retry attempts (default: 3)
     - retry_delay: Delay between retries in seconds (default: 5, used for server errors)
+    - retry_max_delay: Cap for a single backoff delay in seconds (default: 30)
+    - retry_deadline: Overall time budget for all attempts in seconds (default: 300, 0 = none)
+    - http_pool_size: Pooled keep-alive connections per upstream (default: 10)
+    - connect_timeout / stream_first_byte_timeout / stream_idle_timeout /
+      stream_total_timeout: Streaming deadlines (see deadlines.py)
+    
+    HTTP traffic goes through a shared keep-alive session per base URL
+    (see connection_pool.py); subclasses use http_post/http_get/http_delete.
+    
+    When a model is passed to _run_with_retry, every attempt is reported to
+    the shared health tracker (see health.py); an open circuit for the
+    provider+model fails the request immediately and stops further retries.
+    
+    Each request is timed into a RequestTimings (see timings.py): build,
+    per-attempt header/first-byte times and bytes, first text/thinking
+    token and tokens/sec. It is attached to the ProviderResult, sent to the
+    stream callback as TIMINGS and fed to the health tracker and key stats.
     """
     
     # Default retry configuration (used when not specified in config)
@@ -97,12 +254,126 @@ class BaseProvider(ABC):
     RETRY_DELAY_RATE_LIMITED = 0.0  # Immediate retry with key rotation
     RETRY_DELAY_AUTH_ERROR = 0.0  # Immediate retry with key rotation
     RETRY_DELAY_NETWORK_ERROR = 1.0  # seconds
+    # Backoff floor for rate limits when no other key is available
+    RETRY_DELAY_RATE_LIMITED_SAME_KEY = 1.0  # seconds
+    DEFAULT_RETRY_MAX_DELAY = 30.0  # seconds
+    DEFAULT_RETRY_DEADLINE = 300.0  # seconds
+    
+    # Failures that move the request to another key
+    ROTATE_KEY_REASONS = (
+        RetryReason.RATE_LIMITED,
+        RetryReason.AUTH_ERROR,
+        RetryReason.EMPTY_RESPONSE,
+        RetryReason.NETWORK_ERROR,
+    )
     
     def __init__(self, name: str, key_manager=None, config: Optional[Dict] = None):
         self.name = name
         self.key_manager = key_manager
         self.config = config or {}
     
+    @property
+    def health_name(self) -> str:
+        """Provider type the health tracker keys this provider under (google, custom, ...)"""
+        return getattr(self.key_manager, "provider_name", None) or self.name
+    
+    # =========================================================================
+    # HTTP CONNECTION POOL
+    # =========================================================================
+    
+    @property
+    def http(self) -> requests.Session:
+        """Pooled keep-alive session for this provider's base URL"""
+        pool_size = self.config.get("http_pool_size") or DEFAULT_POOL_SIZE
+        return get_connection_pool().get_session(getattr(self, "base_url", ""), pool_size)
+    
+    def http_post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the pooled session"""
+        return self.http.post(url, **kwargs)
+    
+    def http_get(self, url: str, **kwargs) -> requests.Response:
+        """GET through the pooled session"""
+        return self.http.get(url, **kwargs)
+    
+    def http_delete(self, url: str, **kwargs) -> requests.Response:
+        """DELETE through the pooled session"""
+        return self.http.delete(url, **kwargs)
+    
+    def stream_attempt(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: bytes,
+        read: Callable[[requests.Response, StreamWatch], ProviderResult],
+        deadlines: Optional[Deadlines] = None,
+        cancel_token: Optional[CancellationToken] = None,
+        timings: Optional[RequestTimings] = None
+    ) -> ProviderResult:
+        """
+        Send one streaming request and consume it under deadlines.
+        
+        The connect timeout goes to requests; first-byte, idle and total
+        deadlines are enforced by the stream watchdog (see deadlines.py),
+        which closes the response. A missed deadline is raised as a
+        NETWORK_ERROR so the retry loop moves on to another key (unless the
+        attempt already streamed output, see _retry_loop).
+        
+        Args:
+            read: read(response, watch) consumes the response; it must call
+                watch.activity for each body chunk
+            deadlines: Defaults to the provider config's global deadlines
+            cancel_token: Cancelling it closes the response
+            timings: Receives the attempt's header/first-byte times and byte counts
+        """
+        deadlines = deadlines or Deadlines.from_config(self.config)
+        watch = StreamWatch(deadlines)
+        response = self.http_post(
+            url,
+            headers=headers,
+            data=payload,
+            timeout=deadlines.requests_timeout,
+            stream=True
+        )
+        if timings is not None:
+            timings.sent(len(payload))
+        watch.attach(response.close)
+        unregister = cancel_token.on_cancel(response.close) if cancel_token else None
+        try:
+            result = read(response, watch)
+        except Exception:
+            if watch.expired:
+                raise self.stalled_error(watch.expired) from None
+            raise
+        finally:
+            watch.stop()
+            if unregister:
+                unregister()
+            response.close()
+            if timings is not None:
+                timings.received(watch.first_byte_at, watch.bytes_received)
+        if watch.expired:
+            raise self.stalled_error(watch.expired)
+        return result
+    
+    @staticmethod
+    def stalled_error(reason: str) -> RetryableError:
+        """Retryable failure for a stream that missed a deadline"""
+        return RetryableError(
+            RetryReason.NETWORK_ERROR,
+            error=f"Stream stalled: {reason}",
+            detail=reason,
+            notify=f"Stream stalled: {reason}"
+        )
+    
+    def get_connection_stats(self) -> Dict[str, Any]:
+        """Connection reuse counters for this provider's base URL"""
+        stats = get_connection_pool().get_stats()
+        return stats.get(getattr(self, "base_url", "") or "(default)", {
+            "requests": 0,
+            "connections": 0,
+            "reused": 0
+        })
+    
     @abstractmethod
     def generate_stream(
         self, 
@@ -110,7 +381,9 @@ class BaseProvider(ABC):
         model: str, 
         params: Dict,
         callback: StreamCallback,
-        thinking_enabled: bool = False
+        thinking_enabled: bool = False,
+        cancel_token: Optional[CancellationToken] = None,
+        deadlines: Optional[Deadlines] = None
     ) -> ProviderResult:
         """
         Generate a streaming response.
@@ -121,6 +394,9 @@ class BaseProvider(ABC):
             params: Generation parameters (temperature, max_tokens, etc.)
             callback: Callback function for streaming chunks
             thinking_enabled: Whether to enable thinking/reasoning mode
+            cancel_token: Optional token that aborts the stream and any retries
+            deadlines: Connect/first-byte/idle/total limits per attempt
+                (default: from the provider config)
             
         Returns:
             ProviderResult with accumulated content and metadata
@@ -195,33 +471,56 @@ class BaseProvider(ABC):
         max_retries = self.config.get("max_retries", self.DEFAULT_MAX_RETRIES)
         return retry_count < max_retries
     
-    def get_retry_delay(self, reason: RetryReason) -> float:
+    def get_retry_delay(
+        self,
+        reason: RetryReason,
+        retry_count: int = 0,
+        retry_after: Optional[float] = None,
+        rotated: bool = False
+    ) -> float:
         """
         Get the delay before retrying based on reason.
         
-        Uses config.retry_delay for server errors and empty responses,
-        with fixed delays for rate limiting (0) and network errors (1s).
+        Base delays: config.retry_delay for server errors and empty responses,
+        0 for rate limiting/auth errors and 1s for network errors. The base
+        grows exponentially with the retry count (capped at retry_max_delay)
+        and gets jitter so concurrent requests don't retry in lockstep.
         
         Args:
             reason: The RetryReason
+            retry_count: Number of retries already made
+            retry_after: Upstream retry hint in seconds, if any
+            rotated: Whether the retry will use a different key
             
         Returns:
             Delay in seconds (0 for immediate retry)
         """
         # Get configurable delay (used for server errors and empty responses)
-        retry_delay = self.config.get("retry_delay", self.DEFAULT_RETRY_DELAY)
+        retry_delay = float(self.config.get("retry_delay", self.DEFAULT_RETRY_DELAY))
+        max_delay = float(self.config.get("retry_max_delay", self.DEFAULT_RETRY_MAX_DELAY))
         
-        if reason == RetryReason.RATE_LIMITED:
-            return self.RETRY_DELAY_RATE_LIMITED  # Immediate retry with different key
-        if reason == RetryReason.AUTH_ERROR:
-            return self.RETRY_DELAY_AUTH_ERROR  # Immediate retry with different key
-        if reason == RetryReason.SERVER_ERROR:
-            return float(retry_delay)  # Use config value
-        if reason == RetryReason.EMPTY_RESPONSE:
-            return float(retry_delay)  # Use config value
-        if reason == RetryReason.NETWORK_ERROR:
-            return self.RETRY_DELAY_NETWORK_ERROR
-        return 0
+        if reason in (RetryReason.RATE_LIMITED, RetryReason.AUTH_ERROR):
+            if rotated:
+                return 0.0  # Immediate retry with a different key
+            if reason == RetryReason.AUTH_ERROR:
+                return self.RETRY_DELAY_AUTH_ERROR
+            base = self.RETRY_DELAY_RATE_LIMITED_SAME_KEY
+        elif reason in (RetryReason.SERVER_ERROR, RetryReason.EMPTY_RESPONSE):
+            base = retry_delay  # Use config value
+        elif reason == RetryReason.NETWORK_ERROR:
+            base = self.RETRY_DELAY_NETWORK_ERROR
+        else:
+            return 0.0
+        
+        delay = min(max_delay, base * (2 ** max(0, retry_count)))
+        # Equal jitter: keep at least half the backoff, randomize the rest
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        
+        # Upstream hints describe the key we just used - honor them when retrying on it
+        if retry_after is not None and not rotated:
+            delay = max(delay, retry_after)
+        
+        return round(delay, 2)
     
     def rotate_key_if_possible(self, reason: str) -> bool:
         """
@@ -238,6 +537,319 @@ class BaseProvider(ABC):
             return new_key is not None and self.key_manager.has_more_keys()
         return False
     
+    def report_key_failure(self, failure: RetryableError):
+        """
+        Tell the key scheduler why the current key failed.
+        
+        429 cools the key down (for Retry-After seconds when given),
+        401/403 quarantine it for good; other failures are only counted.
+        """
+        if failure.reason == RetryReason.RATE_LIMITED:
+            self.key_manager.mark_rate_limited(failure.retry_after)
+        elif failure.status_code in (401, 403):
+            self.key_manager.mark_invalid()
+        else:
+            self.key_manager.mark_failed()
+    
+    def classify_failure(self, failure: RetryableError) -> str:
+        """Health-tracker failure kind (see health.py) for a RetryableError"""
+        if failure.reason == RetryReason.RATE_LIMITED:
+            return health.FAILURE_RATE_LIMITED
+        if failure.reason == RetryReason.AUTH_ERROR or failure.status_code in (401, 403):
+            return health.FAILURE_AUTH
+        if failure.reason == RetryReason.EMPTY_RESPONSE:
+            return health.FAILURE_EMPTY
+        if failure.reason == RetryReason.NETWORK_ERROR:
+            return health.FAILURE_NETWORK
+        if failure.status_code >= 500:
+            return health.FAILURE_SERVER_ERROR
+        if failure.reason == RetryReason.SERVER_ERROR and not failure.status_code:
+            return health.FAILURE_UNEXPECTED
+        return health.FAILURE_CLIENT
+    
+    def serialize_body(self, body: Dict) -> bytes:
+        """
+        Serialize a request body to JSON bytes once, for reuse across retries.
+        
+        Media placeholders (see media.py) are materialized here, straight
+        into the request bytes.
+        
+        Args:
+            body: Request body dict
+            
+        Returns:
+            UTF-8 encoded compact JSON
+        """
+        return encode_json_body(body)
+    
+    def _extract_error_brief(self, error_text: str, status_code: int = 0) -> str:
+        """Extract a brief error description (providers override for their formats)"""
+        first_line = error_text.split('\n')[0][:100] if error_text else ""
+        if status_code:
+            return f"HTTP {status_code}: {first_line[:80]}"
+        return first_line or "Unknown error"
+    
+    def error_from_response(self, response: requests.Response) -> RetryableError:
+        """
+        Classify a non-200 HTTP response for the retry loop.
+        
+        Args:
+            response: Upstream response with an error status
+            
+        Returns:
+            RetryableError describing the failure (not raised)
+        """
+        error_text = response.text[:500]
+        status_code = response.status_code
+        return RetryableError(
+            reason=self.get_retry_reason(status_code, error_text),
+            error=f"API error ({status_code}): {error_text}",
+            detail=self._extract_error_brief(error_text, status_code),
+            notify=error_text,
+            status_code=status_code,
+            retry_after=parse_retry_after(response.headers, error_text)
+        )
+    
+    def _run_with_retry(
+        self,
+        attempt: Callable[[int], ProviderResult],
+        callback: Optional[StreamCallback] = None,
+        retry_unexpected: bool = True,
+        cancel_token: Optional[CancellationToken] = None,
+        model: Optional[str] = None,
+        probe: Optional[FirstTokenProbe] = None,
+        timings: Optional[RequestTimings] = None
+    ) -> ProviderResult:
+        """
+        Run request attempts until one succeeds or retries are exhausted.
+        
+        The attempt function performs exactly one HTTP request. It returns a
+        ProviderResult when done (success or terminal failure) and raises
+        RetryableError - or lets requests exceptions escape - to ask for a retry.
+        
+        Args:
+            attempt: Callable taking the current retry count
+            callback: Stream callback notified with ERROR on final failure
+            retry_unexpected: Whether unexpected exceptions are retried as server errors
+            cancel_token: Once cancelled, the failed attempt is not retried
+            model: Model name; when given, outcomes feed the health tracker
+                and an open circuit fails the request without sending it
+            probe: FirstTokenProbe wrapping the stream callback, for TTFT
+            timings: RequestTimings started before the body was built
+                (a fresh one is created when omitted)
+            
+        The request holds a key lease (see key_manager.py) for all of its
+        attempts; rotation moves the lease rather than taking a second one.
+        
+        Returns:
+            ProviderResult with retry_count and timings set
+        """
+        tracker = health.get_health_tracker()
+        if model is not None and not tracker.allow_request(self.health_name, model):
+            error = (f"Circuit open for {self.health_name}/{model} "
+                     f"(retry in {tracker.retry_in(self.health_name, model):.0f}s)")
+            self.log("warn", error)
+            if callback:
+                callback(CallbackType.ERROR, error)
+            return ProviderResult(success=False, error=error)
+        
+        lease = None
+        if self.key_manager:
+            try:
+                lease = self.key_manager.acquire()
+            except KeysBusyError as e:
+                self.log_error(str(e))
+                if callback:
+                    callback(CallbackType.ERROR, str(e))
+                if model is not None:
+                    tracker.release(self.health_name, model)
+                return ProviderResult(success=False, error=str(e))
+        if timings is None:
+            timings = RequestTimings()
+        try:
+            result = self._retry_loop(attempt, callback, retry_unexpected, cancel_token, model, probe, timings)
+        finally:
+            if lease is not None:
+                lease.release()
+        result.timings = timings
+        if callback:
+            callback(CallbackType.TIMINGS, timings.to_dict())
+        return result
+    
+    def _retry_loop(
+        self,
+        attempt: Callable[[int], ProviderResult],
+        callback: Optional[StreamCallback],
+        retry_unexpected: bool,
+        cancel_token: Optional[CancellationToken] = None,
+        model: Optional[str] = None,
+        probe: Optional[FirstTokenProbe] = None,
+        timings: Optional[RequestTimings] = None
+    ) -> ProviderResult:
+        """Attempt/backoff loop of _run_with_retry, run while a key lease is held"""
+        timings = timings or RequestTimings()
+        timeout = self.config.get("request_timeout", 120)
+        deadline_budget = float(self.config.get("retry_deadline", self.DEFAULT_RETRY_DEADLINE) or 0)
+        deadline = time.monotonic() + deadline_budget if deadline_budget > 0 else None
+        retry_count = 0
+        tracker = health.get_health_tracker() if model is not None else None
+        
+        while True:
+            if cancel_token is not None and cancel_token.cancelled:
+                if tracker:
+                    tracker.release(self.health_name, model)
+                return ProviderResult(success=False, error=CANCELLED_ERROR, retry_count=retry_count)
+            started = timings.start_attempt(retry_count, self._attempt_key_number()).started
+            if probe is not None:
+                probe.start()
+            try:
+                result = attempt(retry_count)
+            except Exception as e:
+                # Closing the response on cancel makes the read fail with
+                # whatever the transport raises; that is not a failure
+                if cancel_token is not None and cancel_token.cancelled:
+                    return self._cancelled(cancel_token, timings, tracker, model, retry_count)
+                failure, kind = self._attempt_failure(e, timeout, retry_unexpected)
+            else:
+                # A cancelled stream ends quietly with the text read so far,
+                # which must not pass for the complete answer
+                if cancel_token is not None and cancel_token.cancelled:
+                    return self._cancelled(cancel_token, timings, tracker, model, retry_count)
+                result.retry_count = retry_count
+                timings.end_attempt(OUTCOME_OK if result.success else "failed")
+                if result.success:
+                    self._record_success(result, timings, probe, tracker, model, time.monotonic() - started)
+                elif tracker:
+                    tracker.release(self.health_name, model)
+                return result
+            
+            timings.end_attempt(kind)
+            circuit_open = tracker is not None and tracker.record_failure(self.health_name, model, kind)
+            if circuit_open:
+                self.log("warn", f"Circuit open for {self.health_name}/{model}, not retrying")
+            
+            # A retry starts the answer over, but the caller already has the
+            # deltas this attempt forwarded; failing beats duplicating them
+            partial = probe is not None and probe.forwarded
+            if partial:
+                self.log("warn", f"Stream failed after sending output, not retrying ({failure.detail})")
+            
+            if not circuit_open and not partial and self.should_retry(failure.reason, retry_count):
+                rotated = False
+                if failure.reason in self.ROTATE_KEY_REASONS and self.key_manager:
+                    self.report_key_failure(failure)
+                    rotated = self.rotate_key_if_possible(f"({failure.reason.value})")
+                    # A single-key pool "rotates" back onto the same key
+                    rotated = rotated and self.key_manager.get_key_count() != 1
+                
+                delay = self.get_retry_delay(failure.reason, retry_count, failure.retry_after, rotated)
+                
+                if deadline is None or time.monotonic() + delay < deadline:
+                    self.log_retry(failure.reason, retry_count + 1, delay, failure.detail)
+                    if delay > 0:
+                        if cancel_token is not None:
+                            cancel_token.wait(delay)
+                        else:
+                            time.sleep(delay)
+                    retry_count += 1
+                    continue
+                
+                self.log("warn", f"Retry deadline of {deadline_budget:.0f}s reached, giving up")
+            
+            if failure.status_code:
+                self.log_error(f"API error: {failure.notify}", failure.status_code)
+            if callback and failure.notify is not None:
+                callback(CallbackType.ERROR, failure.notify)
+            return ProviderResult(
+                success=False,
+                error=failure.error,
+                retry_count=retry_count
+            )
+
+    def _attempt_failure(
+        self,
+        e: Exception,
+        timeout: float,
+        retry_unexpected: bool
+    ) -> Tuple[RetryableError, str]:
+        """Log an attempt's exception and map it to (RetryableError, health failure kind)"""
+        if isinstance(e, RetryableError):
+            return e, self.classify_failure(e)
+        
+        if isinstance(e, requests.exceptions.Timeout):
+            self.log_error(f"Request timeout after {timeout}s")
+            return RetryableError(
+                RetryReason.NETWORK_ERROR,
+                error=f"Request timeout after {timeout}s",
+                detail=f"timeout after {timeout}s",
+                notify=f"Request timeout after {timeout}s"
+            ), health.FAILURE_TIMEOUT
+        
+        error_msg = str(e)
+        if isinstance(e, requests.exceptions.RequestException):
+            self.log_error(f"Network error: {error_msg}")
+            return RetryableError(
+                RetryReason.NETWORK_ERROR,
+                error=f"Network error: {error_msg}",
+                detail=error_msg[:100],
+                notify=error_msg
+            ), health.FAILURE_NETWORK
+        
+        self.log_error(f"Unexpected error: {error_msg}")
+        return RetryableError(
+            RetryReason.SERVER_ERROR if retry_unexpected else RetryReason.NON_RETRYABLE,
+            error=f"Unexpected error: {error_msg}",
+            detail=error_msg[:100],
+            notify=error_msg
+        ), health.FAILURE_UNEXPECTED
+    
+    def _cancelled(
+        self,
+        cancel_token: CancellationToken,
+        timings: RequestTimings,
+        tracker: Optional[health.HealthTracker],
+        model: Optional[str],
+        retry_count: int
+    ) -> ProviderResult:
+        """Result for an attempt stopped by cancel_token: no retry, no health outcome"""
+        timings.end_attempt(OUTCOME_CANCELLED)
+        self.log("info", f"Request cancelled ({cancel_token.reason})")
+        if tracker:
+            tracker.release(self.health_name, model)
+        return ProviderResult(success=False, error=CANCELLED_ERROR, retry_count=retry_count)
+    
+    def _attempt_key_number(self) -> Optional[int]:
+        if not self.key_manager:
+            return None
+        number = self.key_manager.get_key_number()
+        return number if isinstance(number, int) else None
+
+    def _record_success(
+        self,
+        result: ProviderResult,
+        timings: RequestTimings,
+        probe: Optional[FirstTokenProbe],
+        tracker: Optional["health.HealthTracker"],
+        model: Optional[str],
+        latency: float
+    ):
+        """Finish the timings of a successful attempt and feed health/key stats"""
+        if result.usage and result.usage.completion_tokens:
+            completion_tokens = result.usage.completion_tokens
+        else:
+            completion_tokens = estimate_tokens(result.content + result.thinking_content)
+        timings.finish(probe, completion_tokens)
+        ttft = probe.ttft if probe is not None else None
+        attempt = timings.current
+        if tracker:
+            tracker.record_success(
+                self.health_name, model, latency, ttft,
+                ttfb=attempt.first_byte if attempt else None,
+                tokens_per_second=timings.tokens_per_second
+            )
+        if self.key_manager:
+            self.key_manager.mark_success(ttft, timings.tokens_per_second)
+
     def detect_empty_response(
         self,
         content: str,
@@ -338,8 +950,8 @@ def estimate_message_tokens(messages: List[Dict]) -> int:
             for item in content:
                 if item.get("type") == "text":
                     total += estimate_tokens(item.get("text", ""))
-                elif item.get("type") == "image_url":
-                    # Estimate ~85 tokens per image (conservative)
+                elif item.get("type") in ("image_url", "media"):
+                    # Estimate ~85 tokens per image/attachment (conservative)
                     total += 85
         # Add overhead for role, etc.
         total += 4
@@ -0,0 +1,133 @@
+"""
+Shared HTTP Connection Pool
+
+Keeps one long-lived requests.Session per upstream base URL so that every
+provider call reuses keep-alive connections instead of paying a fresh
+TCP+TLS handshake per request.
+
+Sessions are shared across threads and across provider instances that
+point at the same base URL.
+"""
+
+import threading
+from typing import Dict, Tuple, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Default number of pooled connections per upstream host
+DEFAULT_POOL_SIZE = 10
+
+
+class ConnectionPool:
+    """
+    Registry of pooled HTTP sessions keyed by (base_url, pool_size).
+
+    Each session mounts an HTTPAdapter sized from config so concurrent
+    requests (Flask threads, GUI streams, file processor) can each hold a
+    keep-alive connection without evicting one another.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[Tuple[str, int], requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def get_session(self, base_url: str, pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+        """
+        Get (or create) the pooled session for an upstream base URL.
+
+        Args:
+            base_url: Upstream base URL the session is dedicated to
+            pool_size: Maximum number of pooled connections per host
+
+        Returns:
+            Shared requests.Session
+        """
+        pool_size = max(1, int(pool_size or DEFAULT_POOL_SIZE))
+        key = (base_url or "", pool_size)
+
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._create_session(pool_size)
+                self._sessions[key] = session
+            return session
+
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
+        """Create a keep-alive session with a sized connection pool"""
+        session = requests.Session()
+        # Retries are handled by BaseProvider, not urllib3
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report connection reuse per upstream base URL.
+
+        Returns:
+            Dict of base_url -> {"requests", "connections", "reused", "pool_size"}
+        """
+        stats = {}
+        with self._lock:
+            items = list(self._sessions.items())
+
+        for (base_url, pool_size), session in items:
+            requests_made = 0
+            connections_opened = 0
+            for adapter in set(session.adapters.values()):
+                pool_manager = getattr(adapter, "poolmanager", None)
+                if pool_manager is None:
+                    continue
+                try:
+                    for pool_key in list(pool_manager.pools.keys()):
+                        host_pool = pool_manager.pools.get(pool_key)
+                        if host_pool is None:
+                            continue
+                        requests_made += getattr(host_pool, "num_requests", 0)
+                        connections_opened += getattr(host_pool, "num_connections", 0)
+                except Exception:
+                    continue
+
+            entry = stats.setdefault(base_url or "(default)", {
+                "requests": 0,
+                "connections": 0,
+                "reused": 0,
+                "pool_size": pool_size
+            })
+            entry["requests"] += requests_made
+            entry["connections"] += connections_opened
+            entry["reused"] += max(0, requests_made - connections_opened)
+
+        return stats
+
+    def close_all(self):
+        """Close all pooled sessions (used on shutdown)"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                pass
+
+
+# Global pool shared by all providers
+_POOL = ConnectionPool()
+
+
+def get_connection_pool() -> ConnectionPool:
+    """Get the global connection pool"""
+    return _POOL
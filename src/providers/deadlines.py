@@ -0,0 +1,192 @@
+"""
+Streaming Request Deadlines
+
+A single request_timeout used to cover connecting, waiting for the first
+byte and every gap between chunks, so a stream that stalled mid-response
+could hang for the full timeout. Deadlines splits it:
+
+- connect:    TCP/TLS connect (requests' connect timeout)
+- first_byte: request sent -> first body chunk (headers included)
+- idle:       longest gap between body chunks once streaming
+- total:      whole attempt, 0 = unbounded (retry_deadline still applies)
+
+A shared watchdog thread checks every registered StreamWatch and closes the
+response of an attempt that misses a deadline; BaseProvider.stream_attempt
+then raises a NETWORK_ERROR RetryableError, so the retry loop resumes on
+another key.
+
+Config (globals, overridable per origin):
+    connect_timeout = 10
+    stream_first_byte_timeout =         # empty = request_timeout
+    stream_idle_timeout = 30
+    stream_total_timeout = 0
+    origin_deadlines = popup_prompt: first_byte=15, idle=10; endpoint/ocr: total=300
+"""
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_CONNECT = 10.0
+DEFAULT_IDLE = 30.0
+
+# Watchdog resolution: deadlines fire at most this late
+POLL_INTERVAL = 0.1
+
+_FIELDS = ("connect", "first_byte", "idle", "total")
+
+
+def parse_origin_deadlines(value: Any) -> Dict[str, Dict[str, float]]:
+    """
+    Parse origin_deadlines ("popup_prompt: first_byte=15, idle=10; snip_tool: idle=5")
+    into {origin: {field: seconds}}. Unknown fields and bad numbers are ignored.
+    """
+    if not value or value is True:
+        return {}
+    origins: Dict[str, Dict[str, float]] = {}
+    for entry in str(value).split(";"):
+        origin, _, settings = entry.partition(":")
+        origin = origin.strip().lower()
+        if not origin:
+            continue
+        values = origins.setdefault(origin, {})
+        for setting in settings.split(","):
+            name, _, number = setting.partition("=")
+            name = name.strip().lower()
+            if name not in _FIELDS:
+                continue
+            try:
+                values[name] = float(number)
+            except ValueError:
+                pass
+    return origins
+
+
+@dataclass(frozen=True)
+class Deadlines:
+    """Per-attempt time limits for a streaming request (seconds)"""
+    connect: float = DEFAULT_CONNECT
+    first_byte: float = 120.0
+    idle: float = DEFAULT_IDLE
+    total: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: Dict, origin: Optional[str] = None) -> "Deadlines":
+        """Global deadlines from config, with origin_deadlines overrides for origin"""
+        request_timeout = float(config.get("request_timeout") or 120)
+        deadlines = cls(
+            connect=float(config.get("connect_timeout") or DEFAULT_CONNECT),
+            first_byte=float(config.get("stream_first_byte_timeout") or request_timeout),
+            idle=float(config.get("stream_idle_timeout") or DEFAULT_IDLE),
+            total=float(config.get("stream_total_timeout") or 0),
+        )
+        if origin:
+            overrides = parse_origin_deadlines(config.get("origin_deadlines")).get(origin.lower())
+            if overrides:
+                deadlines = replace(deadlines, **overrides)
+        return deadlines
+
+    @property
+    def requests_timeout(self) -> Tuple[float, float]:
+        """
+        (connect, read) timeout for requests.
+
+        The read timeout bounds the wait for response headers and each socket
+        read; the watchdog enforces the tighter idle and total limits.
+        """
+        return (self.connect, max(self.first_byte, self.idle))
+
+
+class StreamWatch:
+    """
+    Deadline state of one streaming attempt.
+
+    Create it right before sending the request, attach() the response once
+    headers arrive and call activity() for every body chunk.
+    """
+
+    __slots__ = ("deadlines", "started", "last_activity", "first_byte_at", "bytes_received",
+                 "expired", "_close")
+
+    def __init__(self, deadlines: Deadlines):
+        self.deadlines = deadlines
+        self.started = time.monotonic()
+        self.last_activity = self.started
+        self.first_byte_at: Optional[float] = None
+        self.bytes_received = 0
+        self.expired: Optional[str] = None
+        self._close: Optional[Callable[[], None]] = None
+
+    def attach(self, close: Callable[[], None]):
+        """Start watching; close is called (from the watchdog thread) on a missed deadline"""
+        self._close = close
+        _WATCHDOG.add(self)
+
+    def stop(self):
+        _WATCHDOG.discard(self)
+
+    def activity(self, nbytes: int = 0):
+        now = time.monotonic()
+        if self.first_byte_at is None:
+            self.first_byte_at = now
+        self.last_activity = now
+        self.bytes_received += nbytes
+
+    def check(self, now: float) -> Optional[str]:
+        """Name of the deadline missed at time now, or None"""
+        deadlines = self.deadlines
+        if deadlines.total and now - self.started > deadlines.total:
+            return f"total deadline of {deadlines.total:g}s exceeded"
+        if self.first_byte_at is None:
+            if now - self.started > deadlines.first_byte:
+                return f"no data after {deadlines.first_byte:g}s"
+        elif now - self.last_activity > deadlines.idle:
+            return f"stream idle for {deadlines.idle:g}s"
+        return None
+
+    def expire(self, reason: str):
+        self.expired = reason
+        if self._close:
+            try:
+                self._close()
+            except Exception:
+                pass
+
+
+class _Watchdog:
+    """Background thread that expires overdue StreamWatches"""
+
+    def __init__(self):
+        self._watches = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, watch: StreamWatch):
+        with self._cond:
+            self._watches.add(watch)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="StreamWatchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def discard(self, watch: StreamWatch):
+        with self._cond:
+            self._watches.discard(watch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._watches:
+                    self._cond.wait()
+                self._cond.wait(POLL_INTERVAL)
+                watches = list(self._watches)
+            now = time.monotonic()
+            for watch in watches:
+                reason = watch.check(now)
+                if reason:
+                    self.discard(watch)
+                    watch.expire(reason)
+
+
+_WATCHDOG = _Watchdog()
@@ -13,7 +13,6 @@ Reference: JSON-request-reference.md and reverse-proxy/src/upstream/gemini.js
 
 import json
 import os
-import re
 import time
 from dataclasses import dataclass
 from pathlib import Path
@@ -24,12 +23,20 @@ from .base import (
     BaseProvider,
     ProviderResult,
     StreamCallback,
+    FirstTokenProbe,
     UsageData,
     CallbackType,
     RetryReason,
+    RetryableError,
     estimate_tokens,
     estimate_message_tokens
 )
+from .media import MediaPart
+from .deadlines import Deadlines, StreamWatch
+from .timings import RequestTimings
+from .sse import iter_sse_events
+from src.cancellation import CancellationToken
+from src.text_buffer import TextBuffer
 
 
 # Base URL for Gemini API
@@ -184,7 +191,7 @@ class GeminiNativeProvider(BaseProvider):
                 }
             }
             
-            init_response = requests.post(
+            init_response = self.http_post(
                 init_url,
                 headers=init_headers,
                 json=init_body,
@@ -213,7 +220,7 @@ class GeminiNativeProvider(BaseProvider):
                 "X-Goog-Upload-Command": "upload, finalize"
             }
             
-            upload_response = requests.post(
+            upload_response = self.http_post(
                 upload_url,
                 headers=upload_headers,
                 data=file_data,
@@ -269,7 +276,7 @@ class GeminiNativeProvider(BaseProvider):
         headers = {"x-goog-api-key": current_key}
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self.http_get(url, headers=headers, timeout=30)
             
             if response.status_code != 200:
                 return None, f"Failed to get file info ({response.status_code}): {response.text[:200]}"
@@ -300,7 +307,7 @@ class GeminiNativeProvider(BaseProvider):
         headers = {"x-goog-api-key": current_key}
         
         try:
-            response = requests.delete(url, headers=headers, timeout=30)
+            response = self.http_delete(url, headers=headers, timeout=30)
             
             if response.status_code not in (200, 204):
                 return False, f"Failed to delete file ({response.status_code}): {response.text[:200]}"
@@ -332,7 +339,7 @@ class GeminiNativeProvider(BaseProvider):
         headers = {"x-goog-api-key": current_key}
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self.http_get(url, headers=headers, timeout=30)
             
             if response.status_code != 200:
                 return None, f"Failed to list files ({response.status_code}): {response.text[:200]}"
@@ -399,13 +406,13 @@ class GeminiNativeProvider(BaseProvider):
         }
 
         try:
-            response = requests.post(
+            response = self.http_post(
                 url,
                 headers={
                     "Content-Type": "application/json",
                     "x-goog-api-key": current_key
                 },
-                json=req_body,
+                data=self.serialize_body(req_body),
                 timeout=30
             )
             
@@ -426,7 +433,7 @@ class GeminiNativeProvider(BaseProvider):
         url = f"{self.base_url}/{batch_name}"
         
         try:
-            response = requests.get(
+            response = self.http_get(
                 url,
                 headers={"x-goog-api-key": current_key},
                 timeout=30
@@ -446,7 +453,7 @@ class GeminiNativeProvider(BaseProvider):
         url = f"{self.base_url}/batches?pageSize={page_size}"
         
         try:
-            response = requests.get(
+            response = self.http_get(
                 url,
                 headers={"x-goog-api-key": current_key},
                 timeout=30
@@ -466,7 +473,7 @@ class GeminiNativeProvider(BaseProvider):
         url = f"{self.base_url}/{batch_name}:cancel"
         
         try:
-            response = requests.post(
+            response = self.http_post(
                 url,
                 headers={"x-goog-api-key": current_key},
                 timeout=30
@@ -625,48 +632,26 @@ class GeminiNativeProvider(BaseProvider):
                 part = None
                 is_media = False
                 
+                media = None
+                
                 if item.get("type") == "text":
                     part = {"text": item.get("text", "")}
+                elif item.get("type") == "media":
+                    # Internal media part (session attachments)
+                    media = item.get("media")
                 elif item.get("type") == "image_url":
-                    image_url = item.get("image_url", {}).get("url", "")
-                    # Parse data URL
-                    match = re.match(r"data:([^;]+);base64,(.+)", image_url)
-                    if match:
-                        mime_type, b64_data = match.groups()
-                        part = {
-                            "inline_data": {
-                                "mime_type": mime_type,
-                                "data": b64_data
-                            }
-                        }
-                        is_media = True
+                    # Reference the data URL payload without copying it
+                    media = MediaPart.from_data_url(item.get("image_url", {}).get("url", ""))
                 elif item.get("type") == "inline_data":
                     # Native inline data (audio, etc.)
                     inline = item.get("inline_data", {})
-                    part = {
-                        "inline_data": {
-                            "mime_type": inline.get("mime_type", ""),
-                            "data": inline.get("data", "")
-                        }
-                    }
-                    is_media = True
+                    media = MediaPart.from_base64(inline.get("mime_type", ""), inline.get("data", ""))
                 elif item.get("type") == "file":
                     # Generic file type (PDF, etc.)
                     # Can be nested {"file": {"url": ...}} or flat {"url": ...}
                     file_obj = item.get("file", {})
                     url = file_obj.get("url", "") or item.get("url", "")
-                    
-                    # Check for data URL
-                    match = re.match(r"data:([^;]+);base64,(.+)", url)
-                    if match:
-                        mime_type, b64_data = match.groups()
-                        part = {
-                            "inline_data": {
-                                "mime_type": mime_type,
-                                "data": b64_data
-                            }
-                        }
-                        is_media = True
+                    media = MediaPart.from_data_url(url)
                 elif item.get("type") == "file_data":
                     # File uploaded via Files API
                     file_data = item.get("file_data", {})
@@ -678,6 +663,16 @@ class GeminiNativeProvider(BaseProvider):
                     }
                     is_media = True
                 
+                if media is not None:
+                    # Base64 is written straight into the request bytes at serialization
+                    part = {
+                        "inline_data": {
+                            "mime_type": media.mime_type,
+                            "data": media.wire_base64()
+                        }
+                    }
+                    is_media = True
+                
                 if part:
                     all_parts.append(part)
                     if is_media:
@@ -780,7 +775,8 @@ class GeminiNativeProvider(BaseProvider):
         params: Dict,
         callback: StreamCallback,
         thinking_enabled: bool = False,
-        retry_count: int = 0
+        cancel_token: Optional[CancellationToken] = None,
+        deadlines: Optional[Deadlines] = None
     ) -> ProviderResult:
         """
         Generate a streaming response with full retry logic.
@@ -791,255 +787,174 @@ class GeminiNativeProvider(BaseProvider):
                 error="No API keys configured for Gemini"
             )
         
-        current_key = self.key_manager.get_current_key()
-        if not current_key:
-            return ProviderResult(
-                success=False,
-                error="No API key available"
-            )
+        url = self._get_url(model, streaming=True)
         
-        key_num = self.key_manager.get_key_number()
-        timeout = self.config.get("request_timeout", 120)
+        timings = RequestTimings()
+        # Built and serialized once - retries resend the same bytes
+        body = self._build_request_body(messages, model, params, thinking_enabled)
+        payload = self.serialize_body(body)
+        timings.built()
         
-        url = self._get_url(model, streaming=True)
-        headers = {
+        # Times the first token of each attempt for the health tracker
+        probe = FirstTokenProbe(callback)
+        
+        def attempt(retry_count: int) -> ProviderResult:
+            current_key = self.key_manager.get_current_key()
+            if not current_key:
+                return ProviderResult(
+                    success=False,
+                    error="No API key available"
+                )
+            
+            key_num = self.key_manager.get_key_number()
+            self.log_request(model, key_num, thinking_enabled, streaming=True, retry=retry_count)
+            
+            return self.stream_attempt(
+                url,
+                self._get_headers(current_key),
+                payload,
+                lambda response, watch: self._read_stream(
+                    response, messages, key_num, probe, cancel_token, watch
+                ),
+                deadlines,
+                cancel_token,
+                timings
+            )
+        
+        return self._run_with_retry(
+            attempt, callback=callback, cancel_token=cancel_token, model=model, probe=probe, timings=timings
+        )
+    
+    def _get_headers(self, api_key: str) -> Dict[str, str]:
+        """Get request headers"""
+        return {
             "Content-Type": "application/json",
-            "x-goog-api-key": current_key
+            "x-goog-api-key": api_key
         }
-        body = self._build_request_body(messages, model, params, thinking_enabled)
+    
+    def _read_stream(
+        self,
+        response: requests.Response,
+        messages: List[Dict],
+        key_num: int,
+        callback: StreamCallback,
+        cancel_token: Optional[CancellationToken] = None,
+        watch: Optional[StreamWatch] = None
+    ) -> ProviderResult:
+        """
+        Consume one streaming response.
         
-        self.log_request(model, key_num, thinking_enabled, streaming=True, retry=retry_count)
+        Raises:
+            RetryableError: On HTTP errors or an empty response
+        """
+        # Handle error responses
+        if response.status_code != 200:
+            raise self.error_from_response(response)
         
         # Accumulators
-        accumulated_content = ""
-        accumulated_thinking = ""
+        accumulated_content = TextBuffer()
+        accumulated_thinking = TextBuffer()
         accumulated_tool_calls = []
         usage_data = None
         
-        try:
-            response = requests.post(
-                url,
-                headers=headers,
-                json=body,
-                timeout=timeout,
-                stream=True
-            )
-            
-            # Handle error responses
-            if response.status_code != 200:
-                error_text = response.text[:500]
-                status_code = response.status_code
+        # Process streaming response
+        for event in iter_sse_events(
+            response, cancel_token=cancel_token, on_chunk=watch.activity if watch else None
+        ):
+            try:
+                data = event.json()
+                candidate = data.get("candidates", [{}])[0]
+                content_parts = candidate.get("content", {}).get("parts", [])
                 
-                reason = self.get_retry_reason(status_code, error_text)
-                
-                if self.should_retry(reason, retry_count):
-                    delay = self.get_retry_delay(reason)
-                    # Extract brief error description from response
-                    error_brief = self._extract_error_brief(error_text, status_code)
-                    self.log_retry(reason, retry_count + 1, delay, error_brief)
-                    
-                    if reason in (RetryReason.RATE_LIMITED, RetryReason.AUTH_ERROR):
-                        self.rotate_key_if_possible(f"({reason.value})")
+                for part in content_parts:
+                    # Handle thinking content (thought: true)
+                    if part.get("thought") is True and part.get("text"):
+                        thinking_text = part["text"]
+                        accumulated_thinking.append(thinking_text)
+                        callback(CallbackType.THINKING, thinking_text)
                     
-                    if delay > 0:
-                        time.sleep(delay)
+                    # Handle regular text
+                    elif "text" in part and not part.get("thought"):
+                        text = part["text"]
+                        accumulated_content.append(text)
+                        callback(CallbackType.TEXT, text)
                     
-                    return self.generate_stream(
-                        messages, model, params, callback, thinking_enabled, retry_count + 1
-                    )
-                
-                self.log_error(f"API error: {error_text}", status_code)
-                callback(CallbackType.ERROR, error_text)
-                return ProviderResult(
-                    success=False,
-                    error=f"API error ({status_code}): {error_text}",
-                    retry_count=retry_count
-                )
-            
-            # Process streaming response
-            response.encoding = 'utf-8'
-            buffer = ""
-            
-            for line in response.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                
-                if not line.startswith("data: "):
-                    continue
-                
-                try:
-                    data = json.loads(line[6:])
-                    candidate = data.get("candidates", [{}])[0]
-                    content_parts = candidate.get("content", {}).get("parts", [])
-                    
-                    for part in content_parts:
-                        # Handle thinking content (thought: true)
-                        if part.get("thought") is True and part.get("text"):
-                            thinking_text = part["text"]
-                            accumulated_thinking += thinking_text
-                            callback(CallbackType.THINKING, thinking_text)
-                        
-                        # Handle regular text
-                        elif "text" in part and not part.get("thought"):
-                            text = part["text"]
-                            accumulated_content += text
-                            callback(CallbackType.TEXT, text)
-                        
-                        # Handle function calls
-                        elif "functionCall" in part:
-                            fc = part["functionCall"]
-                            tool_call = {
-                                "id": fc.get("id", f"call_{len(accumulated_tool_calls)}"),
-                                "type": "function",
-                                "function": {
-                                    "name": fc.get("name", ""),
-                                    "arguments": json.dumps(fc.get("args", {}))
-                                }
+                    # Handle function calls
+                    elif "functionCall" in part:
+                        fc = part["functionCall"]
+                        tool_call = {
+                            "id": fc.get("id", f"call_{len(accumulated_tool_calls)}"),
+                            "type": "function",
+                            "function": {
+                                "name": fc.get("name", ""),
+                                "arguments": json.dumps(fc.get("args", {}))
                             }
-                            accumulated_tool_calls.append(tool_call)
-                            callback(CallbackType.TOOL_CALLS, [tool_call])
-                    
-                    # Capture usage metadata
-                    if "usageMetadata" in data:
-                        usage = data["usageMetadata"]
-                        usage_data = UsageData(
-                            prompt_tokens=usage.get("promptTokenCount", 0),
-                            completion_tokens=usage.get("candidatesTokenCount", 0),
-                            total_tokens=usage.get("totalTokenCount", 0)
-                        )
-                        callback(CallbackType.USAGE, usage_data.to_dict())
-                
-                except json.JSONDecodeError:
-                    continue
-            
-            callback(CallbackType.DONE, None)
-            
-            # Check for empty response
-            output_tokens = usage_data.completion_tokens if usage_data else 0
-            
-            if self.detect_empty_response(
-                accumulated_content,
-                accumulated_thinking,
-                accumulated_tool_calls,
-                output_tokens
-            ):
-                self.log("warn", "Empty response detected (no content, 0 output tokens)")
+                        }
+                        accumulated_tool_calls.append(tool_call)
+                        callback(CallbackType.TOOL_CALLS, [tool_call])
                 
-                if self.should_retry(RetryReason.EMPTY_RESPONSE, retry_count):
-                    delay = self.get_retry_delay(RetryReason.EMPTY_RESPONSE)
-                    self.log_retry(RetryReason.EMPTY_RESPONSE, retry_count + 1, delay, "0 output tokens, no content")
-                    self.rotate_key_if_possible("(empty response)")
-                    
-                    if delay > 0:
-                        time.sleep(delay)
-                    
-                    return self.generate_stream(
-                        messages, model, params, callback, thinking_enabled, retry_count + 1
+                # Capture usage metadata
+                if "usageMetadata" in data:
+                    usage = data["usageMetadata"]
+                    usage_data = UsageData(
+                        prompt_tokens=usage.get("promptTokenCount", 0),
+                        completion_tokens=usage.get("candidatesTokenCount", 0),
+                        total_tokens=usage.get("totalTokenCount", 0)
                     )
-                
-                return ProviderResult(
-                    success=False,
-                    error="Empty response after retries exhausted",
-                    retry_count=retry_count
-                )
-            
-            # Estimate usage if not provided
-            if not usage_data:
-                input_tokens = estimate_message_tokens(messages)
-                output_tokens = estimate_tokens(accumulated_content + accumulated_thinking)
-                usage_data = UsageData(
-                    prompt_tokens=input_tokens,
-                    completion_tokens=output_tokens,
-                    total_tokens=input_tokens + output_tokens,
-                    estimated=True
-                )
-                callback(CallbackType.USAGE, usage_data.to_dict())
+                    callback(CallbackType.USAGE, usage_data.to_dict())
             
-            self.log_success(key_num)
-            
-            return ProviderResult(
-                success=True,
-                content=accumulated_content,
-                thinking_content=accumulated_thinking,
-                tool_calls=accumulated_tool_calls,
-                usage=usage_data,
-                retry_count=retry_count
-            )
+            except json.JSONDecodeError:
+                continue
         
-        except requests.exceptions.Timeout:
-            self.log_error(f"Request timeout after {timeout}s")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, f"timeout after {timeout}s")
-                self.rotate_key_if_possible("(timeout)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, f"Request timeout after {timeout}s")
-            return ProviderResult(
-                success=False,
-                error=f"Request timeout after {timeout}s",
-                retry_count=retry_count
+        callback(CallbackType.DONE, None)
+        
+        # Check for empty response
+        output_tokens = usage_data.completion_tokens if usage_data else 0
+        
+        content = accumulated_content.getvalue()
+        thinking = accumulated_thinking.getvalue()
+        
+        if self.detect_empty_response(
+            content,
+            thinking,
+            accumulated_tool_calls,
+            output_tokens
+        ):
+            self.log("warn", "Empty response detected (no content, 0 output tokens)")
+            raise RetryableError(
+                RetryReason.EMPTY_RESPONSE,
+                error="Empty response after retries exhausted",
+                detail="0 output tokens, no content"
             )
         
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            self.log_error(f"Network error: {error_msg}")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, error_msg[:100])
-                self.rotate_key_if_possible("(network error)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, error_msg)
-            return ProviderResult(
-                success=False,
-                error=f"Network error: {error_msg}",
-                retry_count=retry_count
+        # Estimate usage if not provided
+        if not usage_data:
+            input_tokens = estimate_message_tokens(messages)
+            output_tokens = estimate_tokens(content + thinking)
+            usage_data = UsageData(
+                prompt_tokens=input_tokens,
+                completion_tokens=output_tokens,
+                total_tokens=input_tokens + output_tokens,
+                estimated=True
             )
+            callback(CallbackType.USAGE, usage_data.to_dict())
         
-        except Exception as e:
-            error_msg = str(e)
-            self.log_error(f"Unexpected error: {error_msg}")
-            
-            if self.should_retry(RetryReason.SERVER_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.SERVER_ERROR)
-                self.log_retry(RetryReason.SERVER_ERROR, retry_count + 1, delay, error_msg[:100])
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, error_msg)
-            return ProviderResult(
-                success=False,
-                error=f"Unexpected error: {error_msg}",
-                retry_count=retry_count
-            )
+        self.log_success(key_num)
+        
+        return ProviderResult(
+            success=True,
+            content=content,
+            thinking_content=thinking,
+            tool_calls=accumulated_tool_calls,
+            usage=usage_data
+        )
     
     def generate(
         self,
         messages: List[Dict],
         model: str,
         params: Dict,
-        thinking_enabled: bool = False,
-        retry_count: int = 0
+        thinking_enabled: bool = False
     ) -> ProviderResult:
         """
         Generate a non-streaming response with retry logic.
@@ -1050,172 +965,101 @@ class GeminiNativeProvider(BaseProvider):
                 error="No API keys configured for Gemini"
             )
         
-        current_key = self.key_manager.get_current_key()
-        if not current_key:
-            return ProviderResult(
-                success=False,
-                error="No API key available"
-            )
-        
-        key_num = self.key_manager.get_key_number()
-        timeout = self.config.get("request_timeout", 120)
-        
+        # (connect, read) - the read timeout covers the whole response wait
+        timeout = (Deadlines.from_config(self.config).connect, self.config.get("request_timeout", 120))
         url = self._get_url(model, streaming=False)
-        headers = {
-            "Content-Type": "application/json",
-            "x-goog-api-key": current_key
-        }
-        body = self._build_request_body(messages, model, params, thinking_enabled)
         
-        self.log_request(model, key_num, thinking_enabled, streaming=False, retry=retry_count)
+        timings = RequestTimings()
+        # Built and serialized once - retries resend the same bytes
+        body = self._build_request_body(messages, model, params, thinking_enabled)
+        payload = self.serialize_body(body)
+        timings.built()
         
-        try:
-            response = requests.post(url, headers=headers, json=body, timeout=timeout)
-            
-            # Handle error responses
-            if response.status_code != 200:
-                error_text = response.text[:500]
-                status_code = response.status_code
-                
-                reason = self.get_retry_reason(status_code, error_text)
-                
-                if self.should_retry(reason, retry_count):
-                    delay = self.get_retry_delay(reason)
-                    error_brief = self._extract_error_brief(error_text, status_code)
-                    self.log_retry(reason, retry_count + 1, delay, error_brief)
-                    
-                    if reason in (RetryReason.RATE_LIMITED, RetryReason.AUTH_ERROR):
-                        self.rotate_key_if_possible(f"({reason.value})")
-                    
-                    if delay > 0:
-                        time.sleep(delay)
-                    
-                    return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-                
-                self.log_error(f"API error: {error_text}", status_code)
+        def attempt(retry_count: int) -> ProviderResult:
+            current_key = self.key_manager.get_current_key()
+            if not current_key:
                 return ProviderResult(
                     success=False,
-                    error=f"API error ({status_code}): {error_text}",
-                    retry_count=retry_count
+                    error="No API key available"
                 )
             
-            # Parse response
-            data = response.json()
-            candidate = data.get("candidates", [{}])[0]
-            content_parts = candidate.get("content", {}).get("parts", [])
-            
-            accumulated_content = ""
-            accumulated_thinking = ""
-            tool_calls = []
-            
-            for part in content_parts:
-                if part.get("thought") is True and part.get("text"):
-                    accumulated_thinking += part["text"]
-                elif "text" in part and not part.get("thought"):
-                    accumulated_content += part["text"]
-                elif "functionCall" in part:
-                    fc = part["functionCall"]
-                    tool_calls.append({
-                        "id": fc.get("id", f"call_{len(tool_calls)}"),
-                        "type": "function",
-                        "function": {
-                            "name": fc.get("name", ""),
-                            "arguments": json.dumps(fc.get("args", {}))
-                        }
-                    })
-            
-            # Parse usage
-            usage_meta = data.get("usageMetadata", {})
-            usage_data = UsageData(
-                prompt_tokens=usage_meta.get("promptTokenCount", 0),
-                completion_tokens=usage_meta.get("candidatesTokenCount", 0),
-                total_tokens=usage_meta.get("totalTokenCount", 0)
-            )
+            key_num = self.key_manager.get_key_number()
+            self.log_request(model, key_num, thinking_enabled, streaming=False, retry=retry_count)
             
-            # Check for empty response
-            if self.detect_empty_response(
-                accumulated_content,
-                accumulated_thinking,
-                tool_calls,
-                usage_data.completion_tokens
-            ):
-                self.log("warn", "Empty response detected")
-                
-                if self.should_retry(RetryReason.EMPTY_RESPONSE, retry_count):
-                    delay = self.get_retry_delay(RetryReason.EMPTY_RESPONSE)
-                    self.log_retry(RetryReason.EMPTY_RESPONSE, retry_count + 1, delay, "0 output tokens, no content")
-                    self.rotate_key_if_possible("(empty response)")
-                    
-                    if delay > 0:
-                        time.sleep(delay)
-                    
-                    return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-                
-                return ProviderResult(
-                    success=False,
-                    error="Empty response after retries exhausted",
-                    retry_count=retry_count
-                )
-            
-            self.log_success(key_num)
-            
-            return ProviderResult(
-                success=True,
-                content=accumulated_content,
-                thinking_content=accumulated_thinking,
-                tool_calls=tool_calls,
-                usage=usage_data,
-                retry_count=retry_count
-            )
+            response = self.http_post(url, headers=self._get_headers(current_key), data=payload, timeout=timeout)
+            timings.sent(len(payload))
+            timings.received(None, len(response.content or b""))
+            return self._parse_response(response, key_num)
         
-        except requests.exceptions.Timeout:
-            self.log_error(f"Request timeout after {timeout}s")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, f"timeout after {timeout}s")
-                self.rotate_key_if_possible("(timeout)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-            
-            return ProviderResult(
-                success=False,
-                error=f"Request timeout after {timeout}s",
-                retry_count=retry_count
-            )
+        return self._run_with_retry(attempt, retry_unexpected=False, model=model, timings=timings)
+    
+    def _parse_response(self, response: requests.Response, key_num: int) -> ProviderResult:
+        """
+        Parse one non-streaming response.
         
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            self.log_error(f"Network error: {error_msg}")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, error_msg[:100])
-                self.rotate_key_if_possible("(network error)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-            
-            return ProviderResult(
-                success=False,
-                error=f"Network error: {error_msg}",
-                retry_count=retry_count
-            )
+        Raises:
+            RetryableError: On HTTP errors or an empty response
+        """
+        # Handle error responses
+        if response.status_code != 200:
+            raise self.error_from_response(response)
         
-        except Exception as e:
-            error_msg = str(e)
-            self.log_error(f"Unexpected error: {error_msg}")
-            
-            return ProviderResult(
-                success=False,
-                error=f"Unexpected error: {error_msg}",
-                retry_count=retry_count
+        # Parse response
+        data = response.json()
+        candidate = data.get("candidates", [{}])[0]
+        content_parts = candidate.get("content", {}).get("parts", [])
+        
+        accumulated_content = ""
+        accumulated_thinking = ""
+        tool_calls = []
+        
+        for part in content_parts:
+            if part.get("thought") is True and part.get("text"):
+                accumulated_thinking += part["text"]
+            elif "text" in part and not part.get("thought"):
+                accumulated_content += part["text"]
+            elif "functionCall" in part:
+                fc = part["functionCall"]
+                tool_calls.append({
+                    "id": fc.get("id", f"call_{len(tool_calls)}"),
+                    "type": "function",
+                    "function": {
+                        "name": fc.get("name", ""),
+                        "arguments": json.dumps(fc.get("args", {}))
+                    }
+                })
+        
+        # Parse usage
+        usage_meta = data.get("usageMetadata", {})
+        usage_data = UsageData(
+            prompt_tokens=usage_meta.get("promptTokenCount", 0),
+            completion_tokens=usage_meta.get("candidatesTokenCount", 0),
+            total_tokens=usage_meta.get("totalTokenCount", 0)
+        )
+        
+        # Check for empty response
+        if self.detect_empty_response(
+            accumulated_content,
+            accumulated_thinking,
+            tool_calls,
+            usage_data.completion_tokens
+        ):
+            self.log("warn", "Empty response detected")
+            raise RetryableError(
+                RetryReason.EMPTY_RESPONSE,
+                error="Empty response after retries exhausted",
+                detail="0 output tokens, no content"
             )
+        
+        self.log_success(key_num)
+        
+        return ProviderResult(
+            success=True,
+            content=accumulated_content,
+            thinking_content=accumulated_thinking,
+            tool_calls=tool_calls,
+            usage=usage_data
+        )
     
     def fetch_models(self) -> tuple[List[Dict], Optional[str]]:
         """
@@ -1248,7 +1092,7 @@ class GeminiNativeProvider(BaseProvider):
         headers = {"x-goog-api-key": current_key}
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self.http_get(url, headers=headers, timeout=30)
             
             if response.status_code != 200:
                 return None, f"Failed to fetch models ({response.status_code}): {response.text[:200]}"
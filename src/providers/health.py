@@ -0,0 +1,277 @@
+"""
+Provider Health Tracking and Circuit Breaking
+
+BaseProvider._run_with_retry reports every attempt here: successes (with
+latency, time to first byte/token and generation throughput) and failures
+classified by kind. Per provider+model the tracker keeps counters, a
+rolling success rate and latency/TTFT/TTFB/tokens-per-second percentiles,
+and drives a circuit breaker:
+
+- closed:    requests flow; circuit_failure_threshold consecutive server
+             errors/timeouts/network failures open the circuit
+- open:      requests fail immediately for circuit_open_seconds
+             (doubling on each re-open, capped at MAX_OPEN_SECONDS)
+- half-open: one probe request is let through; success closes the
+             circuit, failure re-opens it
+
+Only provider-side failures trip the breaker. Rate limits and auth errors
+are key problems handled by the key scheduler; 4xx client errors are the
+request's fault.
+
+RequestPipeline uses is_available() to walk provider_fallback_chain past
+providers whose circuit is open.
+
+Config:
+    circuit_failure_threshold = 5    # consecutive failures that open a circuit
+    circuit_open_seconds = 30        # first open period
+    provider_fallback_chain = google, openrouter, custom   # empty = no fallback
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.metrics import RollingPercentiles
+
+# Failure kinds reported by the retry loop
+FAILURE_SERVER_ERROR = "server_error"
+FAILURE_TIMEOUT = "timeout"
+FAILURE_NETWORK = "network"
+FAILURE_EMPTY = "empty_response"
+FAILURE_RATE_LIMITED = "rate_limited"
+FAILURE_AUTH = "auth"
+FAILURE_CLIENT = "client_error"
+FAILURE_UNEXPECTED = "unexpected"  # parsing bugs etc., not the provider's fault
+
+# Kinds that count towards opening the circuit
+BREAKER_FAILURES = (FAILURE_SERVER_ERROR, FAILURE_TIMEOUT, FAILURE_NETWORK)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_OPEN_SECONDS = 30.0
+MAX_OPEN_SECONDS = 300.0
+OUTCOME_WINDOW = 100  # attempts in the rolling success rate
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 open_seconds: float = DEFAULT_OPEN_SECONDS):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.open_until = 0.0
+        self.times_opened = 0
+        self._current_open = open_seconds
+        self._probe_in_flight = False
+
+    def allow(self, now: float) -> bool:
+        """Whether a request may go out now (claims the probe when half-open)"""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN:
+            if now < self.open_until:
+                return False
+            self.state = CIRCUIT_HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def would_allow(self, now: float) -> bool:
+        """Like allow() but without claiming the half-open probe"""
+        if self.state == CIRCUIT_OPEN:
+            return now >= self.open_until
+        if self.state == CIRCUIT_HALF_OPEN:
+            return not self._probe_in_flight
+        return True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CIRCUIT_CLOSED:
+            self.state = CIRCUIT_CLOSED
+            self._current_open = self.open_seconds
+
+    def record_failure(self, now: float) -> bool:
+        """
+        Count a provider-side failure.
+
+        Returns:
+            True if this failure opened the circuit
+        """
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._current_open = min(self._current_open * 2, MAX_OPEN_SECONDS)
+            return self._open(now)
+        if self.state == CIRCUIT_CLOSED and self.consecutive_failures >= self.failure_threshold:
+            return self._open(now)
+        return False
+
+    def release_probe(self):
+        """Give back a half-open probe whose outcome says nothing about health"""
+        self._probe_in_flight = False
+
+    def _open(self, now: float) -> bool:
+        self.state = CIRCUIT_OPEN
+        self.opened_at = now
+        self.open_until = now + self._current_open
+        self.times_opened += 1
+        self._probe_in_flight = False
+        return True
+
+
+class _ModelHealth:
+    """Counters and breaker for one provider+model"""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.requests = 0
+        self.successes = 0
+        self.failures: Dict[str, int] = {}
+        self.outcomes = deque(maxlen=OUTCOME_WINDOW)
+        self.ttft = RollingPercentiles()
+        self.latency = RollingPercentiles()
+        self.ttfb = RollingPercentiles()
+        self.throughput = RollingPercentiles()
+        self.breaker = CircuitBreaker(failure_threshold, open_seconds)
+
+
+class HealthTracker:
+    """Per provider+model health, shared by every provider instance"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _ModelHealth] = {}
+        self.failure_threshold = DEFAULT_FAILURE_THRESHOLD
+        self.open_seconds = DEFAULT_OPEN_SECONDS
+
+    def configure(self, config: Dict):
+        """Apply circuit_failure_threshold / circuit_open_seconds to new and existing breakers"""
+        with self._lock:
+            self.failure_threshold = int(config.get("circuit_failure_threshold") or DEFAULT_FAILURE_THRESHOLD)
+            self.open_seconds = float(config.get("circuit_open_seconds") or DEFAULT_OPEN_SECONDS)
+            for entry in self._entries.values():
+                entry.breaker.failure_threshold = self.failure_threshold
+                entry.breaker.open_seconds = self.open_seconds
+
+    def _entry(self, provider: str, model: str) -> _ModelHealth:
+        key = (provider, model or "")
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _ModelHealth(self.failure_threshold, self.open_seconds)
+        return entry
+
+    def allow_request(self, provider: str, model: str) -> bool:
+        """Check the breaker before sending; claims the probe slot when half-open"""
+        with self._lock:
+            return self._entry(provider, model).breaker.allow(time.monotonic())
+
+    def is_available(self, provider: str, model: str) -> bool:
+        """Non-claiming check used to pick a provider from the fallback chain"""
+        with self._lock:
+            return self._entry(provider, model).breaker.would_allow(time.monotonic())
+
+    def retry_in(self, provider: str, model: str) -> float:
+        """Seconds until an open circuit lets a probe through"""
+        with self._lock:
+            breaker = self._entry(provider, model).breaker
+            return max(0.0, breaker.open_until - time.monotonic()) if breaker.state == CIRCUIT_OPEN else 0.0
+
+    def record_success(self, provider: str, model: str, latency: float, ttft: Optional[float] = None,
+                       ttfb: Optional[float] = None, tokens_per_second: Optional[float] = None):
+        with self._lock:
+            entry = self._entry(provider, model)
+            entry.requests += 1
+            entry.successes += 1
+            entry.outcomes.append(True)
+            entry.latency.add(latency)
+            if ttft is not None:
+                entry.ttft.add(ttft)
+            if ttfb is not None:
+                entry.ttfb.add(ttfb)
+            if tokens_per_second:
+                entry.throughput.add(tokens_per_second)
+            entry.breaker.record_success()
+
+    def record_failure(self, provider: str, model: str, kind: str) -> bool:
+        """
+        Record a failed attempt.
+
+        Returns:
+            True if the circuit is open after this failure
+        """
+        with self._lock:
+            entry = self._entry(provider, model)
+            entry.requests += 1
+            entry.failures[kind] = entry.failures.get(kind, 0) + 1
+            entry.outcomes.append(False)
+            if kind not in BREAKER_FAILURES:
+                entry.breaker.release_probe()
+                return entry.breaker.state == CIRCUIT_OPEN
+            if entry.breaker.record_failure(time.monotonic()):
+                print(f"  [Health] Circuit OPEN for {provider}/{model} "
+                      f"({entry.breaker.consecutive_failures} consecutive failures)")
+            return entry.breaker.state == CIRCUIT_OPEN
+
+    def release(self, provider: str, model: str):
+        """Release a half-open probe without an outcome (e.g. cancelled request)"""
+        with self._lock:
+            self._entry(provider, model).breaker.release_probe()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Health snapshot keyed by "provider/model" """
+        with self._lock:
+            entries = list(self._entries.items())
+        now = time.monotonic()
+        stats = {}
+        for (provider, model), entry in entries:
+            outcomes = list(entry.outcomes)
+            breaker = entry.breaker
+            stats[f"{provider}/{model}"] = {
+                "requests": entry.requests,
+                "successes": entry.successes,
+                "failures": dict(entry.failures),
+                "success_rate": round(sum(outcomes) / len(outcomes), 3) if outcomes else None,
+                "ttft": entry.ttft.snapshot(),
+                "latency": entry.latency.snapshot(),
+                "ttfb": entry.ttfb.snapshot(),
+                "tokens_per_second": entry.throughput.snapshot((10, 50, 90)),
+                "circuit": breaker.state,
+                "circuit_opened": breaker.times_opened,
+                "circuit_retry_in": round(max(0.0, breaker.open_until - now), 1)
+                if breaker.state == CIRCUIT_OPEN else 0.0,
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def parse_fallback_chain(value: Any) -> List[str]:
+    """Parse provider_fallback_chain ("google, openrouter, custom") into provider types"""
+    if not value or value is True:
+        return []
+    items = value if isinstance(value, (list, tuple)) else str(value).replace("->", ",").split(",")
+    chain: List[str] = []
+    for item in items:
+        name = str(item).strip().lower()
+        if name and name not in chain:
+            chain.append(name)
+    return chain
+
+
+_TRACKER = HealthTracker()
+
+
+def get_health_tracker() -> HealthTracker:
+    """The process-wide provider health tracker"""
+    return _TRACKER
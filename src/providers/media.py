@@ -0,0 +1,216 @@
+"""
+Media Parts and Wire Serialization
+
+Images, audio and documents travel through message conversion as MediaPart
+objects - a MIME type plus either raw bytes or a reference into an existing
+base64 string (a plain base64 payload or a data URL). Parsing a data URL
+only locates the ";base64," marker near its start; the multi-megabyte
+payload is never regex-scanned or sliced.
+
+Providers put WireMedia placeholders into request bodies. encode_json_body()
+serializes the rest of the body with json and splices the media bytes in
+at the end, so base64 text (or a data URL) is materialized exactly once,
+directly into the outgoing request bytes.
+
+Internal content item produced by ChatSession.get_conversation_for_api:
+    {"type": "media", "media": MediaPart}
+"""
+
+import base64
+import hashlib
+import json
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Union
+
+
+DATA_URL_PREFIX = "data:"
+BASE64_MARKER = ";base64,"
+# MIME types (with parameters) are short - bound the marker search
+MAX_DATA_URL_HEADER = 256
+
+# Characters that base64 never contains but would need escaping in JSON
+_JSON_UNSAFE = (b'"', b"\\", b"\n", b"\r")
+
+
+class MediaPart:
+    """
+    A media payload (mime type + base64 data) that avoids string copies.
+
+    Backed by exactly one of:
+    - raw bytes (encoded to base64 only when serialized)
+    - a base64 string, optionally starting at an offset (e.g. inside a data URL)
+    """
+
+    __slots__ = ("mime_type", "_raw", "_source", "_offset", "_wire")
+
+    def __init__(
+        self,
+        mime_type: str,
+        raw: Optional[bytes] = None,
+        source: Optional[str] = None,
+        offset: int = 0
+    ):
+        self.mime_type = mime_type or "application/octet-stream"
+        self._raw = raw
+        self._source = source
+        self._offset = offset
+        self._wire: Optional[bytes] = None
+
+    @classmethod
+    def from_bytes(cls, mime_type: str, data: bytes) -> "MediaPart":
+        """Wrap raw file bytes"""
+        return cls(mime_type, raw=data)
+
+    @classmethod
+    def from_base64(cls, mime_type: str, b64_data: str) -> "MediaPart":
+        """Wrap an existing base64 string (no copy)"""
+        return cls(mime_type, source=b64_data or "")
+
+    @classmethod
+    def from_data_url(cls, url: Any) -> Optional["MediaPart"]:
+        """
+        Reference the payload of a base64 data URL without slicing it.
+
+        Returns:
+            MediaPart, or None if url is not a base64 data URL
+        """
+        if not isinstance(url, str) or not url.startswith(DATA_URL_PREFIX):
+            return None
+        marker = url.find(BASE64_MARKER, len(DATA_URL_PREFIX), MAX_DATA_URL_HEADER)
+        if marker < 0:
+            return None
+        mime_type = url[len(DATA_URL_PREFIX):marker]
+        return cls(mime_type, source=url, offset=marker + len(BASE64_MARKER))
+
+    @property
+    def is_audio(self) -> bool:
+        return self.mime_type.startswith("audio/")
+
+    @property
+    def is_image(self) -> bool:
+        return self.mime_type.startswith("image/")
+
+    @property
+    def base64_length(self) -> int:
+        """Length of the base64 payload in characters"""
+        if self._raw is not None:
+            return 4 * ((len(self._raw) + 2) // 3)
+        return len(self._source) - self._offset
+
+    def base64_bytes(self) -> Union[bytes, memoryview]:
+        """
+        Base64 payload as ASCII bytes, computed once and cached.
+
+        Returns a memoryview into the encoded source when the payload starts
+        at an offset, so the data URL prefix is skipped without a copy.
+
+        Raises:
+            UnicodeEncodeError: If the source string is not ASCII
+        """
+        if self._wire is None:
+            if self._raw is not None:
+                self._wire = base64.b64encode(self._raw)
+            else:
+                self._wire = self._source.encode("ascii")
+        if self._raw is None and self._offset:
+            return memoryview(self._wire)[self._offset:]
+        return self._wire
+
+    def is_json_safe(self) -> bool:
+        """Whether the payload can be written into a JSON string unescaped"""
+        if self._raw is not None:
+            return True
+        try:
+            self.base64_bytes()
+        except UnicodeEncodeError:
+            return False
+        return all(self._wire.find(ch, self._offset) < 0 for ch in _JSON_UNSAFE)
+
+    def digest(self) -> str:
+        """SHA-256 hex digest of the decoded media bytes"""
+        raw = self._raw if self._raw is not None else base64.b64decode(self.base64_bytes())
+        return hashlib.sha256(raw).hexdigest()
+
+    def base64_str(self) -> str:
+        """Base64 payload as a str (copies - for legacy/debug use)"""
+        if self._raw is not None:
+            return base64.b64encode(self._raw).decode("ascii")
+        return self._source[self._offset:] if self._offset else self._source
+
+    def data_url(self) -> str:
+        """Full data URL as a str (copies - for legacy/debug use)"""
+        return f"{DATA_URL_PREFIX}{self.mime_type}{BASE64_MARKER}{self.base64_str()}"
+
+    def wire_base64(self) -> "WireMedia":
+        """Placeholder serialized as the bare base64 string"""
+        return WireMedia(self, data_url=False)
+
+    def wire_data_url(self) -> "WireMedia":
+        """Placeholder serialized as a data URL string"""
+        return WireMedia(self, data_url=True)
+
+    def __repr__(self):
+        return f"MediaPart({self.mime_type}, {self.base64_length} b64 chars)"
+
+
+class WireMedia:
+    """Placeholder for a media payload inside a request body"""
+
+    __slots__ = ("part", "data_url")
+
+    def __init__(self, part: MediaPart, data_url: bool = False):
+        self.part = part
+        self.data_url = data_url
+
+    def json_chunks(self) -> List[Union[bytes, memoryview]]:
+        """The JSON string literal for this payload, as byte chunks"""
+        if not self.part.is_json_safe():
+            # Not plain base64 - let json do the escaping
+            value = self.part.data_url() if self.data_url else self.part.base64_str()
+            return [json.dumps(value, ensure_ascii=False).encode("utf-8")]
+
+        payload = self.part.base64_bytes()
+        if self.data_url:
+            header = json.dumps(f"{DATA_URL_PREFIX}{self.part.mime_type}{BASE64_MARKER}", ensure_ascii=False)
+            return [header[:-1].encode("utf-8"), payload, b'"']
+        return [b'"', payload, b'"']
+
+
+def media_item(part: MediaPart) -> Dict[str, Any]:
+    """Build the internal message content item for a media part"""
+    return {"type": "media", "media": part}
+
+
+def encode_json_body(body: Any) -> bytes:
+    """
+    Serialize a request body to compact UTF-8 JSON bytes.
+
+    WireMedia placeholders are replaced by their payloads, which are
+    spliced into the output instead of going through the JSON encoder.
+    """
+    media: List[WireMedia] = []
+    nonce = uuid.uuid4().hex
+
+    def default(obj):
+        if isinstance(obj, WireMedia):
+            media.append(obj)
+            return f"\x00{nonce}:{len(media) - 1}\x00"
+        if isinstance(obj, MediaPart):
+            media.append(obj.wire_base64())
+            return f"\x00{nonce}:{len(media) - 1}\x00"
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    encoded = json.dumps(body, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+    if not media:
+        return encoded
+
+    placeholder = re.compile(rb'"\\u0000' + nonce.encode("ascii") + rb':(\d+)\\u0000"')
+    chunks: List[Union[bytes, memoryview]] = []
+    position = 0
+    for match in placeholder.finditer(encoded):
+        chunks.append(encoded[position:match.start()])
+        chunks.extend(media[int(match.group(1))].json_chunks())
+        position = match.end()
+    chunks.append(encoded[position:])
+    return b"".join(chunks)
@@ -10,8 +10,6 @@ Reference: JSON-request-reference.md and reverse-proxy/src/upstream/openai-compa
 """
 
 import json
-import time
-import re
 from typing import List, Dict, Optional, Any
 import requests
 
@@ -19,12 +17,30 @@ from .base import (
     BaseProvider, 
     ProviderResult, 
     StreamCallback,
+    FirstTokenProbe,
     UsageData,
     CallbackType,
     RetryReason,
+    RetryableError,
     estimate_tokens,
     estimate_message_tokens
 )
+from .media import MediaPart
+from .deadlines import Deadlines, StreamWatch
+from .timings import RequestTimings
+from .sse import iter_sse_events
+from src.cancellation import CancellationToken
+from src.text_buffer import TextBuffer
+
+
+# Audio mime subtypes that differ from the OpenAI input_audio format name
+AUDIO_MIME_TO_FORMAT = {
+    "mpeg": "mp3",
+    "x-wav": "wav",
+    "mp4": "m4a",
+    "x-m4a": "m4a",
+    "x-ms-wma": "wma",
+}
 
 
 # Safety settings for Google's OpenAI-compatible endpoint
@@ -206,14 +222,41 @@ class OpenAICompatibleProvider(BaseProvider):
         
         return content
     
+    def _media_to_content(self, media: MediaPart) -> Dict:
+        """
+        Convert an internal media part to an OpenAI content item.
+        
+        Audio -> input_audio (bare base64 + format), images -> image_url,
+        anything else (PDFs, etc.) -> OpenRouter file with a data URL.
+        The payload itself is only written out at request serialization.
+        """
+        if media.is_audio:
+            # Extract format from mime type (e.g., "audio/mp3" -> "mp3")
+            audio_format = media.mime_type.split("/")[-1].split(";")[0]
+            audio_format = AUDIO_MIME_TO_FORMAT.get(audio_format, audio_format)
+            return {
+                "type": "input_audio",
+                "input_audio": {
+                    "data": media.wire_base64(),
+                    "format": audio_format
+                }
+            }
+        if media.is_image:
+            return {"type": "image_url", "image_url": {"url": media.wire_data_url()}}
+        return {"type": "file", "file": {"file_data": media.wire_data_url()}}
+    
     def _process_messages(self, messages: List[Dict]) -> List[Dict]:
         """
         Process messages to handle specific content types like audio and files.
         
         Transforms:
+        - Internal media parts -> image_url / input_audio / file
         - Audio data URLs -> OpenAI 'input_audio' format
         - PDF files -> OpenRouter 'file' format
         
+        Base64 payloads are carried as MediaPart references and only
+        materialized when the request body is serialized.
+        
         Also applies provider-specific content ordering:
         - OpenRouter: Text First, Media Last (per their documentation)
         """
@@ -230,12 +273,24 @@ class OpenAICompatibleProvider(BaseProvider):
             for item in content:
                 item_type = item.get("type")
                 
+                # Internal media part (session attachments) -> wire format by type
+                if item_type == "media":
+                    new_content.append(self._media_to_content(item.get("media")))
+                
+                # Data URL images are passed through, but serialized without a copy
+                elif item_type == "image_url":
+                    image_url = item.get("image_url", {})
+                    media = MediaPart.from_data_url(image_url.get("url"))
+                    if media:
+                        new_content.append({
+                            "type": "image_url",
+                            "image_url": dict(image_url, url=media.wire_data_url())
+                        })
+                    else:
+                        new_content.append(item)
+                
                 # Handle Audio (input_audio or explicit audio type)
-                if item_type == "input_audio" or item_type == "audio":
-                    # Check for inline data or data URL
-                    audio_data = None
-                    audio_format = "wav" # default
-                    
+                elif item_type == "input_audio" or item_type == "audio":
                     if "input_audio" in item:
                         # Already in correct format?
                         new_content.append(item)
@@ -243,22 +298,10 @@ class OpenAICompatibleProvider(BaseProvider):
                         
                     # Parse data URL if present
                     data_url = item.get("image_url", {}).get("url") or item.get("url") or item.get("data")
-                    if data_url and isinstance(data_url, str) and data_url.startswith("data:"):
-                        match = re.match(r"data:audio/([^;]+);base64,(.+)", data_url)
-                        if match:
-                            fmt, b64 = match.groups()
-                            # key mappings often used: "mp3"->"mp3", "wav"->"wav"
-                            audio_format = fmt
-                            audio_data = b64
+                    media = MediaPart.from_data_url(data_url)
                     
-                    if audio_data:
-                        new_content.append({
-                            "type": "input_audio",
-                            "input_audio": {
-                                "data": audio_data,
-                                "format": audio_format
-                            }
-                        })
+                    if media and media.is_audio:
+                        new_content.append(self._media_to_content(media))
                     else:
                         # Pass through if we couldn't process (might be valid already)
                         new_content.append(item)
@@ -298,25 +341,8 @@ class OpenAICompatibleProvider(BaseProvider):
                     
                     # Check if this is audio content
                     if mime_type.startswith("audio/"):
-                        # Extract format from mime type (e.g., "audio/mp3" -> "mp3")
-                        audio_format = mime_type.split("/")[-1]
-                        # Handle special cases for mime type variations
-                        mime_to_format = {
-                            "mpeg": "mp3",
-                            "x-wav": "wav",
-                            "mp4": "m4a",
-                            "x-m4a": "m4a",
-                            "x-ms-wma": "wma",
-                        }
-                        audio_format = mime_to_format.get(audio_format, audio_format)
-                        
-                        new_content.append({
-                            "type": "input_audio",
-                            "input_audio": {
-                                "data": inline.get("data", ""),
-                                "format": audio_format
-                            }
-                        })
+                        media = MediaPart.from_base64(mime_type, inline.get("data", ""))
+                        new_content.append(self._media_to_content(media))
                     else:
                         # Non-audio inline data - pass through (may be handled by server)
                         new_content.append(item)
@@ -403,17 +429,18 @@ class OpenAICompatibleProvider(BaseProvider):
         params: Dict,
         callback: StreamCallback,
         thinking_enabled: bool = False,
-        retry_count: int = 0
+        cancel_token: Optional[CancellationToken] = None,
+        deadlines: Optional[Deadlines] = None
     ) -> ProviderResult:
         """
         Generate a streaming response with full retry logic.
         
-        Retry behavior (matching reverse-proxy):
+        Retry behavior (matching reverse-proxy, see BaseProvider._run_with_retry):
         - 429: Immediate key rotation, retry
         - 401/402/403: Immediate key rotation, retry
-        - 5xx: 2 second delay, retry
-        - Empty response: Key rotation, 2 second delay, retry
-        - Network error: Key rotation, 1 second delay, retry
+        - 5xx: retry_delay backoff, retry
+        - Empty response: Key rotation, retry_delay backoff, retry
+        - Network error: Key rotation, 1 second backoff, retry
         """
         if not self.key_manager or not self.key_manager.has_keys():
             return ProviderResult(
@@ -421,291 +448,197 @@ class OpenAICompatibleProvider(BaseProvider):
                 error=f"No API keys configured for {self.name}"
             )
         
-        current_key = self.key_manager.get_current_key()
-        if not current_key:
-            return ProviderResult(
-                success=False,
-                error="No API key available"
-            )
-        
-        key_num = self.key_manager.get_key_number()
-        timeout = self.config.get("request_timeout", 120)
-        
         url = self._get_completions_url()
-        headers = self._get_headers(current_key)
+        
+        timings = RequestTimings()
+        # Built and serialized once - retries resend the same bytes
         body = self._build_request_body(messages, model, params, thinking_enabled, streaming=True)
+        payload = self.serialize_body(body)
+        timings.built()
+        
+        # Times the first token of each attempt for the health tracker
+        probe = FirstTokenProbe(callback)
+        
+        def attempt(retry_count: int) -> ProviderResult:
+            current_key = self.key_manager.get_current_key()
+            if not current_key:
+                return ProviderResult(
+                    success=False,
+                    error="No API key available"
+                )
+            
+            key_num = self.key_manager.get_key_number()
+            self.log_request(model, key_num, thinking_enabled, streaming=True, retry=retry_count)
+            
+            # Make streaming request
+            return self.stream_attempt(
+                url,
+                self._get_headers(current_key),
+                payload,
+                lambda response, watch: self._read_stream(
+                    response, messages, key_num, probe, cancel_token, watch
+                ),
+                deadlines,
+                cancel_token,
+                timings
+            )
         
-        self.log_request(model, key_num, thinking_enabled, streaming=True, retry=retry_count)
+        return self._run_with_retry(
+            attempt, callback=callback, cancel_token=cancel_token, model=model, probe=probe, timings=timings
+        )
+    
+    def _read_stream(
+        self,
+        response: requests.Response,
+        messages: List[Dict],
+        key_num: int,
+        callback: StreamCallback,
+        cancel_token: Optional[CancellationToken] = None,
+        watch: Optional[StreamWatch] = None
+    ) -> ProviderResult:
+        """
+        Consume one streaming response.
+        
+        Raises:
+            RetryableError: On HTTP errors or an empty response
+        """
+        # Handle error responses
+        if response.status_code != 200:
+            raise self.error_from_response(response)
         
         # Accumulators for content
-        accumulated_content = ""
-        accumulated_thinking = ""
+        accumulated_content = TextBuffer()
+        accumulated_thinking = TextBuffer()
         accumulated_tool_calls = []
         usage_data = None
         
-        try:
-            # Make streaming request
-            response = requests.post(
-                url,
-                headers=headers,
-                json=body,
-                timeout=timeout,
-                stream=True
-            )
+        # Process streaming response
+        chunk_count = 0
+        for event in iter_sse_events(
+            response, cancel_token=cancel_token, on_chunk=watch.activity if watch else None
+        ):
+            if event.is_done:
+                callback(CallbackType.DONE, None)
+                break
             
-            # Handle error responses
-            if response.status_code != 200:
-                error_text = response.text[:500]
-                status_code = response.status_code
-                
-                reason = self.get_retry_reason(status_code, error_text)
+            try:
+                data = event.json()
+                chunk_count += 1
                 
-                if self.should_retry(reason, retry_count):
-                    delay = self.get_retry_delay(reason)
-                    error_brief = self._extract_error_brief(error_text, status_code)
-                    self.log_retry(reason, retry_count + 1, delay, error_brief)
+                # Get choices array - may be empty in usage-only chunks
+                choices = data.get("choices", [])
+                if choices:
+                    choice = choices[0]
                     
-                    # Rotate key for rate limit and auth errors
-                    if reason in (RetryReason.RATE_LIMITED, RetryReason.AUTH_ERROR):
-                        self.rotate_key_if_possible(f"({reason.value})")
+                    # Defensive check: ensure choice is not None
+                    if choice is None:
+                        self.log("warn", f"Chunk {chunk_count}: choices[0] is None, raw: {event.text[:200]}")
+                        continue
                     
-                    if delay > 0:
-                        time.sleep(delay)
+                    # Defensive check: ensure choice is a dict
+                    if not isinstance(choice, dict):
+                        self.log("warn", f"Chunk {chunk_count}: choice is not dict: {type(choice)}, raw: {event.text[:200]}")
+                        continue
                     
-                    return self.generate_stream(
-                        messages, model, params, callback, thinking_enabled, retry_count + 1
-                    )
-                
-                self.log_error(f"API error: {error_text}", status_code)
-                callback(CallbackType.ERROR, error_text)
-                return ProviderResult(
-                    success=False,
-                    error=f"API error ({status_code}): {error_text}",
-                    retry_count=retry_count
-                )
-            
-            # Process streaming response
-            response.encoding = 'utf-8'
-            
-            chunk_count = 0
-            for line in response.iter_lines(decode_unicode=True):
-                if not line:
-                    continue
-                
-                line = line.strip()
-                
-                if line == "data: [DONE]":
-                    callback(CallbackType.DONE, None)
-                    break
-                
-                # Ignore SSE comments/keep-alive heartbeats (lines starting with :)
-                if line.startswith(":"):
-                    continue
-                
-                if not line.startswith("data: "):
-                    # Log unexpected line format for debugging
-                    if line:
-                        self.log("debug", f"Unexpected line format: {line[:100]}")
-                    continue
-                
-                try:
-                    json_str = line[6:]
-                    data = json.loads(json_str)
-                    chunk_count += 1
+                    delta = choice.get("delta")
                     
-                    # Get choices array - may be empty in usage-only chunks
-                    choices = data.get("choices", [])
-                    if choices:
-                        choice = choices[0]
-                        
-                        # Defensive check: ensure choice is not None
-                        if choice is None:
-                            self.log("warn", f"Chunk {chunk_count}: choices[0] is None, raw: {json_str[:200]}")
-                            continue
-                        
-                        # Defensive check: ensure choice is a dict
-                        if not isinstance(choice, dict):
-                            self.log("warn", f"Chunk {chunk_count}: choice is not dict: {type(choice)}, raw: {json_str[:200]}")
-                            continue
-                        
-                        delta = choice.get("delta")
-                        
-                        # Defensive check: ensure delta is not None
-                        if delta is None:
-                            # Some servers send delta: null, use empty dict
-                            delta = {}
-                        
-                        # Defensive check: ensure delta is a dict
-                        if not isinstance(delta, dict):
-                            self.log("warn", f"Chunk {chunk_count}: delta is not dict: {type(delta)}, raw: {json_str[:200]}")
-                            continue
-                        
-                        # Handle regular content
-                        content = delta.get("content", "")
-                        if content:
-                            accumulated_content += content
-                            callback(CallbackType.TEXT, content)
-                        
-                        # Handle reasoning_content (DeepSeek/thinking style)
-                        reasoning = delta.get("reasoning_content", "")
-                        if reasoning:
-                            accumulated_thinking += reasoning
-                            callback(CallbackType.THINKING, reasoning)
-                        
-                        # Also check for "reasoning" field (some servers use this)
-                        reasoning_alt = delta.get("reasoning", "")
-                        if reasoning_alt:
-                            accumulated_thinking += reasoning_alt
-                            callback(CallbackType.THINKING, reasoning_alt)
-                        
-                        # Handle tool calls
-                        tool_calls = delta.get("tool_calls")
-                        if tool_calls:
-                            accumulated_tool_calls.extend(tool_calls)
-                            callback(CallbackType.TOOL_CALLS, tool_calls)
+                    # Defensive check: ensure delta is not None
+                    if delta is None:
+                        # Some servers send delta: null, use empty dict
+                        delta = {}
                     
-                    # Handle usage data (comes with stream_options.include_usage)
-                    # This may come in a chunk with empty choices array
-                    if "usage" in data:
-                        usage = data["usage"]
-                        if usage and isinstance(usage, dict):
-                            usage_data = UsageData(
-                                prompt_tokens=usage.get("prompt_tokens", 0),
-                                completion_tokens=usage.get("completion_tokens", 0),
-                                total_tokens=usage.get("total_tokens", 0)
-                            )
-                            callback(CallbackType.USAGE, usage_data.to_dict())
-                
-                except json.JSONDecodeError as e:
-                    self.log("warn", f"Chunk {chunk_count}: JSON decode error: {e}, raw: {line[:200]}")
-                    continue
-            
-            # Check for empty response
-            output_tokens = usage_data.completion_tokens if usage_data else 0
-            
-            if self.detect_empty_response(
-                accumulated_content,
-                accumulated_thinking,
-                accumulated_tool_calls,
-                output_tokens
-            ):
-                self.log("warn", "Empty response detected (no content, 0 output tokens)")
-                
-                if self.should_retry(RetryReason.EMPTY_RESPONSE, retry_count):
-                    delay = self.get_retry_delay(RetryReason.EMPTY_RESPONSE)
-                    self.log_retry(RetryReason.EMPTY_RESPONSE, retry_count + 1, delay, "0 output tokens, no content")
-                    self.rotate_key_if_possible("(empty response)")
+                    # Defensive check: ensure delta is a dict
+                    if not isinstance(delta, dict):
+                        self.log("warn", f"Chunk {chunk_count}: delta is not dict: {type(delta)}, raw: {event.text[:200]}")
+                        continue
+                    
+                    # Handle regular content
+                    content = delta.get("content", "")
+                    if content:
+                        accumulated_content.append(content)
+                        callback(CallbackType.TEXT, content)
                     
-                    if delay > 0:
-                        time.sleep(delay)
+                    # Handle reasoning_content (DeepSeek/thinking style)
+                    reasoning = delta.get("reasoning_content", "")
+                    if reasoning:
+                        accumulated_thinking.append(reasoning)
+                        callback(CallbackType.THINKING, reasoning)
                     
-                    return self.generate_stream(
-                        messages, model, params, callback, thinking_enabled, retry_count + 1
-                    )
+                    # Also check for "reasoning" field (some servers use this)
+                    reasoning_alt = delta.get("reasoning", "")
+                    if reasoning_alt:
+                        accumulated_thinking.append(reasoning_alt)
+                        callback(CallbackType.THINKING, reasoning_alt)
+                    
+                    # Handle tool calls
+                    tool_calls = delta.get("tool_calls")
+                    if tool_calls:
+                        accumulated_tool_calls.extend(tool_calls)
+                        callback(CallbackType.TOOL_CALLS, tool_calls)
                 
-                return ProviderResult(
-                    success=False,
-                    error="Empty response after retries exhausted",
-                    retry_count=retry_count
-                )
-            
-            # Estimate usage if not provided
-            if not usage_data:
-                input_tokens = estimate_message_tokens(messages)
-                output_tokens = estimate_tokens(accumulated_content + accumulated_thinking)
-                usage_data = UsageData(
-                    prompt_tokens=input_tokens,
-                    completion_tokens=output_tokens,
-                    total_tokens=input_tokens + output_tokens,
-                    estimated=True
-                )
-                callback(CallbackType.USAGE, usage_data.to_dict())
+                # Handle usage data (comes with stream_options.include_usage)
+                # This may come in a chunk with empty choices array
+                if "usage" in data:
+                    usage = data["usage"]
+                    if usage and isinstance(usage, dict):
+                        usage_data = UsageData(
+                            prompt_tokens=usage.get("prompt_tokens", 0),
+                            completion_tokens=usage.get("completion_tokens", 0),
+                            total_tokens=usage.get("total_tokens", 0)
+                        )
+                        callback(CallbackType.USAGE, usage_data.to_dict())
             
-            self.log_success(key_num)
-            
-            return ProviderResult(
-                success=True,
-                content=accumulated_content,
-                thinking_content=accumulated_thinking,
-                tool_calls=accumulated_tool_calls,
-                usage=usage_data,
-                retry_count=retry_count
-            )
+            except json.JSONDecodeError as e:
+                self.log("warn", f"Chunk {chunk_count}: JSON decode error: {e}, raw: {event.text[:200]}")
+                continue
         
-        except requests.exceptions.Timeout:
-            self.log_error(f"Request timeout after {timeout}s")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, f"timeout after {timeout}s")
-                self.rotate_key_if_possible("(timeout)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, f"Request timeout after {timeout}s")
-            return ProviderResult(
-                success=False,
-                error=f"Request timeout after {timeout}s",
-                retry_count=retry_count
+        # Check for empty response
+        output_tokens = usage_data.completion_tokens if usage_data else 0
+        
+        content = accumulated_content.getvalue()
+        thinking = accumulated_thinking.getvalue()
+        
+        if self.detect_empty_response(
+            content,
+            thinking,
+            accumulated_tool_calls,
+            output_tokens
+        ):
+            self.log("warn", "Empty response detected (no content, 0 output tokens)")
+            raise RetryableError(
+                RetryReason.EMPTY_RESPONSE,
+                error="Empty response after retries exhausted",
+                detail="0 output tokens, no content"
             )
         
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            self.log_error(f"Network error: {error_msg}")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, error_msg[:100])
-                self.rotate_key_if_possible("(network error)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, error_msg)
-            return ProviderResult(
-                success=False,
-                error=f"Network error: {error_msg}",
-                retry_count=retry_count
+        # Estimate usage if not provided
+        if not usage_data:
+            input_tokens = estimate_message_tokens(messages)
+            output_tokens = estimate_tokens(content + thinking)
+            usage_data = UsageData(
+                prompt_tokens=input_tokens,
+                completion_tokens=output_tokens,
+                total_tokens=input_tokens + output_tokens,
+                estimated=True
             )
+            callback(CallbackType.USAGE, usage_data.to_dict())
         
-        except Exception as e:
-            error_msg = str(e)
-            self.log_error(f"Unexpected error: {error_msg}")
-            
-            if self.should_retry(RetryReason.SERVER_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.SERVER_ERROR)
-                self.log_retry(RetryReason.SERVER_ERROR, retry_count + 1, delay, error_msg[:100])
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate_stream(
-                    messages, model, params, callback, thinking_enabled, retry_count + 1
-                )
-            
-            callback(CallbackType.ERROR, error_msg)
-            return ProviderResult(
-                success=False,
-                error=f"Unexpected error: {error_msg}",
-                retry_count=retry_count
-            )
+        self.log_success(key_num)
+        
+        return ProviderResult(
+            success=True,
+            content=content,
+            thinking_content=thinking,
+            tool_calls=accumulated_tool_calls,
+            usage=usage_data
+        )
     
     def generate(
         self,
         messages: List[Dict],
         model: str,
         params: Dict,
-        thinking_enabled: bool = False,
-        retry_count: int = 0
+        thinking_enabled: bool = False
     ) -> ProviderResult:
         """
         Generate a non-streaming response with retry logic.
@@ -716,53 +649,49 @@ class OpenAICompatibleProvider(BaseProvider):
                 error=f"No API keys configured for {self.name}"
             )
         
-        current_key = self.key_manager.get_current_key()
-        if not current_key:
-            return ProviderResult(
-                success=False,
-                error="No API key available"
-            )
-        
-        key_num = self.key_manager.get_key_number()
-        timeout = self.config.get("request_timeout", 120)
-        
+        # (connect, read) - the read timeout covers the whole response wait
+        timeout = (Deadlines.from_config(self.config).connect, self.config.get("request_timeout", 120))
         url = self._get_completions_url()
-        headers = self._get_headers(current_key)
-        body = self._build_request_body(messages, model, params, thinking_enabled, streaming=False)
         
-        self.log_request(model, key_num, thinking_enabled, streaming=False, retry=retry_count)
+        timings = RequestTimings()
+        # Built and serialized once - retries resend the same bytes
+        body = self._build_request_body(messages, model, params, thinking_enabled, streaming=False)
+        payload = self.serialize_body(body)
+        timings.built()
         
-        try:
-            response = requests.post(url, headers=headers, json=body, timeout=timeout)
-            
-            # Handle error responses
-            if response.status_code != 200:
-                error_text = response.text[:500]
-                status_code = response.status_code
-                
-                reason = self.get_retry_reason(status_code, error_text)
-                
-                if self.should_retry(reason, retry_count):
-                    delay = self.get_retry_delay(reason)
-                    error_brief = self._extract_error_brief(error_text, status_code)
-                    self.log_retry(reason, retry_count + 1, delay, error_brief)
-                    
-                    if reason in (RetryReason.RATE_LIMITED, RetryReason.AUTH_ERROR):
-                        self.rotate_key_if_possible(f"({reason.value})")
-                    
-                    if delay > 0:
-                        time.sleep(delay)
-                    
-                    return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-                
-                self.log_error(f"API error: {error_text}", status_code)
+        def attempt(retry_count: int) -> ProviderResult:
+            current_key = self.key_manager.get_current_key()
+            if not current_key:
                 return ProviderResult(
                     success=False,
-                    error=f"API error ({status_code}): {error_text}",
-                    retry_count=retry_count
+                    error="No API key available"
                 )
             
-            # Parse response - with better error handling for malformed responses
+            key_num = self.key_manager.get_key_number()
+            self.log_request(model, key_num, thinking_enabled, streaming=False, retry=retry_count)
+            
+            response = self.http_post(url, headers=self._get_headers(current_key), data=payload, timeout=timeout)
+            timings.sent(len(payload))
+            timings.received(None, len(response.content or b""))
+            return self._parse_response(response, key_num)
+        
+        return self._run_with_retry(attempt, retry_unexpected=False, model=model, timings=timings)
+    
+    def _parse_response(self, response: requests.Response, key_num: int) -> ProviderResult:
+        """
+        Parse one non-streaming response.
+        
+        Raises:
+            RetryableError: On HTTP errors or an empty response
+        """
+        # Handle error responses
+        if response.status_code != 200:
+            raise self.error_from_response(response)
+        
+        # Parse response - with better error handling for malformed responses
+        try:
+            data = response.json()
+        except ValueError as e:
             response_text = response.text
             
             # Debug: log raw response if it looks problematic
@@ -770,129 +699,65 @@ class OpenAICompatibleProvider(BaseProvider):
                 self.log_error(f"Empty response body (Content-Length: {response.headers.get('Content-Length', 'not set')})")
                 raise ValueError("Empty response body from server")
             
-            try:
-                data = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                self.log_error(f"JSON decode error: {e}, raw response: {response_text[:500]}")
-                raise
-            
-            # Defensive parsing of choices
-            choices = data.get("choices", [])
-            if not choices:
-                self.log("warn", f"No choices in response: {json.dumps(data)[:500]}")
+            self.log_error(f"JSON decode error: {e}, raw response: {response_text[:500]}")
+            raise
+        
+        # Defensive parsing of choices
+        choices = data.get("choices", [])
+        if not choices:
+            self.log("warn", f"No choices in response: {json.dumps(data)[:500]}")
+            choice = {}
+        else:
+            choice = choices[0]
+            if choice is None:
+                self.log("warn", f"choices[0] is None, full response: {json.dumps(data)[:500]}")
+                choice = {}
+            elif not isinstance(choice, dict):
+                self.log("warn", f"choice is not dict: {type(choice)}, raw: {json.dumps(data)[:500]}")
                 choice = {}
-            else:
-                choice = choices[0]
-                if choice is None:
-                    self.log("warn", f"choices[0] is None, full response: {json.dumps(data)[:500]}")
-                    choice = {}
-                elif not isinstance(choice, dict):
-                    self.log("warn", f"choice is not dict: {type(choice)}, raw: {json.dumps(data)[:500]}")
-                    choice = {}
-            
-            message = choice.get("message") if isinstance(choice, dict) else None
-            if message is None:
-                message = {}
-            elif not isinstance(message, dict):
-                self.log("warn", f"message is not dict: {type(message)}")
-                message = {}
-            
-            content = message.get("content", "") or ""
-            reasoning = message.get("reasoning_content", "") or ""
-            # Also check for "reasoning" field (some servers use this)
-            if not reasoning:
-                reasoning = message.get("reasoning", "") or ""
-            tool_calls = message.get("tool_calls", []) or []
-            
-            # Parse usage
-            usage = data.get("usage")
-            if usage is None or not isinstance(usage, dict):
-                usage = {}
-            usage_data = UsageData(
-                prompt_tokens=usage.get("prompt_tokens", 0),
-                completion_tokens=usage.get("completion_tokens", 0),
-                total_tokens=usage.get("total_tokens", 0)
-            )
-            
-            # Check for empty response
-            if self.detect_empty_response(content, reasoning, tool_calls, usage_data.completion_tokens):
-                self.log("warn", "Empty response detected")
-                
-                if self.should_retry(RetryReason.EMPTY_RESPONSE, retry_count):
-                    delay = self.get_retry_delay(RetryReason.EMPTY_RESPONSE)
-                    self.log_retry(RetryReason.EMPTY_RESPONSE, retry_count + 1, delay, "0 output tokens, no content")
-                    self.rotate_key_if_possible("(empty response)")
-                    
-                    if delay > 0:
-                        time.sleep(delay)
-                    
-                    return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-                
-                return ProviderResult(
-                    success=False,
-                    error="Empty response after retries exhausted",
-                    retry_count=retry_count
-                )
-            
-            self.log_success(key_num)
-            
-            return ProviderResult(
-                success=True,
-                content=content,
-                thinking_content=reasoning,
-                tool_calls=tool_calls,
-                usage=usage_data,
-                retry_count=retry_count
-            )
         
-        except requests.exceptions.Timeout:
-            self.log_error(f"Request timeout after {timeout}s")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, f"timeout after {timeout}s")
-                self.rotate_key_if_possible("(timeout)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-            
-            return ProviderResult(
-                success=False,
-                error=f"Request timeout after {timeout}s",
-                retry_count=retry_count
+        message = choice.get("message") if isinstance(choice, dict) else None
+        if message is None:
+            message = {}
+        elif not isinstance(message, dict):
+            self.log("warn", f"message is not dict: {type(message)}")
+            message = {}
+        
+        content = message.get("content", "") or ""
+        reasoning = message.get("reasoning_content", "") or ""
+        # Also check for "reasoning" field (some servers use this)
+        if not reasoning:
+            reasoning = message.get("reasoning", "") or ""
+        tool_calls = message.get("tool_calls", []) or []
+        
+        # Parse usage
+        usage = data.get("usage")
+        if usage is None or not isinstance(usage, dict):
+            usage = {}
+        usage_data = UsageData(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0)
+        )
+        
+        # Check for empty response
+        if self.detect_empty_response(content, reasoning, tool_calls, usage_data.completion_tokens):
+            self.log("warn", "Empty response detected")
+            raise RetryableError(
+                RetryReason.EMPTY_RESPONSE,
+                error="Empty response after retries exhausted",
+                detail="0 output tokens, no content"
             )
         
-        except requests.exceptions.RequestException as e:
-            error_msg = str(e)
-            self.log_error(f"Network error: {error_msg}")
-            
-            if self.should_retry(RetryReason.NETWORK_ERROR, retry_count):
-                delay = self.get_retry_delay(RetryReason.NETWORK_ERROR)
-                self.log_retry(RetryReason.NETWORK_ERROR, retry_count + 1, delay, error_msg[:100])
-                self.rotate_key_if_possible("(network error)")
-                
-                if delay > 0:
-                    time.sleep(delay)
-                
-                return self.generate(messages, model, params, thinking_enabled, retry_count + 1)
-            
-            return ProviderResult(
-                success=False,
-                error=f"Network error: {error_msg}",
-                retry_count=retry_count
-            )
+        self.log_success(key_num)
         
-        except Exception as e:
-            error_msg = str(e)
-            self.log_error(f"Unexpected error: {error_msg}")
-            
-            return ProviderResult(
-                success=False,
-                error=f"Unexpected error: {error_msg}",
-                retry_count=retry_count
-            )
+        return ProviderResult(
+            success=True,
+            content=content,
+            thinking_content=reasoning,
+            tool_calls=tool_calls,
+            usage=usage_data
+        )
     
     def fetch_models(self) -> tuple[List[Dict], Optional[str]]:
         """
@@ -919,7 +784,7 @@ class OpenAICompatibleProvider(BaseProvider):
         headers = self._get_headers(current_key)
         
         try:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = self.http_get(url, headers=headers, timeout=30)
             
             if response.status_code != 200:
                 return None, f"Failed to fetch models ({response.status_code}): {response.text[:200]}"
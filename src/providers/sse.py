@@ -0,0 +1,235 @@
+"""
+Incremental Server-Sent Events Decoder
+
+Byte-level SSE parser used by the streaming providers. Instead of decoding
+and inspecting every line (response.iter_lines), it reads large
+iter_content chunks, splits events on the blank-line delimiter directly in
+the byte buffer and hands the raw data payload to the JSON decoder, which
+accepts bytes. Single-line "data:" events - the common case for OpenAI and
+Gemini - take a fast path with no per-line work at all.
+
+Supports multi-line data fields, comments/heartbeats (": ..."), the
+"event" and "id" fields, and LF, CRLF or CR line endings.
+
+Uses orjson for payload decoding when it is installed, falling back to the
+standard library json module.
+"""
+
+import json
+from typing import Callable, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    orjson = None
+    HAVE_ORJSON = False
+
+
+# Bytes requested per read. Chunked transfer encoding (used by every SSE
+# upstream) returns each chunk as soon as it arrives, so a large value only
+# reduces per-read overhead; it never delays delivery.
+DEFAULT_CHUNK_SIZE = 16 * 1024
+
+# OpenAI-style end-of-stream sentinel
+DONE_SENTINEL = b"[DONE]"
+
+
+def loads_json(data):
+    """
+    Decode a JSON payload (bytes or str) with the fastest available decoder.
+
+    Raises:
+        json.JSONDecodeError: On malformed input (orjson's error subclasses it)
+    """
+    if HAVE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class SSEEvent:
+    """A dispatched SSE event with its raw (undecoded) data payload"""
+
+    __slots__ = ("data", "event", "id")
+
+    def __init__(self, data: bytes, event: Optional[str] = None, id: Optional[str] = None):
+        self.data = data
+        self.event = event
+        self.id = id
+
+    @property
+    def is_done(self) -> bool:
+        """Whether this is the OpenAI "[DONE]" sentinel"""
+        return self.data.strip() == DONE_SENTINEL
+
+    @property
+    def text(self) -> str:
+        """Data payload decoded as UTF-8 (for logging)"""
+        return self.data.decode("utf-8", errors="replace")
+
+    def json(self):
+        """Decode the data payload as JSON"""
+        return loads_json(self.data)
+
+    def __repr__(self):
+        return f"SSEEvent(event={self.event!r}, data={self.data[:60]!r})"
+
+
+class SSEDecoder:
+    """
+    Incremental SSE decoder.
+
+    Feed raw byte chunks as they arrive; complete events are returned as
+    soon as their terminating blank line has been seen. Call flush() at end
+    of stream to dispatch a trailing event that lacks the final blank line.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0  # Buffer prefix already searched for a delimiter
+        self._pending_cr = False  # Chunk ended in "\r" - may be half of "\r\n"
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        Add a chunk of bytes and return the events it completed.
+
+        Args:
+            chunk: Raw bytes from the response body
+
+        Returns:
+            List of complete events (possibly empty)
+        """
+        if self._pending_cr:
+            chunk = b"\r" + chunk
+            self._pending_cr = False
+        if b"\r" in chunk:
+            if chunk.endswith(b"\r"):
+                chunk = chunk[:-1]
+                self._pending_cr = True
+            chunk = chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        buffer = self._buffer
+        buffer += chunk
+
+        events = []
+        start = 0
+        # Resume one byte early: the delimiter may straddle the previous chunk
+        search = self._scanned - 1 if self._scanned else 0
+        while True:
+            end = buffer.find(b"\n\n", search)
+            if end < 0:
+                break
+            if end > start:
+                event = self._parse_block(bytes(buffer[start:end]))
+                if event is not None:
+                    events.append(event)
+            start = search = end + 2
+
+        if start:
+            del buffer[:start]
+        self._scanned = len(buffer)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """
+        Dispatch whatever is left in the buffer (end of stream).
+
+        Returns:
+            List with the trailing event, if any
+        """
+        block = bytes(self._buffer).strip(b"\n")
+        self._buffer.clear()
+        self._scanned = 0
+        self._pending_cr = False
+        event = self._parse_block(block) if block else None
+        return [event] if event is not None else []
+
+    @staticmethod
+    def _parse_block(block: bytes) -> Optional[SSEEvent]:
+        """Parse one event block (lines between blank-line delimiters)"""
+        # Fast path: a single "data:" line
+        if block.startswith(b"data:") and b"\n" not in block:
+            data = block[5:]
+            if data[:1] == b" ":
+                data = data[1:]
+            return SSEEvent(data)
+
+        data_lines = []
+        event_type = None
+        event_id = None
+        for line in block.split(b"\n"):
+            if not line or line[:1] == b":":
+                continue  # Blank line or comment/heartbeat
+            name, _, value = line.partition(b":")
+            if value[:1] == b" ":
+                value = value[1:]
+            if name == b"data":
+                data_lines.append(value)
+            elif name == b"event":
+                event_type = value.decode("utf-8", errors="replace")
+            elif name == b"id":
+                event_id = value.decode("utf-8", errors="replace")
+            # "retry" and unknown fields are ignored
+
+        if not data_lines:
+            return None
+        return SSEEvent(b"\n".join(data_lines), event_type, event_id)
+
+
+def iter_sse_chunks(chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+    """
+    Decode SSE events from an iterable of byte chunks.
+
+    Args:
+        chunks: Raw byte chunks in arrival order
+
+    Yields:
+        SSEEvent for each complete event
+    """
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        if chunk:
+            yield from decoder.feed(chunk)
+    yield from decoder.flush()
+
+
+def iter_sse_events(
+    response,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    cancel_token=None,
+    on_chunk: Optional[Callable[[int], None]] = None
+) -> Iterator[SSEEvent]:
+    """
+    Decode SSE events from a streaming requests.Response.
+
+    Args:
+        response: Response opened with stream=True
+        chunk_size: Bytes requested per read
+        cancel_token: Optional CancellationToken; reading stops once it is cancelled
+        on_chunk: Called with the size of each raw chunk as it arrives
+            (deadline tracking and byte counts)
+
+    Yields:
+        SSEEvent for each complete event
+    """
+    chunks = response.iter_content(chunk_size=chunk_size)
+    if cancel_token is not None:
+        chunks = _until_cancelled(chunks, cancel_token)
+    if on_chunk is not None:
+        chunks = _notify_chunks(chunks, on_chunk)
+    return iter_sse_chunks(chunks)
+
+
+def _until_cancelled(chunks: Iterable[bytes], cancel_token) -> Iterator[bytes]:
+    """Pass chunks through until the token is cancelled"""
+    for chunk in chunks:
+        if cancel_token.cancelled:
+            return
+        yield chunk
+
+
+def _notify_chunks(chunks: Iterable[bytes], on_chunk: Callable[[int], None]) -> Iterator[bytes]:
+    """Pass chunks through, calling on_chunk with each one's size"""
+    for chunk in chunks:
+        on_chunk(len(chunk))
+        yield chunk
@@ -0,0 +1,147 @@
+"""
+Request Timing Instrumentation
+
+RequestTimings is stamped by the provider while a request runs and is
+attached to ProviderResult.timings (and sent to the stream callback as a
+TIMINGS event) when it finishes:
+
+- build:          request body construction + serialization
+- per attempt:    headers (request sent -> response headers, which
+                  includes connecting), first_byte (-> first body chunk),
+                  duration, outcome, bytes sent/received
+- first_text / first_thinking: request start -> first token of each kind
+- tokens_per_second: completion tokens / (first token -> end of stream)
+
+requests does not expose the TCP/TLS connect time on its own, so the
+closest measurable "connect" figure is time to response headers.
+
+All figures are seconds relative to the request or attempt start.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+OUTCOME_OK = "ok"
+OUTCOME_CANCELLED = "cancelled"
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+@dataclass
+class AttemptTiming:
+    """Timings of one HTTP attempt"""
+    retry: int
+    started: float
+    key: Optional[int] = None
+    headers: Optional[float] = None
+    first_byte: Optional[float] = None
+    duration: Optional[float] = None
+    outcome: Optional[str] = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "retry": self.retry,
+            "key": self.key,
+            "headers_ms": _ms(self.headers),
+            "first_byte_ms": _ms(self.first_byte),
+            "duration_ms": _ms(self.duration),
+            "outcome": self.outcome,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+@dataclass
+class RequestTimings:
+    """Timings of a provider request across all of its attempts"""
+    started: float = field(default_factory=time.monotonic)
+    build: Optional[float] = None
+    attempts: List[AttemptTiming] = field(default_factory=list)
+    first_text: Optional[float] = None
+    first_thinking: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+
+    def built(self):
+        """Mark the request body as built and serialized"""
+        self.build = time.monotonic() - self.started
+
+    @property
+    def current(self) -> Optional[AttemptTiming]:
+        return self.attempts[-1] if self.attempts else None
+
+    def start_attempt(self, retry: int, key: Optional[int] = None) -> AttemptTiming:
+        attempt = AttemptTiming(retry=retry, started=time.monotonic(), key=key)
+        self.attempts.append(attempt)
+        return attempt
+
+    def sent(self, nbytes: int):
+        """Record the request body size and the arrival of response headers"""
+        attempt = self.current
+        if attempt is not None:
+            attempt.bytes_sent = nbytes
+            attempt.headers = time.monotonic() - attempt.started
+
+    def received(self, first_byte_at: Optional[float], nbytes: int):
+        """Record the body of the current attempt (monotonic first-byte time, total bytes)"""
+        attempt = self.current
+        if attempt is not None:
+            if first_byte_at is not None:
+                attempt.first_byte = first_byte_at - attempt.started
+            attempt.bytes_received = nbytes
+
+    def end_attempt(self, outcome: str):
+        attempt = self.current
+        if attempt is not None and attempt.outcome is None:
+            attempt.duration = time.monotonic() - attempt.started
+            attempt.outcome = outcome
+
+    def finish(self, probe=None, completion_tokens: int = 0):
+        """
+        Take token timestamps from the successful attempt's FirstTokenProbe
+        and derive generation throughput.
+        """
+        if probe is None:
+            return
+        if probe.first_text_at is not None:
+            self.first_text = probe.first_text_at - self.started
+        if probe.first_thinking_at is not None:
+            self.first_thinking = probe.first_thinking_at - self.started
+        if probe.first_token_at is not None and completion_tokens:
+            generating = time.monotonic() - probe.first_token_at
+            if generating > 0:
+                self.tokens_per_second = completion_tokens / generating
+
+    @property
+    def ttfb(self) -> Optional[float]:
+        """Request start -> first body byte of the final attempt"""
+        attempt = self.current
+        if attempt is None or attempt.first_byte is None:
+            return None
+        return attempt.started + attempt.first_byte - self.started
+
+    @property
+    def bytes_sent(self) -> int:
+        return sum(attempt.bytes_sent for attempt in self.attempts)
+
+    @property
+    def bytes_received(self) -> int:
+        return sum(attempt.bytes_received for attempt in self.attempts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        final = self.current
+        return {
+            "build_ms": _ms(self.build),
+            "headers_ms": _ms(final.headers) if final else None,
+            "ttfb_ms": _ms(self.ttfb),
+            "ttft_text_ms": _ms(self.first_text),
+            "ttft_thinking_ms": _ms(self.first_thinking),
+            "tokens_per_second": round(self.tokens_per_second, 1) if self.tokens_per_second else None,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "attempts": [attempt.to_dict() for attempt in self.attempts],
+        }
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Non-blocking Request Logging
+
+RequestPipeline used to render rich panels (and whole raw outputs) on the
+request thread, so concurrent requests serialized on console I/O and their
+output interleaved. Now the pipeline only builds a small dict per event and
+enqueues it; a single background writer renders the records one at a time.
+
+Records (all carry "event", "ts" and "request_id"):
+    request_start     origin, provider, model, streaming, thinking, session_id
+    request_complete  origin, provider, model, error, elapsed, chars,
+                      reasoning_chars, retries, hedged, fallbacks, cancelled,
+                      tokens_saved, served_by, tokens {...}, timings {...}
+                      (if measured)
+    raw_response      origin, full, text
+
+Renderers (request_log_format):
+    console  rich panels, or plain text without rich (default)
+    jsonl    one compact JSON object per line, to request_log_file or stdout
+    off      records are dropped before they are queued
+
+register_renderer() adds custom renderers. When the queue is full
+(request_log_queue_size) new records are dropped and counted rather than
+blocking the request.
+"""
+
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from src.console import console, HAVE_RICH, print_panel
+
+DEFAULT_FORMAT = "console"
+DEFAULT_QUEUE_SIZE = 1000
+
+EVENT_START = "request_start"
+EVENT_COMPLETE = "request_complete"
+EVENT_RAW = "raw_response"
+
+
+# ------------------------------------------------------------------
+# Formatting helpers shared by renderers and RequestContext
+# ------------------------------------------------------------------
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def format_bytes(count: int) -> str:
+    return f"{count} B" if count < 1024 else f"{count / 1024:.1f} KB"
+
+
+def format_usage(tokens: Dict[str, Any]) -> str:
+    est = " (est)" if tokens.get("estimated") else ""
+    return (f"📊 Tokens: {tokens.get('input', 0)} in | {tokens.get('output', 0)} out | "
+            f"{tokens.get('total', 0)} total{est}")
+
+
+def format_timings(timings: Optional[Dict[str, Any]]) -> List[str]:
+    """Timing / transfer / attempt lines for a record's "timings" (seconds)"""
+    if not timings:
+        return []
+    parts = []
+    for label, key in (("build", "build"), ("headers", "headers"), ("first byte", "ttfb"),
+                       ("first text", "ttft_text"), ("first thinking", "ttft_thinking")):
+        value = timings.get(key)
+        if value is not None:
+            parts.append(f"{label} {format_duration(value)}")
+    if timings.get("tokens_per_second"):
+        parts.append(f"{timings['tokens_per_second']:.1f} tok/s")
+    lines = [f"⏱ Timing: {' | '.join(parts)}"] if parts else []
+    lines.append(f"📡 Transfer: {format_bytes(timings.get('bytes_sent', 0))} sent | "
+                 f"{format_bytes(timings.get('bytes_received', 0))} received")
+    attempts = timings.get("attempts") or []
+    if len(attempts) > 1:
+        tries = []
+        for attempt in attempts:
+            key = f" key #{attempt['key']}" if attempt.get("key") else ""
+            duration = attempt.get("duration_ms")
+            took = f" {format_duration(duration / 1000.0)}" if duration is not None else ""
+            tries.append(f"#{attempt['retry'] + 1}{key} {attempt.get('outcome')}{took}")
+        lines.append(f"🔁 Attempts: {' -> '.join(tries)}")
+    return lines
+
+
+# ------------------------------------------------------------------
+# Renderers
+# ------------------------------------------------------------------
+
+class ConsoleRenderer:
+    """Rich request panels (plain text when rich is unavailable)"""
+
+    def render(self, record: Dict[str, Any]):
+        event = record.get("event")
+        if event == EVENT_START:
+            self._start(record)
+        elif event == EVENT_COMPLETE:
+            self._complete(record)
+        elif event == EVENT_RAW:
+            self._raw(record)
+
+    def close(self):
+        pass
+
+    def _start(self, record: Dict[str, Any]):
+        if HAVE_RICH:
+            info = [
+                f"[bold]Provider:[/bold] {record['provider']}",
+                f"[bold]Model:[/bold] {record['model']}",
+                f"[bold]Streaming:[/bold] {'[green]ON[/green]' if record['streaming'] else '[red]OFF[/red]'}",
+                f"[bold]Thinking:[/bold] {'[green]ON[/green]' if record['thinking'] else '[red]OFF[/red]'}"
+            ]
+            if record.get("session_id"):
+                info.append(f"[bold]Session:[/bold] {record['session_id']}")
+
+            console.print()
+            print_panel(
+                "\n".join(info),
+                title=f"[bold]API REQUEST: {record['origin']}[/bold]",
+                border_style="blue",
+                style="white"
+            )
+        else:
+            print(f"\n{'='*60}")
+            print(f"[API REQUEST] {record['origin']}")
+            print(f"  Provider: {record['provider']}")
+            print(f"  Model: {record['model']}")
+            print(f"  Streaming: {'ON' if record['streaming'] else 'OFF'}")
+            print(f"  Thinking: {'ON' if record['thinking'] else 'OFF'}")
+            if record.get("session_id"):
+                print(f"  Session: {record['session_id']}")
+
+    def _complete(self, record: Dict[str, Any]):
+        error = record.get("error")
+        fallbacks = record.get("fallbacks")
+        if HAVE_RICH:
+            style = "green" if not error else "red"
+            title = "[bold green]SUCCESS[/bold green]" if not error else f"[bold red]FAILED: {error}[/bold red]"
+
+            summary = []
+            if not error:
+                summary.append(f"Length: {record['chars']} chars")
+                if record.get("reasoning_chars"):
+                    summary.append(f"Thinking: {record['reasoning_chars']} chars")
+
+            summary.append(f"Elapsed: {record['elapsed']:.2f}s")
+            if record.get("retries"):
+                summary.append(f"Retries: {record['retries']}")
+            if record.get("hedged"):
+                summary.append("Hedged: yes")
+            if fallbacks:
+                summary.append(f"Fallback: {' -> '.join(fallbacks)} -> {record['provider']}")
+            if record.get("served_by"):
+                summary.append(f"Served by: {record['served_by']}")
+            if record.get("cancelled"):
+                summary.append(f"Cancelled: ~{record['tokens_saved']} output tokens saved")
+
+            summary.append(f"\n{format_usage(record['tokens'])}")
+            summary.extend(format_timings(record.get("timings")))
+
+            print_panel(
+                "\n".join(summary),
+                title=title,
+                border_style=style,
+                style="white"
+            )
+            console.print()
+        else:
+            if error:
+                print(f"  [FAILED] {error}")
+                if record["elapsed"] > 0:
+                    print(f"  Elapsed: {record['elapsed']:.1f}s")
+                if record.get("cancelled"):
+                    print(f"  Cancelled: ~{record['tokens_saved']} output tokens saved")
+            else:
+                print(f"  [SUCCESS] {record['chars']} chars")
+                if record.get("reasoning_chars"):
+                    print(f"  Thinking: {record['reasoning_chars']} chars")
+                print(f"  Elapsed: {record['elapsed']:.1f}s")
+                if record.get("retries"):
+                    print(f"  Retries: {record['retries']}")
+                if record.get("hedged"):
+                    print(f"  Hedged: yes")
+                if fallbacks:
+                    print(f"  Fallback: {' -> '.join(fallbacks)} -> {record['provider']}")
+                if record.get("served_by"):
+                    print(f"  Served by: {record['served_by']}")
+
+            # ALWAYS log token usage
+            print(f"  {format_usage(record['tokens'])}")
+            for line in format_timings(record.get("timings")):
+                print(f"  {line}")
+            print(f"{'='*60}\n")
+
+    def _raw(self, record: Dict[str, Any]):
+        text = record["text"]
+        if record.get("full"):
+            if HAVE_RICH:
+                print_panel(
+                    text,
+                    title=f"RAW AI OUTPUT ({record['origin']})",
+                    border_style="dim white"
+                )
+            else:
+                print(f"\n--- RAW AI OUTPUT ({record['origin']}) ---")
+                print(text)
+                print("--- END RAW OUTPUT ---\n")
+        elif HAVE_RICH:
+            console.print(f"[dim]Preview: {text}[/dim]")
+        else:
+            print(f"  Preview: {text}")
+
+
+class JsonlRenderer:
+    """One JSON object per line, appended to a file or written to stdout"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._stream = open(path, "a", encoding="utf-8") if path else None
+
+    def render(self, record: Dict[str, Any]):
+        stream = self._stream or sys.stdout
+        stream.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        stream.flush()
+
+    def close(self):
+        if self._stream:
+            self._stream.close()
+            self._stream = None
+
+
+_RENDERERS: Dict[str, Callable[[Dict], Any]] = {
+    "console": lambda config: ConsoleRenderer(),
+    "jsonl": lambda config: JsonlRenderer(config.get("request_log_file") or None),
+}
+
+
+def register_renderer(name: str, factory: Callable[[Dict], Any]):
+    """
+    Add a renderer selectable via request_log_format.
+
+    factory(config) returns an object with render(record) and close().
+    """
+    _RENDERERS[name.lower()] = factory
+
+
+# ------------------------------------------------------------------
+# Sink
+# ------------------------------------------------------------------
+
+class RequestLog:
+    """Bounded record queue drained by one background writer thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self.max_queued = DEFAULT_QUEUE_SIZE
+        self._renderer = ConsoleRenderer()
+        self._settings = (DEFAULT_FORMAT, None, DEFAULT_QUEUE_SIZE)
+        self._enabled = True
+        self._thread: Optional[threading.Thread] = None
+
+        # Stats
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def configure(self, config: Dict):
+        """Apply request_log_format / request_log_file / request_log_queue_size (cheap when unchanged)"""
+        fmt = str(config.get("request_log_format") or DEFAULT_FORMAT).lower()
+        settings = (fmt, config.get("request_log_file") or None,
+                    int(config.get("request_log_queue_size") or DEFAULT_QUEUE_SIZE))
+        if settings == self._settings:
+            return
+        with self._lock:
+            if settings == self._settings:
+                return
+            self.flush()
+            factory = _RENDERERS.get(fmt)
+            if factory is None and fmt != "off":
+                print(f"  [RequestLog] Unknown request_log_format '{fmt}', using {DEFAULT_FORMAT}")
+                factory = _RENDERERS[DEFAULT_FORMAT]
+            old = self._renderer
+            self._renderer = factory(config) if factory else None
+            self._enabled = factory is not None
+            self.max_queued = max(1, settings[2])
+            self._settings = settings
+        if old is not None and old is not self._renderer:
+            old.close()
+
+    def emit(self, record: Dict[str, Any]):
+        """Queue a record for rendering; never blocks"""
+        if not self._enabled:
+            return
+        if self._queue.qsize() >= self.max_queued:
+            self.dropped += 1
+            return
+        record.setdefault("ts", round(time.time(), 3))
+        self._queue.put(record)
+        if self._thread is None:
+            self._start()
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Wait until everything queued so far is rendered"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "format": self._settings[0] if self._enabled else "off",
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="RequestLog", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            renderer = self._renderer
+            if renderer is None:
+                continue
+            try:
+                renderer.render(item)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"  [RequestLog] Render error: {e}", file=sys.stderr)
+
+
+_LOG = RequestLog()
+atexit.register(_LOG.flush, 1.0)
+
+
+def get_request_log() -> RequestLog:
+    """The process-wide request log sink"""
+    return _LOG
@@ -10,12 +10,27 @@ This pipeline ensures:
 4. Unified error handling
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, Callable, Dict, Any, List
+from typing import Optional, Callable, Dict, Any, List, Tuple
+import threading
 import time
+import uuid
 
-from src.console import console, Panel, HAVE_RICH, print_panel
+from src.admission import BATCH, AdmissionRejected, get_admission_controller, priority_for
+from src.cancellation import CANCELLED_ERROR, CancellationToken
+from src.hedging import HedgedStream, get_hedge_delay
+from src.metrics import RollingPercentiles
+from src.middleware import MiddlewareChain, get_middleware_chain
+from src.providers.deadlines import Deadlines
+from src.providers.health import get_health_tracker, parse_fallback_chain
+from src.request_log import (
+    EVENT_COMPLETE, EVENT_RAW, EVENT_START, format_timings, format_usage, get_request_log
+)
+from src.text_buffer import TextBuffer
+from src.usage_ledger import get_usage_ledger
 
 class RequestOrigin(Enum):
     """Origin of an API request - helps identify request source in logs"""
@@ -29,6 +44,7 @@ class RequestOrigin(Enum):
     ENDPOINT_SUMMARIZE = "endpoint/summarize"
     ENDPOINT_TEXTEDIT = "endpoint/textedit"
     ENDPOINT_CUSTOM = "endpoint/custom"
+    GATEWAY = "gateway"
 
 
 @dataclass
@@ -41,6 +57,8 @@ class RequestContext:
     streaming: bool
     thinking_enabled: bool
     session_id: Optional[str] = None
+    # Correlates the start/complete log records of one request
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
     
     # Populated after response
     input_tokens: int = 0
@@ -49,17 +67,110 @@ class RequestContext:
     estimated: bool = False
     elapsed_time: float = 0.0
     retry_count: int = 0
+    hedged: bool = False  # A hedge request was fired (see hedging.py)
+    # provider/model entries skipped or failed before ctx.provider served
+    fallbacks: List[str] = field(default_factory=list)
+    # Set when the caller cancelled the request mid-stream; tokens_saved is
+    # the estimated output that was never generated
+    cancelled: bool = False
+    tokens_saved: int = 0
+    # Middleware stage that answered the request without calling the provider
+    served_by: Optional[str] = None
+    # Response cache opt-in (per-action "cache" in prompts.json); None =
+    # response_cache_default
+    cache: Optional[bool] = None
+    # Per-request scratch space for middleware stages
+    middleware_data: Dict[str, Any] = field(default_factory=dict, repr=False)
+    # Admission priority class (see admission.py); None = derived from origin
+    priority: Optional[str] = None
+    # HTTP status (429 / 503) and Retry-After seconds when admission refused
+    # the request
+    rejected_status: Optional[int] = None
+    retry_after: Optional[int] = None
     
-    # Response content
-    response_text: str = ""
-    reasoning_text: str = ""
+    # Provider timings (see providers/timings.py), in seconds; None when not
+    # measured. headers_time is request start -> response headers (includes
+    # connecting); ttft_* count from the start of the provider request
+    build_time: Optional[float] = None
+    headers_time: Optional[float] = None
+    ttfb: Optional[float] = None
+    ttft_text: Optional[float] = None
+    ttft_thinking: Optional[float] = None
+    tokens_per_second: Optional[float] = None
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    attempts: List[Dict] = field(default_factory=list)  # AttemptTiming.to_dict() per try
+    
+    # Response content - streamed deltas are appended to the buffers;
+    # response_text / reasoning_text expose the joined text
+    response_buffer: TextBuffer = field(default_factory=TextBuffer, repr=False)
+    reasoning_buffer: TextBuffer = field(default_factory=TextBuffer, repr=False)
     tool_calls: List[Dict] = field(default_factory=list)
     error: Optional[str] = None
     
+    @property
+    def response_text(self) -> str:
+        return self.response_buffer.getvalue()
+    
+    @response_text.setter
+    def response_text(self, value: str):
+        self.response_buffer = TextBuffer(value or "")
+    
+    @property
+    def reasoning_text(self) -> str:
+        return self.reasoning_buffer.getvalue()
+    
+    @reasoning_text.setter
+    def reasoning_text(self, value: str):
+        self.reasoning_buffer = TextBuffer(value or "")
+    
+    def usage_fields(self) -> Dict[str, Any]:
+        return {
+            "input": self.input_tokens,
+            "output": self.output_tokens,
+            "total": self.total_tokens,
+            "estimated": self.estimated,
+        }
+    
     def get_usage_summary(self) -> str:
         """Get formatted usage summary"""
-        est = " (est)" if self.estimated else ""
-        return f"📊 Tokens: {self.input_tokens} in | {self.output_tokens} out | {self.total_tokens} total{est}"
+        return format_usage(self.usage_fields())
+    
+    def apply_timings(self, timings: Dict[str, Any]):
+        """Record a provider TIMINGS event (RequestTimings.to_dict())"""
+        def seconds(key):
+            value = timings.get(key)
+            return value / 1000.0 if value is not None else None
+        
+        self.build_time = seconds("build_ms")
+        self.headers_time = seconds("headers_ms")
+        self.ttfb = seconds("ttfb_ms")
+        self.ttft_text = seconds("ttft_text_ms")
+        self.ttft_thinking = seconds("ttft_thinking_ms")
+        self.tokens_per_second = timings.get("tokens_per_second")
+        self.bytes_sent = timings.get("bytes_sent", 0)
+        self.bytes_received = timings.get("bytes_received", 0)
+        self.attempts = list(timings.get("attempts", []))
+    
+    def timing_fields(self) -> Optional[Dict[str, Any]]:
+        """Provider timings for log records (None when the provider sent none)"""
+        if not self.attempts:
+            return None
+        return {
+            "build": self.build_time,
+            "headers": self.headers_time,
+            "ttfb": self.ttfb,
+            "ttft_text": self.ttft_text,
+            "ttft_thinking": self.ttft_thinking,
+            "tokens_per_second": self.tokens_per_second,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "attempts": self.attempts,
+        }
+    
+    def get_timing_summary(self) -> List[str]:
+        """Formatted timing/transfer lines (empty when the provider sent no timings)"""
+        return format_timings(self.timing_fields())
 
 
 @dataclass
@@ -73,6 +184,119 @@ class StreamCallback:
     on_tool_calls: Optional[Callable[[List], None]] = None
 
 
+class DeltaCoalescer:
+    """
+    Batches streamed text/thinking deltas before they reach StreamCallback.
+    
+    A batch is emitted once window_ms has passed since its first delta or
+    once it holds max_chars characters; a background flusher emits batches
+    that would otherwise wait on a stalled stream. Pending text is flushed
+    before any other event (tool calls, usage, done, error) and on close(),
+    so ordering is preserved and nothing is dropped.
+    
+    Handlers are always invoked under the coalescer lock, so they never run
+    concurrently even though the flusher thread may invoke them.
+    """
+    
+    def __init__(
+        self,
+        on_text: Optional[Callable[[str], None]],
+        on_thinking: Optional[Callable[[str], None]],
+        window_ms: float = 30,
+        max_chars: int = 1024
+    ):
+        self._handlers = {"text": on_text, "thinking": on_thinking}
+        self._window = max(0.0, window_ms) / 1000.0
+        self._max_chars = max(1, max_chars)
+        self._kind: Optional[str] = None
+        self._parts: List[str] = []
+        self._size = 0
+        self._deadline = 0.0
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        
+        # Stats
+        self.deltas_in = 0
+        self.batches_out = 0
+    
+    def add(self, kind: str, content: str):
+        """Queue a "text" or "thinking" delta"""
+        if not content or not self._handlers.get(kind):
+            return
+        with self._lock:
+            self.deltas_in += 1
+            if self._parts and kind != self._kind:
+                self._flush_locked()
+            if not self._parts:
+                self._kind = kind
+                self._deadline = time.monotonic() + self._window
+                self._start_flusher()
+                self._wakeup.notify()
+            self._parts.append(content)
+            self._size += len(content)
+            if self._size >= self._max_chars or time.monotonic() >= self._deadline:
+                self._flush_locked()
+    
+    def flush(self):
+        """Emit any pending batch now"""
+        with self._lock:
+            self._flush_locked()
+    
+    def close(self):
+        """Flush and stop the background flusher"""
+        with self._lock:
+            self._flush_locked()
+            self._closed = True
+            self._wakeup.notify()
+    
+    def _flush_locked(self):
+        if not self._parts:
+            return
+        text = self._parts[0] if len(self._parts) == 1 else "".join(self._parts)
+        handler = self._handlers[self._kind]
+        self._parts = []
+        self._size = 0
+        self._kind = None
+        self.batches_out += 1
+        handler(text)
+    
+    def _start_flusher(self):
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._run_flusher, name="DeltaCoalescer", daemon=True)
+            self._flusher.start()
+    
+    def _run_flusher(self):
+        with self._lock:
+            while not self._closed:
+                if not self._parts:
+                    self._wakeup.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                try:
+                    self._flush_locked()
+                except Exception as e:
+                    print(f"  [Pipeline] Stream callback error: {e}")
+
+
+# Completion tokens of recent finished streams per origin, used to estimate
+# how much output a cancelled request would have produced
+_OUTPUT_TOKENS: Dict[str, RollingPercentiles] = {}
+_OUTPUT_TOKENS_LOCK = threading.Lock()
+
+
+def _output_tokens_for(origin: str) -> RollingPercentiles:
+    with _OUTPUT_TOKENS_LOCK:
+        stats = _OUTPUT_TOKENS.get(origin)
+        if stats is None:
+            stats = _OUTPUT_TOKENS[origin] = RollingPercentiles()
+        return stats
+
+
 class RequestPipeline:
     """
     Unified request pipeline with mandatory logging.
@@ -84,78 +308,135 @@ class RequestPipeline:
     - Error tracking
     """
     
+    @staticmethod
+    def _begin(ctx: RequestContext, config: Dict) -> MiddlewareChain:
+        """Log the request start; returns the middleware chain for config"""
+        get_request_log().configure(config)
+        RequestPipeline.log_request_start(ctx)
+        return get_middleware_chain(config)
+    
+    @staticmethod
+    def _complete(ctx: RequestContext, config: Dict, chain: MiddlewareChain):
+        """Run the post-response / error stages, then log and record the request"""
+        chain.finish(ctx)
+        RequestPipeline.log_request_complete(ctx)
+        RequestPipeline.record_usage(ctx, config)
+    
+    @staticmethod
+    @contextmanager
+    def _running(ctx: RequestContext, config: Dict, chain: MiddlewareChain):
+        """
+        Wrap a request's body so _complete runs even when it raises.
+        
+        The exception still propagates, but the error stages see it in
+        ctx.error first (a singleflight leader releases its followers).
+        """
+        try:
+            yield
+        except BaseException as e:
+            if not ctx.error:
+                ctx.error = f"Unexpected error: {e}"
+            raise
+        finally:
+            RequestPipeline._complete(ctx, config, chain)
+    
+    @staticmethod
+    def _replay(ctx: RequestContext, result, stream_wrapper: Callable[[str, Any], None]):
+        """
+        Feed a middleware stage's answer to the stream callback as if it had
+        been streamed. A live answer streams its own events.
+        
+        Returns:
+            (text, reasoning, usage, error) like a streaming call, or None
+            when a live answer declined and the provider has to be called
+        """
+        if hasattr(result, "stream"):
+            result = result.stream(stream_wrapper)
+            if result is None:
+                ctx.served_by = None
+                return None
+            usage = result.usage.to_dict() if result.usage is not None else None
+            return result.content, result.thinking_content, usage, result.error
+        if result.error:
+            stream_wrapper("error", result.error)
+            return None, None, None, result.error
+        usage = result.usage.to_dict() if result.usage is not None else None
+        if result.thinking_content:
+            stream_wrapper("thinking", result.thinking_content)
+        if result.content:
+            stream_wrapper("text", result.content)
+        if result.tool_calls:
+            stream_wrapper("tool_calls", list(result.tool_calls))
+        if usage:
+            stream_wrapper("usage", usage)
+        stream_wrapper("done", None)
+        return result.content, result.thinking_content, usage, None
+    
     @staticmethod
     def log_request_start(ctx: RequestContext):
-        """Log when request starts"""
-        if HAVE_RICH:
-            info = [
-                f"[bold]Provider:[/bold] {ctx.provider}",
-                f"[bold]Model:[/bold] {ctx.model}",
-                f"[bold]Streaming:[/bold] {'[green]ON[/green]' if ctx.streaming else '[red]OFF[/red]'}",
-                f"[bold]Thinking:[/bold] {'[green]ON[/green]' if ctx.thinking_enabled else '[red]OFF[/red]'}"
-            ]
-            if ctx.session_id:
-                info.append(f"[bold]Session:[/bold] {ctx.session_id}")
-            
-            console.print()
-            print_panel(
-                "\n".join(info),
-                title=f"[bold]API REQUEST: {ctx.origin.value}[/bold]",
-                border_style="blue",
-                style="white"
-            )
-        else:
-            print(f"\n{'='*60}")
-            print(f"[API REQUEST] {ctx.origin.value}")
-            print(f"  Provider: {ctx.provider}")
-            print(f"  Model: {ctx.model}")
-            print(f"  Streaming: {'ON' if ctx.streaming else 'OFF'}")
-            print(f"  Thinking: {'ON' if ctx.thinking_enabled else 'OFF'}")
-            if ctx.session_id:
-                print(f"  Session: {ctx.session_id}")
+        """Log when request starts (queued; rendered by the request log writer)"""
+        get_request_log().emit({
+            "event": EVENT_START,
+            "request_id": ctx.request_id,
+            "origin": ctx.origin.value,
+            "provider": ctx.provider,
+            "model": ctx.model,
+            "streaming": ctx.streaming,
+            "thinking": ctx.thinking_enabled,
+            "session_id": ctx.session_id,
+        })
     
     @staticmethod
     def log_request_complete(ctx: RequestContext):
         """Log when request completes - always includes token usage"""
-        if HAVE_RICH:
-            style = "green" if not ctx.error else "red"
-            title = "[bold green]SUCCESS[/bold green]" if not ctx.error else f"[bold red]FAILED: {ctx.error}[/bold red]"
-            
-            summary = []
-            if not ctx.error:
-                summary.append(f"Length: {len(ctx.response_text)} chars")
-                if ctx.reasoning_text:
-                    summary.append(f"Thinking: {len(ctx.reasoning_text)} chars")
-            
-            summary.append(f"Elapsed: {ctx.elapsed_time:.2f}s")
-            if ctx.retry_count > 0:
-                summary.append(f"Retries: {ctx.retry_count}")
-            
-            summary.append(f"\n{ctx.get_usage_summary()}")
-            
-            print_panel(
-                "\n".join(summary),
-                title=title,
-                border_style=style,
-                style="white"
-            )
-            console.print()
-        else:
-            if ctx.error:
-                print(f"  [FAILED] {ctx.error}")
-                if ctx.elapsed_time > 0:
-                    print(f"  Elapsed: {ctx.elapsed_time:.1f}s")
-            else:
-                print(f"  [SUCCESS] {len(ctx.response_text)} chars")
-                if ctx.reasoning_text:
-                    print(f"  Thinking: {len(ctx.reasoning_text)} chars")
-                print(f"  Elapsed: {ctx.elapsed_time:.1f}s")
-                if ctx.retry_count > 0:
-                    print(f"  Retries: {ctx.retry_count}")
-            
-            # ALWAYS log token usage
-            print(f"  {ctx.get_usage_summary()}")
-            print(f"{'='*60}\n")
+        record = {
+            "event": EVENT_COMPLETE,
+            "request_id": ctx.request_id,
+            "origin": ctx.origin.value,
+            "provider": ctx.provider,
+            "model": ctx.model,
+            "error": ctx.error,
+            "elapsed": round(ctx.elapsed_time, 3),
+            "chars": len(ctx.response_buffer),
+            "reasoning_chars": len(ctx.reasoning_buffer),
+            "retries": ctx.retry_count,
+            "hedged": ctx.hedged,
+            "fallbacks": list(ctx.fallbacks),
+            "cancelled": ctx.cancelled,
+            "tokens_saved": ctx.tokens_saved,
+            "served_by": ctx.served_by,
+            "tokens": ctx.usage_fields(),
+        }
+        timings = ctx.timing_fields()
+        if timings:
+            record["timings"] = timings
+        get_request_log().emit(record)
+    
+    @staticmethod
+    def record_usage(ctx: RequestContext, config: Dict):
+        """Append the finished request to the usage ledger (if usage_ledger_file is set)"""
+        ledger = get_usage_ledger(config)
+        if ledger is None:
+            return
+        ttfts = [t for t in (ctx.ttft_text, ctx.ttft_thinking) if t is not None]
+        # Answered by middleware (e.g. the response cache): nothing was spent
+        spent = ctx.served_by is None
+        ledger.record({
+            "request_id": ctx.request_id,
+            "origin": ctx.origin.value,
+            "provider": ctx.provider,
+            "model": ctx.model,
+            "key_num": ctx.attempts[-1].get("key") if ctx.attempts else None,
+            "input_tokens": ctx.input_tokens if spent else 0,
+            "output_tokens": ctx.output_tokens if spent else 0,
+            "total_tokens": ctx.total_tokens if spent else 0,
+            "estimated": ctx.estimated,
+            "cost": None if spent else 0.0,
+            "latency": ctx.elapsed_time,
+            "ttft": min(ttfts) if ttfts else None,
+            "success": not ctx.error,
+            "error": ctx.error,
+        })
     
     @staticmethod
     def log_raw_response(ctx: RequestContext, log_full: bool = False):
@@ -166,69 +447,71 @@ class RequestPipeline:
             ctx: Request context with response
             log_full: If True, log full content; if False, log truncated
         """
-        if ctx.response_text:
-            if HAVE_RICH:
-                if log_full:
-                    print_panel(
-                        ctx.response_text,
-                        title=f"RAW AI OUTPUT ({ctx.origin.value})",
-                        border_style="dim white"
-                    )
-                else:
-                    preview = ctx.response_text[:200] + "..." if len(ctx.response_text) > 200 else ctx.response_text
-                    console.print(f"[dim]Preview: {preview}[/dim]")
-            else:
-                if log_full:
-                    print(f"\n--- RAW AI OUTPUT ({ctx.origin.value}) ---")
-                    print(ctx.response_text)
-                    print("--- END RAW OUTPUT ---\n")
-                else:
-                    preview = ctx.response_text[:200] + "..." if len(ctx.response_text) > 200 else ctx.response_text
-                    print(f"  Preview: {preview}")
+        text = ctx.response_text
+        if not text:
+            return
+        if not log_full and len(text) > 200:
+            text = text[:200] + "..."
+        get_request_log().emit({
+            "event": EVENT_RAW,
+            "request_id": ctx.request_id,
+            "origin": ctx.origin.value,
+            "full": log_full,
+            "text": text,
+        })
     
     @staticmethod
-    def execute_streaming(
+    def create_coalescer(config: Dict, callbacks: StreamCallback) -> Optional[DeltaCoalescer]:
+        """
+        Create the delta coalescer for a streaming request.
+        
+        Returns None when disabled (stream_coalesce_ms = 0) or when there
+        are no text/thinking callbacks to batch for.
+        """
+        window_ms = config.get("stream_coalesce_ms", 30)
+        if not window_ms or window_ms <= 0:
+            return None
+        if not callbacks.on_text and not callbacks.on_thinking:
+            return None
+        return DeltaCoalescer(
+            callbacks.on_text,
+            callbacks.on_thinking,
+            window_ms=window_ms,
+            max_chars=config.get("stream_coalesce_chars", 1024)
+        )
+    
+    @staticmethod
+    def _make_stream_wrapper(
         ctx: RequestContext,
-        session,
-        config: Dict,
-        ai_params: Dict,
-        key_managers: Dict,
         callbacks: StreamCallback,
-        log_raw: bool = False
-    ) -> RequestContext:
+        coalescer: Optional[DeltaCoalescer] = None
+    ) -> Callable[[str, Any], None]:
         """
-        Execute streaming API request with logging.
-        
-        Args:
-            ctx: Request context
-            session: Chat session object
-            config: Configuration dictionary
-            ai_params: AI parameters
-            key_managers: Dictionary of key managers
-            callbacks: Streaming callbacks
-            log_raw: Whether to log raw AI output
-        
-        Returns:
-            Updated RequestContext with response data
+        Build the callback that records stream events into ctx and forwards
+        them to the caller's StreamCallback (through the coalescer if any).
         """
-        from .api_client import call_api_chat_stream
-        
-        RequestPipeline.log_request_start(ctx)
-        start_time = time.time()
-        
-        # Wrap the user's callback to capture data
         def stream_wrapper(data_type, content):
             if data_type == "text":
-                ctx.response_text += content
-                if callbacks.on_text:
+                ctx.response_buffer.append(content)
+                if coalescer:
+                    coalescer.add("text", content)
+                elif callbacks.on_text:
                     callbacks.on_text(content)
+                return
             
             elif data_type == "thinking":
-                ctx.reasoning_text += content
-                if callbacks.on_thinking:
+                ctx.reasoning_buffer.append(content)
+                if coalescer:
+                    coalescer.add("thinking", content)
+                elif callbacks.on_thinking:
                     callbacks.on_thinking(content)
+                return
+            
+            # Any other event ends the current batch to keep ordering
+            if coalescer:
+                coalescer.flush()
             
-            elif data_type == "tool_calls":
+            if data_type == "tool_calls":
                 if isinstance(content, list):
                     ctx.tool_calls.extend(content)
                 if callbacks.on_tool_calls:
@@ -246,21 +529,252 @@ class RequestPipeline:
                 if callbacks.on_done:
                     callbacks.on_done()
             
+            elif data_type == "timings":
+                ctx.apply_timings(content)
+            
             elif data_type == "error":
                 ctx.error = content
                 if callbacks.on_error:
                     callbacks.on_error(content)
         
-        # Execute the actual API call
-        text, reasoning, usage, error = call_api_chat_stream(
-            session, config, ai_params, key_managers, stream_wrapper
-        )
+        return stream_wrapper
+    
+    @staticmethod
+    def _run_stream(
+        ctx: RequestContext,
+        config: Dict,
+        stream_wrapper: Callable[[str, Any], None],
+        launch: Callable,
+        cancel_token: Optional[CancellationToken] = None
+    ):
+        """
+        Run a streaming call, hedged when ctx.origin is listed in hedge_origins.
+        
+        Args:
+            launch: launch(callback, cancel_token, is_hedge) -> (text, reasoning, usage, error)
+            cancel_token: Caller's token; cancels the request (every attempt when hedged)
+        """
+        delay = get_hedge_delay(config, ctx.origin.value)
+        if delay is None:
+            return launch(stream_wrapper, cancel_token, False)
+        hedge = HedgedStream(ctx.origin.value, delay, launch, stream_wrapper)
+        unregister = cancel_token.on_cancel(hedge.cancel) if cancel_token else None
+        try:
+            return hedge.run()
+        finally:
+            if unregister:
+                unregister()
+            ctx.hedged = hedge.hedged
+    
+    @staticmethod
+    def _finish_stream(
+        ctx: RequestContext,
+        ai_params: Dict,
+        error: Optional[str],
+        cancel_token: Optional[CancellationToken] = None
+    ):
+        """
+        Record the outcome of a streaming call in ctx.
+        
+        Completed streams feed the per-origin output size history; a stream
+        stopped by cancel_token is marked cancelled, with tokens_saved
+        estimated from that history (or max_tokens before any history).
+        """
+        from .providers.base import estimate_tokens
         
-        ctx.elapsed_time = time.time() - start_time
         if error:
             ctx.error = error
+        history = _output_tokens_for(ctx.origin.value)
+        if not error and ctx.output_tokens:
+            history.add(ctx.output_tokens)
         
-        RequestPipeline.log_request_complete(ctx)
+        if error == CANCELLED_ERROR and cancel_token is not None and cancel_token.cancelled:
+            ctx.cancelled = True
+            generated = estimate_tokens(ctx.response_text) + estimate_tokens(ctx.reasoning_text)
+            expected = history.percentile(50) or ai_params.get("max_tokens") or 0
+            ctx.tokens_saved = max(0, int(expected) - generated)
+    
+    @staticmethod
+    def fallback_candidates(ctx: RequestContext, config: Dict, key_managers: Dict) -> List[Tuple[str, str]]:
+        """
+        Providers to try for a request: ctx.provider first, then every
+        provider_fallback_chain entry that has keys and a configured model.
+        """
+        candidates = [(ctx.provider, ctx.model)]
+        for provider in parse_fallback_chain(config.get("provider_fallback_chain")):
+            if any(provider == p for p, _ in candidates):
+                continue
+            key_manager = key_managers.get(provider)
+            model = config.get(f"{provider}_model")
+            if key_manager and key_manager.has_keys() and model:
+                candidates.append((provider, model))
+        return candidates
+    
+    @staticmethod
+    def _with_fallback(
+        ctx: RequestContext,
+        config: Dict,
+        key_managers: Dict,
+        run: Callable,
+        stream_wrapper: Optional[Callable[[str, Any], None]] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ):
+        """
+        Run a request against the fallback chain.
+        
+        The request first waits for an upstream slot (admission.py); when it
+        is refused or cancelled while waiting, the error is returned in the
+        shape run() uses - (None, None, None, error) for streaming requests
+        (those with a stream_wrapper), (ProviderResult, error) otherwise.
+        
+        Candidates whose circuit is open are skipped (the last one is always
+        tried so the request fails with its error). A failed candidate hands
+        over to the next one unless it already streamed output or was
+        cancelled; its error events are held back until no fallback is left.
+        
+        Args:
+            run: run(callback) -> tuple ending in the error; reads the
+                candidate from ctx.provider / ctx.model
+            stream_wrapper: Stream callback for streaming requests
+            cancel_token: Stops waiting for a slot
+        """
+        slot = None
+        admission = get_admission_controller(config)
+        if admission is not None:
+            try:
+                slot = admission.acquire(priority_for(ctx), cancel_token)
+                error = None if slot is not None else CANCELLED_ERROR
+            except AdmissionRejected as e:
+                ctx.rejected_status, ctx.retry_after = e.status, e.retry_after
+                error = e.message
+            if error:
+                if stream_wrapper is None:
+                    from .providers.base import ProviderResult
+                    return ProviderResult(success=False, error=error), error
+                if error != CANCELLED_ERROR:
+                    stream_wrapper("error", error)
+                return None, None, None, error
+        try:
+            return RequestPipeline._try_candidates(ctx, config, key_managers, run, stream_wrapper)
+        finally:
+            if slot is not None:
+                slot.release()
+    
+    @staticmethod
+    def _try_candidates(
+        ctx: RequestContext,
+        config: Dict,
+        key_managers: Dict,
+        run: Callable,
+        stream_wrapper: Optional[Callable[[str, Any], None]] = None
+    ):
+        """The fallback loop of _with_fallback, run while holding a slot"""
+        candidates = RequestPipeline.fallback_candidates(ctx, config, key_managers)
+        tracker = get_health_tracker()
+        result = None
+        for index, (provider, model) in enumerate(candidates):
+            last = index == len(candidates) - 1
+            if not last and not tracker.is_available(provider, model):
+                print(f"  [Fallback] {provider}/{model} circuit open, skipping")
+                ctx.fallbacks.append(provider)
+                continue
+            
+            ctx.provider, ctx.model = provider, model
+            held: List[Any] = []
+            callback = stream_wrapper
+            if stream_wrapper and not last:
+                def callback(kind, content, held=held):
+                    if kind == "error":
+                        held.append(content)
+                    else:
+                        stream_wrapper(kind, content)
+            
+            result = run(callback)
+            error = result[-1]
+            streamed = ctx.response_buffer or ctx.reasoning_buffer or ctx.tool_calls
+            if last or not error or error == CANCELLED_ERROR or streamed:
+                for content in held:
+                    stream_wrapper("error", content)
+                return result
+            
+            print(f"  [Fallback] {provider}/{model} failed ({error}), trying next provider")
+            ctx.fallbacks.append(provider)
+        return result
+    
+    @staticmethod
+    def execute_streaming(
+        ctx: RequestContext,
+        session,
+        config: Dict,
+        ai_params: Dict,
+        key_managers: Dict,
+        callbacks: StreamCallback,
+        log_raw: bool = False,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> RequestContext:
+        """
+        Execute streaming API request with logging.
+        
+        Args:
+            ctx: Request context
+            session: Chat session object
+            config: Configuration dictionary
+            ai_params: AI parameters
+            key_managers: Dictionary of key managers
+            callbacks: Streaming callbacks
+            log_raw: Whether to log raw AI output
+            cancel_token: Cancelling it closes the upstream stream
+        
+        Returns:
+            Updated RequestContext with response data
+        """
+        from .api_client import call_api_chat_stream
+        
+        chain = RequestPipeline._begin(ctx, config)
+        start_time = time.time()
+        
+        coalescer = RequestPipeline.create_coalescer(config, callbacks)
+        stream_wrapper = chain.wrap_stream(
+            ctx, RequestPipeline._make_stream_wrapper(ctx, callbacks, coalescer)
+        )
+        
+        hedge_provider = config.get("hedge_provider")
+        deadlines = Deadlines.from_config(config, ctx.origin.value)
+        
+        def launch(callback, cancel_token, is_hedge):
+            provider_override = model_override = None
+            if ctx.fallbacks:
+                # Serving from the fallback chain
+                provider_override, model_override = ctx.provider, ctx.model
+            if is_hedge and hedge_provider:
+                provider_override, model_override = hedge_provider, None
+            return call_api_chat_stream(
+                session, config, ai_params, key_managers, callback,
+                provider_override=provider_override,
+                model_override=model_override,
+                cancel_token=cancel_token,
+                deadlines=deadlines
+            )
+        
+        # Execute the actual API call
+        with RequestPipeline._running(ctx, config, chain):
+            _, answered = chain.before_request(ctx, None, config, ai_params, session=session,
+                                               cancel_token=cancel_token)
+            try:
+                outcome = RequestPipeline._replay(ctx, answered, stream_wrapper) if answered is not None else None
+                if outcome is None:
+                    outcome = RequestPipeline._with_fallback(
+                        ctx, config, key_managers,
+                        lambda callback: RequestPipeline._run_stream(ctx, config, callback, launch, cancel_token),
+                        stream_wrapper, cancel_token
+                    )
+                text, reasoning, usage, error = outcome
+            finally:
+                if coalescer:
+                    coalescer.close()
+        
+            ctx.elapsed_time = time.time() - start_time
+            RequestPipeline._finish_stream(ctx, ai_params, error, cancel_token)
         
         if log_raw:
             RequestPipeline.log_raw_response(ctx, log_full=True)
@@ -274,7 +788,8 @@ class RequestPipeline:
         config: Dict,
         ai_params: Dict,
         key_managers: Dict,
-        log_raw: bool = False
+        log_raw: bool = False,
+        cancel_token: Optional[CancellationToken] = None
     ) -> RequestContext:
         """
         Execute non-streaming API request with logging.
@@ -286,43 +801,153 @@ class RequestPipeline:
             ai_params: AI parameters
             key_managers: Dictionary of key managers
             log_raw: Whether to log raw AI output
+            cancel_token: Stops waiting for an upstream slot or for a
+                singleflight leader (a call that already started runs to
+                completion)
         
         Returns:
             Updated RequestContext with response data
         """
-        from .api_client import call_api_with_retry
-        from .providers.base import estimate_message_tokens, estimate_tokens
+        from .api_client import call_api_result
         
-        RequestPipeline.log_request_start(ctx)
+        chain = RequestPipeline._begin(ctx, config)
         start_time = time.time()
         
-        text, error = call_api_with_retry(
-            provider=ctx.provider,
-            messages=messages,
-            model_override=ctx.model,
-            config=config,
-            ai_params=ai_params,
-            key_managers=key_managers
-        )
+        def run(callback):
+            result = call_api_result(
+                provider=ctx.provider,
+                messages=messages,
+                model_override=ctx.model,
+                config=config,
+                ai_params=ai_params,
+                key_managers=key_managers,
+                thinking_enabled=ctx.thinking_enabled
+            )
+            return result, result.error
         
-        ctx.elapsed_time = time.time() - start_time
+        with RequestPipeline._running(ctx, config, chain):
+            messages, result = chain.before_request(ctx, messages, config, ai_params,
+                                                     cancel_token=cancel_token)
+            if hasattr(result, "stream"):
+                result = result.stream(lambda data_type, content: None)
+                if result is None:
+                    ctx.served_by = None
+            if result is None:
+                result, _ = RequestPipeline._with_fallback(
+                    ctx, config, key_managers, run, cancel_token=cancel_token
+                )
+            error = result.error
+            if error == CANCELLED_ERROR and cancel_token is not None and cancel_token.cancelled:
+                ctx.cancelled = True
         
-        if error:
-            ctx.error = error
+            ctx.elapsed_time = time.time() - start_time
+            RequestPipeline._apply_result(ctx, result, messages, config)
+        
+        if log_raw and not error:
+            RequestPipeline.log_raw_response(ctx, log_full=True)
+        
+        return ctx
+    
+    @staticmethod
+    def _apply_result(ctx: RequestContext, result, messages: List[Dict], config: Dict):
+        """
+        Copy a non-streaming ProviderResult into ctx.
+        
+        Thinking follows thinking_output like the streaming path (filter drops
+        it, raw puts it before the answer). Token counts come from the
+        provider's usage; they are estimated only when it reported none.
+        """
+        from .providers.base import estimate_message_tokens, estimate_tokens
+        
+        ctx.retry_count = result.retry_count
+        if result.timings is not None:
+            ctx.apply_timings(result.timings.to_dict())
+        if result.error:
+            ctx.error = result.error
+            return
+        
+        thinking = result.thinking_content or ""
+        thinking_output = config.get("thinking_output", "reasoning_content")
+        if thinking_output == "raw":
+            ctx.response_text = thinking + (result.content or "")
+        else:
+            ctx.response_text = result.content or ""
+            if thinking_output != "filter":
+                ctx.reasoning_text = thinking
+        ctx.tool_calls = list(result.tool_calls)
+        
+        usage = result.usage
+        if usage is not None and (usage.prompt_tokens or usage.completion_tokens):
+            ctx.input_tokens = usage.prompt_tokens
+            ctx.output_tokens = usage.completion_tokens
+            ctx.total_tokens = usage.total_tokens or usage.prompt_tokens + usage.completion_tokens
+            ctx.estimated = usage.estimated
         else:
-            ctx.response_text = text or ""
-            # Estimate tokens for non-streaming response
             ctx.input_tokens = estimate_message_tokens(messages)
-            ctx.output_tokens = estimate_tokens(text or "")
+            ctx.output_tokens = estimate_tokens(result.content or "") + estimate_tokens(thinking)
             ctx.total_tokens = ctx.input_tokens + ctx.output_tokens
             ctx.estimated = True
+    
+    @staticmethod
+    def execute_batch(
+        ctx: RequestContext,
+        message_lists: List[List[Dict]],
+        config: Dict,
+        ai_params: Dict,
+        key_managers: Dict,
+        max_workers: Optional[int] = None,
+        log_raw: bool = False,
+        on_result: Optional[Callable[[int, RequestContext], None]] = None,
+        cancel_token: Optional[CancellationToken] = None
+    ) -> List[RequestContext]:
+        """
+        Execute one non-streaming request per message list, concurrently.
         
-        RequestPipeline.log_request_complete(ctx)
+        Args:
+            ctx: Template context; each item gets its own RequestContext with
+                the same origin, provider, model, thinking flag, session and
+                cache setting, and ctx.priority (default: batch, see admission.py)
+            message_lists: One message list per request
+            max_workers: Concurrent requests (default: batch_concurrency)
+            on_result: on_result(index, item_ctx), called on the worker
+                thread as each request finishes (in completion order)
+            cancel_token: Once cancelled, items that have not started are
+                skipped and marked cancelled
         
-        if log_raw and not error:
-            RequestPipeline.log_raw_response(ctx, log_full=True)
+        Returns:
+            Contexts in the order of message_lists; failures are recorded in
+            each context's error
+        """
+        contexts = [
+            create_request_context(
+                ctx.origin, ctx.provider, ctx.model, streaming=False,
+                thinking_enabled=ctx.thinking_enabled, session_id=ctx.session_id,
+                cache=ctx.cache
+            )
+            for _ in message_lists
+        ]
+        for item_ctx in contexts:
+            item_ctx.priority = ctx.priority or BATCH
+        workers = min(len(contexts), max(1, int(max_workers or config.get("batch_concurrency") or 4)))
         
-        return ctx
+        def run(item):
+            index, (item_ctx, messages) = item
+            if cancel_token is not None and cancel_token.cancelled:
+                item_ctx.error = CANCELLED_ERROR
+                item_ctx.cancelled = True
+            else:
+                item_ctx = RequestPipeline.execute_simple(
+                    item_ctx, messages, config, ai_params, key_managers, log_raw, cancel_token
+                )
+            if on_result is not None:
+                on_result(index, item_ctx)
+            return item_ctx
+        
+        items = enumerate(zip(contexts, message_lists))
+        if workers <= 1:
+            return [run(item) for item in items]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="PipelineBatch") as pool:
+            return list(pool.map(run, items))
     
     @staticmethod
     def execute_unified_stream(
@@ -332,7 +957,8 @@ class RequestPipeline:
         ai_params: Dict,
         key_managers: Dict,
         callbacks: StreamCallback,
-        log_raw: bool = False
+        log_raw: bool = False,
+        cancel_token: Optional[CancellationToken] = None
     ) -> RequestContext:
         """
         Execute streaming API request using the unified streaming API.
@@ -348,69 +974,61 @@ class RequestPipeline:
             key_managers: Dictionary of key managers
             callbacks: Streaming callbacks
             log_raw: Whether to log raw AI output
+            cancel_token: Cancelling it closes the upstream stream
         
         Returns:
             Updated RequestContext with response data
         """
         from .api_client import call_api_stream_unified
         
-        RequestPipeline.log_request_start(ctx)
+        chain = RequestPipeline._begin(ctx, config)
         start_time = time.time()
         
-        # Wrap callbacks
-        def stream_wrapper(data_type, content):
-            if data_type == "text":
-                ctx.response_text += content
-                if callbacks.on_text:
-                    callbacks.on_text(content)
-            
-            elif data_type == "thinking":
-                ctx.reasoning_text += content
-                if callbacks.on_thinking:
-                    callbacks.on_thinking(content)
-            
-            elif data_type == "tool_calls":
-                if isinstance(content, list):
-                    ctx.tool_calls.extend(content)
-                if callbacks.on_tool_calls:
-                    callbacks.on_tool_calls(content)
-            
-            elif data_type == "usage":
-                ctx.input_tokens = content.get("prompt_tokens", 0)
-                ctx.output_tokens = content.get("completion_tokens", 0)
-                ctx.total_tokens = content.get("total_tokens", 0)
-                ctx.estimated = content.get("estimated", False)
-                if callbacks.on_usage:
-                    callbacks.on_usage(content)
-            
-            elif data_type == "done":
-                if callbacks.on_done:
-                    callbacks.on_done()
-            
-            elif data_type == "error":
-                ctx.error = content
-                if callbacks.on_error:
-                    callbacks.on_error(content)
+        coalescer = RequestPipeline.create_coalescer(config, callbacks)
+        stream_wrapper = chain.wrap_stream(
+            ctx, RequestPipeline._make_stream_wrapper(ctx, callbacks, coalescer)
+        )
         
         thinking_output = config.get("thinking_output", "reasoning_content")
         
-        text, reasoning, usage, error = call_api_stream_unified(
-            provider_type=ctx.provider,
-            messages=messages,
-            model=ctx.model,
-            config=config,
-            ai_params=ai_params,
-            key_managers=key_managers,
-            callback=stream_wrapper,
-            thinking_enabled=ctx.thinking_enabled,
-            thinking_output=thinking_output
-        )
+        hedge_provider = config.get("hedge_provider")
+        deadlines = Deadlines.from_config(config, ctx.origin.value)
         
-        ctx.elapsed_time = time.time() - start_time
-        if error:
-            ctx.error = error
+        def launch(callback, cancel_token, is_hedge):
+            provider, model = ctx.provider, ctx.model
+            if is_hedge and hedge_provider and hedge_provider != ctx.provider:
+                provider, model = hedge_provider, config.get(f"{hedge_provider}_model")
+            return call_api_stream_unified(
+                provider_type=provider,
+                messages=messages,
+                model=model,
+                config=config,
+                ai_params=ai_params,
+                key_managers=key_managers,
+                callback=callback,
+                thinking_enabled=ctx.thinking_enabled,
+                thinking_output=thinking_output,
+                cancel_token=cancel_token,
+                deadlines=deadlines
+            )
         
-        RequestPipeline.log_request_complete(ctx)
+        with RequestPipeline._running(ctx, config, chain):
+            messages, answered = chain.before_request(ctx, messages, config, ai_params, cancel_token=cancel_token)
+            try:
+                outcome = RequestPipeline._replay(ctx, answered, stream_wrapper) if answered is not None else None
+                if outcome is None:
+                    outcome = RequestPipeline._with_fallback(
+                        ctx, config, key_managers,
+                        lambda callback: RequestPipeline._run_stream(ctx, config, callback, launch, cancel_token),
+                        stream_wrapper, cancel_token
+                    )
+                text, reasoning, usage, error = outcome
+            finally:
+                if coalescer:
+                    coalescer.close()
+        
+            ctx.elapsed_time = time.time() - start_time
+            RequestPipeline._finish_stream(ctx, ai_params, error, cancel_token)
         
         if log_raw and not error:
             RequestPipeline.log_raw_response(ctx, log_full=True)
@@ -425,7 +1043,8 @@ def create_request_context(
     model: str,
     streaming: bool = True,
     thinking_enabled: bool = False,
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    cache: Optional[bool] = None
 ) -> RequestContext:
     """Create a new request context"""
     return RequestContext(
@@ -434,5 +1053,6 @@ def create_request_context(
         model=model,
         streaming=streaming,
         thinking_enabled=thinking_enabled,
-        session_id=session_id
+        session_id=session_id,
+        cache=cache
     )
\ No newline at end of file
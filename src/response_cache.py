@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Exact-match Response Cache
+
+Re-running the same TextEditTool action on the same text, or ShareX posting
+the same screenshot to /ocr again, would otherwise pay a full upstream round
+trip for an answer we already have. The "cache" pipeline middleware stage
+answers such repeats from a local cache.
+
+The key is a SHA-256 over a canonical JSON form of everything that shapes
+the answer: provider, model, ai_params, thinking settings and the messages
+(system instruction included). Media parts - data URLs or MediaPart items -
+enter the key as the digest of their decoded bytes, so a multi-megabyte
+screenshot is hashed once instead of being serialized into the key.
+
+Tiers:
+    memory  LRU of response_cache_size entries
+    disk    optional, one JSON file per entry in response_cache_dir, least
+            recently used entries removed beyond response_cache_disk_mb
+Entries older than response_cache_ttl seconds are dropped from both.
+
+Only requests that opt in are cached: RequestContext.cache (set from the
+per-action "cache" option in prompts.json, or endpoints' cached_endpoints),
+falling back to response_cache_default. Failed, cancelled and empty
+responses are never stored.
+
+Config:
+    pipeline_middleware = cache
+    response_cache_size = 256         # memory entries, 0 = no memory tier
+    response_cache_ttl = 86400        # seconds, 0 = no expiry
+    response_cache_dir =              # empty = no disk tier
+    response_cache_disk_mb = 100
+    response_cache_default = 0        # cache requests without a per-action setting
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .middleware import Middleware
+from .providers.base import ProviderResult, UsageData
+from .providers.media import DATA_URL_PREFIX, MediaPart
+
+DEFAULT_SIZE = 256
+DEFAULT_TTL = 86400
+DEFAULT_DISK_MB = 100
+
+# RequestContext.middleware_data key holding the request's cache key
+_KEY = "response_cache_key"
+
+
+# ------------------------------------------------------------------
+# Keys
+# ------------------------------------------------------------------
+
+def _part_media(part: Dict) -> Optional[MediaPart]:
+    """The media of a content part in any of the message formats, or None"""
+    kind = part.get("type")
+    if kind == "media":
+        return part.get("media")
+    if kind == "image_url":
+        url = part.get("image_url")
+        return MediaPart.from_data_url(url.get("url") if isinstance(url, dict) else url)
+    if kind == "file":
+        return MediaPart.from_data_url((part.get("file") or {}).get("file_data"))
+    if kind == "input_audio":
+        audio = part.get("input_audio") or {}
+        return MediaPart.from_base64(f"audio/{audio.get('format', 'wav')}", audio.get("data", ""))
+    return None
+
+
+def _canonical(value: Any) -> Any:
+    """
+    value with every media payload replaced by the digest of its bytes, so
+    the same image keys the same whether it is a data URL or a MediaPart.
+    """
+    if isinstance(value, MediaPart):
+        return {"media": value.mime_type, "sha256": value.digest()}
+    if isinstance(value, dict):
+        media = _part_media(value)
+        if isinstance(media, MediaPart):
+            return {"media": media.mime_type, "sha256": media.digest()}
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, str) and value.startswith(DATA_URL_PREFIX):
+        media = MediaPart.from_data_url(value)
+        if media is not None:
+            return {"media": media.mime_type, "sha256": media.digest()}
+    return value
+
+
+def cache_key(
+    provider: str,
+    model: str,
+    messages: List[Dict],
+    ai_params: Dict,
+    config: Dict,
+    thinking_enabled: bool = False
+) -> str:
+    """Hex SHA-256 identifying a request by everything that shapes its answer"""
+    payload = {
+        "provider": provider,
+        "model": model,
+        "params": ai_params,
+        "thinking": thinking_enabled,
+        "thinking_config": {k: v for k, v in config.items() if k.startswith("thinking")},
+        "messages": _canonical(messages),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# ------------------------------------------------------------------
+# Stage
+# ------------------------------------------------------------------
+
+class ResponseCache(Middleware):
+    """Memory LRU plus optional disk tier, used as the "cache" middleware stage"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._disk_index: "Optional[OrderedDict[str, int]]" = None  # key -> file size, LRU order
+        self._disk_bytes = 0
+        self._settings = None
+        self.size = DEFAULT_SIZE
+        self.ttl = DEFAULT_TTL
+        self.directory: Optional[str] = None
+        self.disk_limit = DEFAULT_DISK_MB * 1024 * 1024
+
+        # Stats
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expired = 0
+
+        self.configure(config or {})
+
+    def configure(self, config: Dict):
+        """Apply response_cache_* settings (cheap when unchanged)"""
+        settings = tuple(config.get(key) for key in (
+            "response_cache_size", "response_cache_ttl", "response_cache_dir", "response_cache_disk_mb"
+        ))
+        if settings == self._settings:
+            return
+        size, ttl, directory, disk_mb = settings
+        with self._lock:
+            self.size = DEFAULT_SIZE if size is None else max(0, int(size))
+            self.ttl = DEFAULT_TTL if ttl is None else max(0.0, float(ttl))
+            directory = directory if isinstance(directory, str) and directory else None
+            if directory != self.directory:
+                self._disk_index, self._disk_bytes = None, 0
+            self.directory = directory
+            self.disk_limit = int(float(DEFAULT_DISK_MB if disk_mb is None else disk_mb) * 1024 * 1024)
+            self._settings = settings
+            self._trim_memory()
+        if self.directory:
+            with self._lock:
+                self._trim_disk()
+
+    # -- Middleware hooks ------------------------------------------------
+
+    def before_request(self, ctx, request):
+        config = request.config
+        self.configure(config)
+        enabled = ctx.cache if ctx.cache is not None else config.get("response_cache_default", False)
+        if not enabled:
+            return None
+        key = cache_key(ctx.provider, ctx.model, request.get_messages(), request.ai_params,
+                        config, ctx.thinking_enabled)
+        entry = self.get(key)
+        if entry is None:
+            ctx.middleware_data[_KEY] = key
+            return None
+        usage = entry.get("usage")
+        return ProviderResult(
+            success=True,
+            content=entry.get("content", ""),
+            thinking_content=entry.get("thinking", ""),
+            tool_calls=list(entry.get("tool_calls") or []),
+            usage=UsageData(**usage) if usage else None
+        )
+
+    def after_response(self, ctx):
+        key = ctx.middleware_data.get(_KEY)
+        if key is None or ctx.cancelled or not (ctx.response_text or ctx.tool_calls):
+            return
+        self.put(key, {
+            "content": ctx.response_text,
+            "thinking": ctx.reasoning_text,
+            "tool_calls": list(ctx.tool_calls),
+            "usage": {
+                "prompt_tokens": ctx.input_tokens,
+                "completion_tokens": ctx.output_tokens,
+                "total_tokens": ctx.total_tokens,
+                "estimated": ctx.estimated,
+            },
+        })
+
+    # -- Tiers -----------------------------------------------------------
+
+    def _fresh(self, created: float) -> bool:
+        return not self.ttl or time.time() - created < self.ttl
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached entry for key, or None (counted as a miss)"""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if self._fresh(item[0]):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return item[1]
+                del self._memory[key]
+                self.expired += 1
+            item = self._disk_get(key) if self.directory else None
+            if item is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, item)
+            return item[1]
+
+    def put(self, key: str, entry: Dict):
+        """Store entry under key in every enabled tier"""
+        item = (time.time(), entry)
+        with self._lock:
+            self.stores += 1
+            self._memory_put(key, item)
+            if self.directory:
+                self._disk_put(key, item)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self.directory:
+                for key in list(self._load_disk_index()):
+                    self._disk_remove(key)
+
+    def _memory_put(self, key: str, item: Tuple[float, Dict]):
+        if not self.size:
+            return
+        self._memory[key] = item
+        self._memory.move_to_end(key)
+        self._trim_memory()
+
+    def _trim_memory(self):
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_disk_index(self) -> "OrderedDict[str, int]":
+        """Scan response_cache_dir once, oldest files first"""
+        if self._disk_index is None:
+            files = []
+            os.makedirs(self.directory, exist_ok=True)
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+            files.sort()
+            self._disk_index = OrderedDict((key, size) for _, key, size in files)
+            self._disk_bytes = sum(self._disk_index.values())
+        return self._disk_index
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Dict]]:
+        index = self._load_disk_index()
+        if key not in index:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                data = json.load(f)
+            item = (float(data["created"]), data["entry"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self._disk_remove(key)
+            return None
+        if not self._fresh(item[0]):
+            self._disk_remove(key)
+            self.expired += 1
+            return None
+        index.move_to_end(key)
+        try:
+            os.utime(self._path(key))  # Keeps LRU order across restarts
+        except OSError:
+            pass
+        return item
+
+    def _disk_put(self, key: str, item: Tuple[float, Dict]):
+        index = self._load_disk_index()
+        data = json.dumps({"created": item[0], "entry": item[1]}, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f"  [ResponseCache] Disk write failed: {e}")
+            return
+        self._disk_bytes += len(data) - index.pop(key, 0)
+        index[key] = len(data)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        index = self._load_disk_index()
+        while index and self._disk_bytes > self.disk_limit:
+            self._disk_remove(next(iter(index)))
+            self.evictions += 1
+
+    def _disk_remove(self, key: str):
+        self._disk_bytes -= self._disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "entries": len(self._memory),
+            "disk_entries": len(self._disk_index) if self._disk_index is not None else None,
+            "disk_bytes": self._disk_bytes if self._disk_index is not None else None,
+        }
+
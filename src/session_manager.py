@@ -10,6 +10,7 @@ from datetime import datetime
 from pathlib import Path
 
 from .config import SESSIONS_FILE
+from .providers.media import MediaPart, media_item
 
 # Global session storage
 CHAT_SESSIONS = OrderedDict()
@@ -79,6 +80,10 @@ class ChatSession:
         """
         Convert session messages to API format.
         
+        Images are included as internal media items ({"type": "media"}) that
+        reference the base64 data; providers turn them into their wire format
+        without building data URL strings.
+        
         Args:
             include_image: Whether to include image data in the first user message
             include_system_instruction: Whether to prepend system instruction if available
@@ -107,8 +112,7 @@ class ChatSession:
                     
                     # Add session-level image first (legacy backward compat)
                     if needs_session_image:
-                        data_url = f"data:{self.mime_type};base64,{self.image_base64}"
-                        content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+                        content_parts.append(media_item(MediaPart.from_base64(self.mime_type, self.image_base64)))
                     
                     # Add per-message attachments
                     if has_attachments:
@@ -118,8 +122,7 @@ class ChatSession:
                             if attach_path:
                                 b64, mime = AttachmentManager.load_image(attach_path)
                                 if b64:
-                                    data_url = f"data:{mime};base64,{b64}"
-                                    content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
+                                    content_parts.append(media_item(MediaPart.from_base64(mime, b64)))
                     
                     # Add text content last (context -> question ordering)
                     content_parts.append({"type": "text", "text": content})
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+In-flight Request Coalescing (singleflight)
+
+A ShareX hotkey that fires twice, or two windows regenerating the same
+conversation, send identical requests at the same moment; each used to make
+its own upstream call. The "singleflight" pipeline middleware stage lets the
+first of them (the leader) call the provider while identical requests that
+arrive before it finishes (followers) attach to that call:
+
+- the leader's text / thinking deltas are recorded and fanned out to every
+  follower as they arrive; a follower that joins mid-stream first gets a
+  replay of everything it missed
+- when the leader finishes, followers receive its tool calls, usage and
+  done (or its error) and return the same result
+- a follower whose own cancel token fires stops following; the leader's
+  call is not affected
+- if the leader is cancelled, followers that have not received anything yet
+  make their own upstream call; the others fail
+
+Requests are identical when their response_cache.cache_key matches
+(provider, model, parameters, thinking settings, messages, media bytes).
+Followers' deltas pass through the on_delta hooks of their own chain, so
+list the stage before stages that rewrite deltas - the leader then shares
+the provider's deltas and each request rewrites them once. Followers are
+logged with served_by "singleflight" and record no tokens in the usage
+ledger. /health reports leaders, followers, upstream_calls_saved and
+takeovers under middleware.singleflight.
+
+Config:
+    pipeline_middleware = singleflight
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CANCELLED_ERROR, CancellationToken
+from .middleware import Middleware
+from .providers.base import ProviderResult, UsageData
+from .response_cache import cache_key
+
+# Follower gives up when the leader produces nothing for this long (seconds)
+FOLLOW_IDLE_TIMEOUT = 300.0
+
+LEADER_CANCELLED_ERROR = "Shared request was cancelled by the request it was attached to"
+
+# RequestContext.middleware_data key of a leader's Flight
+_FLIGHT = "singleflight"
+
+
+class Flight:
+    """One upstream call and the stream events it produced so far"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Tuple[str, Any]] = []
+        self.result: Optional[ProviderResult] = None
+        self.followers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def publish(self, kind: str, content: Any):
+        with self._cond:
+            self.events.append((kind, content))
+            self._cond.notify_all()
+
+    def finish(self, events: List[Tuple[str, Any]], result: ProviderResult):
+        """Append the closing events and wake every follower"""
+        with self._cond:
+            self.events.extend(events)
+            self.result = result
+            self._cond.notify_all()
+
+    def wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def next_events(self, index: int, cancel_token: Optional[CancellationToken]):
+        """
+        Block until there are events after index, the flight is done, the
+        token is cancelled or FOLLOW_IDLE_TIMEOUT passes.
+
+        Returns:
+            (new events, done)
+        """
+        with self._cond:
+            if index >= len(self.events) and not self.done:
+                if not (cancel_token is not None and cancel_token.cancelled):
+                    self._cond.wait(FOLLOW_IDLE_TIMEOUT)
+            return self.events[index:], self.done
+
+
+class Follower:
+    """
+    Live answer for an attached request: stream() delivers the leader's
+    events to the follower's callback and returns the shared result.
+    """
+
+    def __init__(self, group: "SingleFlight", flight: Flight, cancel_token: Optional[CancellationToken]):
+        self.group = group
+        self.flight = flight
+        self.cancel_token = cancel_token
+
+    def stream(self, callback: Callable[[str, Any], None]) -> Optional[ProviderResult]:
+        """
+        Returns:
+            The leader's result, a cancelled result, or None when the caller
+            should make its own upstream call (nothing was delivered yet)
+        """
+        flight = self.flight
+        token = self.cancel_token
+        unregister = token.on_cancel(flight.wake) if token is not None else None
+        index = 0
+        try:
+            while True:
+                events, done = flight.next_events(index, token)
+                index += len(events)
+                for kind, content in events:
+                    callback(kind, content)
+                if token is not None and token.cancelled:
+                    return ProviderResult(success=False, error=CANCELLED_ERROR)
+                if done and index >= len(flight.events):
+                    result = flight.result
+                    if result.error != CANCELLED_ERROR:
+                        return result
+                    break
+                if not events and not done:
+                    print(f"  [SingleFlight] Leader idle for {FOLLOW_IDLE_TIMEOUT:.0f}s, detaching")
+                    break
+        finally:
+            if unregister:
+                unregister()
+        if index:
+            callback("error", LEADER_CANCELLED_ERROR)
+            return ProviderResult(success=False, error=LEADER_CANCELLED_ERROR)
+        self.group.count("takeovers")
+        return None
+
+
+class SingleFlight(Middleware):
+    """Coalesces identical in-flight requests onto one upstream call"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.takeovers = 0
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def before_request(self, ctx, request):
+        key = cache_key(ctx.provider, ctx.model, request.get_messages(), request.ai_params,
+                        request.config, ctx.thinking_enabled)
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(key)
+                self.leaders += 1
+                ctx.middleware_data[_FLIGHT] = flight
+                return None
+            flight.followers += 1
+            self.followers += 1
+        return Follower(self, flight, request.cancel_token)
+
+    def on_delta(self, ctx, kind, content):
+        flight = ctx.middleware_data.get(_FLIGHT)
+        if flight is not None:
+            flight.publish(kind, content)
+        return content
+
+    def after_response(self, ctx):
+        flight = self._land(ctx)
+        if flight is None:
+            return
+        usage = UsageData(ctx.input_tokens, ctx.output_tokens, ctx.total_tokens, ctx.estimated)
+        events = []
+        if not ctx.streaming:
+            # No deltas were published for a non-streaming leader
+            if ctx.reasoning_text:
+                events.append(("thinking", ctx.reasoning_text))
+            if ctx.response_text:
+                events.append(("text", ctx.response_text))
+        if ctx.tool_calls:
+            events.append(("tool_calls", list(ctx.tool_calls)))
+        if ctx.total_tokens:
+            events.append(("usage", usage.to_dict()))
+        events.append(("done", None))
+        flight.finish(events, ProviderResult(
+            success=True,
+            content=ctx.response_text,
+            thinking_content=ctx.reasoning_text,
+            tool_calls=list(ctx.tool_calls),
+            usage=usage
+        ))
+
+    def on_error(self, ctx, error):
+        flight = self._land(ctx)
+        if flight is None:
+            return
+        events = [] if error == CANCELLED_ERROR else [("error", error)]
+        flight.finish(events, ProviderResult(success=False, error=error))
+
+    def _land(self, ctx) -> Optional[Flight]:
+        """Detach a leader's flight so new requests start a fresh call"""
+        flight = ctx.middleware_data.pop(_FLIGHT, None)
+        if flight is not None:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+        return flight
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "upstream_calls_saved": self.followers - self.takeovers,
+                "takeovers": self.takeovers,
+                "in_flight": len(self._flights),
+            }
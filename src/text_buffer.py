@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Append-only text buffer for streamed responses.
+
+Repeated `text += delta` on a string held in an attribute copies the whole
+string on every delta, so accumulating a response is quadratic in its
+length. TextBuffer keeps the deltas in a list and joins them lazily, only
+when the full text is read. Providers, the request pipeline and the chat
+windows all accumulate streamed text through it.
+"""
+
+from typing import List, Optional
+
+
+class TextBuffer:
+    """
+    Append-only text accumulator with O(1) appends and a lazily joined value.
+
+    Reading the value joins the pending chunks once and caches the result,
+    so repeated reads without new appends are free.
+    """
+
+    __slots__ = ("_chunks", "_length", "_value")
+
+    def __init__(self, initial: str = ""):
+        self._chunks: List[str] = [initial] if initial else []
+        self._length = len(initial)
+        self._value: Optional[str] = initial
+
+    def append(self, text: str):
+        """Append a chunk of text"""
+        if text:
+            self._chunks.append(text)
+            self._length += len(text)
+            self._value = None
+
+    def getvalue(self) -> str:
+        """Get the accumulated text"""
+        if self._value is None:
+            self._value = "".join(self._chunks)
+            # Collapse so the next join starts from one chunk
+            self._chunks = [self._value]
+        return self._value
+
+    def clear(self):
+        """Discard all accumulated text"""
+        self._chunks = []
+        self._length = 0
+        self._value = ""
+
+    def __iadd__(self, text: str) -> "TextBuffer":
+        self.append(text)
+        return self
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TextBuffer):
+            other = other.getvalue()
+        if isinstance(other, str):
+            return self.getvalue() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"TextBuffer({self._length} chars, {len(self._chunks)} chunks)"
@@ -24,7 +24,7 @@ def main():
     
     # Initialize key managers
     for provider in ["custom", "openrouter", "google"]:
-        web_server.KEY_MANAGERS[provider] = KeyManager(keys[provider], provider)
+        web_server.KEY_MANAGERS[provider] = KeyManager.from_config(keys[provider], provider, config)
     
     # Run the menu
     show_tools_menu(endpoints=web_server.ENDPOINTS)
@@ -2531,9 +2531,8 @@ class FileProcessor(BaseTool):
         Returns:
             Response text or None on failure
         """
-        from src.api_client import call_api_with_retry
+        from src.api_client import call_api_with_retry, get_provider_for_type
         from src import web_server
-        from src.providers.gemini_native import GeminiNativeProvider
         
         # Get the provider
         provider_name = checkpoint.provider.lower()
@@ -2544,8 +2543,8 @@ class FileProcessor(BaseTool):
         if not key_manager:
             raise Exception("Google key manager not found")
         
-        # Create provider instance for upload
-        provider = GeminiNativeProvider(key_manager=key_manager, config=web_server.CONFIG)
+        # Shared provider instance for upload (keeps upload cache and connections)
+        provider = get_provider_for_type(provider_name, key_manager, web_server.CONFIG)
         
         # Upload file
         if interactive:
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Persistent Usage Ledger
+
+Every request that finishes in RequestPipeline is appended to a local SQLite
+database: origin, provider, model, key number, real or estimated tokens,
+latency, time to first token, success and (when usage_prices covers the
+model) cost. The hot path only enqueues a row; a background writer inserts
+rows in batches of up to BATCH_SIZE, one transaction per batch, at most
+FLUSH_INTERVAL seconds after they were queued.
+
+Query helpers aggregate by day, model, key, origin or provider; /usage in
+web_server.py serves them.
+
+Config:
+    usage_ledger_file = usage_ledger.db     # empty = ledger off
+    usage_prices = gemini-2.5-flash: 0.30/2.50; gpt-5*: 1.25/10
+        # USD per million input/output tokens, model name glob patterns
+"""
+
+import atexit
+import fnmatch
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+BATCH_SIZE = 100
+FLUSH_INTERVAL = 1.0  # seconds
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    day TEXT NOT NULL,
+    request_id TEXT,
+    origin TEXT,
+    provider TEXT,
+    model TEXT,
+    key_num INTEGER,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated INTEGER NOT NULL DEFAULT 0,
+    latency REAL,
+    ttft REAL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS usage_day ON usage (day);
+CREATE INDEX IF NOT EXISTS usage_model ON usage (provider, model);
+"""
+
+_COLUMNS = ("ts", "day", "request_id", "origin", "provider", "model", "key_num",
+            "input_tokens", "output_tokens", "total_tokens", "estimated",
+            "latency", "ttft", "success", "error", "cost")
+
+# group name -> columns it aggregates by
+GROUPS = {
+    "day": ("day",),
+    "model": ("provider", "model"),
+    "key": ("provider", "key_num"),
+    "origin": ("origin",),
+    "provider": ("provider",),
+}
+
+_STOP = object()
+
+
+def parse_prices(value: Any) -> List[Tuple[str, float, float]]:
+    """
+    Parse usage_prices ("gemini-2.5-flash: 0.30/2.50; gpt-5*: 1.25/10") into
+    (pattern, input_per_mtok, output_per_mtok). Malformed entries are skipped.
+    """
+    if not value or value is True:
+        return []
+    prices = []
+    for entry in str(value).split(";"):
+        pattern, _, rates = entry.partition(":")
+        input_rate, _, output_rate = rates.partition("/")
+        try:
+            prices.append((pattern.strip(), float(input_rate), float(output_rate or input_rate)))
+        except ValueError:
+            continue
+    return [price for price in prices if price[0]]
+
+
+class UsageLedger:
+    """SQLite usage table with a batched background writer"""
+
+    def __init__(self, path: str, prices: Any = None):
+        self.path = path
+        self.prices_value = prices
+        self.prices = parse_prices(prices)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def cost_of(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        """USD cost from usage_prices, or None when no pattern matches the model"""
+        for pattern, input_rate, output_rate in self.prices:
+            if fnmatch.fnmatchcase(model or "", pattern):
+                return (input_tokens * input_rate + output_tokens * output_rate) / 1_000_000
+        return None
+
+    def record(self, entry: Dict[str, Any]):
+        """
+        Queue one request for the ledger; never blocks on the database.
+
+        entry keys: origin, provider, model, key_num, input_tokens,
+        output_tokens, total_tokens, estimated, latency, ttft, success,
+        error, request_id (missing keys are stored as NULL / 0).
+        """
+        ts = entry.get("ts") or time.time()
+        row = dict(entry, ts=ts, day=time.strftime("%Y-%m-%d", time.localtime(ts)))
+        if row.get("cost") is None:
+            row["cost"] = self.cost_of(row.get("model"), row.get("input_tokens") or 0,
+                                       row.get("output_tokens") or 0)
+        self._queue.put(tuple(_value(row, column) for column in _COLUMNS))
+        if self._thread is None:
+            self._start()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued row is committed"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """Write what is queued and stop the writer"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(5)
+            self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="UsageLedger", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                rows, waiters, stop = self._next_batch()
+                if rows:
+                    try:
+                        with conn:
+                            conn.executemany(
+                                f"INSERT INTO usage ({', '.join(_COLUMNS)}) "
+                                f"VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                                rows
+                            )
+                        self.written += len(rows)
+                    except sqlite3.Error as e:
+                        self.errors += 1
+                        print(f"  [UsageLedger] Write failed ({len(rows)} rows): {e}")
+                for waiter in waiters:
+                    waiter.set()
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        """Block for one item, then gather more for up to FLUSH_INTERVAL"""
+        rows, waiters = [], []
+        item = self._queue.get()
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            if item is _STOP:
+                return rows, waiters, True
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                return rows, waiters, False  # Flush requested: write now
+            rows.append(item)
+            remaining = deadline - time.monotonic()
+            if len(rows) >= BATCH_SIZE or remaining <= 0:
+                return rows, waiters, False
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return rows, waiters, False
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def aggregate(self, group: str, since: Optional[float] = None,
+                  until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Totals per group ("day", "model", "key", "origin", "provider") for
+        requests with since <= ts < until (epoch seconds, None = open).
+        """
+        columns = GROUPS.get(group)
+        if columns is None:
+            raise ValueError(f"Unknown usage group: {group}")
+        where, args = [], []
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            args.append(until)
+        keys = ", ".join(columns)
+        sql = (
+            f"SELECT {keys}, COUNT(*), SUM(success), SUM(input_tokens), SUM(output_tokens), "
+            f"SUM(total_tokens), SUM(estimated), AVG(latency), MAX(latency), AVG(ttft), SUM(cost) "
+            f"FROM usage {'WHERE ' + ' AND '.join(where) if where else ''} "
+            f"GROUP BY {keys} ORDER BY {keys}"
+        )
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, args).fetchall()
+        finally:
+            conn.close()
+        results = []
+        for row in rows:
+            (requests, successes, input_tokens, output_tokens, total_tokens,
+             estimated, avg_latency, max_latency, avg_ttft, cost) = row[len(columns):]
+            result = dict(zip(columns, row[:len(columns)]))
+            result.update({
+                "requests": requests,
+                "successes": successes,
+                "success_rate": round(successes / requests, 3) if requests else None,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": total_tokens,
+                "estimated_requests": estimated,
+                "avg_latency": _round(avg_latency),
+                "max_latency": _round(max_latency),
+                "avg_ttft": _round(avg_ttft),
+                "cost": round(cost, 6) if cost is not None else None,
+            })
+            results.append(result)
+        return results
+
+    def per_day(self, days: int = 30) -> List[Dict[str, Any]]:
+        return self.aggregate("day", since=days_ago(days))
+
+    def per_model(self, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.aggregate("model", since=days_ago(days))
+
+    def per_key(self, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.aggregate("key", since=days_ago(days))
+
+
+def _value(row: Dict[str, Any], column: str) -> Any:
+    value = row.get(column)
+    if column in ("estimated", "success"):
+        return int(bool(value))
+    if column.endswith("_tokens"):
+        return int(value or 0)
+    if column == "error" and value:
+        return str(value)[:500]
+    return value
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def days_ago(days: Optional[int]) -> Optional[float]:
+    """Epoch seconds of local midnight days-1 days ago (days=1: today)"""
+    if not days:
+        return None
+    midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+    return midnight - (days - 1) * 86400
+
+
+_LEDGER: Optional[UsageLedger] = None
+_LEDGER_LOCK = threading.Lock()
+
+
+def get_usage_ledger(config: Dict) -> Optional[UsageLedger]:
+    """
+    The process-wide ledger for usage_ledger_file (None when unset).
+
+    Changing the file switches to a new ledger; the old one is flushed and
+    closed.
+    """
+    global _LEDGER
+    path = config.get("usage_ledger_file")
+    if not isinstance(path, str) or not path:
+        path = None  # Empty, or "off" parsed to False
+    prices = config.get("usage_prices")
+    ledger = _LEDGER
+    if ledger is not None and ledger.path == path:
+        if ledger.prices_value != prices:
+            ledger.prices_value, ledger.prices = prices, parse_prices(prices)
+        return ledger
+    with _LEDGER_LOCK:
+        if _LEDGER is not None and _LEDGER.path != path:
+            _LEDGER.close()
+            _LEDGER = None
+        if path and _LEDGER is None:
+            _LEDGER = UsageLedger(path, prices)
+        return _LEDGER
+
+
+@atexit.register
+def _close_ledger():
+    if _LEDGER is not None:
+        _LEDGER.close()
@@ -4,14 +4,26 @@ Flask web server with API endpoints
 """
 
 import base64
-import time
 
 from flask import Flask, request, abort, jsonify
 
 from .config import CONFIG_FILE
 from .api_client import call_api_simple, call_api_chat, fetch_models
+from .event_stream import EventStream, result_event, wants_stream
+from .gateway import error_response as gateway_error, gateway, init_gateway
+from .request_pipeline import RequestPipeline, RequestContext, RequestOrigin
+from .admission import BATCH, HTTP, get_admission_controller, get_admission_stats
+from .hedging import get_hedge_stats
+from .image_batch import DEFAULT_MAX_IMAGES, read_images, run_batch
+from .jobs import DEFAULT_MAX_WAIT, QueueFull, get_job_runner
+from .providers.connection_pool import get_connection_pool
+from .providers.health import get_health_tracker
+from .middleware import get_middleware_stats
+from .request_log import get_request_log
+from .usage_ledger import GROUPS as USAGE_GROUPS, days_ago, get_usage_ledger
 from .session_manager import ChatSession, add_session, get_session, list_sessions
 from .gui.core import show_chat_gui, show_session_browser, get_gui_status, HAVE_GUI
+from .gui.prompts import get_prompts_config
 
 # Global state - will be initialized by main.py
 CONFIG = {}
@@ -25,104 +37,151 @@ CACHED_MODELS = None
 app = Flask(__name__)
 
 
+def prepare_endpoint_request(endpoint_name, prompt_template, streaming, image=None):
+    """
+    Build the RequestContext and messages for an endpoint request from the
+    current Flask request (image, provider / prompt / lang / model overrides).
+    
+    Args:
+        streaming: Whether the request will be streamed (thinking is only
+            requested for streamed answers)
+        image: (image_bytes, mime_type) to use instead of the request's
+            image (batch requests)
+    
+    Returns:
+        (ctx, messages, show_result) - show_result(text) opens the chat
+        window when ?show= asks for it
+    """
+    image_bytes = None
+    mime_type = 'image/png'
+    
+    if image is not None:
+        image_bytes, mime_type = image
+    elif 'image' in request.files:
+        image_file = request.files['image']
+        image_bytes = image_file.read()
+        mime_type = image_file.mimetype or 'image/png'
+    elif request.content_type and 'image' in request.content_type:
+        image_bytes = request.get_data()
+        mime_type = request.content_type.split(';')[0]
+    elif request.data:
+        image_bytes = request.data
+    
+    if not image_bytes:
+        abort(400, description='No image found in request.')
+    
+    base64_image = base64.b64encode(image_bytes).decode('utf-8')
+    
+    # Parse provider override
+    provider = CONFIG.get("default_provider", "google")
+    if request.args.get('provider'):
+        provider = request.args.get('provider').lower()
+    elif request.headers.get('X-API-Provider'):
+        provider = request.headers.get('X-API-Provider').lower()
+    
+    # Parse prompt override
+    prompt = prompt_template
+    if request.args.get('prompt'):
+        prompt = request.args.get('prompt')
+    elif request.headers.get('X-Custom-Prompt'):
+        prompt = request.headers.get('X-Custom-Prompt')
+    
+    # Parse lang parameter and substitute {lang} placeholder
+    lang = request.args.get('lang', 'English')
+    if request.headers.get('X-Target-Language'):
+        lang = request.headers.get('X-Target-Language')
+    prompt = prompt.replace('{lang}', lang)
+    
+    # Parse model override
+    model_override = None
+    if request.args.get('model'):
+        model_override = request.args.get('model')
+    elif request.headers.get('X-API-Model'):
+        model_override = request.headers.get('X-API-Model')
+    
+    # Determine the effective model for logging
+    if model_override:
+        effective_model = model_override
+    elif provider == "openrouter":
+        effective_model = CONFIG.get("openrouter_model", "openai/gpt-oss-120b:free")
+    elif provider == "google":
+        effective_model = CONFIG.get("google_model", "gemini-2.5-flash")
+    elif provider == "custom":
+        effective_model = CONFIG.get("custom_model", "not configured")
+    else:
+        effective_model = "unknown"
+    
+    # Show parameter: yes/true/1 = show chat window, anything else = no
+    # Uses show_ai_response_in_chat_window
+    default_show = CONFIG.get('show_ai_response_in_chat_window', 'no')
+    show_param = request.args.get('show', default_show)
+    if isinstance(show_param, bool):
+        show_gui = show_param
+    else:
+        show_gui = str(show_param).lower() in ('yes', 'true', '1')
+    
+    # Determine origin based on endpoint name
+    try:
+        origin_name = f"ENDPOINT_{endpoint_name.upper()}"
+        origin = getattr(RequestOrigin, origin_name, RequestOrigin.ENDPOINT_OCR)
+    except:
+        origin = RequestOrigin.ENDPOINT_OCR
+    
+    ctx = RequestContext(
+        origin=origin,
+        provider=provider,
+        model=effective_model,
+        streaming=streaming,
+        thinking_enabled=streaming and CONFIG.get("thinking_enabled", False),
+        cache=endpoint_name in get_prompts_config().get_endpoint_setting("cached_endpoints", [])
+    )
+    
+    # Prepare messages for simple API call
+    data_url = f"data:{mime_type};base64,{base64_image}"
+    messages = [{
+        "role": "user",
+        "content": [
+            {"type": "image_url", "image_url": {"url": data_url}},
+            {"type": "text", "text": prompt}
+        ]
+    }]
+    
+    def show_result(result):
+        """Show chat window if requested"""
+        if show_gui and HAVE_GUI:
+            session = ChatSession(
+                endpoint=endpoint_name,
+                image_base64=base64_image,
+                mime_type=mime_type
+            )
+            session.add_message("user", prompt)
+            session.add_message("assistant", result)
+            add_session(session, CONFIG.get("max_sessions", 50))
+            show_chat_gui(session, initial_response=result)
+    
+    return ctx, messages, show_result
+
+
 def create_endpoint_handler(endpoint_name, prompt_template):
     """Create a handler function for a specific endpoint"""
     def handler():
-        start_time = time.time()
-        
-        image_bytes = None
-        mime_type = 'image/png'
-        
-        if 'image' in request.files:
-            image_file = request.files['image']
-            image_bytes = image_file.read()
-            mime_type = image_file.mimetype or 'image/png'
-        elif request.content_type and 'image' in request.content_type:
-            image_bytes = request.get_data()
-            mime_type = request.content_type.split(';')[0]
-        elif request.data:
-            image_bytes = request.data
-        
-        if not image_bytes:
-            abort(400, description='No image found in request.')
+        # ?stream=1 or Accept: text/event-stream = SSE response (thinking
+        # included when thinking_enabled is on)
+        streaming = wants_stream(request)
+        ctx, messages, show_result = prepare_endpoint_request(endpoint_name, prompt_template, streaming)
         
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Parse provider override
-        provider = CONFIG.get("default_provider", "google")
-        if request.args.get('provider'):
-            provider = request.args.get('provider').lower()
-        elif request.headers.get('X-API-Provider'):
-            provider = request.headers.get('X-API-Provider').lower()
-        
-        # Parse prompt override
-        prompt = prompt_template
-        if request.args.get('prompt'):
-            prompt = request.args.get('prompt')
-        elif request.headers.get('X-Custom-Prompt'):
-            prompt = request.headers.get('X-Custom-Prompt')
-        
-        # Parse lang parameter and substitute {lang} placeholder
-        lang = request.args.get('lang', 'English')
-        if request.headers.get('X-Target-Language'):
-            lang = request.headers.get('X-Target-Language')
-        prompt = prompt.replace('{lang}', lang)
-        
-        # Parse model override
-        model_override = None
-        if request.args.get('model'):
-            model_override = request.args.get('model')
-        elif request.headers.get('X-API-Model'):
-            model_override = request.headers.get('X-API-Model')
-        
-        # Determine the effective model for logging
-        if model_override:
-            effective_model = model_override
-        elif provider == "openrouter":
-            effective_model = CONFIG.get("openrouter_model", "openai/gpt-oss-120b:free")
-        elif provider == "google":
-            effective_model = CONFIG.get("google_model", "gemini-2.5-flash")
-        elif provider == "custom":
-            effective_model = CONFIG.get("custom_model", "not configured")
-        else:
-            effective_model = "unknown"
-        
-        # Show parameter: yes/true/1 = show chat window, anything else = no
-        # Uses show_ai_response_in_chat_window
-        default_show = CONFIG.get('show_ai_response_in_chat_window', 'no')
-        show_param = request.args.get('show', default_show)
-        if isinstance(show_param, bool):
-            show_gui = show_param
-        else:
-            show_gui = str(show_param).lower() in ('yes', 'true', '1')
-        
-        # Use unified pipeline
-        from .request_pipeline import RequestPipeline, RequestContext, RequestOrigin
-        
-        # Determine origin based on endpoint name
-        try:
-            origin_name = f"ENDPOINT_{endpoint_name.upper()}"
-            origin = getattr(RequestOrigin, origin_name, RequestOrigin.ENDPOINT_OCR)
-        except:
-            origin = RequestOrigin.ENDPOINT_OCR
+        if streaming:
+            # Runs on a worker thread; a client disconnect cancels the request
+            def run(stream):
+                done = RequestPipeline.execute_unified_stream(
+                    ctx, messages, CONFIG, AI_PARAMS, KEY_MANAGERS, stream.stream_callback(),
+                    cancel_token=stream.cancel_token
+                )
+                stream.send(*result_event(done))
+                if not done.error:
+                    show_result(done.response_text)
             
-        ctx = RequestContext(
-            origin=origin,
-            provider=provider,
-            model=effective_model,
-            streaming=False,
-            thinking_enabled=False
-        )
-        
-        # Prepare messages for simple API call
-        data_url = f"data:{mime_type};base64,{base64_image}"
-        messages = [{
-            "role": "user",
-            "content": [
-                {"type": "image_url", "image_url": {"url": data_url}},
-                {"type": "text", "text": prompt}
-            ]
-        }]
+            return EventStream().response(run, name=f"SSE-{endpoint_name}")
         
         # Execute via pipeline
         ctx = RequestPipeline.execute_simple(ctx, messages, CONFIG, AI_PARAMS, KEY_MANAGERS)
@@ -131,20 +190,13 @@ def create_endpoint_handler(endpoint_name, prompt_template):
         error = ctx.error
         elapsed = ctx.elapsed_time
         
+        if ctx.rejected_status:
+            return jsonify({"error": error, "elapsed": elapsed}), ctx.rejected_status, \
+                {"Retry-After": str(ctx.retry_after)}
         if error:
             return jsonify({"error": error, "elapsed": elapsed}), 500
         
-        # Show chat window if requested
-        if show_gui and HAVE_GUI:
-            session = ChatSession(
-                endpoint=endpoint_name,
-                image_base64=base64_image,
-                mime_type=mime_type
-            )
-            session.add_message("user", prompt)
-            session.add_message("assistant", result)
-            add_session(session, CONFIG.get("max_sessions", 50))
-            show_chat_gui(session, initial_response=result)
+        show_result(result)
         
         if request.headers.get('Accept') == 'application/json':
             return jsonify({"text": result, "elapsed": elapsed})
@@ -155,6 +207,69 @@ def create_endpoint_handler(endpoint_name, prompt_template):
     return handler
 
 
+def create_batch_handler(endpoint_name, prompt_template):
+    """
+    Create the POST /<endpoint>/batch handler: one endpoint request per
+    uploaded image (multipart files and/or zip), run concurrently.
+    
+    Query: concurrency=N lowers batch_concurrency for this request;
+    stream=1 sends each result as it finishes (see image_batch.py)
+    """
+    def handler():
+        try:
+            images = read_images(request, int(CONFIG.get("batch_max_images") or DEFAULT_MAX_IMAGES))
+            concurrency = int(request.args.get('concurrency', 0))
+        except ValueError as e:
+            abort(400, description=str(e))
+        
+        # Overrides (provider, prompt, lang, model) apply to every image and
+        # any image's ctx serves as the batch template; results are never
+        # shown in chat windows
+        message_lists = []
+        for _, image_bytes, mime_type in images:
+            ctx, messages, _ = prepare_endpoint_request(
+                endpoint_name, prompt_template, False, image=(image_bytes, mime_type)
+            )
+            message_lists.append(messages)
+        names = [name for name, _, _ in images]
+        
+        def run(stream=None):
+            return run_batch(ctx, names, message_lists, CONFIG, AI_PARAMS, KEY_MANAGERS,
+                             concurrency=concurrency, stream=stream)
+        
+        if wants_stream(request):
+            def stream_run(stream):
+                summary = run(stream)
+                del summary["results"]  # Already sent one by one
+                stream.send("done", summary)
+            
+            return EventStream().response(stream_run, name=f"SSE-{endpoint_name}-batch")
+        
+        return jsonify(run())
+    
+    handler.__name__ = f"handle_{endpoint_name}_batch"
+    return handler
+
+
+@app.before_request
+def admission_check():
+    """
+    Refuse upstream-bound POSTs with 429 before their body is read when the
+    admission queue is already full (background job submissions have their
+    own queue)
+    """
+    if request.method != 'POST' or request.endpoint == 'submit_job':
+        return None
+    controller = get_admission_controller(CONFIG)
+    rejected = controller.check(HTTP) if controller is not None else None
+    if rejected is None:
+        return None
+    headers = {"Retry-After": str(rejected.retry_after)}
+    if request.blueprint == gateway.name:
+        return gateway_error(rejected.message, 429, "rate_limit_error", headers)
+    return jsonify({"error": rejected.message}), 429, headers
+
+
 @app.route('/')
 def index():
     """Root endpoint with service information"""
@@ -185,8 +300,17 @@ def health():
         "gui_available": HAVE_GUI,
         "gui_running": gui_status["running"],
         "providers": {p: km.get_key_count() for p, km in KEY_MANAGERS.items() if km.has_keys()},
+        "keys": {p: km.get_stats() for p, km in KEY_MANAGERS.items() if km.has_keys()},
+        "key_queues": {p: km.get_queue_stats() for p, km in KEY_MANAGERS.items() if km.has_keys()},
         "endpoints_count": len(ENDPOINTS),
-        "sessions_count": len(list_sessions())
+        "sessions_count": len(list_sessions()),
+        "connections": get_connection_pool().get_stats(),
+        "hedging": get_hedge_stats(),
+        "middleware": get_middleware_stats(),
+        "admission": get_admission_stats(CONFIG),
+        "jobs": get_job_runner(CONFIG).get_stats(),
+        "provider_health": get_health_tracker().get_stats(),
+        "request_log": get_request_log().get_stats()
     })
 
 
@@ -220,6 +344,92 @@ def get_models():
     })
 
 
+@app.route('/usage')
+def usage_report():
+    """
+    Aggregated usage from the ledger.
+    
+    Query: group=day|model|key|origin|provider (default day), days=N
+    (default 30, 0 = all time)
+    """
+    ledger = get_usage_ledger(CONFIG)
+    if ledger is None:
+        return jsonify({"error": "Usage ledger disabled (set usage_ledger_file)"}), 404
+    
+    group = request.args.get('group', 'day').lower()
+    if group not in USAGE_GROUPS:
+        return jsonify({"error": f"Unknown group '{group}'", "groups": list(USAGE_GROUPS)}), 400
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    
+    rows = ledger.aggregate(group, since=days_ago(days))
+    return jsonify({"group": group, "days": days, "rows": rows})
+
+
+@app.route('/jobs/<endpoint_name>', methods=['POST'])
+def submit_job(endpoint_name):
+    """
+    Run an endpoint request in the background; returns the job id at once.
+    
+    Accepts the same image and overrides as POST /<endpoint>.
+    """
+    prompt_template = ENDPOINTS.get(endpoint_name)
+    if prompt_template is None:
+        return jsonify({"error": f"Unknown endpoint '{endpoint_name}'"}), 404
+    ctx, messages, show_result = prepare_endpoint_request(endpoint_name, prompt_template, True)
+    ctx.priority = BATCH
+    
+    def run(job):
+        done = RequestPipeline.execute_unified_stream(
+            ctx, messages, CONFIG, AI_PARAMS, KEY_MANAGERS, job.stream_callback(),
+            cancel_token=job.cancel_token
+        )
+        job.complete(done)
+        if not done.error:
+            show_result(done.response_text)
+    
+    try:
+        job = get_job_runner(CONFIG).submit(endpoint_name, run)
+    except QueueFull:
+        return jsonify({"error": "Too many jobs queued, try again later"}), 503, {"Retry-After": "5"}
+    return jsonify(job.to_dict()), 202, {"Location": f"/jobs/{job.id}"}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Job status, partial text and usage.
+    
+    Query: wait=N long-polls up to N seconds (capped at jobs_max_wait) for
+    the job to finish - or, with since=<chars>, for its text to grow past
+    that length
+    """
+    runner = get_job_runner(CONFIG)
+    try:
+        wait = min(float(request.args.get('wait', 0)), float(CONFIG.get("jobs_max_wait", DEFAULT_MAX_WAIT)))
+        since = int(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({"error": "wait and since must be numbers"}), 400
+    
+    job = runner.store.get_job(job_id)
+    if job is not None and wait > 0:
+        job.wait(wait, since)
+    data = runner.store.get(job_id)
+    if data is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(data)
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    if not get_job_runner(CONFIG).cancel(job_id):
+        return jsonify({"error": "Job not found or already finished"}), 404
+    return jsonify({"id": job_id, "status": "cancelling"})
+
+
 @app.route('/sessions')
 def sessions_list():
     """List all chat sessions"""
@@ -273,8 +483,16 @@ def init_web_server(config, ai_params, endpoints, key_managers):
         for endpoint_name, prompt in endpoints.items():
             handler = create_endpoint_handler(endpoint_name, prompt)
             app.add_url_rule(f'/{endpoint_name}', endpoint_name, handler, methods=['POST'])
+            batch_handler = create_batch_handler(endpoint_name, prompt)
+            app.add_url_rule(f'/{endpoint_name}/batch', f'{endpoint_name}_batch', batch_handler,
+                             methods=['POST'])
     else:
         # No endpoints registered - API available but no custom routes
         ENDPOINTS = {}
     
+    # OpenAI-compatible /v1/chat/completions (opt-in, like the endpoints)
+    if config.get("gateway_enabled", False):
+        init_gateway(config, ai_params, key_managers)
+        app.register_blueprint(gateway)
+    
     return app
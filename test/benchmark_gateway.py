@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Load test: /v1/chat/completions gateway against a local mock upstream.
+
+Starts a mock OpenAI-compatible upstream (fixed think time, optional
+streaming) and the gateway on a threaded werkzeug server, configured as the
+"custom" provider. The same requests are then sent straight to the mock and
+through the gateway at the given concurrency; the difference between the
+two latency distributions is the latency the gateway adds (pipeline, key
+scheduling, re-encoding, the extra HTTP hop).
+
+Usage:
+    python test/benchmark_gateway.py [--requests N] [--concurrency N]
+                                     [--upstream-ms MS] [--stream]
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server
+
+from src.gateway import gateway, init_gateway
+from src.key_manager import KeyManager
+from src.metrics import _nearest_rank
+
+WORDS = "The quick brown fox jumps over the lazy dog".split()
+
+
+class MockUpstream(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions answering after a fixed delay"""
+
+    delay = 0.02
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.delay)
+        usage = {"prompt_tokens": 12, "completion_tokens": len(WORDS), "total_tokens": 12 + len(WORDS)}
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in WORDS:
+                self._chunk({"choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]})
+            self._chunk({"choices": [], "usage": usage})
+            self._write(b"data: [DONE]\n\n")
+            self._write(b"")
+            return
+        data = json.dumps({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(WORDS)},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, payload):
+        self._write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_servers(upstream_ms: float, concurrency: int):
+    MockUpstream.delay = upstream_ms / 1000.0
+    upstream = serve(ThreadingHTTPServer(("127.0.0.1", 0), MockUpstream))
+    upstream_url = f"http://127.0.0.1:{upstream.server_port}/v1"
+
+    config = {
+        "default_provider": "custom",
+        "custom_url": upstream_url,
+        "custom_model": "mock-model",
+        "request_log_format": "off",
+        "stream_coalesce_ms": 0,
+    }
+    keys = [f"key-{i}" for i in range(max(1, concurrency))]
+    init_gateway(config, {}, {"custom": KeyManager(keys, "custom")})
+    app = Flask(__name__)
+    app.register_blueprint(gateway)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # No access log lines
+    server = serve(make_server("127.0.0.1", 0, app, threaded=True))
+    return upstream_url, f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def run_load(url: str, requests_count: int, concurrency: int, stream: bool):
+    """(requests/sec, sorted latencies in ms, failures) for requests_count POSTs"""
+    body = {"model": "mock-model", "messages": [{"role": "user", "content": "hi"}], "stream": stream}
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        response = session.post(f"{url}/chat/completions", json=body, stream=stream, timeout=60)
+        if stream:
+            for _ in response.iter_content(chunk_size=None):
+                pass
+        ok = response.status_code == 200
+        response.close()
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    # Provider progress lines would dominate the run's output
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    failures = sum(1 for _, ok in results if not ok)
+    return requests_count / elapsed, latencies, failures
+
+
+def run_benchmark(requests_count: int, concurrency: int, upstream_ms: float, stream: bool):
+    upstream_url, gateway_url = start_servers(upstream_ms, concurrency)
+    mode = "streaming" if stream else "non-streaming"
+    print(f"{requests_count} {mode} requests, concurrency {concurrency}, upstream think time {upstream_ms:.0f} ms\n")
+
+    run_load(gateway_url, min(requests_count, 20), concurrency, stream)  # Warm connections and pools
+    rows = {}
+    print(f"{'Target':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'failed':>8}")
+    print("-" * 48)
+    for label, url in (("direct", upstream_url), ("gateway", gateway_url)):
+        rate, latencies, failures = run_load(url, requests_count, concurrency, stream)
+        rows[label] = latencies
+        print(f"{label:<10}{rate:>10.1f}{_nearest_rank(latencies, 50):>10.1f}"
+              f"{_nearest_rank(latencies, 99):>10.1f}{failures:>8}")
+
+    added_p50 = _nearest_rank(rows["gateway"], 50) - _nearest_rank(rows["direct"], 50)
+    added_p99 = _nearest_rank(rows["gateway"], 99) - _nearest_rank(rows["direct"], 99)
+    print(f"\nAdded latency: p50 {added_p50:.1f} ms, p99 {added_p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the OpenAI-compatible gateway")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per target")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--upstream-ms", type=float, default=20, help="Mock upstream think time")
+    parser.add_argument("--stream", action="store_true", help="Use stream: true")
+    args = parser.parse_args()
+    run_benchmark(args.requests, args.concurrency, args.upstream_ms, args.stream)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request body construction for large media payloads.
+
+Builds and serializes a request carrying a 20 MB audio file (about 27 MB
+of base64) for both providers, comparing:
+
+- Previous path: data URL string -> re.match(...) to split mime/base64
+  (full regex pass + slice copy) -> json.dumps -> .encode()
+- Current path: MediaPart referencing the data URL -> provider conversion
+  -> serialize_body() splicing the payload into the request bytes
+
+Usage:
+    python test/benchmark_media.py [--size-mb N] [--rounds N]
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.providers.gemini_native import GeminiNativeProvider
+from src.providers.openai_compatible import OpenAICompatibleProvider
+
+
+def make_messages(size_mb: int):
+    """Same audio data URL as a Gemini file part and an OpenAI audio part"""
+    audio = os.urandom(size_mb * 1024 * 1024)
+    data_url = "data:audio/mpeg;base64," + base64.b64encode(audio).decode("ascii")
+    text = {"type": "text", "text": "Transcribe this recording."}
+    gemini = [{"role": "user", "content": [text, {"type": "file", "file": {"url": data_url}}]}]
+    openai = [{"role": "user", "content": [text, {"type": "audio", "url": data_url}]}]
+    return gemini, openai, len(data_url)
+
+
+def old_gemini_body(messages):
+    """Previous Gemini conversion: regex split, then json.dumps + encode"""
+    parts = []
+    for item in messages[0]["content"]:
+        if item["type"] == "text":
+            parts.append({"text": item["text"]})
+        else:
+            match = re.match(r"data:([^;]+);base64,(.+)", item["file"]["url"])
+            mime_type, b64_data = match.groups()
+            parts.append({"inline_data": {"mime_type": mime_type, "data": b64_data}})
+    body = {"contents": [{"role": "user", "parts": parts}]}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def old_openai_body(messages):
+    """Previous OpenAI conversion: regex split to input_audio, then json.dumps + encode"""
+    content = []
+    for item in messages[0]["content"]:
+        if item["type"] == "text":
+            content.append(item)
+        else:
+            match = re.match(r"data:audio/([^;]+);base64,(.+)", item["url"])
+            fmt, b64 = match.groups()
+            content.append({"type": "input_audio", "input_audio": {"data": b64, "format": fmt}})
+    body = {"model": "m", "messages": [{"role": "user", "content": content}]}
+    return json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def new_gemini_body(provider, messages):
+    return provider.serialize_body(provider._build_request_body(messages, "gemini-2.5-flash", {}, False))
+
+
+def new_openai_body(provider, messages):
+    return provider.serialize_body(provider._build_request_body(messages, "m", {}, False, streaming=False))
+
+
+def bench(fn, rounds: int):
+    durations = []
+    size = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = len(fn())
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), size
+
+
+def run_benchmark(size_mb: int, rounds: int):
+    gemini_messages, openai_messages, url_length = make_messages(size_mb)
+    gemini = GeminiNativeProvider()
+    openai = OpenAICompatibleProvider("custom", "http://localhost/v1")
+
+    cases = [
+        ("Gemini", lambda: old_gemini_body(gemini_messages), lambda: new_gemini_body(gemini, gemini_messages)),
+        ("OpenAI", lambda: old_openai_body(openai_messages), lambda: new_openai_body(openai, openai_messages)),
+    ]
+
+    print(f"Audio payload: {size_mb} MB ({url_length / 1e6:.1f}M chars as data URL)")
+    print(f"{'Provider':<10}{'Body size':>12}{'Previous (ms)':>16}{'MediaPart (ms)':>17}{'Speedup':>10}")
+    print("-" * 65)
+    for name, old_fn, new_fn in cases:
+        old_ms, old_size = bench(old_fn, rounds)
+        new_ms, new_size = bench(new_fn, rounds)
+        print(f"{name:<10}{new_size / 1e6:>10.1f}MB{old_ms:>16.1f}{new_ms:>17.1f}{old_ms / new_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark media request body construction")
+    parser.add_argument("--size-mb", type=int, default=20, help="Audio payload size in MB")
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per path")
+    args = parser.parse_args()
+    run_benchmark(args.size_mb, args.rounds)
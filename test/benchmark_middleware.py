@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pipeline middleware overhead per request.
+
+Runs the middleware calls RequestPipeline makes for one request (chain
+lookup, before_request, stream wrapping, finish) with no stages configured,
+and with one stage per hook for comparison. The empty chain has to stay
+under a microsecond per request.
+
+Usage:
+    python test/benchmark_middleware.py [--requests N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.middleware import Middleware, get_middleware_chain, register_middleware
+from src.request_pipeline import RequestOrigin, create_request_context
+
+BUDGET_NS = 1000
+
+
+class _NoOp(Middleware):
+    """Overrides every hook without doing anything"""
+
+    def before_request(self, ctx, request):
+        return None
+
+    def on_delta(self, ctx, kind, content):
+        return content
+
+    def after_response(self, ctx):
+        pass
+
+    def on_error(self, ctx, error):
+        pass
+
+
+def _stream_wrapper(data_type, content):
+    pass
+
+
+def ns_per_request(config, requests: int) -> float:
+    ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+    messages = [{"role": "user", "content": "hi"}]
+    ai_params = {}
+    start = time.perf_counter()
+    for _ in range(requests):
+        chain = get_middleware_chain(config)
+        chain.wrap_stream(ctx, _stream_wrapper)
+        chain.before_request(ctx, messages, config, ai_params)
+        chain.finish(ctx)
+    elapsed = time.perf_counter() - start
+    return elapsed / requests * 1e9
+
+
+def run_benchmark(requests: int):
+    register_middleware("benchmark_noop", lambda config: _NoOp())
+    cases = [
+        ("empty chain", {}),
+        ("1 no-op stage", {"pipeline_middleware": "benchmark_noop"}),
+        ("4 no-op stages", {"pipeline_middleware": ["benchmark_noop"] * 4}),
+    ]
+    print(f"{'Chain':<18}{'ns/request':>12}")
+    print("-" * 30)
+    empty = None
+    for label, config in cases:
+        result = min(ns_per_request(config, requests) for _ in range(5))
+        empty = result if empty is None else empty
+        print(f"{label:<18}{result:>12.1f}")
+    verdict = "OK" if empty < BUDGET_NS else "OVER BUDGET"
+    print(f"\nEmpty chain: {empty:.1f} ns/request (budget {BUDGET_NS} ns) - {verdict}")
+    return empty < BUDGET_NS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline middleware overhead")
+    parser.add_argument("--requests", type=int, default=200_000, help="Simulated requests per run")
+    args = parser.parse_args()
+    sys.exit(0 if run_benchmark(args.requests) else 1)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: SSE stream parsing.
+
+Replays recorded-style OpenAI and Gemini streams through a real
+requests.Response and compares the previous per-line parser
+(iter_lines + strip/startswith + json.loads) with the byte-level
+SSEDecoder used by the providers.
+
+Usage:
+    python test/benchmark_sse.py [--events N] [--rounds N] [--replay FILE]
+
+--replay parses a captured raw stream body (e.g. saved with curl -N) in
+addition to the synthetic ones.
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from urllib3.response import HTTPResponse
+
+from src.providers.sse import iter_sse_events, HAVE_ORJSON
+
+# Transport chunk size seen from typical upstreams (one TLS record)
+WIRE_CHUNK = 1400
+
+WORDS = "The quick brown fox jumps over the lazy dog while naïve cafés serve crème brûlée 🚀".split()
+
+
+def build_openai_stream(events: int) -> bytes:
+    """OpenAI-compatible chat.completion.chunk stream with usage and [DONE]"""
+    parts = [b": OPENROUTER PROCESSING\n\n"]
+    for i in range(events):
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "delta": {"content": WORDS[i % len(WORDS)] + " "}, "finish_reason": None}]
+        }
+        parts.append(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+    usage = {"choices": [], "usage": {"prompt_tokens": 12, "completion_tokens": events, "total_tokens": events + 12}}
+    parts.append(b"data: " + json.dumps(usage).encode("utf-8") + b"\n\n")
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def build_gemini_stream(events: int) -> bytes:
+    """Gemini streamGenerateContent?alt=sse stream (CRLF delimited)"""
+    parts = []
+    for i in range(events):
+        chunk = {
+            "candidates": [{
+                "content": {"parts": [{"text": WORDS[i % len(WORDS)] + " "}], "role": "model"},
+                "index": 0
+            }],
+            "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": i + 1, "totalTokenCount": i + 13},
+            "modelVersion": "gemini-2.5-flash"
+        }
+        parts.append(b"data: " + json.dumps(chunk).encode("utf-8") + b"\r\n\r\n")
+    return b"".join(parts)
+
+
+def make_response(body: bytes) -> requests.Response:
+    """Build a streaming requests.Response over an in-memory body"""
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = HTTPResponse(
+        body=io.BytesIO(body),
+        preload_content=False,
+        decode_content=False
+    )
+    # Emulate wire-sized reads
+    original_read = response.raw._fp.read
+    response.raw._fp.read = lambda amt=None: original_read(min(amt or WIRE_CHUNK, WIRE_CHUNK))
+    return response
+
+
+def parse_per_line(body: bytes) -> int:
+    """Previous implementation: decode, strip and json.loads line by line"""
+    response = make_response(body)
+    response.encoding = "utf-8"
+    count = 0
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        line = line.strip()
+        if line == "data: [DONE]":
+            break
+        if line.startswith(":"):
+            continue
+        if not line.startswith("data: "):
+            continue
+        try:
+            json.loads(line[6:])
+            count += 1
+        except json.JSONDecodeError:
+            continue
+    return count
+
+
+def parse_sse_decoder(body: bytes) -> int:
+    """Current implementation: byte-level SSEDecoder"""
+    count = 0
+    for event in iter_sse_events(make_response(body)):
+        if event.is_done:
+            break
+        try:
+            event.json()
+            count += 1
+        except json.JSONDecodeError:
+            continue
+    return count
+
+
+def bench(fn, body: bytes, rounds: int):
+    durations = []
+    count = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = fn(body)
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), count
+
+
+def run_benchmark(events: int, rounds: int, replay: str = None):
+    streams = [
+        ("OpenAI", build_openai_stream(events)),
+        ("Gemini", build_gemini_stream(events)),
+    ]
+    if replay:
+        with open(replay, "rb") as f:
+            streams.append((os.path.basename(replay), f.read()))
+
+    print(f"JSON decoder: {'orjson' if HAVE_ORJSON else 'json (stdlib)'}")
+    print(f"{'Stream':<14}{'Size':>10}{'Events':>8}{'Per-line (ms)':>16}{'SSEDecoder (ms)':>18}{'Speedup':>10}")
+    print("-" * 76)
+    for name, body in streams:
+        old_ms, old_count = bench(parse_per_line, body, rounds)
+        new_ms, new_count = bench(parse_sse_decoder, body, rounds)
+        if old_count != new_count:
+            print(f"  ! {name}: event count mismatch ({old_count} vs {new_count})")
+        print(f"{name:<14}{len(body) // 1024:>8}KB{new_count:>8}{old_ms:>16.2f}{new_ms:>18.2f}{old_ms / new_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SSE stream parsing")
+    parser.add_argument("--events", type=int, default=5000, help="Events per synthetic stream")
+    parser.add_argument("--rounds", type=int, default=10, help="Timed rounds per parser")
+    parser.add_argument("--replay", help="Raw captured SSE body to replay")
+    args = parser.parse_args()
+    run_benchmark(args.events, args.rounds, args.replay)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streamed response accumulation.
+
+Measures the cost per appended token as the response grows, comparing
+`obj.text += delta` on an attribute (what RequestContext and the chat
+windows used to do) with TextBuffer.append. The string version grows
+linearly per token (quadratic overall); TextBuffer stays flat.
+
+Usage:
+    python test/benchmark_text_buffer.py [--max-chars N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.text_buffer import TextBuffer
+
+# Typical streamed delta (~1 token)
+DELTA = "word "
+
+
+class _Holder:
+    """Stands in for RequestContext / the chat window"""
+    def __init__(self):
+        self.text = ""
+        self.buffer = TextBuffer()
+
+
+def ns_per_token_str(chars: int) -> float:
+    holder = _Holder()
+    tokens = chars // len(DELTA)
+    start = time.perf_counter()
+    for _ in range(tokens):
+        holder.text += DELTA
+    elapsed = time.perf_counter() - start
+    return elapsed / tokens * 1e9
+
+
+def ns_per_token_buffer(chars: int) -> float:
+    holder = _Holder()
+    tokens = chars // len(DELTA)
+    start = time.perf_counter()
+    for _ in range(tokens):
+        holder.buffer.append(DELTA)
+    result = holder.buffer.getvalue()  # Final join is part of the cost
+    elapsed = time.perf_counter() - start
+    assert len(result) == tokens * len(DELTA)
+    return elapsed / tokens * 1e9
+
+
+def run_benchmark(max_chars: int):
+    sizes = []
+    size = 10_000
+    while size <= max_chars:
+        sizes.append(size)
+        size *= 4
+
+    print(f"{'Output chars':>14}{'str += (ns/token)':>20}{'TextBuffer (ns/token)':>24}")
+    print("-" * 58)
+    for chars in sizes:
+        old = min(ns_per_token_str(chars) for _ in range(3))
+        new = min(ns_per_token_buffer(chars) for _ in range(3))
+        print(f"{chars:>14,}{old:>20.1f}{new:>24.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark streamed text accumulation")
+    parser.add_argument("--max-chars", type=int, default=640_000, help="Largest response size to test")
+    args = parser.parse_args()
+    run_benchmark(args.max_chars)
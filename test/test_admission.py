@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control: priority ordering of waiters, queue-full (429)
+and queue-timeout (503) refusals with Retry-After, cancellation while
+waiting, and pipeline requests refused a slot.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src import admission
+from src.admission import BATCH, HTTP, INTERACTIVE, AdmissionController, AdmissionRejected
+from src.cancellation import CancellationToken
+from src.request_pipeline import RequestOrigin, RequestPipeline, create_request_context
+
+
+def wait_for(predicate, timeout=5.0):
+    end = time.time() + timeout
+    while not predicate():
+        if time.time() > end:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_priority_order(self):
+        controller = AdmissionController(1, queue_size=4)
+        held = controller.acquire(HTTP)
+        order = []
+
+        def waiter(priority):
+            slot = controller.acquire(priority)
+            order.append(priority)
+            slot.release()
+
+        threads = []
+        for priority in (BATCH, HTTP, INTERACTIVE):
+            threads.append(threading.Thread(target=waiter, args=(priority,)))
+            threads[-1].start()
+            wait_for(lambda p=priority: controller.get_stats()["queued"][p] == 1)
+        held.release()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, [INTERACTIVE, HTTP, BATCH])
+        stats = controller.get_stats()
+        self.assertEqual((stats["in_flight"], stats["admitted"][BATCH]), (0, 1))
+        self.assertEqual(stats["wait_ms"][BATCH]["count"], 1)
+
+    def test_queue_full_and_timeout(self):
+        controller = AdmissionController(1, queue_size=0, queue_timeout=0.05)
+        held = controller.acquire(HTTP)
+
+        self.assertEqual(controller.check(HTTP).status, 429)
+        self.assertIsNone(controller.check(INTERACTIVE))  # GUI requests are never refused
+        with self.assertRaises(AdmissionRejected) as caught:
+            controller.acquire(BATCH)
+        self.assertEqual(caught.exception.status, 429)
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+
+        controller.configure(1, 1, 0.05)
+        with self.assertRaises(AdmissionRejected) as caught:
+            controller.acquire(HTTP)
+        self.assertEqual(caught.exception.status, 503)
+        held.release()
+
+        stats = controller.get_stats()
+        self.assertEqual((stats["rejected_queue_full"], stats["rejected_timeout"]), (2, 1))
+        self.assertEqual(stats["queued"], {INTERACTIVE: 0, HTTP: 0, BATCH: 0})
+
+    def test_cancel_while_waiting(self):
+        controller = AdmissionController(1)
+        held = controller.acquire(INTERACTIVE)
+        token = CancellationToken()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(controller.acquire(INTERACTIVE, token)))
+        thread.start()
+        wait_for(lambda: controller.get_stats()["queued"][INTERACTIVE] == 1)
+        token.cancel("closed")
+        thread.join(5)
+
+        self.assertEqual(results, [None])
+        held.release()
+        with controller.acquire(HTTP):  # The abandoned waiter does not hold the slot
+            self.assertEqual(controller.get_stats()["in_flight"], 1)
+
+
+class TestPipelineAdmission(unittest.TestCase):
+    def tearDown(self):
+        admission._CONTROLLER = None
+
+    @patch('src.api_client.call_api_result')
+    def test_endpoint_request_refused(self, mock_call):
+        config = {"admission_max_concurrent": 1, "admission_queue_size": 0}
+        held = admission.get_admission_controller(config).acquire(INTERACTIVE)
+
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m")
+        ctx = RequestPipeline.execute_simple(ctx, [{"role": "user", "content": "hi"}], config, {}, {})
+        held.release()
+
+        self.assertEqual(ctx.rejected_status, 429)
+        self.assertGreaterEqual(ctx.retry_after, 1)
+        self.assertTrue(ctx.error)
+        mock_call.assert_not_called()
+        self.assertEqual(admission.get_admission_stats(config)["rejected_queue_full"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared provider connection pool.
+Verifies sessions are shared per base URL and keep-alive connections are reused.
+"""
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.providers.connection_pool import ConnectionPool
+from src.providers.openai_compatible import OpenAICompatibleProvider
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"data": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_session_shared_per_base_url(self):
+        """Providers pointing at the same upstream share one session"""
+        a = OpenAICompatibleProvider("custom", "http://shared.example/v1/chat/completions")
+        b = OpenAICompatibleProvider("custom", "http://shared.example/v1")
+        c = OpenAICompatibleProvider("custom", "http://other.example/v1")
+        self.assertIs(a.http, b.http)
+        self.assertIsNot(a.http, c.http)
+
+    def test_connection_reuse_counter(self):
+        """Sequential requests reuse one keep-alive connection"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        pool = ConnectionPool()
+        try:
+            base_url = f"http://127.0.0.1:{server.server_port}"
+            session = pool.get_session(base_url, pool_size=2)
+            for _ in range(5):
+                response = session.get(f"{base_url}/models", timeout=5)
+                response.content
+
+            stats = pool.get_stats()[base_url]
+            self.assertEqual(stats["requests"], 5)
+            self.assertEqual(stats["connections"], 1)
+            self.assertEqual(stats["reused"], 4)
+        finally:
+            pool.close_all()
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming deadlines: config parsing, deadline checks, idle
+stalls being retried on another key, and stalls after output failing
+instead of repeating it.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from src.key_manager import KeyManager
+from src.providers.base import CallbackType
+from src.providers.deadlines import Deadlines, StreamWatch, parse_origin_deadlines
+from src.providers.openai_compatible import OpenAICompatibleProvider
+
+
+class TestDeadlineConfig(unittest.TestCase):
+    def test_parse_origin_deadlines(self):
+        self.assertEqual(
+            parse_origin_deadlines("popup_prompt: first_byte=15, idle=10; endpoint/ocr: total=300, bogus=1"),
+            {"popup_prompt": {"first_byte": 15.0, "idle": 10.0}, "endpoint/ocr": {"total": 300.0}}
+        )
+        self.assertEqual(parse_origin_deadlines(None), {})
+
+    def test_origin_overrides_globals(self):
+        config = {
+            "request_timeout": 90,
+            "stream_idle_timeout": 20,
+            "origin_deadlines": "popup_prompt: idle=5",
+        }
+        self.assertEqual(Deadlines.from_config(config), Deadlines(10.0, 90.0, 20.0, 0.0))
+        self.assertEqual(Deadlines.from_config(config, "popup_prompt"), Deadlines(10.0, 90.0, 5.0, 0.0))
+        self.assertEqual(Deadlines.from_config(config, "popup_prompt").requests_timeout, (10.0, 90.0))
+
+
+class TestStreamWatch(unittest.TestCase):
+    def test_first_byte_then_idle(self):
+        watch = StreamWatch(Deadlines(first_byte=5, idle=1))
+        start = watch.started
+        self.assertIsNone(watch.check(start + 4))
+        self.assertIn("no data", watch.check(start + 6))
+
+        watch.activity()
+        self.assertIsNone(watch.check(watch.last_activity + 0.5))
+        self.assertIn("idle", watch.check(watch.last_activity + 2))
+
+    def test_total(self):
+        watch = StreamWatch(Deadlines(total=3))
+        watch.activity()
+        self.assertIn("total", watch.check(watch.started + 4))
+
+
+class StalledResponse:
+    """Streaming response that sends its chunks and then hangs until closed"""
+
+    status_code = 200
+
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.closed = threading.Event()
+
+    def iter_content(self, chunk_size=None):
+        yield from self.chunks
+        if self.closed.wait(5):
+            raise requests.exceptions.ConnectionError("connection closed")
+
+    def close(self):
+        self.closed.set()
+
+
+class TestIdleStall(unittest.TestCase):
+    def stream(self, mock_post, stalled):
+        good = MagicMock()
+        good.status_code = 200
+        good.iter_content.return_value = [
+            b'data: {"choices": [{"delta": {"content": "Done"}}]}\n\n',
+            b'data: [DONE]\n\n',
+        ]
+        mock_post.side_effect = [stalled, good]
+
+        provider = OpenAICompatibleProvider(
+            "custom", "http://fake.url/v1", KeyManager(["k1", "k2"], "custom"),
+            {"max_retries": 2, "stream_idle_timeout": 0.2}
+        )
+        events = []
+        start = time.monotonic()
+        result = provider.generate_stream([{"role": "user", "content": "hi"}], "m", {},
+                                          lambda kind, content: events.append((kind, content)))
+
+        self.assertLess(time.monotonic() - start, 2.0)
+        self.assertTrue(stalled.closed.is_set())
+        deltas = [content for kind, content in events if kind == CallbackType.TEXT]
+        errors = [content for kind, content in events if kind == CallbackType.ERROR]
+        return result, deltas, errors
+
+    @patch('requests.Session.post')
+    def test_stall_retries_on_another_key(self, mock_post):
+        # A keep-alive comment is activity, but no output reached the caller
+        result, deltas, errors = self.stream(mock_post, StalledResponse(b': keep-alive\n\n'))
+
+        self.assertTrue(result.success)
+        self.assertEqual(result.content, "Done")
+        self.assertEqual((deltas, errors), (["Done"], []))
+        keys = [call.kwargs["headers"]["Authorization"] for call in mock_post.call_args_list]
+        self.assertEqual(keys, ["Bearer k1", "Bearer k2"])
+        self.assertEqual(mock_post.call_args.kwargs["timeout"], (10.0, 120.0))
+
+    @patch('requests.Session.post')
+    def test_stall_after_output_is_not_retried(self, mock_post):
+        stalled = StalledResponse(b'data: {"choices": [{"delta": {"content": "Par"}}]}\n\n')
+        result, deltas, errors = self.stream(mock_post, stalled)
+
+        self.assertFalse(result.success)
+        self.assertIn("Stream stalled", result.error)
+        self.assertEqual(deltas, ["Par"])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(mock_post.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for stream delta coalescing in the request pipeline.
+"""
+
+import threading
+import time
+import unittest
+
+from src.request_pipeline import (
+    DeltaCoalescer,
+    RequestContext,
+    RequestOrigin,
+    RequestPipeline,
+    StreamCallback,
+)
+
+
+class TestDeltaCoalescer(unittest.TestCase):
+    def test_batches_within_window(self):
+        """Many fast deltas collapse into few callbacks, text unchanged"""
+        received = []
+        coalescer = DeltaCoalescer(received.append, None, window_ms=1000)
+        for i in range(200):
+            coalescer.add("text", f"{i} ")
+        coalescer.close()
+
+        self.assertEqual("".join(received), "".join(f"{i} " for i in range(200)))
+        self.assertEqual(len(received), 1)
+        self.assertEqual(coalescer.deltas_in, 200)
+
+    def test_size_limit_flushes(self):
+        received = []
+        coalescer = DeltaCoalescer(received.append, None, window_ms=1000, max_chars=10)
+        for _ in range(5):
+            coalescer.add("text", "abcde")
+        self.assertEqual(received, ["abcdeabcde", "abcdeabcde"])
+        coalescer.close()
+        self.assertEqual(received[-1], "abcde")
+
+    def test_stalled_stream_flushed_by_timer(self):
+        received = threading.Event()
+        coalescer = DeltaCoalescer(lambda text: received.set(), None, window_ms=20)
+        coalescer.add("text", "partial")
+        self.assertTrue(received.wait(2))
+        coalescer.close()
+
+    def test_kind_switch_preserves_order(self):
+        events = []
+        coalescer = DeltaCoalescer(
+            lambda t: events.append(("text", t)),
+            lambda t: events.append(("thinking", t)),
+            window_ms=1000
+        )
+        coalescer.add("thinking", "a")
+        coalescer.add("thinking", "b")
+        coalescer.add("text", "c")
+        coalescer.close()
+        self.assertEqual(events, [("thinking", "ab"), ("text", "c")])
+
+    def test_pipeline_flushes_before_done(self):
+        """Pending text reaches on_text before on_done, ctx sees every delta"""
+        events = []
+        callbacks = StreamCallback(
+            on_text=lambda t: events.append(("text", t)),
+            on_done=lambda: events.append(("done", None))
+        )
+        ctx = RequestContext(
+            origin=RequestOrigin.CHAT_WINDOW, provider="google", model="m",
+            streaming=True, thinking_enabled=False
+        )
+        coalescer = RequestPipeline.create_coalescer({"stream_coalesce_ms": 1000}, callbacks)
+        wrapper = RequestPipeline._make_stream_wrapper(ctx, callbacks, coalescer)
+        for part in ["Hel", "lo"]:
+            wrapper("text", part)
+        self.assertEqual(ctx.response_text, "Hello")
+        wrapper("done", None)
+        coalescer.close()
+        self.assertEqual(events, [("text", "Hello"), ("done", None)])
+
+    def test_disabled_by_config(self):
+        callbacks = StreamCallback(on_text=lambda t: None)
+        self.assertIsNone(RequestPipeline.create_coalescer({"stream_coalesce_ms": 0}, callbacks))
+        self.assertIsNone(RequestPipeline.create_coalescer({}, StreamCallback()))
+
+
+if __name__ == '__main__':
+    unittest.main()
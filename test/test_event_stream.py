@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for EventStream: event framing of a StreamCallback and a final
+result, stream negotiation, worker errors, and keep-alives and cancellation
+when the client disconnects. The endpoint handler's SSE path is covered in
+test_web_server.py.
+"""
+
+import json
+import threading
+import unittest
+
+from flask import Flask, request
+
+from src.event_stream import EventStream, result_event, wants_stream
+from src.request_pipeline import RequestOrigin, create_request_context
+
+
+def parse_events(body):
+    """(event, data) pairs of an SSE body, comments skipped"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestEventStream(unittest.TestCase):
+    def test_events(self):
+        def target(stream):
+            callbacks = stream.stream_callback()
+            callbacks.on_thinking("hmm")
+            callbacks.on_text("Hello")
+            callbacks.on_usage({"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m")
+            ctx.response_text, ctx.reasoning_text, ctx.total_tokens = "Hello", "hmm", 5
+            stream.send(*result_event(ctx))
+
+        body = "".join(EventStream().run(target))
+        self.assertTrue(body.startswith(": stream open\n\n"))
+        events = parse_events(body)
+        self.assertEqual([event for event, _ in events], ["thinking", "text", "usage", "done"])
+        self.assertEqual(events[0][1], {"text": "hmm"})
+        done = events[-1][1]
+        self.assertEqual((done["text"], done["thinking"], done["usage"]["total_tokens"]), ("Hello", "hmm", 5))
+
+    def test_errors(self):
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m")
+        ctx.error = "upstream down"
+        self.assertEqual(result_event(ctx)[0], "error")
+
+        def target(stream):
+            raise RuntimeError("boom")
+
+        events = parse_events("".join(EventStream().run(target)))
+        self.assertEqual(events, [("error", {"error": "Unexpected error: boom"})])
+
+    def test_negotiation(self):
+        app = Flask(__name__)
+        for path, headers, expected in (
+            ("/ocr", {}, False),
+            ("/ocr?stream=1", {}, True),
+            ("/ocr", {"Accept": "text/event-stream"}, True),
+            ("/ocr?stream=0", {"Accept": "text/event-stream"}, False),
+        ):
+            with app.test_request_context(path, method="POST", headers=headers):
+                self.assertEqual(wants_stream(request), expected, path)
+
+    def test_disconnect_cancels(self):
+        app = Flask(__name__)
+        stream = EventStream(keepalive=0.05)
+        cancelled = threading.Event()
+
+        def target(stream):
+            stream.send("text", {"text": "partial"})
+            stream.cancel_token.wait(5)
+            cancelled.set()
+
+        app.add_url_rule("/ocr", "ocr", lambda: stream.response(target), methods=["POST"])
+        response = app.test_client().post("/ocr", buffered=False)
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b": stream open\n\n")
+        self.assertIn(b"partial", next(chunks))
+        self.assertEqual(next(chunks), b": keep-alive\n\n")
+        response.close()  # What the server does when the client went away
+
+        self.assertTrue(cancelled.wait(5))
+        self.assertEqual(stream.cancel_token.reason, "client disconnected")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the OpenAI-compatible gateway: request validation and auth,
+non-streaming chat.completion bodies and the streamed chunk format.
+"""
+
+import json
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from src.gateway import gateway, init_gateway
+from src.key_manager import KeyManager
+from src.providers.base import ProviderResult, UsageData
+
+CONFIG = {"default_provider": "custom", "custom_model": "local-model", "stream_coalesce_ms": 0}
+
+
+def stream_payloads(body):
+    """data: payloads of an SSE body, comments skipped"""
+    return [block[len("data: "):] for block in body.strip().split("\n\n") if block.startswith("data: ")]
+
+
+class TestGateway(unittest.TestCase):
+    def setUp(self):
+        init_gateway(dict(CONFIG), {"temperature": 0.7}, {"custom": KeyManager(["k1"], "custom")})
+        app = Flask(__name__)
+        app.register_blueprint(gateway)
+        self.client = app.test_client()
+
+    def post(self, body, **kwargs):
+        return self.client.post("/v1/chat/completions", json=body, **kwargs)
+
+    @patch('src.api_client.call_api_result')
+    def test_completion(self, mock_call):
+        mock_call.return_value = ProviderResult(
+            success=True, content="Hi there",
+            usage=UsageData(prompt_tokens=4, completion_tokens=2, total_tokens=6)
+        )
+        response = self.post({"messages": [{"role": "user", "content": "hi"}], "temperature": 0.1})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["object"], "chat.completion")
+        self.assertEqual(body["model"], "local-model")
+        self.assertEqual(body["choices"][0]["message"], {"role": "assistant", "content": "Hi there"})
+        self.assertEqual(body["choices"][0]["finish_reason"], "stop")
+        self.assertEqual(body["usage"], {"prompt_tokens": 4, "completion_tokens": 2, "total_tokens": 6})
+        kwargs = mock_call.call_args.kwargs
+        self.assertEqual((kwargs["provider"], kwargs["ai_params"]["temperature"]), ("custom", 0.1))
+
+    @patch('src.api_client.call_api_result')
+    def test_upstream_error(self, mock_call):
+        mock_call.return_value = ProviderResult(success=False, error="HTTP 500")
+        response = self.post({"messages": [{"role": "user", "content": "hi"}]})
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.get_json()["error"]["message"], "HTTP 500")
+
+    @patch('src.providers.openai_compatible.OpenAICompatibleProvider.generate')
+    def test_reasoning_effort_reaches_provider(self, mock_generate):
+        mock_generate.return_value = ProviderResult(success=True, content="ok")
+        for effort, expected in (("high", True), ("none", False)):
+            init_gateway(dict(CONFIG, thinking_enabled=not expected), {}, {"custom": KeyManager(["k1"], "custom")})
+            response = self.post({"messages": [{"role": "user", "content": "hi"}], "reasoning_effort": effort})
+            self.assertEqual(response.status_code, 200, effort)
+            self.assertIs(mock_generate.call_args.kwargs["thinking_enabled"], expected, effort)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_stream(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("text", "Hel")
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        response = self.post({"model": "m2", "messages": [{"role": "user", "content": "hi"}], "stream": True,
+                              "stream_options": {"include_usage": True}})
+
+        self.assertEqual(response.mimetype, "text/event-stream")
+        payloads = stream_payloads(response.get_data(as_text=True))
+        self.assertEqual(payloads[-1], "[DONE]")
+        chunks = [json.loads(p) for p in payloads[:-1]]
+        self.assertEqual([c["choices"][0]["delta"] for c in chunks[:2]],
+                         [{"role": "assistant", "content": "Hel"}, {"content": "lo"}])
+        self.assertEqual(chunks[2]["choices"][0]["finish_reason"], "stop")
+        self.assertEqual((chunks[3]["choices"], chunks[3]["usage"]["total_tokens"]), ([], 5))
+        self.assertEqual({c["model"] for c in chunks}, {"m2"})
+        self.assertEqual(mock_stream.call_args.kwargs["model"], "m2")
+
+    def test_validation_and_auth(self):
+        self.assertEqual(self.post({"messages": []}).status_code, 400)
+        self.assertEqual(self.post({"messages": [{"role": "user", "content": "hi"}],
+                                    "provider": "nope"}).status_code, 400)
+        init_gateway(dict(CONFIG, gateway_api_key="secret"), {}, {"custom": KeyManager(["k1"], "custom")})
+        self.assertEqual(self.post({"messages": []}).status_code, 401)
+        self.assertEqual(self.post({"messages": []}, headers={"Authorization": "Bearer secret"}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged streaming requests, cancellation tokens and rolling percentiles.
+"""
+
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from src.cancellation import CANCELLED_ERROR, CancellationToken
+from src.hedging import HedgedStream, get_hedge_delay, get_origin_stats, parse_hedge_origins
+from src.key_manager import KeyManager
+from src.metrics import RollingPercentiles
+from src.providers.openai_compatible import OpenAICompatibleProvider
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+
+def fast_launch(text, delay=0.0):
+    """Attempt that streams text after delay seconds (or stops if cancelled)"""
+    def launch(callback, cancel_token, is_hedge):
+        if cancel_token.wait(delay):
+            return None, None, None, CANCELLED_ERROR
+        callback("text", text)
+        callback("done", None)
+        return text, None, None, None
+    return launch
+
+
+class TestHedgedStream(unittest.TestCase):
+    def test_hedge_wins_and_primary_is_cancelled(self):
+        primary_token = {}
+
+        def launch(callback, cancel_token, is_hedge):
+            if is_hedge:
+                return fast_launch("hedge")(callback, cancel_token, is_hedge)
+            primary_token["token"] = cancel_token
+            cancel_token.wait(5)
+            return None, None, None, CANCELLED_ERROR
+
+        events = []
+        hedge = HedgedStream("test_hedge_wins", 0.05, launch, lambda *e: events.append(e))
+        result = hedge.run()
+
+        self.assertEqual(result[0], "hedge")
+        self.assertEqual(events, [("text", "hedge"), ("done", None)])
+        self.assertTrue(primary_token["token"].cancelled)
+        stats = get_origin_stats("test_hedge_wins").to_dict()
+        self.assertEqual((stats["hedges_fired"], stats["hedges_won"]), (1, 1))
+
+    def test_fast_primary_never_hedges(self):
+        calls = []
+
+        def launch(callback, cancel_token, is_hedge):
+            calls.append(is_hedge)
+            return fast_launch("primary")(callback, cancel_token, is_hedge)
+
+        events = []
+        hedge = HedgedStream("test_fast_primary", 5.0, launch, lambda *e: events.append(e))
+        self.assertEqual(hedge.run()[0], "primary")
+        self.assertFalse(hedge.hedged)
+        self.assertEqual(calls, [False])
+        self.assertEqual(len(get_origin_stats("test_fast_primary").ttft), 1)
+
+    def test_loser_output_counts_as_wasted(self):
+        primary_won = threading.Event()
+
+        def launch(callback, cancel_token, is_hedge):
+            if is_hedge:
+                # Streams 400 chars before noticing it lost
+                primary_won.wait(5)
+                callback("text", "x" * 400)
+                return None, None, None, CANCELLED_ERROR
+            cancel_token.wait(0.1)
+            callback("text", "primary")
+            primary_won.set()
+            cancel_token.wait(0.2)
+            return "primary", None, None, None
+
+        hedge = HedgedStream("test_wasted", 0.02, launch, lambda *e: None)
+        self.assertEqual(hedge.run()[0], "primary")
+        stats = get_origin_stats("test_wasted").to_dict()
+        self.assertEqual((stats["hedges_fired"], stats["hedges_won"]), (1, 0))
+        self.assertEqual(stats["wasted_tokens"], 100)
+
+    def test_loser_ttft_is_sampled(self):
+        sampled = threading.Event()
+
+        def launch(callback, cancel_token, is_hedge):
+            if is_hedge:
+                return fast_launch("hedge")(callback, cancel_token, is_hedge)
+            # A slow primary whose first token is already in flight when it loses
+            cancel_token.wait(5)
+            callback("text", "late")
+            sampled.set()
+            return None, None, None, CANCELLED_ERROR
+
+        hedge = HedgedStream("test_loser_ttft", 0.1, launch, lambda *e: None)
+        self.assertEqual(hedge.run()[0], "hedge")
+        self.assertTrue(sampled.wait(5))
+        ttft = get_origin_stats("test_loser_ttft").ttft
+        self.assertEqual(len(ttft), 2)
+        self.assertLess(ttft.percentile(0), 0.1)  # The hedge, timed from its own start
+        self.assertGreaterEqual(ttft.percentile(100), 0.1)  # The primary
+
+    def test_primary_failure_before_delay_is_returned(self):
+        def launch(callback, cancel_token, is_hedge):
+            callback("error", "boom")
+            return None, None, None, "boom"
+
+        events = []
+        hedge = HedgedStream("test_failure", 5.0, launch, lambda *e: events.append(e))
+        self.assertEqual(hedge.run()[3], "boom")
+        self.assertEqual(events, [("error", "boom")])
+        self.assertFalse(hedge.hedged)
+
+
+class TestHedgeConfig(unittest.TestCase):
+    def test_parse_origins(self):
+        self.assertEqual(
+            parse_hedge_origins("popup_prompt, snip_tool:95"),
+            {"popup_prompt": None, "snip_tool": 95.0}
+        )
+        self.assertEqual(parse_hedge_origins(None), {})
+
+    def test_delay_uses_percentile_once_warm(self):
+        config = {"hedge_origins": "test_delay:50", "hedge_delay": 3.0, "hedge_min_delay": 0.1}
+        self.assertIsNone(get_hedge_delay(config, "chat_window"))
+        self.assertEqual(get_hedge_delay(config, "test_delay"), 3.0)
+        ttft = get_origin_stats("test_delay").ttft
+        for i in range(1, 21):
+            ttft.add(i / 10)
+        self.assertEqual(get_hedge_delay(config, "test_delay"), 1.0)
+
+
+class TestRollingPercentiles(unittest.TestCase):
+    def test_window_and_percentiles(self):
+        stats = RollingPercentiles(window=100)
+        self.assertIsNone(stats.percentile(50))
+        for value in range(1, 201):
+            stats.add(value)
+        self.assertEqual(len(stats), 100)
+        self.assertEqual(stats.percentile(50), 150)
+        self.assertEqual(stats.percentile(100), 200)
+        self.assertEqual(stats.snapshot((90,)), {"count": 100, "p90": 190})
+
+
+class TestCancellation(unittest.TestCase):
+    def test_on_cancel_runs_once(self):
+        token = CancellationToken()
+        closed = []
+        unregister = token.on_cancel(lambda: closed.append(1))
+        token.cancel()
+        token.cancel()
+        unregister()
+        self.assertEqual(closed, [1])
+        token.on_cancel(lambda: closed.append(2))  # Already cancelled: runs now
+        self.assertEqual(closed, [1, 2])
+
+    @patch('requests.Session.post')
+    def test_cancelled_stream_is_not_retried(self, mock_post):
+        token = CancellationToken()
+
+        def chunks():
+            yield b'data: {"choices": [{"delta": {"content": "Hi"}}]}\n\n'
+            token.cancel("test")
+            raise requests.exceptions.ConnectionError("closed")
+
+        response = MagicMock()
+        response.status_code = 200
+        response.iter_content.return_value = chunks()
+        mock_post.return_value = response
+
+        provider = OpenAICompatibleProvider(
+            "custom", "http://fake.url/v1", KeyManager(["k1", "k2"], "custom"), {"max_retries": 3}
+        )
+        errors = []
+        result = provider.generate_stream(
+            [{"role": "user", "content": "hi"}], "m", {},
+            lambda kind, content: errors.append(content) if kind.value == "error" else None,
+            cancel_token=token
+        )
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, CANCELLED_ERROR)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(errors, [])
+        response.close.assert_called()
+
+    def stream_with_cancel(self, chunks):
+        """generate_stream over a mocked response body; returns (result, key manager, provider, posts)"""
+        key_manager = KeyManager(["k1", "k2"], "custom")
+        provider = OpenAICompatibleProvider("custom", "http://fake.url/v1", key_manager, {"max_retries": 3})
+        response = MagicMock()
+        response.status_code = 200
+        response.iter_content.return_value = chunks
+        with patch('requests.Session.post', return_value=response) as mock_post, \
+                patch.object(provider, 'log_error') as log_error:
+            result = provider.generate_stream(
+                [{"role": "user", "content": "hi"}], "m", {}, lambda kind, content: None,
+                cancel_token=self.token
+            )
+        return result, key_manager, log_error, mock_post
+
+    def test_cancel_mid_stream_is_not_a_partial_answer(self):
+        self.token = CancellationToken()
+
+        def chunks():
+            yield b'data: {"choices": [{"delta": {"content": "Par"}}]}\n\n'
+            self.token.cancel("test")
+            yield b'data: {"choices": [{"delta": {"content": "tial"}}]}\n\n'
+
+        result, key_manager, log_error, mock_post = self.stream_with_cancel(chunks())
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, CANCELLED_ERROR)
+        self.assertEqual(mock_post.call_count, 1)  # Not retried
+        self.assertEqual([key["in_flight"] for key in key_manager.get_stats()], [0, 0])  # Lease released
+        log_error.assert_not_called()
+
+    def test_read_error_after_cancel_is_not_logged(self):
+        self.token = CancellationToken()
+
+        def chunks():
+            yield b'data: {"choices": [{"delta": {"content": "Par"}}]}\n\n'
+            self.token.cancel("test")
+            raise AttributeError("'NoneType' object has no attribute 'read'")  # Closed response
+
+        result, key_manager, log_error, mock_post = self.stream_with_cancel(chunks())
+        self.assertEqual((result.success, result.error), (False, CANCELLED_ERROR))
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual([key["in_flight"] for key in key_manager.get_stats()], [0, 0])
+        log_error.assert_not_called()
+
+    def test_cancel_stops_hedged_attempts(self):
+        started = threading.Event()
+
+        def launch(callback, cancel_token, is_hedge):
+            started.set()
+            if cancel_token.wait(5):
+                return None, None, None, CANCELLED_ERROR
+            return "late", None, None, None
+
+        hedge = HedgedStream("test_cancel", 5.0, launch, lambda *e: None)
+        threading.Thread(target=lambda: started.wait(5) and hedge.cancel("test")).start()
+        self.assertEqual(hedge.run()[3], CANCELLED_ERROR)
+        self.assertFalse(hedge.hedged)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_pipeline_records_tokens_saved(self, mock_stream):
+        token = CancellationToken()
+
+        def fake_stream(callback, cancel_token, **kwargs):
+            callback("text", "x" * 40)  # ~10 tokens generated
+            token.cancel("closed")
+            return None, None, None, CANCELLED_ERROR
+
+        mock_stream.side_effect = fake_stream
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        ctx = RequestPipeline.execute_unified_stream(
+            ctx, [], {"stream_coalesce_ms": 0}, {"max_tokens": 100}, {}, StreamCallback(),
+            cancel_token=token
+        )
+        self.assertIs(mock_stream.call_args.kwargs["cancel_token"], token)
+        self.assertTrue(ctx.cancelled)
+        self.assertEqual(ctx.error, CANCELLED_ERROR)
+        self.assertEqual(ctx.tokens_saved, 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
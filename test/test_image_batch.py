@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for multi-image batch requests: reading multipart and zip uploads,
+ordered results under the concurrency cap, and streamed results in
+completion order.
+"""
+
+import io
+import json
+import threading
+import time
+import unittest
+import zipfile
+from unittest.mock import patch
+
+from flask import Flask
+
+from src.event_stream import EventStream
+from src.image_batch import read_images, run_batch
+from src.providers.base import ProviderResult
+from src.request_pipeline import RequestOrigin, create_request_context
+
+CONFIG = {"batch_concurrency": 2}
+
+
+def zip_bytes(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def message_lists(count):
+    return [[{"role": "user", "content": f"image {i}"}] for i in range(count)]
+
+
+def answer(messages, **kwargs):
+    """Fake call_api_result: image 1 fails, image 0 is slow"""
+    index = int(messages[0]["content"].split()[-1])
+    if index == 0:
+        time.sleep(0.1)
+    if index == 1:
+        return ProviderResult(success=False, error="HTTP 500")
+    return ProviderResult(success=True, content=f"text {index}")
+
+
+class TestReadImages(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def read(self, max_images=10, **kwargs):
+        with self.app.test_request_context("/ocr/batch", method="POST", **kwargs):
+            from flask import request
+            return read_images(request, max_images)
+
+    def test_multipart_and_zip(self):
+        archive = zip_bytes([("b.png", b"B"), ("notes.txt", b"x"), ("dir/c.jpg", b"C")])
+        images = self.read(data={"image": [(io.BytesIO(b"A"), "a.png", "image/png"),
+                                           (io.BytesIO(archive), "more.zip", "application/zip")]},
+                           content_type="multipart/form-data")
+        self.assertEqual(images, [("a.png", b"A", "image/png"), ("b.png", b"B", "image/png"),
+                                  ("dir/c.jpg", b"C", "image/jpeg")])
+
+        images = self.read(data=archive, content_type="application/zip")
+        self.assertEqual([name for name, _, _ in images], ["b.png", "dir/c.jpg"])
+
+    def test_limits(self):
+        with self.assertRaises(ValueError):
+            self.read(max_images=1, data=zip_bytes([("a.png", b"A"), ("b.png", b"B")]),
+                      content_type="application/zip")
+        with self.assertRaises(ValueError):
+            self.read(data=b"not a zip", content_type="application/zip")
+        with self.assertRaises(ValueError):
+            self.read(data=b"", content_type="text/plain")
+
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m")
+        self.names = ["a.png", "b.png", "c.png", "d.png"]
+
+    @patch('src.api_client.call_api_result')
+    def test_ordered_results_under_cap(self, mock_call):
+        lock = threading.Lock()
+        active = [0, 0]  # current, peak
+
+        def fake_call(messages, **kwargs):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            try:
+                return answer(messages)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        mock_call.side_effect = fake_call
+        summary = run_batch(self.ctx, self.names, message_lists(4), dict(CONFIG, batch_concurrency=3), {}, {},
+                            concurrency=2)
+
+        self.assertEqual((summary["count"], summary["succeeded"], summary["failed"]), (4, 3, 1))
+        self.assertEqual([r["name"] for r in summary["results"]], self.names)
+        self.assertEqual([r["status"] for r in summary["results"]], ["done", "error", "done", "done"])
+        self.assertEqual((summary["results"][0]["text"], summary["results"][1]["error"]), ("text 0", "HTTP 500"))
+        self.assertLessEqual(active[1], 2)
+
+    @patch('src.api_client.call_api_result')
+    def test_stream_in_completion_order(self, mock_call):
+        mock_call.side_effect = answer
+
+        def target(stream):
+            summary = run_batch(self.ctx, self.names, message_lists(4), CONFIG, {}, {}, stream=stream)
+            stream.send("done", {"failed": summary["failed"]})
+
+        blocks = [b for b in "".join(EventStream().run(target)).split("\n\n") if b.startswith("event:")]
+        events = [(b.split("\n")[0][len("event: "):], json.loads(b.split("\n")[1][len("data: "):]))
+                  for b in blocks]
+
+        self.assertEqual([name for name, _ in events], ["result"] * 4 + ["done"])
+        self.assertEqual(events[-2][1]["index"], 0)  # The slow first image finishes last
+        self.assertEqual(sorted(data["index"] for _, data in events[:4]), [0, 1, 2, 3])
+        self.assertEqual(events[-1][1], {"failed": 1})
+
+    @patch('src.api_client.call_api_result')
+    def test_cancelled_items_are_skipped(self, mock_call):
+        mock_call.side_effect = answer
+        stream = EventStream()
+        stream.cancel_token.cancel("client disconnected")
+        summary = run_batch(self.ctx, self.names, message_lists(4), CONFIG, {}, {}, stream=stream)
+
+        mock_call.assert_not_called()
+        self.assertEqual(summary["failed"], 4)
+        self.assertTrue(all(r["status"] == "error" for r in summary["results"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
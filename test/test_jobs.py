@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for background jobs: running pipeline requests on the worker pool,
+long-polling partial text, cancellation, the queue limit and the TTL'd
+store with disk spill.
+"""
+
+import shutil
+import tempfile
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from src.jobs import CANCELLED, DONE, FAILED, QUEUED, JobRunner, QueueFull
+from src.request_pipeline import RequestOrigin, RequestPipeline, create_request_context
+
+CONFIG = {"stream_coalesce_ms": 0}
+
+
+def pipeline_job(text="hi"):
+    """run(job) that streams one request through the pipeline"""
+    def run(job):
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m")
+        job.complete(RequestPipeline.execute_unified_stream(
+            ctx, [{"role": "user", "content": text}], CONFIG, {}, {}, job.stream_callback(),
+            cancel_token=job.cancel_token
+        ))
+    return run
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.runner = JobRunner({"jobs_workers": 1, "jobs_queue_size": 1})
+
+    def tearDown(self):
+        self.runner.shutdown()
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_partial_text_and_result(self, mock_stream):
+        release = threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            callback("text", "Hel")
+            release.wait(5)
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        job = self.runner.submit("ocr", pipeline_job())
+
+        job.wait(5, since=0)  # Returns once text arrived
+        partial = self.runner.store.get(job.id)
+        self.assertEqual((partial["status"], partial["text"]), ("running", "Hel"))
+
+        release.set()
+        job.wait(5)
+        data = self.runner.store.get(job.id)
+        self.assertEqual((data["status"], data["text"], data["usage"]["total_tokens"]), (DONE, "Hello", 5))
+        self.assertEqual(self.runner.get_stats()["finished_in_memory"], 1)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_cancel_and_queue_limit(self, mock_stream):
+        started = threading.Event()
+
+        def fake_stream(callback, cancel_token=None, **kwargs):
+            started.set()
+            cancel_token.wait(5)
+            return None, None, None, "Request cancelled"
+
+        mock_stream.side_effect = fake_stream
+        running = self.runner.submit("ocr", pipeline_job())
+        self.assertTrue(started.wait(5))
+        waiting = self.runner.submit("ocr", pipeline_job("other"))
+        self.assertEqual(waiting.status, QUEUED)
+        with self.assertRaises(QueueFull):
+            self.runner.submit("ocr", pipeline_job())
+
+        self.assertTrue(self.runner.cancel(waiting.id))
+        self.assertTrue(self.runner.cancel(running.id))
+        running.wait(5)
+        waiting.wait(5)
+        self.assertEqual((running.status, waiting.status), (CANCELLED, CANCELLED))
+        self.assertEqual(mock_stream.call_count, 1)  # The queued job never ran
+        self.assertFalse(self.runner.cancel(running.id))
+        self.assertEqual(self.runner.get_stats()["rejected"], 1)
+
+    def test_crash_is_reported(self):
+        def run(job):
+            raise RuntimeError("boom")
+
+        job = self.runner.submit("ocr", run)
+        job.wait(5)
+        self.assertEqual((job.status, job.error), (FAILED, "Unexpected error: boom"))
+
+
+class TestJobStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_spill_and_expiry(self):
+        runner = JobRunner({"jobs_workers": 1, "jobs_memory": 1, "jobs_dir": self.dir, "jobs_ttl": 60})
+        jobs = []
+        for text in ("first", "second"):
+            ctx = SimpleNamespace(response_text=text, reasoning_text="", input_tokens=1, output_tokens=1,
+                                  total_tokens=2, estimated=False, served_by=None, cancelled=False, error=None)
+            jobs.append(runner.submit("ocr", lambda job, ctx=ctx: job.complete(ctx)))
+        jobs[-1].wait(5)
+        runner.shutdown(wait=True)  # Lets the worker file the last job
+
+        self.assertIsNone(runner.store.get_job(jobs[0].id))  # Spilled
+        self.assertEqual(runner.store.get(jobs[0].id)["text"], "first")
+        self.assertEqual(runner.store.get(jobs[1].id)["text"], "second")
+        self.assertEqual(runner.get_stats()["spilled"], 1)
+
+        with patch('src.jobs.time.time', return_value=jobs[1].finished + 120):
+            self.assertIsNone(runner.store.get(jobs[0].id))
+            self.assertIsNone(runner.store.get(jobs[1].id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Tests for API key scheduling: token buckets, cooldowns, quarantine, LRU spread
+and per-key concurrency leases.
+"""
+
+import threading
+import unittest
+from unittest.mock import patch
+
+from src.key_manager import KeyManager, KeysBusyError
+
+
+class TestKeySelection(unittest.TestCase):
+    def test_lru_spreads_requests(self):
+        km = KeyManager(["k1", "k2", "k3"], "custom")
+        picked = [km.acquire().key for _ in range(6)]
+        self.assertEqual(picked, ["k1", "k2", "k3", "k1", "k2", "k3"])
+
+    def test_threads_keep_their_own_key(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        seen = {}
+
+        def worker(name):
+            with km.acquire() as lease:
+                seen[name] = lease.key
+                seen[name + "_again"] = km.get_current_key()
+
+        threads = [threading.Thread(target=worker, args=(f"t{i}",)) for i in range(2)]
+        for t in threads:
+            t.start()
+            t.join()
+        self.assertEqual({seen["t0"], seen["t1"]}, {"k1", "k2"})
+        self.assertEqual(seen["t0"], seen["t0_again"])
+        self.assertEqual(seen["t1"], seen["t1_again"])
+
+    def test_token_bucket_limits_rate(self):
+        km = KeyManager(["k1", "k2"], "custom", rpm_limit=1)
+        self.assertEqual(km.acquire().key, "k1")
+        self.assertEqual(km.acquire().key, "k2")
+        # Both buckets empty: refill takes a minute, so a short wait gives up
+        # and returns the soonest key anyway
+        with patch("src.key_manager.time.sleep") as sleep:
+            self.assertIn(km.acquire(max_wait=0).key, ("k1", "k2"))
+            sleep.assert_not_called()
+
+    def test_current_key_outside_lease_is_free(self):
+        km = KeyManager(["k1", "k2"], "custom", rpm_limit=1)
+        self.assertEqual(km.get_current_key(), "k1")
+        self.assertEqual(km.get_key_number(), 1)
+        self.assertEqual([(s["requests"], s["tokens"]) for s in km.get_stats()], [(0, 1.0), (0, 1.0)])
+
+        with km.acquire() as lease:
+            self.assertEqual(km.get_current_key(), lease.key)
+        self.assertEqual(sum(s["requests"] for s in km.get_stats()), 1)
+
+
+class TestKeyFailures(unittest.TestCase):
+    def test_rate_limited_key_cools_down(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        self.assertEqual(km.acquire().key, "k1")
+        km.mark_rate_limited(retry_after=60)
+        # k2 is used for the next requests while k1 rests
+        self.assertEqual(km.acquire().key, "k2")
+        self.assertEqual(km.acquire(max_wait=0).key, "k2")
+        self.assertGreater(km.get_stats()[0]["cooldown_remaining"], 50)
+
+    def test_cooldown_default_without_retry_after(self):
+        km = KeyManager(["k1"], "custom", cooldown=5)
+        km.acquire().key
+        km.mark_rate_limited()
+        remaining = km.get_stats()[0]["cooldown_remaining"]
+        self.assertTrue(4 < remaining <= 5)
+
+    def test_invalid_key_is_quarantined(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        self.assertEqual(km.acquire().key, "k1")
+        km.mark_invalid()
+        self.assertEqual(km.rotate_key("(auth_error)"), "k2")
+        for _ in range(3):
+            self.assertEqual(km.acquire().key, "k2")
+        self.assertTrue(km.get_stats()[0]["quarantined"])
+
+    def test_all_keys_quarantined(self):
+        km = KeyManager(["k1"], "custom")
+        km.acquire().key
+        km.mark_invalid()
+        self.assertIsNone(km.acquire().key)
+        self.assertIsNone(km.get_current_key())
+
+    def test_rotation_exhausts_then_resets(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        km.acquire().key
+        self.assertEqual(km.rotate_key(), "k2")
+        self.assertTrue(km.has_more_keys())  # k2 itself is still untried
+        km.mark_invalid()
+        self.assertEqual(km.rotate_key(), "k1")  # k1 was tried: reset
+        self.assertTrue(km.has_more_keys())
+
+    def test_reload_keeps_surviving_state(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        km.acquire().key
+        km.mark_invalid()
+        km.reload_keys(["k1", "k3"])
+        self.assertEqual(km.acquire().key, "k3")
+        self.assertEqual(km.get_key_count(), 2)
+
+
+class TestKeyLeases(unittest.TestCase):
+    def test_least_loaded_key_wins(self):
+        km = KeyManager(["k1", "k2"], "custom")
+        first = km.acquire()
+        second = km.acquire()
+        self.assertEqual({first.key, second.key}, {"k1", "k2"})
+        first.release()
+        # k(first) now has nothing in flight while the other still has one
+        self.assertEqual(km.acquire().key, first.key)
+
+    def test_saturated_pool_blocks_until_release(self):
+        km = KeyManager(["k1"], "custom", max_in_flight=1)
+        held = km.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            with km.acquire():
+                acquired.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.assertEqual(km.get_queue_stats()["waiting"], 1)
+        held.release()
+        self.assertTrue(acquired.wait(2))
+        thread.join()
+        self.assertEqual(km.get_stats()[0]["in_flight"], 0)
+
+    def test_queue_timeout_raises(self):
+        km = KeyManager(["k1"], "custom", max_in_flight=1, queue_timeout=0.05)
+        km.acquire()
+        result = {}
+
+        def worker():
+            try:
+                km.acquire()
+            except KeysBusyError as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertIsInstance(result.get("error"), KeysBusyError)
+        self.assertEqual(km.get_queue_stats()["busy_timeouts"], 1)
+
+    def test_rotation_moves_the_lease(self):
+        km = KeyManager(["k1", "k2"], "custom", max_in_flight=1)
+        lease = km.acquire()
+        self.assertEqual(km.rotate_key(), "k2")
+        self.assertEqual([s["in_flight"] for s in km.get_stats()], [0, 1])
+        lease.release()
+        self.assertEqual([s["in_flight"] for s in km.get_stats()], [0, 0])
+
+    def test_rotation_skips_saturated_keys(self):
+        km = KeyManager(["k1", "k2"], "custom", max_in_flight=1)
+        other = threading.Thread(target=km.acquire)  # holds k1 forever
+        other.start()
+        other.join()
+        with km.acquire() as lease:
+            self.assertEqual(lease.key, "k2")
+            # k1 is busy: no rotation, the request keeps its own slot
+            self.assertIsNone(km.rotate_key())
+            self.assertEqual(km.get_current_key(), "k2")
+
+    def test_from_config(self):
+        km = KeyManager.from_config(["k1"], "google", {
+            "key_rpm_limit": 30, "key_max_concurrency": 2, "key_queue_timeout": 5
+        })
+        self.assertEqual((km.rpm_limit, km.max_in_flight, km.queue_timeout), (30, 2, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for media parts and zero-copy request body serialization.
+"""
+
+import base64
+import json
+import unittest
+
+from src.providers.gemini_native import GeminiNativeProvider
+from src.providers.media import MediaPart, encode_json_body, media_item
+from src.providers.openai_compatible import OpenAICompatibleProvider
+from src.session_manager import ChatSession
+
+
+PNG_B64 = base64.b64encode(b"\x89PNG fake image bytes").decode("ascii")
+AUDIO_B64 = base64.b64encode(b"ID3 fake mp3 bytes" * 10).decode("ascii")
+
+
+class TestMediaPart(unittest.TestCase):
+    def test_from_data_url(self):
+        part = MediaPart.from_data_url(f"data:image/png;base64,{PNG_B64}")
+        self.assertEqual(part.mime_type, "image/png")
+        self.assertEqual(part.base64_str(), PNG_B64)
+        self.assertEqual(bytes(part.base64_bytes()), PNG_B64.encode("ascii"))
+        self.assertIsNone(MediaPart.from_data_url("https://example.com/a.png"))
+        self.assertIsNone(MediaPart.from_data_url("data:text/plain,hello"))
+
+    def test_encode_json_body_splices_media(self):
+        part = MediaPart.from_bytes("audio/wav", b"\x00\x01\x02 raw")
+        body = {
+            "text": "naïve \u0000 text",
+            "a": part.wire_base64(),
+            "b": MediaPart.from_base64("image/png", PNG_B64).wire_data_url()
+        }
+        decoded = json.loads(encode_json_body(body))
+        self.assertEqual(decoded["text"], "naïve \u0000 text")
+        self.assertEqual(base64.b64decode(decoded["a"]), b"\x00\x01\x02 raw")
+        self.assertEqual(decoded["b"], f"data:image/png;base64,{PNG_B64}")
+
+    def test_unsafe_payload_falls_back_to_json_escaping(self):
+        part = MediaPart.from_base64("image/png", 'AB"C\nD')
+        decoded = json.loads(encode_json_body({"x": part.wire_base64()}))
+        self.assertEqual(decoded["x"], 'AB"C\nD')
+
+
+class TestProviderMediaConversion(unittest.TestCase):
+    def test_session_attachments_become_media_items(self):
+        session = ChatSession(endpoint="test")
+        session.image_base64 = PNG_B64
+        session.mime_type = "image/png"
+        session.messages.append({"role": "user", "content": "What is this?"})
+
+        content = session.get_conversation_for_api()[0]["content"]
+        self.assertEqual(content[0]["type"], "media")
+        self.assertEqual(content[0]["media"].base64_str(), PNG_B64)
+
+    def test_gemini_inline_data_from_media_and_data_url(self):
+        provider = GeminiNativeProvider()
+        messages = [{"role": "user", "content": [
+            {"type": "text", "text": "Compare"},
+            media_item(MediaPart.from_base64("image/png", PNG_B64)),
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{PNG_B64}"}}
+        ]}]
+        body = json.loads(provider.serialize_body(provider._build_request_body(messages, "gemini-2.5-flash", {}, False)))
+        parts = body["contents"][0]["parts"]
+        self.assertEqual(parts[1]["inline_data"], {"mime_type": "image/png", "data": PNG_B64})
+        self.assertEqual(parts[2]["inline_data"], {"mime_type": "image/jpeg", "data": PNG_B64})
+
+    def test_openai_audio_and_images(self):
+        provider = OpenAICompatibleProvider("custom", "http://fake.url/v1")
+        messages = [{"role": "user", "content": [
+            {"type": "text", "text": "Transcribe"},
+            {"type": "inline_data", "inline_data": {"mime_type": "audio/mpeg", "data": AUDIO_B64}},
+            media_item(MediaPart.from_base64("image/png", PNG_B64)),
+            {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{PNG_B64}", "detail": "low"}}
+        ]}]
+        body = json.loads(provider.serialize_body(provider._build_request_body(messages, "m", {}, False, streaming=False)))
+        content = body["messages"][0]["content"]
+        self.assertEqual(content[1], {"type": "input_audio", "input_audio": {"data": AUDIO_B64, "format": "mp3"}})
+        self.assertEqual(content[2]["image_url"]["url"], f"data:image/png;base64,{PNG_B64}")
+        self.assertEqual(content[3]["image_url"], {"url": f"data:image/png;base64,{PNG_B64}", "detail": "low"})
+
+
+if __name__ == '__main__':
+    unittest.main()
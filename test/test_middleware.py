@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for pipeline middleware: hook order, delta rewriting, short-circuiting
+a request, error isolation, loading stages from config and rebuilding them
+when their settings change.
+"""
+
+import unittest
+from unittest.mock import patch
+
+from src.middleware import Middleware, get_middleware_chain, get_middleware_stats, register_middleware
+from src.providers.base import ProviderResult, UsageData
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+
+class Recorder(Middleware):
+    """Records hook calls; upper-cases text and can answer requests"""
+
+    config_keys = ("test_answer",)
+
+    def __init__(self, config):
+        self.calls = []
+        self.answer = config.get("test_answer")
+
+    def before_request(self, ctx, request):
+        self.calls.append(("before", len(request.messages)))
+        request.messages = request.messages + [{"role": "system", "content": "added"}]
+        return self.answer
+
+    def on_delta(self, ctx, kind, content):
+        self.calls.append(("delta", kind))
+        return None if content == "drop" else content.upper()
+
+    def after_response(self, ctx):
+        self.calls.append(("after", ctx.response_text))
+
+    def on_error(self, ctx, error):
+        self.calls.append(("error", error))
+
+
+class Broken(Middleware):
+    def before_request(self, ctx, request):
+        raise RuntimeError("boom")
+
+    def after_response(self, ctx):
+        raise RuntimeError("boom")
+
+
+STAGES = {}
+
+
+def make_recorder(config):
+    STAGES["recorder"] = Recorder(config)
+    return STAGES["recorder"]
+
+
+class TestMiddleware(unittest.TestCase):
+    def setUp(self):
+        register_middleware("test_recorder", make_recorder)
+        register_middleware("test_broken", lambda config: Broken())
+
+    def tearDown(self):
+        get_middleware_chain({})
+
+    def stream(self, config, fake_stream):
+        texts = []
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        with patch('src.api_client.call_api_stream_unified', side_effect=fake_stream) as mock_stream:
+            RequestPipeline.execute_unified_stream(
+                ctx, [{"role": "user", "content": "hi"}],
+                dict(config, stream_coalesce_ms=0), {}, {}, StreamCallback(on_text=texts.append)
+            )
+        return ctx, texts, mock_stream
+
+    def test_hooks_around_stream(self):
+        def fake_stream(callback, messages, **kwargs):
+            callback("text", "hello ")
+            callback("text", "drop")
+            callback("text", "world")
+            return "hello world", None, None, None
+
+        config = {"pipeline_middleware": "test_broken, test_recorder, metrics"}
+        ctx, texts, mock_stream = self.stream(config, fake_stream)
+
+        self.assertEqual(len(mock_stream.call_args.kwargs["messages"]), 2)
+        self.assertEqual(texts, ["HELLO ", "WORLD"])
+        self.assertEqual(ctx.response_text, "HELLO WORLD")
+        self.assertEqual(STAGES["recorder"].calls,
+                         [("before", 1)] + [("delta", "text")] * 3 + [("after", "HELLO WORLD")])
+        stats = get_middleware_stats()
+        self.assertEqual(stats["stages"], ["test_broken", "test_recorder", "metrics"])
+        self.assertEqual(stats["metrics"]["endpoint/custom"]["requests"], 1)
+
+    def test_error_hook(self):
+        def fake_stream(callback, **kwargs):
+            callback("error", "upstream down")
+            return None, None, None, "upstream down"
+
+        ctx, _, _ = self.stream({"pipeline_middleware": "test_recorder"}, fake_stream)
+        self.assertEqual(STAGES["recorder"].calls[-1], ("error", "upstream down"))
+
+    def test_short_circuit(self):
+        answer = ProviderResult(success=True, content="cached", usage=UsageData(1, 2, 3))
+        config = {"pipeline_middleware": "test_recorder", "test_answer": answer}
+
+        ctx, texts, mock_stream = self.stream(config, None)
+        mock_stream.assert_not_called()
+        self.assertEqual(texts, ["CACHED"])
+        self.assertEqual((ctx.served_by, ctx.total_tokens), ("test_recorder", 3))
+
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m", streaming=False)
+        with patch('src.api_client.call_api_result') as mock_call:
+            RequestPipeline.execute_simple(ctx, [], config, {}, {})
+        mock_call.assert_not_called()
+        self.assertEqual((ctx.response_text, ctx.served_by), ("cached", "test_recorder"))
+
+    def test_chain_from_config(self):
+        self.assertFalse(get_middleware_chain({}))
+        chain = get_middleware_chain({"pipeline_middleware": "metrics, nope, src.middleware:MetricsMiddleware"})
+        self.assertEqual([name for name, _ in chain.stages], ["metrics", "src.middleware:MetricsMiddleware"])
+        self.assertIs(get_middleware_chain({"pipeline_middleware": chain.value}), chain)
+
+    def test_chain_rebuilt_for_stage_settings(self):
+        config = {"pipeline_middleware": "test_recorder, metrics", "test_answer": None}
+        chain = get_middleware_chain(config)
+        self.assertEqual(chain.config_keys, ("test_answer",))
+        self.assertIs(get_middleware_chain(dict(config, unrelated=1)), chain)
+
+        answer = ProviderResult(success=True, content="cached")
+        rebuilt = get_middleware_chain(dict(config, test_answer=answer))
+        self.assertIsNot(rebuilt, chain)
+        self.assertIs(STAGES["recorder"].answer, answer)
+
+
+if __name__ == '__main__':
+    unittest.main()
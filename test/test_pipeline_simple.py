@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for non-streaming pipeline requests: real usage, retries and thinking
+carried into RequestContext, and concurrent execute_batch.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.providers.base import ProviderResult, UsageData
+from src.request_pipeline import RequestOrigin, RequestPipeline, create_request_context
+
+
+def answer(content, thinking="", usage=None, retry_count=0):
+    return ProviderResult(success=True, content=content, thinking_content=thinking,
+                          usage=usage, retry_count=retry_count)
+
+
+class TestExecuteSimple(unittest.TestCase):
+    def run_simple(self, result, config=None):
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m", streaming=False)
+        with patch('src.api_client.call_api_result', return_value=result):
+            return RequestPipeline.execute_simple(
+                ctx, [{"role": "user", "content": "hi"}], config or {}, {}, {}
+            )
+
+    def test_real_usage_retries_and_thinking(self):
+        ctx = self.run_simple(answer(
+            "Hello", thinking="Hmm", retry_count=2,
+            usage=UsageData(prompt_tokens=12, completion_tokens=34, total_tokens=46)
+        ))
+        self.assertIsNone(ctx.error)
+        self.assertEqual(ctx.response_text, "Hello")
+        self.assertEqual(ctx.reasoning_text, "Hmm")
+        self.assertEqual(ctx.retry_count, 2)
+        self.assertEqual((ctx.input_tokens, ctx.output_tokens, ctx.total_tokens), (12, 34, 46))
+        self.assertFalse(ctx.estimated)
+
+    def test_thinking_output_modes_and_estimate(self):
+        ctx = self.run_simple(answer("Hello", thinking="Hmm "), {"thinking_output": "raw"})
+        self.assertEqual(ctx.response_text, "Hmm Hello")
+        self.assertTrue(ctx.estimated)
+        self.assertGreater(ctx.output_tokens, 0)
+
+        ctx = self.run_simple(answer("Hello", thinking="Hmm"), {"thinking_output": "filter"})
+        self.assertEqual((ctx.response_text, ctx.reasoning_text), ("Hello", ""))
+
+    def test_error_keeps_retry_count(self):
+        ctx = self.run_simple(ProviderResult(success=False, error="boom", retry_count=3))
+        self.assertEqual(ctx.error, "boom")
+        self.assertEqual(ctx.retry_count, 3)
+
+
+class TestExecuteBatch(unittest.TestCase):
+    def test_runs_concurrently_in_order(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_call(provider, messages, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            text = messages[0]["content"]
+            if text == "bad":
+                return ProviderResult(success=False, error="bad input")
+            return answer(text.upper(), usage=UsageData(prompt_tokens=1, completion_tokens=2, total_tokens=3))
+
+        template = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m",
+                                          streaming=False, session_id="s1")
+        inputs = ["a", "b", "bad", "c"]
+        with patch('src.api_client.call_api_result', side_effect=fake_call):
+            contexts = RequestPipeline.execute_batch(
+                template, [[{"role": "user", "content": t}] for t in inputs],
+                {"batch_concurrency": 3}, {}, {}
+            )
+
+        self.assertEqual([c.response_text for c in contexts], ["A", "B", "", "C"])
+        self.assertEqual([c.error for c in contexts], [None, None, "bad input", None])
+        self.assertEqual(len({c.request_id for c in contexts}), 4)
+        self.assertEqual({c.session_id for c in contexts}, {"s1"})
+        self.assertEqual(peak[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Tests for provider health tracking, circuit breaking and the pipeline
+fallback chain.
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.key_manager import KeyManager
+from src.providers.health import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, FAILURE_RATE_LIMITED, FAILURE_SERVER_ERROR,
+    CircuitBreaker, get_health_tracker, parse_fallback_chain
+)
+from src.providers.base import ProviderResult
+from src.providers.openai_compatible import OpenAICompatibleProvider
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+
+def error_response(status_code):
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = "upstream error"
+    response.headers = {}
+    return response
+
+
+def failure(error):
+    return ProviderResult(success=False, error=error)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_probes_once(self):
+        breaker = CircuitBreaker(failure_threshold=3, open_seconds=10)
+        self.assertFalse(breaker.record_failure(0))
+        self.assertFalse(breaker.record_failure(0))
+        self.assertTrue(breaker.record_failure(0))
+        self.assertEqual(breaker.state, CIRCUIT_OPEN)
+        self.assertFalse(breaker.allow(5))
+
+        self.assertTrue(breaker.allow(10))  # Half-open probe
+        self.assertEqual(breaker.state, CIRCUIT_HALF_OPEN)
+        self.assertFalse(breaker.allow(10))  # Only one probe at a time
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CIRCUIT_CLOSED)
+        self.assertTrue(breaker.allow(10))
+
+    def test_failed_probe_doubles_open_time(self):
+        breaker = CircuitBreaker(failure_threshold=1, open_seconds=10)
+        breaker.record_failure(0)
+        self.assertTrue(breaker.allow(10))
+        self.assertTrue(breaker.record_failure(10))
+        self.assertEqual(breaker.open_until, 30)
+
+
+class TestHealthTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = get_health_tracker()
+        self.tracker.reset()
+        self.tracker.configure({"circuit_failure_threshold": 2})
+
+    def tearDown(self):
+        self.tracker.reset()
+        self.tracker.configure({})
+
+    def test_rate_limits_do_not_trip_breaker(self):
+        for _ in range(5):
+            self.assertFalse(self.tracker.record_failure("google", "m", FAILURE_RATE_LIMITED))
+        self.assertTrue(self.tracker.is_available("google", "m"))
+        self.tracker.record_failure("google", "m", FAILURE_SERVER_ERROR)
+        self.assertTrue(self.tracker.record_failure("google", "m", FAILURE_SERVER_ERROR))
+        self.assertFalse(self.tracker.is_available("google", "m"))
+
+    def test_stats(self):
+        self.tracker.record_success("custom", "m", latency=0.5, ttft=0.2)
+        self.tracker.record_failure("custom", "m", FAILURE_SERVER_ERROR)
+        stats = self.tracker.get_stats()["custom/m"]
+        self.assertEqual(stats["success_rate"], 0.5)
+        self.assertEqual(stats["failures"], {FAILURE_SERVER_ERROR: 1})
+        self.assertEqual(stats["ttft"]["p50"], 0.2)
+        self.assertEqual(stats["circuit"], CIRCUIT_CLOSED)
+
+    def test_parse_fallback_chain(self):
+        self.assertEqual(parse_fallback_chain("google, openrouter,custom"), ["google", "openrouter", "custom"])
+        self.assertEqual(parse_fallback_chain("google -> custom"), ["google", "custom"])
+        self.assertEqual(parse_fallback_chain(None), [])
+
+    @patch('requests.Session.post')
+    def test_open_circuit_fails_fast(self, mock_post):
+        mock_post.return_value = error_response(503)
+        provider = OpenAICompatibleProvider(
+            "custom", "http://fake.url/v1", KeyManager(["k1"], "custom"),
+            {"max_retries": 5, "retry_delay": 0.01}
+        )
+        messages = [{"role": "user", "content": "hi"}]
+
+        result = provider.generate_stream(messages, "m", {}, lambda kind, content: None)
+        self.assertFalse(result.success)
+        self.assertEqual(mock_post.call_count, 2)  # Stopped retrying once the circuit opened
+
+        errors = []
+        start = time.monotonic()
+        result = provider.generate_stream(
+            messages, "m", {}, lambda kind, content: errors.append(content) if kind.value == "error" else None
+        )
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertFalse(result.success)
+        self.assertIn("Circuit open", result.error)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(len(errors), 1)
+
+
+class TestFallbackChain(unittest.TestCase):
+    def setUp(self):
+        get_health_tracker().reset()
+        key_manager = MagicMock()
+        key_manager.has_keys.return_value = True
+        self.key_managers = {"google": key_manager, "openrouter": key_manager}
+        self.config = {
+            "provider_fallback_chain": "google, openrouter, custom",
+            "google_model": "g-model",
+            "openrouter_model": "or-model",
+            "custom_model": "c-model",  # No keys: not a candidate
+        }
+
+    def tearDown(self):
+        get_health_tracker().reset()
+
+    def make_ctx(self):
+        return create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "google", "g-model", streaming=False)
+
+    def test_candidates(self):
+        self.assertEqual(
+            RequestPipeline.fallback_candidates(self.make_ctx(), self.config, self.key_managers),
+            [("google", "g-model"), ("openrouter", "or-model")]
+        )
+
+    @patch('src.api_client.call_api_result')
+    def test_failure_falls_through(self, mock_call):
+        mock_call.side_effect = [failure("API error (503)"), ProviderResult(success=True, content="answer")]
+        ctx = RequestPipeline.execute_simple(self.make_ctx(), [], self.config, {}, self.key_managers)
+        self.assertEqual(ctx.response_text, "answer")
+        self.assertIsNone(ctx.error)
+        self.assertEqual((ctx.provider, ctx.model), ("openrouter", "or-model"))
+        self.assertEqual(ctx.fallbacks, ["google"])
+        self.assertEqual(mock_call.call_args.kwargs["model_override"], "or-model")
+
+    @patch('src.api_client.call_api_result')
+    def test_open_circuit_is_skipped(self, mock_call):
+        tracker = get_health_tracker()
+        for _ in range(tracker.failure_threshold):
+            tracker.record_failure("google", "g-model", FAILURE_SERVER_ERROR)
+        mock_call.return_value = ProviderResult(success=True, content="answer")
+        ctx = RequestPipeline.execute_simple(self.make_ctx(), [], self.config, {}, self.key_managers)
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertEqual(mock_call.call_args.kwargs["provider"], "openrouter")
+        self.assertEqual(ctx.fallbacks, ["google"])
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_stream_errors_held_until_final(self, mock_stream):
+        def fake_stream(provider_type, callback, **kwargs):
+            if provider_type == "google":
+                callback("error", "google down")
+                return None, None, None, "google down"
+            callback("text", "hello")
+            return "hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        errors, texts = [], []
+        ctx = self.make_ctx()
+        ctx.streaming = True
+        ctx = RequestPipeline.execute_unified_stream(
+            ctx, [], dict(self.config, stream_coalesce_ms=0), {}, self.key_managers,
+            StreamCallback(on_text=texts.append, on_error=errors.append)
+        )
+        self.assertEqual(texts, ["hello"])
+        self.assertEqual(errors, [])
+        self.assertIsNone(ctx.error)
+        self.assertEqual(ctx.provider, "openrouter")
+
+    @patch('src.api_client.call_api_result')
+    def test_last_error_is_reported(self, mock_call):
+        mock_call.side_effect = [failure("first"), failure("second")]
+        ctx = RequestPipeline.execute_simple(self.make_ctx(), [], self.config, {}, self.key_managers)
+        self.assertEqual(ctx.error, "second")
+        self.assertEqual(ctx.fallbacks, ["google"])
+
+
+if __name__ == '__main__':
+    unittest.main()
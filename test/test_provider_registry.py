@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Tests for the provider instance registry in api_client.
+"""
+
+import unittest
+
+from src.api_client import ProviderRegistry
+from src.key_manager import KeyManager
+from src.providers.gemini_native import GeminiNativeProvider
+from src.providers.openai_compatible import OpenAICompatibleProvider
+
+
+class TestProviderRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ProviderRegistry()
+        self.config = {"custom_url": "http://fake.url/v1", "request_timeout": 30}
+
+    def test_reuses_instances(self):
+        """Repeated lookups return the same provider instance"""
+        km = KeyManager(["k1"], "google")
+        first = self.registry.get("google", km, self.config)
+        second = self.registry.get("google", km, self.config)
+        self.assertIsInstance(first, GeminiNativeProvider)
+        self.assertIs(first, second)
+
+    def test_config_change_invalidates(self):
+        """Changing provider settings yields a fresh instance"""
+        km = KeyManager(["k1"], "custom")
+        first = self.registry.get("custom", km, self.config)
+        changed = dict(self.config, request_timeout=60)
+        second = self.registry.get("custom", km, changed)
+        self.assertIsInstance(second, OpenAICompatibleProvider)
+        self.assertIsNot(first, second)
+        # Stale version is dropped rather than kept alongside
+        self.assertEqual(len(self.registry), 1)
+
+    def test_key_list_change_invalidates(self):
+        """Hot-reloaded API keys yield a fresh instance"""
+        km = KeyManager(["k1"], "openrouter")
+        first = self.registry.get("openrouter", km, self.config)
+        km.keys = ["k1", "k2"]
+        second = self.registry.get("openrouter", km, self.config)
+        self.assertIsNot(first, second)
+
+    def test_explicit_invalidate(self):
+        km = KeyManager(["k1"], "google")
+        first = self.registry.get("google", km, self.config)
+        self.registry.invalidate("google")
+        self.assertIsNot(first, self.registry.get("google", km, self.config))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the queue-backed request log: JSONL output, pluggable renderers
+and dropping records instead of blocking when the writer falls behind.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.request_log import EVENT_COMPLETE, EVENT_START, get_request_log, register_renderer
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+
+class BlockingRenderer:
+    """Renderer that holds the writer thread until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.records = []
+
+    def render(self, record):
+        self.release.wait(5)
+        self.records.append(record)
+
+    def close(self):
+        self.release.set()
+
+
+class TestRequestLog(unittest.TestCase):
+    def setUp(self):
+        self.log = get_request_log()
+
+    def tearDown(self):
+        self.log.configure({})
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_jsonl_records(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("text", "hello")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        fd, path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        config = {"request_log_format": "jsonl", "request_log_file": path, "stream_coalesce_ms": 0}
+
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        RequestPipeline.execute_unified_stream(ctx, [], config, {}, {}, StreamCallback())
+        self.assertTrue(self.log.flush())
+        self.log.configure({})  # Closes the file
+
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["event"] for r in records], [EVENT_START, EVENT_COMPLETE])
+        self.assertEqual({r["request_id"] for r in records}, {ctx.request_id})
+        complete = records[1]
+        self.assertEqual(complete["chars"], 5)
+        self.assertEqual(complete["tokens"], {"input": 3, "output": 2, "total": 5, "estimated": False})
+        self.assertIsNone(complete["error"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        renderer = BlockingRenderer()
+        register_renderer("test_blocking", lambda config: renderer)
+        self.log.configure({"request_log_format": "test_blocking", "request_log_queue_size": 2})
+        dropped = self.log.dropped
+
+        start = time.monotonic()
+        for i in range(10):
+            self.log.emit({"event": EVENT_START, "n": i})
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertGreater(self.log.dropped - dropped, 0)
+
+        renderer.release.set()
+        self.assertTrue(self.log.flush())
+        self.assertEqual(renderer.records[0]["n"], 0)
+        self.assertLessEqual(len(renderer.records), 3)
+
+    def test_off_skips_records(self):
+        self.log.configure({"request_log_format": "off"})
+        written = self.log.written
+        self.log.emit({"event": EVENT_START})
+        self.assertTrue(self.log.flush())
+        self.assertEqual(self.log.written, written)
+        self.assertEqual(self.log.get_stats()["format"], "off")
+
+
+if __name__ == '__main__':
+    unittest.main()
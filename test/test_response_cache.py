@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests for the exact-match response cache: canonical keys, pipeline hits for
+streaming and non-streaming requests, and the disk tier's TTL / size limits.
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.middleware import get_middleware_chain, get_middleware_stats
+from src.providers.base import ProviderResult, UsageData
+from src.providers.media import MediaPart
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+from src.response_cache import ResponseCache, cache_key
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+def image_messages(image, text="Extract the text"):
+    return [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": image}} if isinstance(image, str)
+        else {"type": "media", "media": image},
+        {"type": "text", "text": text},
+    ]}]
+
+
+class TestCacheKey(unittest.TestCase):
+    def test_media_hashed_by_bytes(self):
+        data_url = "data:image/png;base64," + base64.b64encode(PNG).decode()
+        key = cache_key("google", "m", image_messages(data_url), {"temperature": 0}, {})
+        self.assertEqual(key, cache_key("google", "m", image_messages(MediaPart.from_bytes("image/png", PNG)),
+                                        {"temperature": 0}, {}))
+        self.assertNotEqual(key, cache_key("google", "m", image_messages(MediaPart.from_bytes("image/png", PNG[:-1])),
+                                           {"temperature": 0}, {}))
+        self.assertNotEqual(key, cache_key("google", "m2", image_messages(data_url), {"temperature": 0}, {}))
+        self.assertNotEqual(key, cache_key("google", "m", image_messages(data_url), {"temperature": 1}, {}))
+        self.assertNotEqual(key, cache_key("google", "m", image_messages(data_url, "Describe"), {"temperature": 0}, {}))
+
+
+class TestPipelineCache(unittest.TestCase):
+    CONFIG = {"pipeline_middleware": "cache", "stream_coalesce_ms": 0}
+
+    def tearDown(self):
+        get_middleware_chain({})
+
+    def simple(self, text, cache=True, config=None):
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False, cache=cache)
+        return RequestPipeline.execute_simple(ctx, [{"role": "user", "content": text}],
+                                              config or self.CONFIG, {}, {})
+
+    @patch('src.api_client.call_api_result')
+    def test_simple_hit(self, mock_call):
+        mock_call.return_value = ProviderResult(
+            success=True, content="answer", thinking_content="why",
+            usage=UsageData(prompt_tokens=10, completion_tokens=5, total_tokens=15)
+        )
+        first = self.simple("same")
+        second = self.simple("same")
+        self.simple("other")
+        self.simple("same", cache=None)  # No per-action setting, response_cache_default off
+
+        self.assertEqual(mock_call.call_count, 3)
+        self.assertIsNone(first.served_by)
+        self.assertEqual(second.served_by, "cache")
+        self.assertEqual((second.response_text, second.reasoning_text, second.total_tokens),
+                         ("answer", "why", 15))
+        stats = get_middleware_stats()["cache"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (1, 2, 2))
+
+        self.simple("unmarked", cache=None, config=dict(self.CONFIG, response_cache_default=True))
+        self.assertEqual(get_middleware_stats()["cache"]["stores"], 3)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_stream_replay(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("text", "Hel")
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        runs = []
+        for _ in range(2):
+            texts = []
+            ctx = create_request_context(RequestOrigin.POPUP_PROMPT, "google", "m", cache=True)
+            RequestPipeline.execute_unified_stream(ctx, [{"role": "user", "content": "hi"}], self.CONFIG, {}, {},
+                                                   StreamCallback(on_text=texts.append))
+            runs.append((ctx, texts))
+
+        self.assertEqual(mock_stream.call_count, 1)
+        ctx, texts = runs[1]
+        self.assertEqual(texts, ["Hello"])
+        self.assertEqual((ctx.served_by, ctx.output_tokens), ("cache", 2))
+
+    @patch('src.api_client.call_api_result')
+    def test_failures_not_stored(self, mock_call):
+        mock_call.return_value = ProviderResult(success=False, error="boom")
+        self.simple("same")
+        self.simple("same")
+        self.assertEqual(mock_call.call_count, 2)
+
+
+class TestDiskTier(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.config = {"response_cache_dir": self.dir, "response_cache_ttl": 60}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_survives_restart_and_expires(self):
+        ResponseCache(self.config).put("k1", {"content": "cached"})
+        cache = ResponseCache(self.config)
+        self.assertEqual(cache.get("k1"), {"content": "cached"})
+        self.assertEqual(cache.disk_hits, 1)
+
+        with patch('src.response_cache.time.time', return_value=os.path.getmtime(
+                os.path.join(self.dir, "k1.json")) + 120):
+            self.assertIsNone(ResponseCache(self.config).get("k1"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "k1.json")))
+
+    def test_size_limit(self):
+        cache = ResponseCache(dict(self.config, response_cache_disk_mb=0.001, response_cache_size=0))
+        for i in range(5):
+            cache.put(f"k{i}", {"content": "x" * 300})
+        self.assertLessEqual(cache.get_stats()["disk_bytes"], 1024)
+        self.assertIsNone(cache.get("k0"))
+        self.assertEqual(cache.get("k4"), {"content": "x" * 300})
+        self.assertEqual(len(os.listdir(self.dir)), cache.get_stats()["disk_entries"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for the iterative retry loop: exponential backoff, jitter and Retry-After.
+"""
+
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.key_manager import KeyManager
+from src.providers.base import RetryReason, parse_retry_after
+from src.providers.openai_compatible import OpenAICompatibleProvider
+
+
+def _error_response(status_code, text="error", headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = text
+    response.headers = headers or {}
+    return response
+
+
+def _ok_response():
+    response = MagicMock()
+    response.status_code = 200
+    response.json.return_value = {
+        "choices": [{"message": {"content": "ok"}}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+    return response
+
+
+class TestRetryBackoff(unittest.TestCase):
+    def setUp(self):
+        self.config = {"max_retries": 3, "retry_delay": 2, "retry_max_delay": 5}
+        self.provider = OpenAICompatibleProvider(
+            "custom", "http://fake.url/v1", KeyManager(["k1"], "custom"), self.config
+        )
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after({"Retry-After": "7"}), 7.0)
+        gemini_body = '{"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12s"}]}}'
+        self.assertEqual(parse_retry_after({}, gemini_body), 12.0)
+        self.assertEqual(parse_retry_after({}, gemini_body[:90] + '"retryDelay": "3s"'), 3.0)
+        self.assertIsNone(parse_retry_after({}, "plain error"))
+
+    def test_backoff_grows_and_is_capped(self):
+        """Delay doubles per attempt with equal jitter, capped at retry_max_delay"""
+        for retry_count, (low, high) in enumerate([(1, 2), (2, 4), (2.5, 5), (2.5, 5)]):
+            delay = self.provider.get_retry_delay(RetryReason.SERVER_ERROR, retry_count)
+            self.assertGreaterEqual(delay, low)
+            self.assertLessEqual(delay, high)
+
+    def test_retry_after_only_applies_to_same_key(self):
+        same_key = self.provider.get_retry_delay(RetryReason.RATE_LIMITED, 0, retry_after=20)
+        rotated = self.provider.get_retry_delay(RetryReason.RATE_LIMITED, 0, retry_after=20, rotated=True)
+        self.assertEqual(same_key, 20)
+        self.assertEqual(rotated, 0)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_rate_limit_honors_retry_after(self, mock_post, mock_sleep):
+        """Single-key 429 waits for Retry-After, and the body is sent unchanged"""
+        mock_post.side_effect = [
+            _error_response(429, "slow down", {"Retry-After": "4"}),
+            _ok_response()
+        ]
+        result = self.provider.generate([{"role": "user", "content": "hi"}], "m", {})
+
+        self.assertTrue(result.success)
+        self.assertEqual(result.retry_count, 1)
+        mock_sleep.assert_called_once_with(4.0)
+        first, second = mock_post.call_args_list
+        self.assertIs(first.kwargs["data"], second.kwargs["data"])
+        # The 429 cooled the key down and the request's lease was released
+        stats = self.provider.key_manager.get_stats()[0]
+        self.assertEqual(stats["rate_limited"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_deadline_stops_retries(self, mock_post, mock_sleep):
+        self.config["retry_deadline"] = 1
+        mock_post.return_value = _error_response(500, "boom")
+        result = self.provider.generate([{"role": "user", "content": "hi"}], "m", {})
+
+        self.assertFalse(result.success)
+        self.assertEqual(mock_post.call_count, 1)
+        mock_sleep.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tests for in-flight request coalescing: followers share the leader's upstream
+call and deltas (with replay of missed ones), take over when the leader
+is cancelled before producing anything, and are released when the leader
+raises.
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from src.cancellation import CancellationToken
+from src.middleware import get_middleware_chain, get_middleware_stats
+from src.providers.base import ProviderResult, UsageData
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+from src.singleflight import LEADER_CANCELLED_ERROR
+
+CONFIG = {"pipeline_middleware": "singleflight", "stream_coalesce_ms": 0}
+
+
+def wait_for(predicate, timeout=5.0):
+    end = time.time() + timeout
+    while not predicate():
+        if time.time() > end:
+            raise AssertionError("condition not reached")
+        time.sleep(0.005)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        get_middleware_chain({})  # Fresh stage (and stats) per test
+
+    def tearDown(self):
+        get_middleware_chain({})
+
+    def stream_in_thread(self, runs, text="hi", token=None):
+        def run():
+            texts = []
+            ctx = create_request_context(RequestOrigin.POPUP_PROMPT, "google", "m")
+            try:
+                RequestPipeline.execute_unified_stream(ctx, [{"role": "user", "content": text}], CONFIG, {}, {},
+                                                       StreamCallback(on_text=texts.append), cancel_token=token)
+            except RuntimeError:
+                pass
+            runs.append((ctx, texts))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_followers_share_stream(self, mock_stream):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            callback("text", "Hel")
+            started.set()
+            release.wait(5)
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        runs = []
+        threads = [self.stream_in_thread(runs)]
+        self.assertTrue(started.wait(5))
+        threads += [self.stream_in_thread(runs) for _ in range(2)]
+        threads.append(self.stream_in_thread(runs, text="other"))
+        wait_for(lambda: get_middleware_stats()["singleflight"]["followers"] == 2)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(mock_stream.call_count, 2)  # Leader and "other"
+        self.assertEqual(len(runs), 4)
+        for ctx, texts in runs:
+            self.assertEqual("".join(texts), "Hello")
+            self.assertEqual(ctx.output_tokens, 2)
+        self.assertEqual(sorted(ctx.served_by or "" for ctx, _ in runs), ["", "", "singleflight", "singleflight"])
+        stats = get_middleware_stats()["singleflight"]
+        self.assertEqual((stats["leaders"], stats["upstream_calls_saved"], stats["in_flight"]), (2, 2, 0))
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_leader_cancelled(self, mock_stream):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            if mock_stream.call_count == 1:
+                started.set()
+                release.wait(5)
+                return None, None, None, "Request cancelled"
+            callback("text", "own")
+            return "own", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        token = CancellationToken()
+        runs = []
+        leader = self.stream_in_thread(runs, token=token)
+        self.assertTrue(started.wait(5))
+        follower = self.stream_in_thread(runs)
+        wait_for(lambda: get_middleware_stats()["singleflight"]["followers"] == 1)
+        token.cancel()
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        ctx, texts = next(run for run in runs if run[0].served_by is None and run[1])
+        self.assertEqual((texts, ctx.error), (["own"], None))
+        self.assertEqual(mock_stream.call_count, 2)
+        stats = get_middleware_stats()["singleflight"]
+        self.assertEqual((stats["takeovers"], stats["upstream_calls_saved"]), (1, 0))
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_leader_cancelled_mid_stream(self, mock_stream):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            callback("text", "partial")
+            started.set()
+            release.wait(5)
+            return "partial", None, None, "Request cancelled"
+
+        mock_stream.side_effect = fake_stream
+        token = CancellationToken()
+        runs = []
+        leader = self.stream_in_thread(runs, token=token)
+        self.assertTrue(started.wait(5))
+        follower = self.stream_in_thread(runs)
+        wait_for(lambda: get_middleware_stats()["singleflight"]["followers"] == 1)
+        token.cancel()
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        ctx, texts = next(run for run in runs if run[0].served_by == "singleflight")
+        self.assertEqual((texts, ctx.error), (["partial"], LEADER_CANCELLED_ERROR))
+        self.assertEqual(mock_stream.call_count, 1)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_leader_exception_releases_followers(self, mock_stream):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            callback("text", "partial")
+            started.set()
+            release.wait(5)
+            raise RuntimeError("boom")
+
+        mock_stream.side_effect = fake_stream
+        runs = []
+        leader = self.stream_in_thread(runs)
+        self.assertTrue(started.wait(5))
+        follower = self.stream_in_thread(runs)
+        wait_for(lambda: get_middleware_stats()["singleflight"]["followers"] == 1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(len(runs), 2)
+        for ctx, texts in runs:
+            self.assertEqual((texts, ctx.error), (["partial"], "Unexpected error: boom"))
+        self.assertEqual(get_middleware_stats()["singleflight"]["in_flight"], 0)
+
+    @patch('src.api_client.call_api_result')
+    def test_simple_leader_exception(self, mock_call):
+        mock_call.side_effect = [RuntimeError("boom"), ProviderResult(success=True, content="answer")]
+        messages = [{"role": "user", "content": "same"}]
+
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False)
+        with self.assertRaises(RuntimeError):
+            RequestPipeline.execute_simple(ctx, messages, CONFIG, {}, {})
+        self.assertEqual(ctx.error, "Unexpected error: boom")
+        self.assertEqual(get_middleware_stats()["singleflight"]["in_flight"], 0)
+
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False)
+        ctx = RequestPipeline.execute_simple(ctx, messages, CONFIG, {}, {})
+        self.assertEqual((ctx.response_text, ctx.served_by), ("answer", None))
+
+    @patch('src.api_client.call_api_result')
+    def test_simple_follower_cancelled(self, mock_call):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_call(**kwargs):
+            started.set()
+            release.wait(5)
+            return ProviderResult(success=True, content="answer")
+
+        mock_call.side_effect = fake_call
+        messages = [{"role": "user", "content": "same"}]
+        leader = threading.Thread(target=lambda: RequestPipeline.execute_simple(
+            create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False),
+            messages, CONFIG, {}, {}
+        ))
+        leader.start()
+        self.assertTrue(started.wait(5))
+
+        token = CancellationToken()
+        token.cancel("client disconnected")
+        ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False)
+        ctx = RequestPipeline.execute_simple(ctx, messages, CONFIG, {}, {}, cancel_token=token)
+        release.set()
+        leader.join(5)
+
+        self.assertTrue(ctx.cancelled)
+        self.assertEqual((ctx.served_by, mock_call.call_count), ("singleflight", 1))
+
+    @patch('src.api_client.call_api_result')
+    def test_simple_followers(self, mock_call):
+        started, release = threading.Event(), threading.Event()
+
+        def fake_call(**kwargs):
+            started.set()
+            release.wait(5)
+            return ProviderResult(success=True, content="answer",
+                                  usage=UsageData(prompt_tokens=10, completion_tokens=5, total_tokens=15))
+
+        mock_call.side_effect = fake_call
+        results = []
+
+        def run():
+            ctx = create_request_context(RequestOrigin.ENDPOINT_OCR, "google", "m", streaming=False)
+            results.append(RequestPipeline.execute_simple(ctx, [{"role": "user", "content": "same"}],
+                                                          CONFIG, {}, {}))
+
+        threads = [threading.Thread(target=run)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        threads.append(threading.Thread(target=run))
+        threads[1].start()
+        wait_for(lambda: get_middleware_stats()["singleflight"]["followers"] == 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertEqual([(ctx.response_text, ctx.total_tokens) for ctx in results], [("answer", 15)] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental byte-level SSE decoder.
+"""
+
+import unittest
+
+from src.providers.sse import SSEDecoder, iter_sse_chunks
+
+
+def _decode(chunks):
+    return list(iter_sse_chunks(chunks))
+
+
+class TestSSEDecoder(unittest.TestCase):
+    def test_single_line_events(self):
+        events = _decode([b'data: {"a": 1}\n\ndata: [DONE]\n\n'])
+        self.assertEqual([e.data for e in events], [b'{"a": 1}', b"[DONE]"])
+        self.assertEqual(events[0].json(), {"a": 1})
+        self.assertTrue(events[1].is_done)
+
+    def test_events_split_across_chunks(self):
+        """Byte-at-a-time delivery yields the same events, including split UTF-8"""
+        body = 'data: {"t": "héllo 👋"}\r\n\r\ndata: {"t": "x"}\r\n\r\n'.encode("utf-8")
+        events = _decode([body[i:i + 1] for i in range(len(body))])
+        self.assertEqual([e.json()["t"] for e in events], ["héllo 👋", "x"])
+
+    def test_multiline_data_and_fields(self):
+        body = b'event: message\nid: 7\ndata: {"a":\ndata: 2}\n\n'
+        event, = _decode([body])
+        self.assertEqual(event.event, "message")
+        self.assertEqual(event.id, "7")
+        self.assertEqual(event.data, b'{"a":\n2}')
+        self.assertEqual(event.json(), {"a": 2})
+
+    def test_comments_and_empty_events_ignored(self):
+        body = b": OPENROUTER PROCESSING\n\n:keep-alive\n\nretry: 100\n\ndata:x\n\n"
+        events = _decode([body])
+        self.assertEqual([e.data for e in events], [b"x"])
+
+    def test_trailing_event_flushed(self):
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b'data: {"last": true}\n'), [])
+        event, = decoder.flush()
+        self.assertEqual(event.json(), {"last": True})
+        self.assertEqual(decoder.flush(), [])
+
+    def test_cr_at_chunk_boundary(self):
+        """A CRLF split across chunks is one line ending, not two"""
+        events = _decode([b"data: a\r", b"\ndata: b\r", b"\n\r", b"\n"])
+        self.assertEqual([e.data for e in events], [b"a\nb"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,13 @@ from src.providers.openai_compatible import OpenAICompatibleProvider, CallbackTy
 from src.providers.gemini_native import GeminiNativeProvider
 from src.key_manager import KeyManager
 
+
+def sse_body(lines, chunk_size=7):
+    """Encode SSE data lines as a byte stream split into small chunks"""
+    body = "".join(line + "\n\n" for line in lines).encode("utf-8")
+    return [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+
 class TestStreamingRetry(unittest.TestCase):
     def setUp(self):
         self.key_manager = MagicMock(spec=KeyManager)
@@ -29,7 +36,7 @@ class TestStreamingRetry(unittest.TestCase):
             }
         }
         
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')  # Mock sleep to run tests fast
     def test_openai_429_retry(self, mock_sleep, mock_post):
         """Test retry on 429 Rate Limit"""
@@ -42,10 +49,10 @@ class TestStreamingRetry(unittest.TestCase):
         
         mock_response_200 = MagicMock()
         mock_response_200.status_code = 200
-        mock_response_200.iter_lines.return_value = [
+        mock_response_200.iter_content.return_value = sse_body([
             'data: {"choices": [{"delta": {"content": "Success"}}]}',
             'data: [DONE]'
-        ]
+        ])
         
         mock_post.side_effect = [mock_response_429, mock_response_200]
         
@@ -69,7 +76,7 @@ class TestStreamingRetry(unittest.TestCase):
         # Sleep should NOT be called for rate limits (immediate retry)
         mock_sleep.assert_not_called()
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_openai_empty_response_retry(self, mock_sleep, mock_post):
         """Test retry on empty response (0 tokens)"""
@@ -79,18 +86,18 @@ class TestStreamingRetry(unittest.TestCase):
         mock_response_empty = MagicMock()
         mock_response_empty.status_code = 200
         # Stream finishes immediately without content
-        mock_response_empty.iter_lines.return_value = [
+        mock_response_empty.iter_content.return_value = sse_body([
             'data: {"usage": {"completion_tokens": 0}}',
             'data: [DONE]'
-        ]
+        ])
         
         mock_response_valid = MagicMock()
         mock_response_valid.status_code = 200
-        mock_response_valid.iter_lines.return_value = [
+        mock_response_valid.iter_content.return_value = sse_body([
             'data: {"choices": [{"delta": {"content": "Valid"}}]}',
             'data: {"usage": {"completion_tokens": 5}}',
             'data: [DONE]'
-        ]
+        ])
         
         mock_post.side_effect = [mock_response_empty, mock_response_valid]
         
@@ -109,7 +116,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(result.retry_count, 1)
         self.key_manager.rotate_key.assert_called() # Should rotate on empty response
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_gemini_network_error_retry(self, mock_sleep, mock_post):
         """Test retry on network error"""
@@ -119,9 +126,9 @@ class TestStreamingRetry(unittest.TestCase):
         mock_response_success = MagicMock()
         mock_response_success.status_code = 200
         # Gemini format
-        mock_response_success.iter_lines.return_value = [
+        mock_response_success.iter_content.return_value = sse_body([
             'data: {"candidates": [{"content": {"parts": [{"text": "Gemini Success"}]}}]}',
-        ]
+        ])
         
         mock_post.side_effect = [requests.exceptions.ConnectionError("Network down"), mock_response_success]
         
@@ -140,7 +147,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(result.retry_count, 1)
         self.key_manager.rotate_key.assert_called() # Should rotate on network error
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_openai_thinking_extraction_streaming(self, mock_sleep, mock_post):
         """Test thinking content extraction from OpenAI-compatible streaming"""
@@ -149,13 +156,13 @@ class TestStreamingRetry(unittest.TestCase):
         # Mock streaming response with reasoning_content
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.iter_lines.return_value = [
+        mock_response.iter_content.return_value = sse_body([
             'data: {"choices": [{"delta": {"reasoning_content": "Let me think..."}}]}',
             'data: {"choices": [{"delta": {"reasoning_content": " this is complex"}}]}',
             'data: {"choices": [{"delta": {"content": "Final answer"}}]}',
             'data: {"usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}}',
             'data: [DONE]'
-        ]
+        ])
         
         mock_post.return_value = mock_response
         
@@ -191,7 +198,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertIsNotNone(callback_data[CallbackType.USAGE])
         self.assertEqual(result.usage.completion_tokens, 20)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_openai_thinking_extraction_nonstreaming(self, mock_sleep, mock_post):
         """Test thinking content extraction from OpenAI-compatible non-streaming"""
@@ -230,7 +237,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(result.usage.prompt_tokens, 15)
         self.assertEqual(result.usage.completion_tokens, 25)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_gemini_thinking_extraction_streaming(self, mock_sleep, mock_post):
         """Test thinking content extraction from Gemini native streaming"""
@@ -239,12 +246,12 @@ class TestStreamingRetry(unittest.TestCase):
         # Mock Gemini streaming with thought parts
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.iter_lines.return_value = [
+        mock_response.iter_content.return_value = sse_body([
             'data: {"candidates": [{"content": {"parts": [{"text": "Analyzing...", "thought": true}]}}]}',
             'data: {"candidates": [{"content": {"parts": [{"text": " considering factors", "thought": true}]}}]}',
             'data: {"candidates": [{"content": {"parts": [{"text": "Based on analysis: success"}]}}]}',
             'data: {"usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 18, "totalTokenCount": 30}}'
-        ]
+        ])
         
         mock_post.return_value = mock_response
         
@@ -276,7 +283,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(callback_data[CallbackType.TEXT], ["Based on analysis: success"])
         self.assertEqual(result.usage.completion_tokens, 18)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_gemini_thinking_extraction_nonstreaming(self, mock_sleep, mock_post):
         """Test thinking content extraction from Gemini native non-streaming"""
@@ -317,7 +324,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(result.usage.prompt_tokens, 20)
         self.assertEqual(result.usage.completion_tokens, 30)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_thinking_config_in_request_body_openai(self, mock_sleep, mock_post):
         """Verify thinking config is added to OpenAI request body when enabled"""
@@ -330,7 +337,7 @@ class TestStreamingRetry(unittest.TestCase):
         
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.iter_lines.return_value = ['data: [DONE]']
+        mock_response.iter_content.return_value = sse_body(['data: [DONE]'])
         mock_post.return_value = mock_response
         
         provider.generate_stream(
@@ -343,13 +350,13 @@ class TestStreamingRetry(unittest.TestCase):
         
         # Check the request body sent to the API
         call_args = mock_post.call_args
-        request_body = call_args.kwargs['json']
+        request_body = json.loads(call_args.kwargs['data'])
         
         # Verify reasoning_effort is included
         self.assertIn("reasoning_effort", request_body)
         self.assertEqual(request_body["reasoning_effort"], "high")
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_thinking_config_in_request_body_gemini(self, mock_sleep, mock_post):
         """Verify thinkingConfig is added to Gemini request body when enabled"""
@@ -360,7 +367,7 @@ class TestStreamingRetry(unittest.TestCase):
         
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.iter_lines.return_value = []
+        mock_response.iter_content.return_value = sse_body([])
         mock_post.return_value = mock_response
         
         provider.generate_stream(
@@ -373,7 +380,7 @@ class TestStreamingRetry(unittest.TestCase):
         
         # Check the request body
         call_args = mock_post.call_args
-        request_body = call_args.kwargs['json']
+        request_body = json.loads(call_args.kwargs['data'])
         
         # Verify thinkingConfig is included
         self.assertIn("generationConfig", request_body)
@@ -382,7 +389,7 @@ class TestStreamingRetry(unittest.TestCase):
         self.assertEqual(gen_config["thinkingConfig"]["thinkingBudget"], -1)
         self.assertTrue(gen_config["thinkingConfig"]["includeThoughts"])
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     @patch('time.sleep')
     def test_gemini_3_uses_thinking_level(self, mock_sleep, mock_post):
         """Verify Gemini 3.x uses thinkingLevel instead of thinkingBudget"""
@@ -393,7 +400,7 @@ class TestStreamingRetry(unittest.TestCase):
         
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.iter_lines.return_value = []
+        mock_response.iter_content.return_value = sse_body([])
         mock_post.return_value = mock_response
         
         provider.generate_stream(
@@ -406,7 +413,7 @@ class TestStreamingRetry(unittest.TestCase):
         
         # Check request body
         call_args = mock_post.call_args
-        request_body = call_args.kwargs['json']
+        request_body = json.loads(call_args.kwargs['data'])
         
         gen_config = request_body["generationConfig"]
         thinking_config = gen_config["thinkingConfig"]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only TextBuffer and its use in RequestContext.
+"""
+
+import unittest
+
+from src.request_pipeline import RequestContext, RequestOrigin
+from src.text_buffer import TextBuffer
+
+
+class TestTextBuffer(unittest.TestCase):
+    def test_append_and_join(self):
+        buf = TextBuffer()
+        self.assertFalse(buf)
+        for part in ["Hel", "lo", "", " wörld"]:
+            buf.append(part)
+        self.assertEqual(buf.getvalue(), "Hello wörld")
+        self.assertEqual(len(buf), 11)
+        self.assertEqual(buf, "Hello wörld")
+
+        buf += "!"
+        self.assertEqual(str(buf), "Hello wörld!")
+
+        buf.clear()
+        self.assertEqual(buf.getvalue(), "")
+        self.assertEqual(len(buf), 0)
+
+    def test_value_cached_until_next_append(self):
+        buf = TextBuffer("a")
+        buf.append("b")
+        first = buf.getvalue()
+        self.assertIs(buf.getvalue(), first)
+        buf.append("c")
+        self.assertEqual(buf.getvalue(), "abc")
+
+    def test_request_context_text_properties(self):
+        ctx = RequestContext(
+            origin=RequestOrigin.CHAT_WINDOW,
+            provider="google",
+            model="m",
+            streaming=True,
+            thinking_enabled=False
+        )
+        ctx.response_buffer.append("par")
+        ctx.response_buffer.append("tial")
+        self.assertEqual(ctx.response_text, "partial")
+
+        ctx.response_text = "replaced"
+        ctx.reasoning_text = None
+        self.assertEqual(ctx.response_text, "replaced")
+        self.assertEqual(ctx.reasoning_text, "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for request timing instrumentation: provider timings across retries,
+their aggregation into health/key stats and the pipeline's RequestContext.
+"""
+
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.key_manager import KeyManager
+from src.providers.base import CallbackType
+from src.providers.health import get_health_tracker
+from src.providers.openai_compatible import OpenAICompatibleProvider
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+
+CHUNKS = [
+    b'data: {"choices": [{"delta": {"reasoning_content": "Hmm"}}]}\n\n',
+    b'data: {"choices": [{"delta": {"content": "Hello"}}]}\n\n',
+    b'data: {"choices": [], "usage": {"prompt_tokens": 3, "completion_tokens": 20, "total_tokens": 23}}\n\n',
+    b'data: [DONE]\n\n',
+]
+
+
+class TestProviderTimings(unittest.TestCase):
+    def setUp(self):
+        get_health_tracker().reset()
+
+    def tearDown(self):
+        get_health_tracker().reset()
+
+    @patch('requests.Session.post')
+    def test_timings_across_retry(self, mock_post):
+        failed = MagicMock()
+        failed.status_code = 503
+        failed.text = "overloaded"
+        failed.headers = {}
+        good = MagicMock()
+        good.status_code = 200
+        good.iter_content.return_value = CHUNKS
+        mock_post.side_effect = [failed, good]
+
+        key_manager = KeyManager(["k1"], "custom")
+        provider = OpenAICompatibleProvider(
+            "custom", "http://fake.url/v1", key_manager, {"max_retries": 2, "retry_delay": 0.01}
+        )
+        events = []
+        result = provider.generate_stream(
+            [{"role": "user", "content": "hi"}], "timing-model", {},
+            lambda kind, content: events.append((kind, content)), thinking_enabled=True
+        )
+
+        self.assertTrue(result.success)
+        timings = result.timings
+        self.assertEqual([a.outcome for a in timings.attempts], ["server_error", "ok"])
+        self.assertEqual([a.key for a in timings.attempts], [1, 1])
+        payload = mock_post.call_args.kwargs["data"]
+        self.assertEqual(timings.bytes_sent, 2 * len(payload))
+        self.assertEqual(timings.bytes_received, sum(len(c) for c in CHUNKS))
+        self.assertIsNotNone(timings.build)
+        self.assertLessEqual(timings.first_thinking, timings.first_text)
+        self.assertGreater(timings.tokens_per_second, 0)
+        self.assertLess(timings.ttfb, timings.first_text)
+
+        kind, content = events[-1]
+        self.assertEqual(kind, CallbackType.TIMINGS)
+        self.assertEqual(len(content["attempts"]), 2)
+
+        stats = get_health_tracker().get_stats()["custom/timing-model"]
+        self.assertEqual(stats["ttfb"]["count"], 1)
+        self.assertEqual(stats["tokens_per_second"]["count"], 1)
+        key_stats = key_manager.get_stats()[0]
+        self.assertEqual(key_stats["successes"], 1)
+        self.assertEqual(key_stats["ttft"]["count"], 1)
+
+
+class TestContextTimings(unittest.TestCase):
+    TIMINGS = {
+        "build_ms": 1.5,
+        "headers_ms": 420.0,
+        "ttfb_ms": 440.0,
+        "ttft_text_ms": 1200.0,
+        "ttft_thinking_ms": None,
+        "tokens_per_second": 52.1,
+        "bytes_sent": 2048,
+        "bytes_received": 300,
+        "attempts": [
+            {"retry": 0, "key": 1, "duration_ms": 310.0, "outcome": "server_error"},
+            {"retry": 1, "key": 2, "duration_ms": 4200.0, "outcome": "ok"},
+        ],
+    }
+
+    def test_summary(self):
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        self.assertEqual(ctx.get_timing_summary(), [])
+        ctx.apply_timings(self.TIMINGS)
+        self.assertEqual(ctx.ttft_text, 1.2)
+        self.assertEqual(ctx.get_timing_summary(), [
+            "⏱ Timing: build 2ms | headers 420ms | first byte 440ms | first text 1.20s | 52.1 tok/s",
+            "📡 Transfer: 2.0 KB sent | 300 B received",
+            "🔁 Attempts: #1 key #1 server_error 310ms -> #2 key #2 ok 4.20s",
+        ])
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_pipeline_records_timings(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("text", "hello")
+            callback("timings", self.TIMINGS)
+            return "hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        ctx = RequestPipeline.execute_unified_stream(
+            ctx, [], {"stream_coalesce_ms": 0}, {}, {}, StreamCallback()
+        )
+        self.assertEqual(ctx.ttfb, 0.44)
+        self.assertEqual(ctx.bytes_sent, 2048)
+        self.assertEqual(len(ctx.attempts), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
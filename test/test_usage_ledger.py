@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite usage ledger: batched writes, aggregates, prices and
+recording from the request pipeline.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from src.request_pipeline import RequestOrigin, RequestPipeline, StreamCallback, create_request_context
+from src.usage_ledger import UsageLedger, get_usage_ledger, parse_prices
+
+
+class TestUsageLedger(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "usage.db")
+
+    def tearDown(self):
+        get_usage_ledger({})  # Closes the shared ledger, if a test opened one
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_aggregates(self):
+        ledger = UsageLedger(self.path, "gemini-*: 1/2")
+        day1 = time.mktime((2026, 3, 1, 12, 0, 0, 0, 0, -1))
+        day2 = day1 + 86400
+        ledger.record({"ts": day1, "provider": "google", "model": "gemini-x", "key_num": 1,
+                       "input_tokens": 1000, "output_tokens": 500, "latency": 1.0, "success": True})
+        ledger.record({"ts": day1, "provider": "google", "model": "gemini-x", "key_num": 2,
+                       "input_tokens": 10, "estimated": True, "latency": 3.0, "success": False,
+                       "error": "boom"})
+        ledger.record({"ts": day2, "provider": "custom", "model": "gpt", "key_num": 1,
+                       "input_tokens": 5, "output_tokens": 5, "latency": 0.5, "success": True})
+        self.assertTrue(ledger.flush())
+        self.assertEqual(ledger.written, 3)
+
+        days = ledger.aggregate("day")
+        self.assertEqual([(d["day"], d["requests"]) for d in days], [("2026-03-01", 2), ("2026-03-02", 1)])
+        self.assertEqual(days[0]["success_rate"], 0.5)
+        self.assertEqual(days[0]["avg_latency"], 2.0)
+        self.assertEqual(days[0]["estimated_requests"], 1)
+
+        models = {(m["provider"], m["model"]): m for m in ledger.aggregate("model")}
+        self.assertAlmostEqual(models[("google", "gemini-x")]["cost"], (1010 * 1 + 500 * 2) / 1e6)
+        self.assertIsNone(models[("custom", "gpt")]["cost"])
+
+        keys = [(k["provider"], k["key_num"], k["requests"]) for k in ledger.aggregate("key", since=day2)]
+        self.assertEqual(keys, [("custom", 1, 1)])
+        ledger.close()
+
+    def test_parse_prices(self):
+        self.assertEqual(parse_prices("a*: 0.3/2.5; b: 1; bad"), [("a*", 0.3, 2.5), ("b", 1.0, 1.0)])
+        self.assertEqual(parse_prices(None), [])
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_pipeline_records_request(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("text", "hello")
+            callback("usage", {"prompt_tokens": 7, "completion_tokens": 3, "total_tokens": 10})
+            callback("timings", {"ttft_text_ms": 250.0, "attempts": [{"retry": 0, "key": 2}]})
+            return "hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        config = {"usage_ledger_file": self.path, "stream_coalesce_ms": 0}
+        ctx = create_request_context(RequestOrigin.ENDPOINT_CUSTOM, "custom", "m")
+        RequestPipeline.execute_unified_stream(ctx, [], config, {}, {}, StreamCallback())
+
+        rows = get_usage_ledger(config).aggregate("key")
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual((row["provider"], row["key_num"]), ("custom", 2))
+        self.assertEqual((row["input_tokens"], row["output_tokens"], row["successes"]), (7, 3, 1))
+        self.assertEqual(row["avg_ttft"], 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
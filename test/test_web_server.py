@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Route tests against web_server.app: the endpoint handler's blocking and SSE
+answers, cancelling the upstream request when an SSE client disconnects, the
+background job routes, multi-image batches, and admission refusals (429 /
+503 with Retry-After) on the endpoint and gateway routes.
+"""
+
+import base64
+import io
+import json
+import sys
+import threading
+import types
+import unittest
+from unittest.mock import patch
+
+from src import admission, jobs
+from src.admission import INTERACTIVE
+from src.gateway import init_gateway
+from src.jobs import JobRunner
+from src.key_manager import KeyManager
+from src.providers.base import ProviderResult
+
+CONFIG = {"flask_endpoints_enabled": True, "gateway_enabled": True, "stream_coalesce_ms": 0}
+ENDPOINTS = {"ocr": "Extract the text ({lang})"}
+IMAGE = {"data": b"\x89PNG fake", "content_type": "image/png"}
+
+
+class PromptsStub:
+    def get_endpoint_setting(self, name, default=None):
+        return default
+
+
+def load_web_server():
+    """
+    src.web_server with its GUI-only imports stubbed (the chat window needs
+    tkinter and pynput), initialized once with the ocr endpoint and the
+    gateway
+    """
+    core = types.ModuleType("src.gui.core")
+    core.HAVE_GUI = False
+    core.show_chat_gui = lambda *args, **kwargs: None
+    core.show_session_browser = lambda: False
+    core.get_gui_status = lambda: {"running": False}
+    prompts = types.ModuleType("src.gui.prompts")
+    prompts.get_prompts_config = PromptsStub
+    sys.modules.setdefault("src.gui.core", core)
+    sys.modules.setdefault("src.gui.prompts", prompts)
+
+    from src import web_server
+    if "ocr" not in web_server.app.view_functions:
+        web_server.init_web_server(dict(CONFIG), {}, ENDPOINTS, {"google": KeyManager(["k1"], "google")})
+    return web_server
+
+
+web_server = load_web_server()
+
+
+def parse_events(body):
+    """(event, data) pairs of an SSE body, comments skipped"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestEndpointHandler(unittest.TestCase):
+    def setUp(self):
+        self.client = web_server.app.test_client()
+
+    @patch('src.api_client.call_api_result')
+    def test_blocking(self, mock_call):
+        mock_call.return_value = ProviderResult(success=True, content="Hello")
+        response = self.client.post("/ocr?lang=German", **IMAGE)
+
+        self.assertEqual((response.status_code, response.get_data(as_text=True)), (200, "Hello"))
+        content = mock_call.call_args.kwargs["messages"][0]["content"]
+        self.assertTrue(content[0]["image_url"]["url"].startswith("data:image/png;base64,"))
+        self.assertEqual(content[1]["text"], "Extract the text (German)")
+
+        response = self.client.post("/ocr?stream=0", headers={"Accept": "text/event-stream"}, **IMAGE)
+        self.assertEqual(response.get_data(as_text=True), "Hello")
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_stream_events(self, mock_stream):
+        def fake_stream(callback, **kwargs):
+            callback("thinking", "hmm")
+            callback("text", "Hel")
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", "hmm", None, None
+
+        mock_stream.side_effect = fake_stream
+        with patch.dict(web_server.CONFIG, {"thinking_enabled": True}):
+            response = self.client.post("/ocr?stream=1", **IMAGE)
+
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual([event for event, _ in events], ["thinking", "text", "text", "usage", "done"])
+        self.assertEqual(events[0][1], {"text": "hmm"})
+        done = events[-1][1]
+        self.assertEqual((done["text"], done["thinking"], done["usage"]["total_tokens"]), ("Hello", "hmm", 5))
+        self.assertTrue(mock_stream.call_args.kwargs["thinking_enabled"])
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_stream_error(self, mock_stream):
+        mock_stream.return_value = (None, None, None, "upstream down")
+        response = self.client.post("/ocr", headers={"Accept": "text/event-stream"}, **IMAGE)
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual(events[-1][0], "error")
+        self.assertEqual(events[-1][1]["error"], "upstream down")
+
+    def test_no_image(self):
+        response = self.client.post("/ocr?stream=1")
+        self.assertEqual(response.status_code, 400)
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_disconnect_cancels(self, mock_stream):
+        cancelled = threading.Event()
+        tokens = []
+
+        def fake_stream(callback, cancel_token=None, **kwargs):
+            tokens.append(cancel_token)
+            callback("text", "partial")
+            cancel_token.wait(5)
+            cancelled.set()
+            return "partial", None, None, "Request cancelled"
+
+        mock_stream.side_effect = fake_stream
+        response = self.client.post("/ocr?stream=1", buffered=False, **IMAGE)
+        chunks = iter(response.response)
+        self.assertEqual(next(chunks), b": stream open\n\n")
+        self.assertIn(b"partial", next(chunks))
+        response.close()  # What the server does when the client went away
+
+        self.assertTrue(cancelled.wait(5))
+        self.assertEqual(tokens[0].reason, "client disconnected")
+
+
+class TestJobRoutes(unittest.TestCase):
+    def setUp(self):
+        jobs._RUNNER = JobRunner({"jobs_workers": 1, "jobs_queue_size": 0})
+        self.client = web_server.app.test_client()
+
+    def tearDown(self):
+        jobs._RUNNER.shutdown()
+        jobs._RUNNER = None
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_submit_and_poll(self, mock_stream):
+        release = threading.Event()
+
+        def fake_stream(callback, **kwargs):
+            callback("text", "Hel")
+            release.wait(5)
+            callback("text", "lo")
+            callback("usage", {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5})
+            return "Hello", None, None, None
+
+        mock_stream.side_effect = fake_stream
+        response = self.client.post("/jobs/ocr", **IMAGE)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()["id"]
+        self.assertEqual(response.headers["Location"], f"/jobs/{job_id}")
+
+        data = self.client.get(f"/jobs/{job_id}?wait=5&since=0").get_json()
+        self.assertEqual((data["status"], data["text"]), ("running", "Hel"))
+        release.set()
+        data = self.client.get(f"/jobs/{job_id}?wait=5").get_json()
+        self.assertEqual((data["status"], data["text"], data["usage"]["total_tokens"]), ("done", "Hello", 5))
+        content = mock_stream.call_args.kwargs["messages"][0]["content"]
+        self.assertEqual(content[1]["text"], "Extract the text (English)")
+
+    @patch('src.api_client.call_api_stream_unified')
+    def test_queue_full_and_cancel(self, mock_stream):
+        def fake_stream(callback, cancel_token=None, **kwargs):
+            cancel_token.wait(5)
+            return None, None, None, "Request cancelled"
+
+        mock_stream.side_effect = fake_stream
+        job_id = self.client.post("/jobs/ocr", **IMAGE).get_json()["id"]
+        response = self.client.post("/jobs/ocr", **IMAGE)
+        self.assertEqual((response.status_code, response.headers["Retry-After"]), (503, "5"))
+
+        response = self.client.delete(f"/jobs/{job_id}")
+        self.assertEqual(response.get_json(), {"id": job_id, "status": "cancelling"})
+        data = self.client.get(f"/jobs/{job_id}?wait=5").get_json()
+        self.assertEqual(data["status"], "cancelled")
+        self.assertEqual(self.client.delete(f"/jobs/{job_id}").status_code, 404)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post("/jobs/nope", **IMAGE).status_code, 404)
+        self.assertEqual(self.client.post("/jobs/ocr").status_code, 400)
+        self.assertEqual(self.client.get("/jobs/missing").status_code, 404)
+        self.assertEqual(self.client.get("/jobs/missing?wait=soon").status_code, 400)
+
+
+class TestBatchRoute(unittest.TestCase):
+    def setUp(self):
+        self.client = web_server.app.test_client()
+
+    def post(self, path, count=3):
+        files = [(io.BytesIO(f"image {i}".encode()), f"{i}.png", "image/png") for i in range(count)]
+        return self.client.post(path, data={"image": files}, content_type="multipart/form-data")
+
+    @staticmethod
+    def answer(messages, **kwargs):
+        """Fake call_api_result: the image bytes say which image it is; image 1 fails"""
+        url = messages[0]["content"][0]["image_url"]["url"]
+        index = int(base64.b64decode(url.split(",", 1)[1]).split()[-1])
+        if index == 1:
+            return ProviderResult(success=False, error="HTTP 500")
+        return ProviderResult(success=True, content=f"text {index}")
+
+    @patch('src.api_client.call_api_result')
+    def test_batch(self, mock_call):
+        mock_call.side_effect = self.answer
+        response = self.post("/ocr/batch?lang=German")
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.get_json()
+        self.assertEqual((summary["count"], summary["succeeded"], summary["failed"]), (3, 2, 1))
+        self.assertEqual([(r["name"], r["status"]) for r in summary["results"]],
+                         [("0.png", "done"), ("1.png", "error"), ("2.png", "done")])
+        self.assertEqual(summary["results"][2]["text"], "text 2")
+        prompts = {call.kwargs["messages"][0]["content"][1]["text"] for call in mock_call.call_args_list}
+        self.assertEqual(prompts, {"Extract the text (German)"})
+
+    @patch('src.api_client.call_api_result')
+    def test_batch_stream(self, mock_call):
+        mock_call.side_effect = self.answer
+        response = self.post("/ocr/batch?stream=1&concurrency=1")
+
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = parse_events(response.get_data(as_text=True))
+        self.assertEqual([event for event, _ in events], ["result"] * 3 + ["done"])
+        self.assertEqual([data["index"] for _, data in events[:3]], [0, 1, 2])  # One at a time
+        done = events[-1][1]
+        self.assertEqual((done["count"], done["failed"]), (3, 1))
+        self.assertNotIn("results", done)
+
+    @patch('src.api_client.call_api_result')
+    def test_bad_requests(self, mock_call):
+        self.assertEqual(self.client.post("/ocr/batch").status_code, 400)
+        self.assertEqual(self.post("/ocr/batch?concurrency=many").status_code, 400)
+        with patch.dict(web_server.CONFIG, {"batch_max_images": 2}):
+            response = self.post("/ocr/batch")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 2", response.get_json()["error"])
+        mock_call.assert_not_called()
+
+
+class TestAdmissionRoutes(unittest.TestCase):
+    CHAT = {"model": "gemini-2.5-flash", "messages": [{"role": "user", "content": "hi"}]}
+
+    def setUp(self):
+        # test_gateway.py points the gateway at its own config
+        init_gateway(web_server.CONFIG, web_server.AI_PARAMS, web_server.KEY_MANAGERS)
+        self.client = web_server.app.test_client()
+
+    def tearDown(self):
+        admission._CONTROLLER = None
+
+    def hold_slot(self, **settings):
+        """Take the only upstream slot under the given admission settings"""
+        config = patch.dict(web_server.CONFIG, {"admission_max_concurrent": 1, **settings})
+        config.start()
+        self.addCleanup(config.stop)
+        slot = admission.get_admission_controller(web_server.CONFIG).acquire(INTERACTIVE)
+        self.addCleanup(slot.release)
+
+    @patch('src.api_client.call_api_result')
+    def test_queue_full(self, mock_call):
+        self.hold_slot(admission_queue_size=0)
+
+        response = self.client.post("/ocr", **IMAGE)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertTrue(response.get_json()["error"])
+
+        response = self.client.post("/v1/chat/completions", json=self.CHAT)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(response.get_json()["error"]["type"], "rate_limit_error")
+
+        mock_call.assert_not_called()
+        self.assertEqual(admission.get_admission_stats(web_server.CONFIG)["rejected_queue_full"], 2)
+
+    @patch('src.api_client.call_api_result')
+    def test_queue_timeout(self, mock_call):
+        self.hold_slot(admission_queue_size=1, admission_queue_timeout=0.05)
+
+        response = self.client.post("/ocr", **IMAGE)
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertTrue(response.get_json()["error"])
+
+        response = self.client.post("/v1/chat/completions", json=self.CHAT)
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+        self.assertEqual(response.get_json()["error"]["type"], "rate_limit_error")
+
+        mock_call.assert_not_called()
+        self.assertEqual(admission.get_admission_stats(web_server.CONFIG)["rejected_timeout"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()